@@ -21,7 +21,10 @@ See: http://doc.pytest.org/en/latest/example/pythoncollection.html#customizing-t
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 
+import os
+import shutil
 import sys
+import tempfile
 
 # always ignore `setup.py` and other aux files
 collect_ignore = [
@@ -34,3 +37,23 @@ collect_ignore = [
 if sys.version_info < (2, 7):
     collect_ignore.append("gc3libs/backends/openstack.py")
     collect_ignore.append("gc3libs/backends/tests/test_openstack.py")
+
+
+# keep tests (and the scripts they run) from reading or writing the
+# user's cache of parsed configuration files (see
+# `gc3libs.config.Configuration.merge_file`)
+_config_cache_dir = None
+
+
+def pytest_configure(config):
+    global _config_cache_dir
+    import gc3libs
+    _config_cache_dir = tempfile.mkdtemp(prefix='gc3pie.test.')
+    os.environ['GC3PIE_CONF_CACHE'] = os.path.join(
+        _config_cache_dir, 'gc3pie.conf.cache')
+    gc3libs.Default.CONFIG_CACHE_FILE = os.environ['GC3PIE_CONF_CACHE']
+
+
+def pytest_unconfigure(config):
+    if _config_cache_dir is not None:
+        shutil.rmtree(_config_cache_dir, ignore_errors=True)
@@ -53,7 +53,6 @@ log = logging.getLogger("gc3.gc3libs")
 log.propagate = True
 
 from gc3libs.quantity import MB, hours, minutes, seconds, MiB
-from gc3libs.compat._collections import OrderedDict
 
 # this needs to be defined before we import other GC3Libs modules, as
 # they may depend on it
@@ -76,6 +75,12 @@ class Default(object):
         os.environ.get('GC3PIE_CONF', os.path.join(RCDIR, "gc3pie.conf"))
     ]
     JOBS_DIR = os.path.join(RCDIR, "jobs")
+    # where to keep parsed configuration files: first look into
+    # `$GC3PIE_CONF_CACHE`, and fall back to `~/.gc3/gc3pie.conf.cache`;
+    # set to `None` (or `$GC3PIE_CONF_CACHE` to the empty string) to
+    # always parse configuration files from scratch
+    CONFIG_CACHE_FILE = os.environ.get(
+        'GC3PIE_CONF_CACHE', os.path.join(RCDIR, "gc3pie.conf.cache"))
 
     # the ARC backends have been removed, but keep their names around
     # so we can issue a warning if a user still has these resources in
@@ -96,6 +101,10 @@ class Default(object):
     SSH_CONFIG_FILE = '~/.ssh/config'
     SSH_PORT = 22
     SSH_CONNECT_TIMEOUT = 30
+    # where OpenSSH control sockets are created, when shared SSH
+    # connections are enabled; `%C` is expanded by `ssh` into a hash
+    # of the connection parameters (see `ssh_config(5)`)
+    SSH_CONTROL_PATH = os.path.join(RCDIR, "ssh", "%C")
 
     PEEK_FILE_SIZE = 120  # expressed in bytes
 
@@ -252,6 +261,11 @@ class Task(Persistable, Struct):
 
     """
 
+    # there can be many `Task` objects alive at the same time: keep
+    # the attributes that every task has out of the instance `__dict__`
+    __slots__ = ('execution', '_attached', '_changed', '_controller',
+                 '_watchers')
+
     # assume that a generic `Task` produces no output -- this should
     # be changed in subclasses!
     would_output = False
@@ -276,6 +290,35 @@ class Task(Persistable, Struct):
         self._controller = None
         self.changed = True
 
+    @defproperty
+    def changed():
+        """
+        Evaluates to `True` if this task has been modified and should
+        be saved to persistent storage.
+
+        Setting it to `True` informs watchers (see `_add_watcher`:meth:)
+        through their `_on_child_changed` method, so that they need not
+        scan all their tasks to find out which ones should be saved.
+        """
+
+        def fget(self):
+            return getattr(self, '_changed', False)
+
+        def fset(self, value):
+            self._changed = value
+            if value:
+                self._notify_changed()
+        return locals()
+
+    def _notify_changed(self):
+        """
+        Call `_on_child_changed` on each watcher of this task.
+        """
+        watchers = getattr(self, '_watchers', None)
+        if watchers:
+            for watcher in watchers:
+                watcher._on_child_changed(self)
+
     # manipulate the "controller" interface used to control the associated job
     def attach(self, controller):
         """
@@ -321,19 +364,56 @@ class Task(Persistable, Struct):
                 pass
             self._controller = Task.__no_controller
 
+    # objects that want to be told about changes in this task's
+    # execution state (e.g., enclosing task collections keeping count
+    # of their children's states) register here; they are called by
+    # `Run.state` through their `_on_child_transition` method, and
+    # by the `changed` setter through their `_on_child_changed` method
+
+    def _add_watcher(self, watcher):
+        """
+        Notify `watcher` of any change in this task's state or return code.
+
+        Registering the same object twice is a no-op.
+        """
+        try:
+            watchers = self._watchers
+        except AttributeError:
+            watchers = self._watchers = []
+        # compare by identity: `Task` objects are `dict`-like and
+        # comparing them by value can be expensive (or recurse forever)
+        for item in watchers:
+            if item is watcher:
+                return
+        watchers.append(watcher)
+
+    def _remove_watcher(self, watcher):
+        """
+        Stop notifying `watcher` of changes in this task's state.
+        """
+        watchers = getattr(self, '_watchers', None)
+        if watchers:
+            watchers[:] = [item for item in watchers if item is not watcher]
+
     # interface with pickle/gc3libs.persistence: do not save the
     # attached grid/engine/core as well: it definitely needs to be
     # saved separately.
 
     def __getstate__(self):
-        state = self.__dict__.copy()
+        state = Struct.__getstate__(self)
         state['_controller'] = None
         state['_attached'] = None
-        state['changed'] = False
+        state['_changed'] = False
+        # watchers are re-registered by the watching objects after loading
+        state.pop('_watchers', None)
         return state
 
     def __setstate__(self, state):
-        self.__dict__ = state
+        # objects saved by older versions of GC3Pie have a plain
+        # `changed` attribute
+        if 'changed' in state:
+            state.setdefault('_changed', state.pop('changed'))
+        Struct.__setstate__(self, state)
         self.detach()
 
     # grid-level actions on this Task object are re-routed to the
@@ -870,6 +950,12 @@ class Application(Task):
       for submission; possibly empty.
     """
 
+    __slots__ = ('arguments', 'inputs', 'outputs', 'output_dir',
+                 'output_base_url', 'requested_cores', 'requested_memory',
+                 'requested_walltime', 'requested_architecture',
+                 'environment', 'join', 'stdin', 'stdout', 'stderr', 'tags',
+                 'jobname')
+
     application_name = 'generic'
     """
     A name for applications of this class.
@@ -1649,6 +1735,9 @@ class Run(Struct):
     the ``.`` syntax; see `gc3libs.utils.Struct` for examples.
     """
 
+    __slots__ = ('_ref', '_state', '_exitcode', '_signal',
+                 '_execution_targets', 'history', 'timestamp')
+
     def __init__(self, initializer=None, attach=None, **keywd):
         """
         Create a new Run object; constructor accepts the same
@@ -1688,15 +1777,29 @@ class Run(Struct):
         self._exitcode = None
         self._signal = None
 
-        # to overcome the "black hole" effect
-        self._execution_targets = []
+        # to overcome the "black hole" effect; nothing is recorded
+        # here yet, so share one empty (immutable) sequence
+        self._execution_targets = ()
 
         Struct.__init__(self, initializer, **keywd)
 
         if 'history' not in self:
             self.history = History()
         if 'timestamp' not in self:
-            self.timestamp = OrderedDict()
+            self.timestamp = {}
+
+    def __setstate__(self, state):
+        # strings loaded from disk are distinct objects in each `Run`;
+        # share the ones that repeat over and over
+        if state.get('_state') in Run.State:
+            state['_state'] = intern(str(state['_state']))
+        if state.get('timestamp'):
+            state['timestamp'] = dict(
+                (intern(str(name)), when)
+                for name, when in state['timestamp'].iteritems())
+        if isinstance(state.get('resource_name'), str):
+            state['resource_name'] = intern(state['resource_name'])
+        Struct.__setstate__(self, state)
 
     @defproperty
     def info():
@@ -1831,6 +1934,8 @@ class Run(Struct):
                 ("Value '%s' is not a legal `gc3libs.Run.State` value." %
                  value)
             if self._state != value:
+                old_state = self._state
+                old_returncode = self.returncode
                 self.state_last_changed = time.time()
                 self.timestamp[value] = time.time()
                 self.history.append(value)
@@ -1843,9 +1948,36 @@ class Run(Struct):
                         "Calling state-transition handler '%s' on %s ...",
                         handler, self._ref)
                     getattr(self._ref, handler)()
-            self._state = value
+                self._state = value
+                self._notify_watchers(old_state, old_returncode)
+            else:
+                self._state = value
         return locals()
 
+    def _get_watchers(self):
+        """
+        Return the list of objects that should be notified of state
+        changes of this `Run`, or ``None``.
+
+        Watchers are registered on the task this `Run` object is
+        attached to; see `Task._add_watcher`:meth:.
+        """
+        return getattr(getattr(self, '_ref', None), '_watchers', None)
+
+    def _notify_watchers(self, old_state, old_returncode):
+        """
+        Inform watchers that state or return code of this `Run` changed.
+
+        Each registered watcher gets its `_on_child_transition` method
+        called with the old and new values of `state` and `returncode`.
+        """
+        watchers = self._get_watchers()
+        if watchers:
+            new_returncode = self.returncode
+            for watcher in watchers:
+                watcher._on_child_transition(
+                    old_state, old_returncode, self._state, new_returncode)
+
     def in_state(self, *names):
         """
         Return `True` if the `Run` state matches any of the given names.
@@ -1890,10 +2022,16 @@ class Run(Struct):
             return self._signal
 
         def fset(self, value):
+            watched = (self._state == Run.State.TERMINATED
+                       and self._get_watchers())
+            if watched:
+                old_returncode = self.returncode
             if value is None:
                 self._signal = None
             else:
                 self._signal = int(value) & 0x7f
+            if watched:
+                self._notify_watchers(self._state, old_returncode)
         return (locals())
 
     @defproperty
@@ -1910,10 +2048,16 @@ class Run(Struct):
             return self._exitcode
 
         def fset(self, value):
+            watched = (self._state == Run.State.TERMINATED
+                       and self._get_watchers())
+            if watched:
+                old_returncode = self.returncode
             if value is None:
                 self._exitcode = None
             else:
                 self._exitcode = int(value) & 0xff
+            if watched:
+                self._notify_watchers(self._state, old_returncode)
         return (locals())
 
     @defproperty
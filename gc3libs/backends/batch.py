@@ -124,6 +124,7 @@ class BatchSystem(LRMS):
                  keyfile=None,
                  ignore_ssh_host_keys=False,
                  ssh_timeout=None,
+                 ssh_control_persist=None,
                  **extra_args):
 
         # init base class
@@ -148,6 +149,7 @@ class BatchSystem(LRMS):
                 port=auth.port,
                 keyfile=(keyfile or auth.keyfile),
                 timeout=(ssh_timeout or auth.timeout),
+                control_persist=ssh_control_persist,
             )
         else:
             raise gc3libs.exceptions.TransportError(
@@ -217,6 +217,13 @@ class ShellcmdLrms(LRMS):
       If `transport` is `ssh`, this value will be used as timeout (in
       seconds) for the TCP connect.
 
+    :param ssh_control_persist:
+
+      If `transport` is `ssh` and this is not ``None``, share one
+      persistent SSH connection to `frontend` among all processes,
+      kept open for the given amount of time after last use.  See
+      `gc3libs.backends.transport.SshTransport`:class: for details.
+
     """
 
     # this matches what the ARC grid-manager does
@@ -297,6 +304,7 @@ ReturnCode=%x"""
                  keyfile=None,
                  ignore_ssh_host_keys=False,
                  ssh_timeout=None,
+                 ssh_control_persist=None,
                  **extra_args):
 
         # init base class
@@ -336,6 +344,7 @@ ReturnCode=%x"""
                 port=auth.port,
                 keyfile=(keyfile or auth.keyfile),
                 timeout=(ssh_timeout or auth.timeout),
+                control_persist=ssh_control_persist,
             )
         else:
             raise gc3libs.exceptions.TransportError(
@@ -23,12 +23,14 @@ __docformat__ = 'reStructuredText'
 # System imports
 import os
 import getpass
+import json
 import tempfile
 
 # Nose imports
 import pytest
 
 # GC3 imports
+import gc3libs.metrics
 from gc3libs.backends import transport
 from gc3libs.exceptions import TransportError
 
@@ -145,6 +147,66 @@ class StubForTestTransport(object):
             self.transport.remove(
                 os.path.join(self.tmpdir, 'nonexistent'))
 
+    def test_trace_disabled(self):
+        tracer = transport.tracer
+        assert not tracer.enabled
+        tracer.records.clear()
+        labels = dict(transport=self.transport.__class__.__name__,
+                      host=self.transport.remote_frontend)
+        commands = gc3libs.metrics.registry.get(
+            'transport_commands_total', **labels)
+        self.transport.isdir(self.tmpdir)
+        self.transport.execute_command('true')
+        assert len(tracer.records) == 0
+        # no metrics are updated either
+        assert commands == gc3libs.metrics.registry.get(
+            'transport_commands_total', **labels)
+
+    def test_trace(self):
+        tracer = transport.tracer
+        tracer.records.clear()
+        (fd, tracefile) = tempfile.mkstemp()
+        os.close(fd)
+        labels = dict(transport=self.transport.__class__.__name__,
+                      host=self.transport.remote_frontend)
+        copied = gc3libs.metrics.registry.get(
+            'transport_bytes_total', direction='get', **labels) or 0
+        tracer.open(tracefile)
+        try:
+            srcfile = os.path.join(self.tmpdir, 'src')
+            with self.transport.open(srcfile, 'w') as stream:
+                stream.write("Test file")
+            self.transport.get(srcfile, tracefile + '.copy')
+            with pytest.raises(TransportError):
+                self.transport.remove(
+                    os.path.join(self.tmpdir, 'nonexistent'))
+        finally:
+            tracer.close()
+            os.remove(tracefile + '.copy')
+
+        assert not tracer.enabled
+        records = list(tracer.records)
+        get = [entry for entry in records if entry['op'] == 'get'][0]
+        assert get['arg'] == srcfile
+        assert get['bytes'] == len("Test file")
+        assert get['caller'] == self.__class__.__name__ + '.test_trace'
+        assert records[-1]['op'] == 'remove'
+        assert records[-1]['error'] is not None
+        assert gc3libs.metrics.registry.get(
+            'transport_bytes_total', direction='get', **labels) == (
+                copied + len("Test file"))
+
+        # the same records have been written to the trace file
+        with open(tracefile) as stream:
+            lines = stream.readlines()
+        os.remove(tracefile)
+        assert len(lines) == len(records)
+        summary = transport.summarize_trace(json.loads(line) for line in lines)
+        stats = summary[self.transport.remote_frontend]
+        assert stats['get']['count'] == 1
+        assert stats['get']['bytes'] == len("Test file")
+        assert stats['remove']['errors'] == 1
+
 
 class TestLocalTransport(StubForTestTransport):
 
@@ -167,6 +229,34 @@ class TestSshTransport(StubForTestTransport):
         self.transport.connect()
         self.extra_setup()
 
+
+@pytest.mark.skipif(
+    'SshTransport' not in os.environ.get('GC3PIE_TESTS_ALLOW', ''),
+    reason=("Skipping SSH test: SSH to localhost not allowed"
+            " (set env variable `GC3PIE_TESTS_ALLOW` to `SshTransport` to run)"))
+class TestSshTransportControlMaster(StubForTestTransport):
+
+    @pytest.fixture(autouse=True)
+    def setUp(self):
+        self.transport = transport.SshTransport('localhost',
+                                                ignore_ssh_host_keys=True,
+                                                control_persist=60)
+        self.transport.connect()
+        self.extra_setup()
+
+
+def test_ssh_control_master_command_line():
+    ssh = transport.SshTransport('example.org', ssh_config='/dev/null',
+                                 username='gc3pie', port=2222,
+                                 control_persist=60)
+    ssh.control_path = '/tmp/ctl/%C'
+    argv = ssh._ssh_command(['-s'], ['sftp'])
+    assert argv[0] == 'ssh'
+    assert 'ControlPath=/tmp/ctl/%C' in argv
+    assert argv[argv.index('-l') + 1] == 'gc3pie'
+    assert argv[argv.index('-p') + 1] == '2222'
+    assert argv[-3:] == ['-s', 'example.org', 'sftp']
+
 # main: run tests
 
 if __name__ == "__main__":
@@ -25,15 +25,211 @@ via SSH.
 __docformat__ = 'reStructuredText'
 
 
+from collections import deque
+import functools
+import json
 import platform
 import os
 import os.path
 import errno
+import select
 import shutil
+import socket
 import getpass
+import sys
+import tempfile
+import threading
+import time
 
+import gc3libs
 from gc3libs.utils import same_docstring_as, samefile
 import gc3libs.exceptions
+import gc3libs.metrics
+from gc3libs.quantity import Duration
+
+
+class TransportTracer(object):
+    """
+    Record every operation performed through a `Transport`:class:.
+
+    For each operation, a dictionary is appended to the ring buffer
+    `records` (which keeps the `size` most recent ones) with keys:
+
+    * ``start``: UNIX timestamp of the start of the operation;
+    * ``transport``: the transport class name, e.g., ``SshTransport``;
+    * ``host``: the host the operation was performed on;
+    * ``op``: the operation name, e.g., ``execute_command`` or ``get``;
+    * ``arg``: the command line, or the path operated on;
+    * ``duration``: how long the operation took, in seconds;
+    * ``bytes``: size of transferred files, or of command output;
+    * ``caller``: the backend method which requested the operation,
+      e.g., ``SlurmLrms.update_job_state``;
+    * ``error``: name of the exception class, if the operation failed.
+
+    Operations are only recorded while attribute `enabled` is true;
+    this is the case if the tracer is created with ``enabled=True``
+    or after a trace file has been opened with `open`:meth:.  Records
+    are then also appended to the trace file, one JSON object per
+    line; command ``gtrace`` summarizes such files.
+
+    The duration of operations is also recorded into histogram
+    ``transport_seconds`` of `gc3libs.metrics.registry`:data:, the
+    number of commands run into counter ``transport_commands_total``,
+    and the size of files copied into counter ``transport_bytes_total``.
+    """
+
+    def __init__(self, size=10000, enabled=False):
+        self.enabled = enabled
+        self.records = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self._stream = None
+
+    def open(self, path):
+        """
+        Record operations, and append records to file `path`, from now on.
+        """
+        stream = open(path, 'a', 1)
+        with self._lock:
+            if self._stream is not None:
+                self._stream.close()
+            self._stream = stream
+            self.enabled = True
+
+    def close(self):
+        """
+        Stop recording operations and writing them to the trace file.
+        """
+        with self._lock:
+            self.enabled = False
+            if self._stream is not None:
+                self._stream.close()
+                self._stream = None
+
+    @staticmethod
+    def _caller():
+        """
+        Return name of the innermost calling method outside this module.
+        """
+        frame = sys._getframe(2)
+        while frame is not None and frame.f_globals.get('__name__') == __name__:
+            frame = frame.f_back
+        if frame is None:
+            return None
+        code = frame.f_code
+        obj = frame.f_locals.get('self')
+        if obj is not None:
+            return obj.__class__.__name__ + '.' + code.co_name
+        return frame.f_globals.get('__name__', '?') + '.' + code.co_name
+
+    def record(self, transport, op, arg, start, duration, nbytes, error=None):
+        host = transport.remote_frontend
+        entry = {
+            'start': start,
+            'transport': transport.__class__.__name__,
+            'host': host,
+            'op': op,
+            'arg': arg,
+            'duration': duration,
+            'bytes': nbytes,
+            'caller': self._caller(),
+            'error': error,
+        }
+        registry = gc3libs.metrics.registry
+        registry.observe(
+            'transport_seconds', duration, host=host, operation=op)
+        if op == 'execute_command':
+            registry.incr('transport_commands_total',
+                          transport=entry['transport'], host=host)
+        elif op in ('get', 'put') and nbytes:
+            registry.incr('transport_bytes_total', nbytes,
+                          transport=entry['transport'], host=host,
+                          direction=op)
+        with self._lock:
+            self.records.append(entry)
+            if self._stream is not None:
+                self._stream.write(json.dumps(entry) + '\n')
+
+
+#: Process-wide tracer of `Transport` operations; it is only enabled
+#: if environment variable ``GC3PIE_TRANSPORT_TRACE`` is set, in which
+#: case records are appended to the file it names.
+tracer = TransportTracer()
+if os.environ.get('GC3PIE_TRANSPORT_TRACE'):
+    try:
+        tracer.open(os.environ['GC3PIE_TRANSPORT_TRACE'])
+    except IOError as err:
+        gc3libs.log.warning(
+            "Cannot open transport trace file '%s': %s",
+            os.environ['GC3PIE_TRANSPORT_TRACE'], err)
+
+
+def summarize_trace(records):
+    """
+    Return dictionary mapping host names to per-operation statistics.
+
+    Statistics for each operation are a dictionary with keys
+    ``count``, ``total`` (total duration), ``max`` (maximum
+    duration), ``bytes`` and ``errors``.
+    """
+    result = {}
+    for entry in records:
+        ops = result.setdefault(entry['host'], {})
+        stats = ops.get(entry['op'])
+        if stats is None:
+            stats = ops[entry['op']] = {
+                'count': 0, 'total': 0.0, 'max': 0.0,
+                'bytes': 0, 'errors': 0}
+        stats['count'] += 1
+        stats['total'] += entry['duration']
+        stats['max'] = max(stats['max'], entry['duration'])
+        stats['bytes'] += (entry['bytes'] or 0)
+        if entry['error']:
+            stats['errors'] += 1
+    return result
+
+
+def _output_size(args, result):
+    if isinstance(result, tuple):
+        return sum(len(data) for data in result[1:]
+                   if isinstance(data, basestring))
+    return None
+
+
+def _path_size(index):
+    def size(args, result):
+        try:
+            return os.path.getsize(args[index])
+        except (IndexError, OSError):
+            return None
+    return size
+
+
+def _traced(op, size=None):
+    """
+    Decorate `Transport` method so that calls are recorded by `tracer`.
+
+    Optional argument `size` is a function computing the number of
+    bytes transferred, given the method arguments and return value.
+    """
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if not tracer.enabled:
+                return method(self, *args, **kwargs)
+            start = time.time()
+            try:
+                result = method(self, *args, **kwargs)
+            except Exception as err:
+                tracer.record(self, op, (args[0] if args else None),
+                              start, time.time() - start, None,
+                              err.__class__.__name__)
+                raise
+            tracer.record(self, op, (args[0] if args else None),
+                          start, time.time() - start,
+                          (size(args, result) if size else None))
+            return result
+        return wrapper
+    return decorate
 
 
 class Transport(object):
@@ -399,18 +595,78 @@ class Transport(object):
 
 import types
 
-import paramiko
-
 import gc3libs
 
 
+class _PipeSocket(object):
+    """
+    Socket-like wrapper around the standard input and output of a
+    child process.
+
+    Only the methods used by `paramiko.SFTPClient` are implemented,
+    so that the SFTP protocol can be spoken to e.g. an ``ssh -s
+    HOST sftp`` process.
+    """
+
+    def __init__(self, argv):
+        self.argv = argv
+        self._timeout = None
+        with open(os.devnull, 'w') as devnull:
+            self._process = subprocess.Popen(
+                argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=devnull, close_fds=True, bufsize=0)
+
+    def get_name(self):
+        return self.argv[0]
+
+    def send(self, data):
+        try:
+            return os.write(self._process.stdin.fileno(), data)
+        except OSError as err:
+            if err.errno == errno.EPIPE:
+                # child process exited; signal EOF to caller
+                return 0
+            raise
+
+    def recv(self, size):
+        fd = self._process.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], self._timeout)
+        if not ready:
+            raise socket.timeout()
+        return os.read(fd, size)
+
+    def recv_ready(self):
+        fd = self._process.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], 0)
+        return bool(ready)
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def gettimeout(self):
+        return self._timeout
+
+    def setblocking(self, blocking):
+        self._timeout = (None if blocking else 0.0)
+
+    def is_alive(self):
+        return self._process.poll() is None
+
+    def close(self):
+        if self.is_alive():
+            self._process.stdin.close()
+            self._process.terminate()
+        self._process.wait()
+
+
 class SshTransport(Transport):
 
     def __init__(self, remote_frontend,
                  ignore_ssh_host_keys=False,
                  ssh_config=None,
                  username=None, port=None,
-                 keyfile=None, timeout=None):
+                 keyfile=None, timeout=None,
+                 control_persist=None):
         """
         Initialize an `SshTransport` object for operating on host `remote_frontend`.
 
@@ -437,15 +693,39 @@ class SshTransport(Transport):
 
         Additional arguments ``user``, ``port``, ``keyfile``, and
         ``timeout``, if given, override the above settings.
+
+        If optional argument `control_persist` is not ``None``,
+        connections are not made through the Python SSH library:
+        instead, the system's OpenSSH ``ssh`` command is run as a
+        "control master" process (see option ``ControlMaster`` in
+        `ssh_config(5)`), which keeps the authenticated connection open
+        for `control_persist` seconds (or for a given `Duration`)
+        after last use.  Commands are then run and files transferred
+        (via the SFTP subsystem) through the control socket, so that
+        any process using this transport, including later invocations
+        of GC3Pie commands, skips connection set up and key exchange
+        entirely.  The control socket location is read from option
+        ``ControlPath`` in the SSH configuration file, and defaults to
+        `gc3libs.Default.SSH_CONTROL_PATH`.
         """
+        # `paramiko` takes a while to load: only do it when needed
+        import paramiko
         self.ssh = paramiko.SSHClient()
         self.ignore_ssh_host_keys = ignore_ssh_host_keys
         self.sftp = None
         self._is_open = False
         self.transport_channel = None
 
+        if isinstance(control_persist, Duration):
+            control_persist = control_persist.amount(Duration.s)
+        self.control_persist = (None if control_persist is None
+                                else int(control_persist))
+
         # use SSH options, if available
         self._ssh_config = paramiko.SSHConfig()
+        # only pass an SSH configuration file to `ssh` if it was
+        # given explicitly; otherwise, let it read the default ones
+        self._ssh_config_file = ssh_config
         config_filename = os.path.expanduser(ssh_config or gc3libs.Default.SSH_CONFIG_FILE)
         if os.path.exists(config_filename):
             with open(config_filename, 'r') as config_file:
@@ -497,16 +777,134 @@ class SshTransport(Transport):
         # support for extra configuration options, not having a direct
         # equivalent in the GC3Pie configuration file
         self.proxy_command = ssh_options.get('proxycommand', None)
+        self.control_path = os.path.expanduser(ssh_options.get(
+            'controlpath', gc3libs.Default.SSH_CONTROL_PATH))
+
+    def _ssh_command(self, options=(), command=()):
+        """
+        Return command-line for running OpenSSH's ``ssh`` on the
+        remote host through the control socket.
+
+        Arguments `options` are inserted before the remote host name,
+        and arguments `command` after it.
+        """
+        argv = [
+            'ssh',
+            '-o', 'BatchMode=yes',
+            '-o', 'ControlPath=' + self.control_path,
+            '-o', ('ConnectTimeout=%d' % self.timeout),
+            '-p', str(self.port),
+        ]
+        if self._ssh_config_file:
+            argv += ['-F', os.path.expanduser(self._ssh_config_file)]
+        if self.username:
+            argv += ['-l', self.username]
+        if self.keyfile:
+            argv += ['-i', os.path.expanduser(self.keyfile)]
+        if self.proxy_command:
+            # `self.remote_frontend` is the actual host name, which
+            # might not match the `Host` stanza in the SSH config file
+            argv += ['-o', 'ProxyCommand=' + self.proxy_command]
+        if self.ignore_ssh_host_keys:
+            argv += ['-o', 'StrictHostKeyChecking=no',
+                     '-o', 'UserKnownHostsFile=' + os.devnull]
+        argv += list(options)
+        argv.append(self.remote_frontend)
+        argv += list(command)
+        return argv
+
+    def _start_control_master(self):
+        """
+        Ensure an OpenSSH control master process for the remote host
+        is running, and start one if not.
+        """
+        with open(os.devnull, 'r+') as devnull:
+            check = subprocess.call(
+                self._ssh_command(['-O', 'check']),
+                stdin=devnull, stdout=devnull, stderr=devnull,
+                close_fds=True)
+            if check == 0:
+                gc3libs.log.debug(
+                    "Re-using SSH control master for host '%s' at '%s'",
+                    self.remote_frontend, self.control_path)
+                return
+            gc3libs.log.debug(
+                "Starting SSH control master for host '%s' at '%s'"
+                " (timeout %ds, persist %ds) ...", self.remote_frontend,
+                self.control_path, self.timeout, self.control_persist)
+            gc3libs.utils.mkdir(os.path.dirname(self.control_path), 0o700)
+            # the control master runs in the background (option `-f`)
+            # once authenticated; it inherits `stderr` and would keep
+            # a pipe open, so collect error messages in a file
+            with tempfile.TemporaryFile() as errors:
+                exitcode = subprocess.call(
+                    self._ssh_command([
+                        '-o', 'ControlMaster=auto',
+                        '-o', ('ControlPersist=%d' % self.control_persist),
+                        '-N', '-f']),
+                    stdin=devnull, stdout=devnull, stderr=errors,
+                    close_fds=True)
+                if exitcode != 0:
+                    errors.seek(0)
+                    raise gc3libs.exceptions.TransportError(
+                        "Could not start SSH control master for host '%s':"
+                        " `ssh` exited with code %d: %s"
+                        % (self.remote_frontend, exitcode,
+                           errors.read().strip()))
+
+    def _connect_via_control_master(self):
+        import paramiko
+        if (self._is_open and self.sftp is not None
+                and self.sftp.get_channel().is_alive()):
+            return
+        try:
+            self._start_control_master()
+            self.sftp = paramiko.SFTPClient(
+                _PipeSocket(self._ssh_command(['-s'], ['sftp'])))
+            self._is_open = True
+        except Exception as ex:
+            gc3libs.log.error(
+                "Could not create ssh connection to %s: %s: %s",
+                self.remote_frontend, ex.__class__.__name__, ex)
+            self._is_open = False
+            raise gc3libs.exceptions.TransportError(
+                "Failed connecting to remote host '{hostname}': {msg}"
+                .format(hostname=self.remote_frontend, msg=ex))
+
+    def _execute_command_via_control_master(self, command, detach):
+        if detach:
+            # `ssh` waits until all remote processes have closed
+            # their standard I/O streams
+            command = command + ' </dev/null >/dev/null 2>&1 &'
+        gc3libs.log.debug("SshTransport running `%s`... ", command)
+        with open(os.devnull, 'r') as devnull:
+            proc = subprocess.Popen(
+                self._ssh_command(command=[command]),
+                stdin=devnull, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, close_fds=True)
+            stdout, stderr = proc.communicate()
+        if proc.returncode == 255:
+            # `ssh` uses exit code 255 to signal connection errors
+            raise gc3libs.exceptions.TransportError(
+                "`ssh` exited with code 255: %s" % stderr.strip())
+        gc3libs.log.debug(
+            "Executed command '%s' on host '%s'; exit code: %d"
+            % (command, self.remote_frontend, proc.returncode))
+        return proc.returncode, stdout, stderr
 
 
     @same_docstring_as(Transport.connect)
     def connect(self):
+        import paramiko
         if not self.remote_frontend:
             self._is_open = False
             raise gc3libs.exceptions.TransportError(
                 "Cannot connect to remote host:"
                 " no host name/IP address known yet.")
 
+        if self.control_persist is not None:
+            return self._connect_via_control_master()
+
         try:
             self.transport_channel = self.ssh.get_transport()
             if not self._is_open or self.transport_channel is None or \
@@ -627,6 +1025,7 @@ class SshTransport(Transport):
                 .format(hostname=self.remote_frontend, msg=ex))
 
     @same_docstring_as(Transport.chmod)
+    @_traced('chmod')
     def chmod(self, path, mode):
         try:
             # check connection first
@@ -638,10 +1037,14 @@ class SshTransport(Transport):
                 % (path, mode, ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.execute_command)
+    @_traced('execute_command', _output_size)
     def execute_command(self, command, detach=False):
         try:
             # check connection first
             self.connect()
+            if self.control_persist is not None:
+                return self._execute_command_via_control_master(
+                    command, detach)
             if detach:
                 command = command + ' &'
             gc3libs.log.debug("SshTransport running `%s`... ", command)
@@ -663,6 +1066,7 @@ class SshTransport(Transport):
                 % (command, ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.exists)
+    @_traced('exists')
     def exists(self, path):
         try:
             self.connect()
@@ -688,6 +1092,7 @@ class SshTransport(Transport):
         return stdout.strip()
 
     @same_docstring_as(Transport.isdir)
+    @_traced('isdir')
     def isdir(self, path):
         # SFTPClient.listdir() raises IOError(errno=2) when called
         # with a non-directory argument
@@ -703,6 +1108,7 @@ class SshTransport(Transport):
                 raise
 
     @same_docstring_as(Transport.listdir)
+    @_traced('listdir')
     def listdir(self, path):
         try:
             # check connection first
@@ -714,6 +1120,7 @@ class SshTransport(Transport):
                 % (path, self.remote_frontend, ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.makedirs)
+    @_traced('makedirs')
     def makedirs(self, path, mode=0o777):
         dirs = path.split('/')
         if '..' in dirs:
@@ -744,6 +1151,7 @@ class SshTransport(Transport):
         Transport.put(self, source, destination,
                       ignore_errors, overwrite, changed_only)
 
+    @_traced('put', _path_size(0))
     def _put_impl(self, source, destination):
         """
         Copy remote file `source` to local `destination` using SFTP.
@@ -760,6 +1168,7 @@ class SshTransport(Transport):
         Transport.get(self, source, destination,
                       ignore_nonexisting, overwrite, changed_only)
 
+    @_traced('get', _path_size(1))
     def _get_impl(self, source, destination):
         """
         Copy remote file `source` to local `destination` using SFTP.
@@ -767,6 +1176,7 @@ class SshTransport(Transport):
         self.sftp.get(source, destination)
 
     @same_docstring_as(Transport.remove)
+    @_traced('remove')
     def remove(self, path):
         try:
             gc3libs.log.debug(
@@ -781,6 +1191,7 @@ class SshTransport(Transport):
                 % (path, self.remote_frontend, ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.remove_tree)
+    @_traced('remove_tree')
     def remove_tree(self, path):
         try:
             gc3libs.log.debug("Running method 'remove_tree';"
@@ -801,6 +1212,7 @@ class SshTransport(Transport):
                    ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.stat)
+    @_traced('stat')
     def stat(self, path):
         try:
             self.connect()
@@ -812,6 +1224,7 @@ class SshTransport(Transport):
                    err.__class__.__name__, str(err)))
 
     @same_docstring_as(Transport.open)
+    @_traced('open')
     def open(self, source, mode, bufsize=-1):
         try:
             # check connection first
@@ -921,6 +1334,7 @@ class LocalTransport(Transport):
         self._is_open = True
 
     @same_docstring_as(Transport.chmod)
+    @_traced('chmod')
     def chmod(self, path, mode):
         try:
             os.chmod(path, mode)
@@ -952,6 +1366,7 @@ class LocalTransport(Transport):
             return -1
 
     @same_docstring_as(Transport.execute_command)
+    @_traced('execute_command', _output_size)
     def execute_command(self, command, detach=False):
         assert self._is_open is True, \
             "`Transport.execute_command()` called" \
@@ -975,6 +1390,7 @@ class LocalTransport(Transport):
                 % (command, ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.exists)
+    @_traced('exists')
     def exists(self, path):
         return os.path.exists(path)
 
@@ -987,6 +1403,7 @@ class LocalTransport(Transport):
         Transport.get(self, source, destination,
                       ignore_nonexisting, overwrite, changed_only)
 
+    @_traced('get', _path_size(1))
     def _get_impl(self, source, destination):
         """
         Copy local file `source` over `destination`.
@@ -1012,10 +1429,12 @@ class LocalTransport(Transport):
         return getpass.getuser()
 
     @same_docstring_as(Transport.isdir)
+    @_traced('isdir')
     def isdir(self, path):
         return os.path.isdir(path)
 
     @same_docstring_as(Transport.listdir)
+    @_traced('listdir')
     def listdir(self, path):
         assert self._is_open is True, \
             "`Transport.execute_command()` called" \
@@ -1029,6 +1448,7 @@ class LocalTransport(Transport):
                 % (path, ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.makedirs)
+    @_traced('makedirs')
     def makedirs(self, path, mode=0o777):
         try:
             os.makedirs(path, mode)
@@ -1045,6 +1465,7 @@ class LocalTransport(Transport):
         Transport.put(self, source, destination,
                       ignore_errors, overwrite, changed_only)
 
+    @_traced('put', _path_size(0))
     def _put_impl(self, source, destination):
         """
         Copy local file `source` over `destination`.
@@ -1052,6 +1473,7 @@ class LocalTransport(Transport):
         self._copy_skip_same(source, destination)
 
     @same_docstring_as(Transport.remove)
+    @_traced('remove')
     def remove(self, path):
         assert self._is_open is True, \
             "`Transport.execute_command()` called" \
@@ -1066,6 +1488,7 @@ class LocalTransport(Transport):
                 % (path, ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.remove_tree)
+    @_traced('remove_tree')
     def remove_tree(self, path):
         assert self._is_open is True, \
             "`Transport.execute_command()` called" \
@@ -1081,6 +1504,7 @@ class LocalTransport(Transport):
                 % (path, ex.__class__.__name__, str(ex)))
 
     @same_docstring_as(Transport.stat)
+    @_traced('stat')
     def stat(self, path):
         try:
             return os.stat(path)
@@ -1090,6 +1514,7 @@ class LocalTransport(Transport):
                 % (path, err.__class__.__name__, str(err)))
 
     @same_docstring_as(Transport.open)
+    @_traced('open')
     def open(self, source, mode, bufsize=0):
         try:
             return open(source, mode, bufsize)
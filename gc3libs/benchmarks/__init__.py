@@ -0,0 +1,463 @@
+#! /usr/bin/env python
+#
+"""
+Scalability benchmarks for the GC3Libs `Engine`:class: machinery.
+
+Benchmarks run a number of tasks to completion on the No-Op backend
+(see `gc3libs.backends.noop`:mod:), so that what gets measured is the
+overhead of GC3Pie's own bookkeeping: task state tracking, workflow
+logic, and persistence.  Each benchmark is identified by:
+
+* the *shape* of the task set (see `SHAPES`:data:): ``flat`` is a
+  plain list of applications, ``parallel``, ``sequential`` and
+  ``dependent`` group applications into
+  `ParallelTaskCollection`:class:, `SequentialTaskCollection`:class:,
+  and `DependentTaskCollection`:class: instances respectively;
+* the number of applications to run;
+* the engine class driving them (``Engine`` or ``BgEngine``);
+* the persistent store where tasks are saved (none, a
+  `FilesystemStore`:class:, or an SQLite-backed `SqlStore`:class:);
+* the No-Op backend transition graph (see `TRANSITION_GRAPHS`:data:).
+
+Alternatively, tasks can be run through the real SLURM backend code
+against the simulated cluster of `gc3libs.testing.fakeslurm`:mod:;
+this is much slower, as each job status update runs an external
+command, but measures the cost of the batch-system code paths.
+
+Function `run_benchmark`:func: returns a dictionary reporting the
+per-cycle latency of `Engine.progress`:meth:, the memory used per
+task, and the throughput of the persistent store.  Results can be
+compared against a baseline JSON file with `compare`:func:, in order
+to catch memory usage regressions; timings depend too much on the
+host (and on its load) to be compared against a fixed baseline.
+
+The benchmarks can be run from the command line::
+
+    python -m gc3libs.benchmarks --tasks 1000,10000 --store sqlite
+
+(use option ``--help`` to list all of them), or through the
+`pytest-benchmark <https://pypi.python.org/pypi/pytest-benchmark>`_
+plugin with ``pytest gc3libs/benchmarks``.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+# 3rd party imports
+import cli._ext.argparse as argparse
+
+# GC3Pie imports
+import gc3libs
+import gc3libs.metrics
+from gc3libs import Run
+from gc3libs.core import BgEngine, Engine
+from gc3libs.persistence import make_store
+from gc3libs.testing.helpers import (SuccessfulApp, temporary_core,
+                                     temporary_directory,
+                                     temporary_slurm_core)
+from gc3libs.workflow import (DependentTaskCollection,
+                              ParallelTaskCollection,
+                              SequentialTaskCollection)
+
+
+#: Default path of the baseline results file.
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+#: Number of applications grouped in each task collection.
+COLLECTION_SIZE = 10
+
+#: No-Op backend transition graphs; ``None`` means the backend default.
+TRANSITION_GRAPHS = {
+    # every job goes through all states, one per cycle
+    'normal': None,
+    # jobs stay in each state for two cycles on average
+    'slow': {
+        Run.State.SUBMITTED: {0.50: Run.State.RUNNING},
+        Run.State.RUNNING: {0.50: Run.State.TERMINATING},
+    },
+}
+
+#: Benchmark metrics compared against the baseline, and whether a
+#: lower value is better for each of them.  Only host-independent
+#: metrics should be listed here: wall-clock times measured on
+#: different hosts (or on the same host under a different load)
+#: cannot be meaningfully compared.
+COMPARED = {
+    'memory_per_task': True,
+}
+
+
+def _make_flat(num_tasks):
+    return [SuccessfulApp('app%d' % n) for n in xrange(num_tasks)]
+
+
+def _make_parallel(num_tasks):
+    return [ParallelTaskCollection(
+        _make_flat(min(COLLECTION_SIZE, num_tasks - start)))
+            for start in xrange(0, num_tasks, COLLECTION_SIZE)]
+
+
+def _make_sequential(num_tasks):
+    return [SequentialTaskCollection(
+        _make_flat(min(COLLECTION_SIZE, num_tasks - start)))
+            for start in xrange(0, num_tasks, COLLECTION_SIZE)]
+
+
+def _make_dependent(num_tasks):
+    result = []
+    for start in xrange(0, num_tasks, COLLECTION_SIZE):
+        coll = DependentTaskCollection()
+        apps = _make_flat(min(COLLECTION_SIZE, num_tasks - start))
+        # arrange applications in a binary tree, each one depending
+        # on its parent
+        for n, app in enumerate(apps):
+            coll.add(app, after=([apps[(n - 1) // 2]] if n else []))
+        result.append(coll)
+    return result
+
+
+#: Map shape name to a function building a list of top-level tasks
+#: that run the given number of applications in total.
+SHAPES = {
+    'flat': _make_flat,
+    'parallel': _make_parallel,
+    'sequential': _make_sequential,
+    'dependent': _make_dependent,
+}
+
+
+def _rss():
+    """
+    Return the resident set size of this process, in bytes.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize()
+    except (IOError, OSError):
+        # `ru_maxrss` is the *peak* memory usage, in kB on Linux
+        # and in bytes on MacOSX
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def _store_totals(registry):
+    saves = 0
+    seconds = 0.0
+    size = 0
+    for sample in registry.as_dict().get('store_save_seconds', []):
+        saves += sample['count']
+        seconds += sample['sum']
+    for sample in registry.as_dict().get('store_pickled_bytes_total', []):
+        size += sample['value']
+    return saves, seconds, size
+
+
+def benchmark_id(shape, num_tasks, engine='Engine', store=None,
+                 transition_graph='normal', backend='noop'):
+    """
+    Return a string identifying a benchmark in the results files.
+
+    Example::
+
+      >>> benchmark_id('flat', 1000, store='sqlite')
+      'flat/1000/Engine/sqlite/normal'
+      >>> benchmark_id('flat', 1000, backend='fakeslurm')
+      'flat/1000/Engine/none/fakeslurm'
+    """
+    return '%s/%d/%s/%s/%s' % (
+        shape, num_tasks, engine, (store or 'none'),
+        (transition_graph if backend == 'noop' else backend))
+
+
+def run_benchmark(shape, num_tasks, engine='Engine', store=None,
+                  transition_graph='normal', backend='noop',
+                  max_cycles=None):
+    """
+    Run `num_tasks` applications, arranged according to `shape`, to
+    completion and return a dictionary of measurements.
+
+    Argument `engine` is either ``Engine`` or ``BgEngine``; in the
+    latter case, the background engine main loop is invoked directly
+    from the calling thread, so that the measurements include the
+    overhead of the `BgEngine`:class: wrapper but are not affected by
+    the scheduling interval.
+
+    Argument `store` is either ``None`` (tasks are not saved),
+    ``filesystem`` or ``sqlite``; stores are created in a temporary
+    directory and removed at the end of the run.
+
+    Argument `backend` is either ``noop`` or ``fakeslurm``; in the
+    latter case, `transition_graph` is ignored and jobs are run
+    through `SlurmLrms`:class: on a simulated cluster where they
+    start and terminate immediately.
+
+    Keys in the returned dictionary are:
+
+    ``cycles``
+      number of `Engine.progress`:meth: cycles run;
+    ``cycle_seconds_mean``, ``cycle_seconds_p50``, ``cycle_seconds_p95``, ``cycle_seconds_max``
+      statistics of the wall-clock time per cycle;
+    ``phase_seconds``
+      total time spent in each phase of `Engine.progress`:meth:;
+    ``setup_seconds``
+      time taken to build tasks and add them to the engine;
+    ``total_seconds``
+      time taken to run the tasks to completion;
+    ``memory_per_task``
+      increase in resident memory after building tasks and adding
+      them to the engine, divided by the number of applications;
+    ``saves``, ``saves_per_second``, ``pickled_bytes_per_second``
+      count and throughput of `Store.save`:meth: calls.
+    """
+    if max_cycles is None:
+        max_cycles = 10 * num_tasks + 100
+    registry = gc3libs.metrics.registry
+    registry.reset()
+    with temporary_directory(prefix='gc3libs.benchmarks.') as tmpdir:
+        if store == 'filesystem':
+            persistence = make_store(os.path.join(tmpdir, 'jobs'))
+        elif store == 'sqlite':
+            persistence = make_store(
+                'sqlite:///' + os.path.join(tmpdir, 'jobs.db'))
+        elif store is None:
+            persistence = None
+        else:
+            raise ValueError("Unknown store type '%s'" % store)
+
+        if backend == 'noop':
+            cluster = temporary_core(TRANSITION_GRAPHS[transition_graph],
+                                     max_cores=(num_tasks + 1))
+        elif backend == 'fakeslurm':
+            cluster = temporary_slurm_core(max_cores=(num_tasks + 1),
+                                           runtime=0)
+        else:
+            raise ValueError("Unknown backend '%s'" % backend)
+        with cluster as core:
+            gc.collect()
+            mem0 = _rss()
+            start = time.time()
+            tasks = SHAPES[shape](num_tasks)
+            e = Engine(core, store=persistence)
+            if engine == 'BgEngine':
+                bg = BgEngine('threading', e)
+                progress = bg._perform
+            elif engine == 'Engine':
+                progress = e.progress
+            else:
+                raise ValueError("Unknown engine class '%s'" % engine)
+            for task in tasks:
+                if persistence:
+                    persistence.save(task)
+                e.add(task)
+            setup = time.time() - start
+            gc.collect()
+            mem1 = _rss()
+
+            cycles = []
+            phases = {}
+            start = time.time()
+            while len(cycles) < max_cycles:
+                t0 = time.time()
+                progress()
+                cycles.append(time.time() - t0)
+                for phase, elapsed in e.last_cycle.items():
+                    phases[phase] = phases.get(phase, 0.0) + elapsed
+                if all(task.execution.state == Run.State.TERMINATED
+                       for task in tasks):
+                    break
+            else:
+                raise RuntimeError(
+                    "Tasks not terminated after %d cycles" % max_cycles)
+            total = time.time() - start
+            e.close()
+
+        saves, save_seconds, pickled = _store_totals(registry)
+
+    return {
+        'cycles': len(cycles),
+        'cycle_seconds_mean': sum(cycles) / len(cycles),
+        'cycle_seconds_p50': _percentile(cycles, 0.50),
+        'cycle_seconds_p95': _percentile(cycles, 0.95),
+        'cycle_seconds_max': max(cycles),
+        'phase_seconds': phases,
+        'setup_seconds': setup,
+        'total_seconds': total,
+        'memory_per_task': float(max(0, mem1 - mem0)) / num_tasks,
+        'saves': saves,
+        'saves_per_second': (saves / save_seconds if save_seconds else None),
+        'pickled_bytes_per_second': (
+            pickled / save_seconds if save_seconds else None),
+    }
+
+
+def compare(results, baseline, tolerance=0.25):
+    """
+    Return list of regressions of `results` with respect to `baseline`.
+
+    Both arguments are dictionaries mapping benchmark IDs (see
+    `benchmark_id`:func:) to the dictionaries returned by
+    `run_benchmark`:func:.  A regression is reported, as a
+    human-readable string, for each metric listed in
+    `COMPARED`:data: that is worse than the baseline by more than a
+    fraction `tolerance` of it::
+
+      >>> compare({'x': {'memory_per_task': 150.0}},
+      ...         {'x': {'memory_per_task': 100.0}})
+      ['x: memory_per_task 150 is worse than baseline 100 by 50%']
+      >>> compare({'x': {'memory_per_task': 90.0}},
+      ...         {'x': {'memory_per_task': 100.0}})
+      []
+      >>> compare({'x': {'cycle_seconds_mean': 2.0}},
+      ...         {'x': {'cycle_seconds_mean': 1.0}})
+      []
+
+    Benchmarks missing from either side are ignored.
+    """
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        for metric, lower_is_better in sorted(COMPARED.items()):
+            value = results[key].get(metric)
+            base = baseline[key].get(metric)
+            if not value or not base:
+                continue
+            if lower_is_better:
+                change = (value - base) / base
+            else:
+                change = (base - value) / base
+            if change > tolerance:
+                regressions.append(
+                    '%s: %s %.4g is worse than baseline %.4g by %d%%'
+                    % (key, metric, value, base, round(100 * change)))
+    return regressions
+
+
+def _list_of(convert):
+    return (lambda arg: [convert(item) for item in arg.split(',')])
+
+
+def main(argv=None):
+    """
+    Run benchmarks as specified on the command line; return exit code.
+
+    Each benchmark is run in a separate child process.
+    """
+    parser = argparse.ArgumentParser(
+        prog='python -m gc3libs.benchmarks',
+        description="Measure GC3Libs' scalability on the No-Op backend.")
+    parser.add_argument(
+        '-n', '--tasks', type=_list_of(int), default=[1000],
+        metavar='NUM[,NUM...]',
+        help="Numbers of applications to run, e.g., '1000,10000,100000'.")
+    parser.add_argument(
+        '-s', '--shape', type=_list_of(str), default=sorted(SHAPES),
+        metavar='SHAPE[,SHAPE...]',
+        help="Task set shapes, among: %s." % str.join(', ', sorted(SHAPES)))
+    parser.add_argument(
+        '-e', '--engine', type=_list_of(str), default=['Engine'],
+        metavar='CLASS[,CLASS...]', help="Engine or BgEngine.")
+    parser.add_argument(
+        '-S', '--store', type=_list_of(str), default=['none'],
+        metavar='STORE[,STORE...]',
+        help="Persistent stores, among: none, filesystem, sqlite.")
+    parser.add_argument(
+        '-g', '--transition-graph', default='normal',
+        choices=sorted(TRANSITION_GRAPHS),
+        help="Transition graph of the No-Op backend.")
+    parser.add_argument(
+        '-B', '--backend', default='noop', choices=['noop', 'fakeslurm'],
+        help=("Run tasks on the No-Op backend, or through the SLURM"
+              " backend on a simulated cluster."))
+    parser.add_argument(
+        '-o', '--output', metavar='FILE',
+        help="Write results to FILE, in JSON format.")
+    parser.add_argument(
+        '-b', '--baseline', metavar='FILE', nargs='?', const=BASELINE_FILE,
+        help=("Compare results with the ones in FILE"
+              " (default: the baseline shipped with GC3Libs)"
+              " and exit with code 1 on regressions."))
+    parser.add_argument(
+        '-t', '--tolerance', type=float, default=0.25,
+        help=("Fraction of the baseline value by which a metric"
+              " can be worse before it is reported as a regression."))
+    args = parser.parse_args(argv)
+    gc3libs.configure_logger(logging.ERROR, 'gc3.benchmarks')
+
+    results = {}
+    for num_tasks in args.tasks:
+        for shape in args.shape:
+            for engine in args.engine:
+                for store in args.store:
+                    if store == 'none':
+                        store = None
+                    key = benchmark_id(
+                        shape, num_tasks, engine, store,
+                        args.transition_graph, args.backend)
+                    # run each benchmark in a fresh process, so that
+                    # memory freed by previous runs does not skew
+                    # the memory usage measurements
+                    pool = multiprocessing.Pool(1)
+                    try:
+                        result = pool.apply(run_benchmark, (
+                            shape, num_tasks, engine, store,
+                            args.transition_graph, args.backend))
+                    finally:
+                        pool.terminate()
+                    results[key] = result
+                    print(
+                        "%-45s %4d cycles, %8.4fs/cycle (p95 %8.4fs),"
+                        " %7.0f bytes/task, %s saves/s"
+                        % (key, result['cycles'],
+                           result['cycle_seconds_mean'],
+                           result['cycle_seconds_p95'],
+                           result['memory_per_task'],
+                           ('%.0f' % result['saves_per_second']
+                            if result['saves_per_second'] else '-')))
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True,
+                      separators=(',', ': '))
+
+    if args.baseline:
+        with open(args.baseline) as stream:
+            baseline = json.load(stream)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("REGRESSION: " + regression)
+        if regressions:
+            return 1
+    return 0
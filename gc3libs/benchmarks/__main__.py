@@ -0,0 +1,31 @@
+#! /usr/bin/env python
+#
+"""
+Run the GC3Libs scalability benchmarks; see `gc3libs.benchmarks`:mod:.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+import sys
+
+from gc3libs.benchmarks import main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
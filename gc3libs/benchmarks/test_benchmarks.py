@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+#
+"""
+Run the `gc3libs.benchmarks`:mod: suite through `pytest-benchmark`.
+
+The number of applications run by each benchmark is taken from
+environment variable ``GC3PIE_BENCHMARK_TASKS`` (a comma-separated
+list, default ``100``); measurements are stored in the
+``extra_info`` section of `pytest-benchmark`'s output.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import os
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+# GC3Pie imports
+from gc3libs.benchmarks import SHAPES, run_benchmark
+
+
+TASKS = [int(n) for n in
+         os.environ.get('GC3PIE_BENCHMARK_TASKS', '100').split(',')]
+
+
+@pytest.mark.parametrize('num_tasks', TASKS)
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+@pytest.mark.parametrize('engine', ['Engine', 'BgEngine'])
+def test_engine(benchmark, shape, num_tasks, engine):
+    if engine == 'BgEngine':
+        pytest.importorskip('apscheduler')
+    result = benchmark.pedantic(
+        run_benchmark, args=(shape, num_tasks, engine),
+        rounds=1, iterations=1)
+    benchmark.extra_info.update(result)
+
+
+@pytest.mark.parametrize('num_tasks', TASKS)
+@pytest.mark.parametrize('store', ['filesystem', 'sqlite'])
+def test_store(benchmark, store, num_tasks):
+    result = benchmark.pedantic(
+        run_benchmark, args=('flat', num_tasks, 'Engine', store),
+        rounds=1, iterations=1)
+    benchmark.extra_info.update(result)
+
+
+# main: run tests
+
+if "__main__" == __name__:
+    pytest.main(["-v", __file__])
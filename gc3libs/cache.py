@@ -0,0 +1,234 @@
+#! /usr/bin/env python
+#
+"""
+Cache results of `Application`:class: runs, keyed by their inputs.
+
+A `ResultCache` stores the output files of successful application
+runs in a content-addressed directory tree, indexed by a hash of
+everything that determines the outcome of a run: command line,
+environment, contents of input files and requested resources.  When
+given a `ResultCache` instance, `gc3libs.core.Core`:class: looks up
+each application in it upon submission: on a hit, the cached output
+files are linked (or copied) into the application's output directory
+and the application is set to ``TERMINATED`` state right away, without
+contacting any computational resource.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+import sqlalchemy as sqla
+import sqlalchemy.sql as sql
+
+# GC3Pie imports
+import gc3libs
+import gc3libs.utils
+
+
+class ResultCache(object):
+
+    """
+    Store output of successful application runs for later reuse.
+
+    The cache lives in directory `path`; an SQLite database
+    ``index.db`` in there records, for each cached result, its
+    size and the time it was stored and last used.
+
+    Optional arguments `max_size` (in bytes) and `max_age` (in seconds)
+    bound the cache size: whenever a new result is stored, entries
+    older than `max_age` are removed, and then least-recently used
+    entries are removed until the total size of the cache is below
+    `max_size`.  A value of ``None`` (default) means no limit.
+
+    Only runs that terminated with a zero return code are cached.
+
+    If `link` is ``True``, files are hard-linked into and out of the
+    cache instead of being copied (falling back to copying if
+    hard-linking fails); this saves time and space, but then
+    modifying an output file in place also alters the cached copy.
+    """
+
+    def __init__(self, path, max_size=None, max_age=None, link=False):
+        self.path = os.path.abspath(path)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.link = link
+        gc3libs.utils.mkdir(self.path)
+        self._engine = sqla.create_engine(
+            'sqlite:///' + os.path.join(self.path, 'index.db'))
+        meta = sqla.MetaData(bind=self._engine)
+        self._table = sqla.Table(
+            'results',
+            meta,
+            sqla.Column('key', sqla.String(length=40), primary_key=True),
+            sqla.Column('returncode', sqla.Integer()),
+            sqla.Column('size', sqla.Integer()),
+            sqla.Column('created', sqla.Float()),
+            sqla.Column('accessed', sqla.Float(), index=True))
+        meta.create_all()
+
+    @staticmethod
+    def key_for(app):
+        """
+        Return a string that identifies the outcome of running `app`.
+
+        The key is a hash of the application's command line,
+        environment, standard I/O redirections, requested resources,
+        and of the *contents* of local input files (remote inputs only
+        contribute their URL).
+        """
+        sha = hashlib.sha1()
+
+        def add(*values):
+            for value in values:
+                sha.update(repr(value))
+                sha.update('\0')
+
+        add(list(app.arguments),
+            sorted(app.environment.items()),
+            app.stdin, app.stdout, app.stderr, app.join,
+            sorted((str(src), dst) for src, dst in app.outputs.items()),
+            app.requested_cores,
+            str(app.requested_memory),
+            str(app.requested_walltime),
+            str(app.requested_architecture))
+        for src, dst in sorted(app.inputs.items(),
+                               key=(lambda item: item[1])):
+            add(dst)
+            if src.scheme == 'file':
+                ResultCache._hash_path(sha, src.path)
+            else:
+                add(str(src))
+        return sha.hexdigest()
+
+    @staticmethod
+    def _hash_path(sha, path):
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                sha.update(name)
+                sha.update('\0')
+                ResultCache._hash_path(sha, os.path.join(path, name))
+        else:
+            with open(path, 'rb') as stream:
+                for block in iter(lambda: stream.read(1 << 20), ''):
+                    sha.update(block)
+
+    def _dir_for(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def lookup(self, key):
+        """
+        Return the return code of the cached run with the given
+        `key`, or ``None`` if there is no such entry.
+        """
+        q = sql.select([self._table.c.returncode]).where(
+            self._table.c.key == key)
+        row = self._engine.execute(q).fetchone()
+        if row is None:
+            return None
+        if not os.path.isdir(self._dir_for(key)):
+            # cache directory was tampered with
+            self._remove(key)
+            return None
+        self._engine.execute(
+            self._table.update()
+            .where(self._table.c.key == key)
+            .values(accessed=time.time()))
+        return row[0]
+
+    def retrieve(self, key, output_dir):
+        """
+        Link or copy the files cached under `key` into `output_dir`.
+        """
+        src = self._dir_for(key)
+        for dirpath, _, filenames in os.walk(src):
+            destdir = os.path.join(output_dir, os.path.relpath(dirpath, src))
+            gc3libs.utils.mkdir(destdir)
+            for name in filenames:
+                gc3libs.utils.copyfile(os.path.join(dirpath, name),
+                                       os.path.join(destdir, name),
+                                       overwrite=True, changed_only=False,
+                                       link=self.link)
+
+    def store(self, key, returncode, output_dir):
+        """
+        Record the files in `output_dir` as the result of the run
+        identified by `key`.  If `output_dir` is ``None``, only the
+        return code is recorded.
+        """
+        dest = self._dir_for(key)
+        if os.path.exists(dest):
+            return
+        gc3libs.utils.mkdir(os.path.dirname(dest))
+        tmpdir = tempfile.mkdtemp(prefix='.tmp', dir=os.path.dirname(dest))
+        size = 0
+        if output_dir is not None:
+            for dirpath, _, filenames in os.walk(output_dir):
+                destdir = os.path.join(
+                    tmpdir, os.path.relpath(dirpath, output_dir))
+                gc3libs.utils.mkdir(destdir)
+                for name in filenames:
+                    srcpath = os.path.join(dirpath, name)
+                    gc3libs.utils.copyfile(
+                        srcpath, os.path.join(destdir, name), link=self.link)
+                    size += os.path.getsize(srcpath)
+        try:
+            os.rename(tmpdir, dest)
+        except OSError:
+            # someone else stored the same result in the meantime
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            return
+        now = time.time()
+        self._engine.execute(self._table.insert().values(
+            key=key, returncode=returncode, size=size,
+            created=now, accessed=now))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove entries exceeding the `max_age` or `max_size` limits.
+        """
+        if self.max_age is not None:
+            q = sql.select([self._table.c.key]).where(
+                self._table.c.created < time.time() - self.max_age)
+            for row in self._engine.execute(q).fetchall():
+                self._remove(row[0])
+        if self.max_size is not None:
+            total = self._engine.execute(
+                sql.select([sql.func.sum(self._table.c.size)])).scalar() or 0
+            if total <= self.max_size:
+                return
+            q = (sql.select([self._table.c.key, self._table.c.size])
+                 .order_by(self._table.c.accessed))
+            for key, size in self._engine.execute(q).fetchall():
+                if total <= self.max_size:
+                    break
+                self._remove(key)
+                total -= size
+
+    def _remove(self, key):
+        self._engine.execute(
+            self._table.delete().where(self._table.c.key == key))
+        shutil.rmtree(self._dir_for(key), ignore_errors=True)
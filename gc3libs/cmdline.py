@@ -46,14 +46,15 @@ __docformat__ = 'reStructuredText'
 
 # stdlib modules
 import fnmatch
+import itertools
 import logging
 from logging.handlers import SysLogHandler
 import math
 import os
 import os.path
 import signal
+import socket
 import sys
-from prettytable import PrettyTable
 import time
 import threading
 try:
@@ -61,15 +62,15 @@ try:
 except ImportError:
     from StringIO import StringIO
 from collections import defaultdict
-from prettytable import PrettyTable
 import SimpleXMLRPCServer as sxmlrpc
+import SocketServer
+import urlparse
 import xmlrpclib
 
 import json
-import yaml
 
-# 3rd party modules
-import daemon
+# 3rd party modules; `daemon`, `prettytable` and `yaml` are imported
+# where they are used, as most commands do not need them
 import cli  # pyCLI
 import cli.app
 import cli._ext.argparse as argparse
@@ -82,12 +83,13 @@ from gc3libs.compat import lockfile
 from gc3libs.compat.lockfile.pidlockfile import PIDLockFile
 import gc3libs.core
 import gc3libs.exceptions
+import gc3libs.metrics
 import gc3libs.persistence
 import gc3libs.utils
 import gc3libs.url
 from gc3libs.quantity import Memory, GB, Duration, hours
 from gc3libs.session import Session
-from gc3libs.poller import get_poller, get_mask_description, events as notify_events
+from gc3libs.utils import defproperty
 
 # types for command-line parsing; see
 # http://docs.python.org/dev/library/argparse.html#type
@@ -446,17 +448,9 @@ class _Script(cli.app.CommandLineApp):
 
         # Read config file(s) from command line
         self.params.config_files = self.params.config_files.split(',')
-        # interface to the GC3Libs main functionality
+        # interface to the GC3Libs main functionality; the `Core` is
+        # only created when first used (see `_core`)
         self.config = self._make_config(self.params.config_files)
-        try:
-            self._core = gc3libs.core.Core(self.config)
-        except gc3libs.exceptions.NoResources:
-            # translate internal error `NoResources` to a
-            # user-readable message.
-            raise gc3libs.exceptions.FatalError(
-                "No computational resources defined."
-                " Please edit the configuration file(s): '%s'."
-                % (str.join("', '", self.params.config_files)))
 
         # call hook methods from derived classes
         self.parse_args()
@@ -600,6 +594,41 @@ class _Script(cli.app.CommandLineApp):
                            str.join("', '", config_file_locations))
             raise
 
+    def _make_core(self):
+        """
+        Return a `gc3libs.core.Core`:class: instance for the resources
+        defined in `self.config`.
+        """
+        try:
+            return gc3libs.core.Core(self.config)
+        except gc3libs.exceptions.NoResources:
+            # translate internal error `NoResources` to a
+            # user-readable message.
+            raise gc3libs.exceptions.FatalError(
+                "No computational resources defined."
+                " Please edit the configuration file(s): '%s'."
+                % (str.join("', '", self.params.config_files)))
+
+    # commands that only inspect a session never use the `Core`, so
+    # do not spend time setting up backends for them
+    _core_instance = None
+
+    @defproperty
+    def _core():
+        """
+        The `gc3libs.core.Core`:class: instance used by this script.
+
+        It is created by `_make_core`:meth: the first time it is used.
+        """
+        def fget(self):
+            if self._core_instance is None:
+                self._core_instance = self._make_core()
+            return self._core_instance
+
+        def fset(self, value):
+            self._core_instance = value
+        return locals()
+
     def _select_resources(self, *resource_names):
         """
         Restrict resources to those listed in `resource_names`.
@@ -1124,6 +1153,15 @@ class _SessionBasedCommand(_Script):
                        help="Set the max NUMber of jobs (default: %(default)s)"
                        " in SUBMITTED or RUNNING state."
                        )
+        parser.add_param("--metrics-file",
+                       dest="metrics_file", default=None,
+                       metavar="PATH",
+                       help="After each cycle of the main loop, write"
+                       " performance metrics (time taken by each phase,"
+                       " latency of operations on resources, transferred"
+                       " and saved data volume) into file PATH; metrics are"
+                       " written in JSON format if PATH ends with '.json',"
+                       " and in Prometheus' text format otherwise.")
         parser.add_param(
             "-o",
             "--output",
@@ -1313,6 +1351,7 @@ class _SessionBasedCommand(_Script):
         try:
             # do a first round of submit/update/retrieve...
             rc = self._main_loop()
+            self._dump_metrics()
             if self.params.wait > 0:
                 self.log.info("sleeping for %d seconds..." % self.params.wait)
                 while not self._main_loop_done(rc):
@@ -1324,6 +1363,7 @@ class _SessionBasedCommand(_Script):
                         time.sleep(1)
                     # ...and now repeat the submit/update/retrieve
                     rc = self._main_loop()
+                    self._dump_metrics()
         except KeyboardInterrupt:  # gracefully intercept Ctrl+C
             sys.stderr.write(
                 "%s: Exiting upon user request (Ctrl+C)\n" % self.name)
@@ -1345,6 +1385,169 @@ class _SessionBasedCommand(_Script):
 
         return rc
 
+    def _dump_metrics(self):
+        """
+        Write metrics to the file given with option ``--metrics-file``.
+        """
+        path = getattr(self.params, 'metrics_file', None)
+        if not path:
+            return
+        try:
+            gc3libs.metrics.registry.dump(path)
+        except (IOError, OSError) as err:
+            self.log.warning(
+                "Could not write metrics to file '%s': %s", path, err)
+
+
+class _TaskSnapshot(object):
+    """
+    Read-only summary of the tasks in a `SessionBasedDaemon`:class:.
+
+    Attribute `rows` is a list of tuples `(depth, id, parent_id,
+    jobname, state, returncode, info)`, one per task, in depth-first
+    order of the task tree; `stats` holds the counts of tasks per
+    state, as returned by `Engine.stats`.
+
+    Since it only contains immutable values, a snapshot can be read
+    from any thread while the daemon keeps running tasks.
+    """
+
+    __slots__ = ('rows', 'stats', 'timestamp')
+
+    def __init__(self, tasks=(), stats=None):
+        rows = []
+        stack = [(0, None, task) for task in reversed(tasks)]
+        while stack:
+            depth, parent_id, task = stack.pop()
+            task_id = str(getattr(task, 'persistent_id', ''))
+            rows.append((depth,
+                         task_id,
+                         parent_id,
+                         getattr(task, 'jobname', ''),
+                         task.execution.state,
+                         task.execution.returncode,
+                         task.execution.info))
+            children = getattr(task, 'tasks', None)
+            if children:
+                stack.extend((depth + 1, task_id, child)
+                             for child in reversed(children))
+        self.rows = rows
+        self.stats = dict(stats or {})
+        self.timestamp = time.time()
+
+    def page(self, offset=0, limit=0, states=None, toplevel=False):
+        """
+        Iterate over rows, skipping the first `offset` matching ones
+        and stopping after `limit` ones (if positive).
+
+        If `states` is not ``None``, only return rows of tasks in one
+        of those states; if `toplevel` is ``True``, only return rows
+        of tasks that are not part of a collection.
+        """
+        rows = self.rows
+        if toplevel:
+            rows = (row for row in rows if row[0] == 0)
+        if states:
+            rows = (row for row in rows if row[4] in states)
+        return itertools.islice(
+            rows, offset, (offset + limit if limit > 0 else None))
+
+    @staticmethod
+    def as_dict(row):
+        """Return a row as a dictionary, suitable for JSON output."""
+        return dict(zip(('depth', 'id', 'parent', 'jobname',
+                         'state', 'returncode', 'info'), row))
+
+
+class _CommRequestHandler(sxmlrpc.SimpleXMLRPCRequestHandler):
+    """
+    Serve XML-RPC calls on POST requests, and task snapshots on GET.
+
+    The following URLs are served on GET:
+
+    ``/tasks``
+      Stream tasks as newline-delimited JSON, one object per line.
+      Optional query parameters `offset`, `limit`, `state` (may be
+      repeated) and `toplevel` select a part of the task list.
+
+    ``/stats``
+      Count of tasks per state, as a JSON object.
+
+    ``/metrics``
+      Performance metrics (see `gc3libs.metrics`:mod:) in Prometheus'
+      text format, or in JSON format if query parameter ``format=json``
+      is given.
+    """
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = urlparse.parse_qs(url.query)
+        snapshot = self.server.comm.get_snapshot()
+        try:
+            if url.path == '/tasks':
+                try:
+                    offset = int(params.get('offset', [0])[0])
+                    limit = int(params.get('limit', [0])[0])
+                except ValueError:
+                    self.send_error(400, "Invalid offset or limit")
+                    return
+                rows = snapshot.page(
+                    offset, limit, params.get('state', None),
+                    ('toplevel' in params))
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                for row in rows:
+                    self.wfile.write(
+                        json.dumps(_TaskSnapshot.as_dict(row)) + '\n')
+            elif url.path == '/stats':
+                self._send_body(json.dumps(self.server.comm.get_stats()),
+                                'application/json')
+            elif url.path == '/metrics':
+                if params.get('format', [None])[0] == 'json':
+                    self._send_body(gc3libs.metrics.registry.to_json(),
+                                    'application/json')
+                else:
+                    self._send_body(gc3libs.metrics.registry.to_prometheus(),
+                                    'text/plain; version=0.0.4')
+            else:
+                self.send_error(404)
+        except socket.error as err:
+            # client went away
+            self.server.comm.log.debug(
+                "Error sending data to %s: %s", self.client_address, err)
+
+    def _send_body(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ThreadingXMLRPCServer(SocketServer.ThreadingMixIn,
+                             sxmlrpc.SimpleXMLRPCServer):
+    """Serve each request in a separate thread."""
+    daemon_threads = True
+
+
+def _locked(method):
+    """
+    Run `method` while the main loop of the parent daemon is idle.
+
+    Methods that access live task objects must be decorated with this,
+    as they are served in a different thread than the main loop.
+    Since such methods may alter tasks, the task snapshot is marked
+    as outdated.
+    """
+    def wrapper(self, *args):
+        with self.parent._loop_lock:
+            self._snapshot_stale = True
+            return method(self, *args)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
 
 class _CommDaemon(object):
     portfile_name = 'daemon.port'
@@ -1353,9 +1556,21 @@ class _CommDaemon(object):
         self.parent = parent
         self.log = self.parent.log
 
-        # Start XMLRPC server
-        self.server = sxmlrpc.SimpleXMLRPCServer((listenip, 0),
-                                                 logRequests=False)
+        # read-only view of tasks, refreshed by the main loop when a
+        # client has asked for it and tasks have changed since it was
+        # taken; task counts are instead copied at every cycle
+        self._snapshot = _TaskSnapshot()
+        self._snapshot_wanted = True
+        self._snapshot_stale = True
+        self._stats = {}
+
+        # Start XMLRPC server; every request is served by a separate
+        # thread, so slow clients cannot block each other
+        self.server = _ThreadingXMLRPCServer((listenip, 0),
+                                             requestHandler=_CommRequestHandler,
+                                             logRequests=False,
+                                             allow_none=True)
+        self.server.comm = self
         self.ip, self.port = self.server.socket.getsockname()
         self.log.info("XMLRPC daemon running on %s,"
                       "port %d.", self.ip, self.port)
@@ -1383,6 +1598,59 @@ class _CommDaemon(object):
     def start(self):
         return self.server.serve_forever()
 
+    def get_snapshot(self):
+        """
+        Return the latest task snapshot, and ask the main loop for a
+        fresh one.
+        """
+        self._snapshot_wanted = True
+        return self._snapshot
+
+    def snapshot_due(self, changed=False):
+        """
+        Return ``True`` if the main loop should call `update_snapshot`.
+
+        This is the case only if a client has read the current
+        snapshot and tasks have changed since it was taken; argument
+        `changed` tells whether the current cycle altered any task.
+
+        Must be called from the main loop with the loop lock held.
+        """
+        if changed:
+            self._snapshot_stale = True
+        if self._snapshot_wanted and self._snapshot_stale:
+            self._snapshot_wanted = False
+            self._snapshot_stale = False
+            return True
+        return False
+
+    def update_snapshot(self, tasks, stats):
+        """
+        Replace the task snapshot with one of the given task list.
+
+        Must be called from the main loop; as only the main loop and
+        `_locked` methods alter tasks, this need not hold the loop lock.
+        """
+        # assignment is atomic, so readers see either the old or
+        # the new snapshot, but never a partial one
+        self._snapshot = _TaskSnapshot(tasks, stats)
+
+    def get_stats(self):
+        """
+        Return the task counts copied at the end of the last main
+        loop cycle.
+        """
+        return self._stats
+
+    def update_stats(self, stats):
+        """
+        Replace the task counts served by `get_stats`.
+
+        Must be called from the main loop with the loop lock held, as
+        `stats` may be a live view of the Engine counters.
+        """
+        self._stats = dict(stats)
+
     def stop(self):
         try:
             self.server.shutdown()
@@ -1462,31 +1730,43 @@ class _CommDaemon(object):
                 rows.extend(_CommDaemon.print_app_table(task, indent, recursive))
         return rows
 
-    def list_jobs(self, opts=None):
-        """usage: list [detail]
+    def list_jobs(self, opts=None, offset=0, limit=0):
+        """usage: list [detail|all] [OFFSET [LIMIT]]
 
-        List jobs"""
+        List jobs; only the first LIMIT jobs after the first OFFSET
+        ones are listed, if given."""
 
+        snapshot = self.get_snapshot()
+        offset = int(offset)
+        limit = int(limit)
         if opts and 'details'.startswith(opts):
-            rows = []
-            for app in self.parent.session.tasks.values():
-                rows.extend(self.print_app_table(app, '', True))
+            from prettytable import PrettyTable
             table = PrettyTable(["JobID", "Job name", "State", "rc", "Info"])
             table.align = 'l'
-            for row in rows:
-                table.add_row(row)
+            for row in snapshot.page(offset, limit):
+                depth, jobid, _, jobname, state, returncode, info = row
+                table.add_row(['  ' * depth + jobid,
+                               jobname, state, returncode, info])
             return str(table)
         elif opts and 'all'.startswith(opts):
-            return str.join(' ', [i.persistent_id for i in self.parent.session.iter_workflow()])
+            return str.join(' ', [row[1] for row in
+                                  snapshot.page(offset, limit)])
         else:
-            return str.join(' ', self.parent.session.list_ids())
+            return str.join(' ', [row[1] for row in
+                                  snapshot.page(offset, limit,
+                                                toplevel=True)])
 
-    def json_list(self):
-        """usage: json_show jobid
+    def json_list(self, offset=0, limit=0):
+        """usage: json_list [OFFSET [LIMIT]]
 
-        List jobs"""
+        List jobs; only the first LIMIT jobs after the first OFFSET
+        ones are listed, if given."""
 
-        jobids = [i.persistent_id for i in self.parent.session.iter_workflow()]
+        import yaml
+        # tasks are loaded afresh from the session store, so there is
+        # no need to wait for the main loop to release the live ones
+        jobids = [row[1] for row in
+                  self.get_snapshot().page(int(offset), int(limit))]
         jobs = []
         for jobid in jobids:
             app = self.parent.session.store.load(jobid)
@@ -1495,6 +1775,7 @@ class _CommDaemon(object):
             jobs.append(yaml.load(sapp.getvalue()))
         return json.dumps(jobs)
 
+    @_locked
     def json_show_job(self, jobid=None, *attrs):
         """usage: json_show <jobid>
 
@@ -1512,10 +1793,12 @@ class _CommDaemon(object):
                 app = all_tasks[jobid]
         else:
             app = self.parent.session.tasks[jobid]
+        import yaml
         sapp = StringIO()
         gc3libs.utils.prettyprint(app, output=sapp)
         return json.dumps(yaml.load(sapp.getvalue()))
 
+    @_locked
     def show_job(self, jobid=None, *attrs):
         """usage: show <jobid> [attributes]
 
@@ -1545,6 +1828,7 @@ class _CommDaemon(object):
         except Exception as ex:
             return "Unable to find job %s" % jobid
 
+    @_locked
     def kill_job(self, jobid=None):
         if not jobid:
             return "Usage: kill <jobid>"
@@ -1564,6 +1848,7 @@ class _CommDaemon(object):
         except Exception as ex:
             return "Error while killing job %s: %s" % (jobid, ex)
 
+    @_locked
     def remove_job(self, jobid=None):
         if not jobid:
             return "Usage: remove <jobid>"
@@ -1580,6 +1865,7 @@ class _CommDaemon(object):
         except Exception as ex:
             return "Error while removing job %s: %s" % (jobid, ex)
 
+    @_locked
     def resubmit_job(self, jobid=None):
         if not jobid:
             return "Usage: resubmit <jobid>"
@@ -1601,7 +1887,7 @@ class _CommDaemon(object):
     def stat_jobs(self):
         """Print how many jobs are in any given state"""
 
-        stats = self.parent._controller.stats()
+        stats = self.get_stats()
         return str.join('\n', ["%s:%s" % x for x in stats.items()])
 
 
@@ -1637,6 +1923,10 @@ class SessionBasedDaemon(_SessionBasedCommand):
       a comma separated list of events
       on the inbox we want to be notified of
 
+    `--coalesce-events SECONDS`
+      merge events on the same inbox file into one, and only report
+      it after no new event has occurred on that file for SECONDS
+
     `--listen IP`
       IP or hostname we want to listen to. Default is localhost.
 
@@ -1654,9 +1944,31 @@ class SessionBasedDaemon(_SessionBasedCommand):
       (the value of `--working-dir` the server was started with) where
       the `daemon.port` file created by the server is stored.
 
+    Requests are served by separate threads, so that slow clients do
+    not hold up each other.  The ``list`` command is answered from a
+    summary of the task list, which the main loop refreshes only after
+    a client has read it and tasks have changed, and ``stat`` from the
+    task counts taken at the end of every main loop cycle, so both can
+    be served at any time; ``json_list`` reads tasks from the session
+    store, and other commands wait for the current cycle to end.
+    ``list`` and
+    ``json_list`` take optional OFFSET and LIMIT arguments to fetch
+    only a part of a long task list.
+
+    The server also streams the task list as newline-delimited JSON
+    on plain HTTP GET requests, for instance::
+
+      curl 'http://HOST:PORT/tasks?state=RUNNING&offset=100&limit=50'
+      curl 'http://HOST:PORT/stats'
+
+    Performance metrics of the server (see `gc3libs.metrics`:mod:)
+    can be scraped from URL ``http://HOST:PORT/metrics``.
+
     """
 
     def cleanup(self, signume=None, frame=None):
+        for poller in getattr(self, 'pollers', []):
+            poller.close()
         self.log.debug("Waiting for communication thread to terminate")
         try:
             self.comm.stop()
@@ -1671,6 +1983,8 @@ class SessionBasedDaemon(_SessionBasedCommand):
 
     def setup(self):
         _Script.setup(self)
+        # held by the main loop while it modifies tasks
+        self._loop_lock = threading.Lock()
         self.subparsers = self.argparser.add_subparsers(title="commands")
         self.parser_server = self.subparsers.add_parser('server', help="Run the main daemon script.")
         self.parser_client = self.subparsers.add_parser('client', help="Connect to a running daemon.")
@@ -1703,6 +2017,7 @@ class SessionBasedDaemon(_SessionBasedCommand):
         self.actions['output'].default = None
 
     def setup_args(self):
+        from gc3libs.poller import events as notify_events
         self.parser_server.add_param('-F', '--foreground',
                        action='store_true',
                        default=False,
@@ -1726,6 +2041,15 @@ class SessionBasedDaemon(_SessionBasedCommand):
                        " Default: %(default)s. Available events: " +
                        str.join(', ', [i[3:] for i in notify_events.keys()]))
 
+        self.parser_server.add_param('--coalesce-events',
+                       type=float,
+                       default=None,
+                       metavar='SECONDS',
+                       help="Merge notify events on the same file into one,"
+                       " which is reported once no other event has occurred"
+                       " on that file for SECONDS. Default: report each"
+                       " event separately.")
+
         self.parser_server.add_param(
             '--listen',
             default="localhost",
@@ -1783,15 +2107,7 @@ class SessionBasedDaemon(_SessionBasedCommand):
         self.params.config_files = self.params.config_files.split(',')
         # interface to the GC3Libs main functionality
         self.config = self._make_config(self.params.config_files)
-        try:
-            self._core = gc3libs.core.Core(self.config)
-        except gc3libs.exceptions.NoResources:
-            # translate internal error `NoResources` to a
-            # user-readable message.
-            raise gc3libs.exceptions.FatalError(
-                "No computational resources defined."
-                " Please edit the configuration file(s): '%s'."
-                % (str.join("', '", self.params.config_files)))
+        self._core = self._make_core()
 
         self.params.working_dir = os.path.abspath(self.params.working_dir)
 
@@ -1819,6 +2135,7 @@ class SessionBasedDaemon(_SessionBasedCommand):
         self.notify_event_mask = 0
 
         # Ensure all the supplied states are correct
+        from gc3libs.poller import events as notify_events
         for istate in state_names:
             if istate not in notify_events:
                 raise gc3libs.exceptions.InvalidUsage(
@@ -1853,14 +2170,14 @@ class SessionBasedDaemon(_SessionBasedCommand):
         # else: log to stdout, which is the default.
 
     def __setup_pollers(self):
-        # Setup inotify on inbox directories
+        # Setup inotify on inbox directories; each poller also
+        # tracks all subdirectories of its inbox
+        from gc3libs.poller import get_poller
         self.pollers = []
-        # We need to create an inotify file descriptor for each
-        # directory, because events returned by
-        # `inotifyx.get_events()` do not contains the full path to the
-        # file.
         for inbox in self.params.inbox:
-            self.pollers.append(get_poller(inbox, self.notify_event_mask, recurse=True))
+            self.pollers.append(get_poller(inbox, self.notify_event_mask,
+                                           recurse=True,
+                                           coalesce=self.params.coalesce_events))
 
     def __setup_comm(self, listen):
         # Communication thread must run on a different thread
@@ -1926,6 +2243,7 @@ class SessionBasedDaemon(_SessionBasedCommand):
                 raise gc3libs.exceptions.FatalError(
                     "PID File %s is already present. Ensure not other daemon"
                     " is running. Delete file to continue." % lockfile)
+            import daemon
             context = daemon.DaemonContext(
                 working_directory=self.params.working_dir,
                 umask=0o002,
@@ -1966,31 +2284,48 @@ class SessionBasedDaemon(_SessionBasedCommand):
         that will be used as the scripts' exitcode.  See
         `_main_loop_exitcode` for an explanation.
         """
-        # hook method: this is the method used to add new applications
-        # to the session.
-        self.every_main_loop()
-
-        # Check if new files were created. 1s timeout
-        for poller in self.pollers:
-            events = poller.get_events()
-            for url, mask in events:
-                self.log.debug("Received notify event %s for %s",
-                               get_mask_description(mask), url)
-
-                new_jobs = self.new_tasks(self.extra.copy(),
-                                          epath=url,
-                                          emask=mask)
-                self._add_new_tasks(list(new_jobs))
-                for task in list(new_jobs):
-                    self._controller.add(task)
-
-        # advance all jobs
-        self._controller.progress()
-
-        # summary
-        stats = self._controller.stats()
-        # compute exitcode based on the running status of jobs
-        self.session.save_all()
+        comm = getattr(self, 'comm', None)
+        snapshot_tasks = None
+        # RPC requests that access tasks wait until this cycle is done
+        with self._loop_lock:
+            # hook method: this is the method used to add new applications
+            # to the session.
+            self.every_main_loop()
+
+            # Check if new files were created. 1s timeout
+            from gc3libs.poller import get_mask_description
+            for poller in self.pollers:
+                events = poller.get_events()
+                for url, mask in events:
+                    self.log.debug("Received notify event %s for %s",
+                                   get_mask_description(mask), url)
+
+                    new_jobs = self.new_tasks(self.extra.copy(),
+                                              epath=url,
+                                              emask=mask)
+                    self._add_new_tasks(list(new_jobs))
+                    for task in list(new_jobs):
+                        self._controller.add(task)
+
+            # advance all jobs
+            self._controller.progress()
+
+            # summary
+            stats = self._controller.stats()
+            # compute exitcode based on the running status of jobs
+            changed = self.session.save_all()
+
+            # publish task counts for `stat` requests, and decide
+            # whether the task list for `list` requests is needed
+            if comm is not None:
+                comm.update_stats(stats)
+                if comm.snapshot_due(changed > 0):
+                    snapshot_tasks = list(self.session.tasks.values())
+
+        # walking the whole task tree can take a while, so do it
+        # without blocking RPC requests
+        if snapshot_tasks is not None:
+            comm.update_snapshot(snapshot_tasks, comm.get_stats())
         return self._main_loop_exitcode(stats)
 
     def _main_loop_exitcode(self, stats):
@@ -2149,6 +2484,11 @@ class SessionBasedScript(_SessionBasedCommand):
         generated, where N is the quotient of
         `self.instances_per_file` by `self.instances_per_job`.
 
+        Note that all tasks yielded are kept in memory (and in the
+        session); for very large parameter sweeps, consider yielding a
+        single `gc3libs.workflow.StreamingTaskCollection`:class:
+        instead, which creates tasks only as they are needed.
+
         See also: `process_args`:meth:
         """
         inputs = self._search_for_input_files(self.params.args)
@@ -2192,6 +2532,7 @@ class SessionBasedScript(_SessionBasedCommand):
         description.
 
         """
+        from prettytable import PrettyTable
         table = PrettyTable(['state', 'n', 'n%'])
         table.align = 'r'
         table.align['n%'] = 'c'
@@ -2236,6 +2577,7 @@ class SessionBasedScript(_SessionBasedCommand):
         :param   only: Root class (or tuple of root classes) of tasks to
                        consider.
         """
+        from prettytable import PrettyTable
         table = PrettyTable(['JobID', 'Job name', 'State', 'Info'])
         table.align = 'l'
         for task in self.session:
@@ -24,9 +24,15 @@ __docformat__ = 'reStructuredText'
 
 # stdlib imports
 import ConfigParser
+import cPickle as pickle
+from cStringIO import StringIO
+import hashlib
 import inspect
+import logging
 import os
 import re
+import tempfile
+import threading
 
 # GC3Pie imports
 import gc3libs
@@ -118,6 +124,30 @@ def _legacy_parse_os_overhead(os_overhead_str):
         # will see the error message from the `Memory`/`Quantity` parser.
         return Memory(os_overhead_str)
 
+
+class _WarningsRecorder(logging.Handler):
+    """
+    Record messages of level ``WARNING`` or higher logged by the
+    thread that created this handler.
+
+    Attribute `messages` is a list of `(level, message)` pairs; it is
+    ``None`` if warnings are not enabled on `gc3libs.log`, as they
+    would then never reach this handler.
+    """
+
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self._thread = threading.current_thread().ident
+        if gc3libs.log.isEnabledFor(logging.WARNING):
+            self.messages = []
+        else:
+            self.messages = None
+
+    def emit(self, record):
+        if self.messages is not None and record.thread == self._thread:
+            self.messages.append((record.levelno, record.getMessage()))
+
+
 # the main class of this module
 
 
@@ -274,6 +304,14 @@ class Configuration(gc3libs.utils.Struct):
           No type conversion is performed on values set this way - so
           they all end up being strings!
 
+        The result of parsing is cached in file
+        `gc3libs.Default.CONFIG_CACHE_FILE` and reused as long as the
+        configuration file is not modified; warnings issued while
+        parsing the file are logged again when the cached result is
+        used.  Files defining prologue or epilogue scripts are never
+        cached, since the way their paths are resolved depends on
+        which files exist.
+
         :raise gc3libs.exceptions.ConfigurationError: if the
             configuration file does not exist, cannot be read, is
             corrupt or has wrong format.
@@ -282,7 +320,23 @@ class Configuration(gc3libs.utils.Struct):
             "Configuration.merge_file(): Reading file '%s' ...",
             filename)
         with open(filename, 'r') as stream:
-            defaults, resources, auths = self._parse(stream, filename)
+            contents = stream.read()
+        key = self._cache_key(filename, contents)
+        cached = self._cache_lookup(filename, key)
+        if cached is None:
+            recorder = _WarningsRecorder()
+            gc3libs.log.addHandler(recorder)
+            try:
+                parsed = self._parse(StringIO(contents), filename)
+            finally:
+                gc3libs.log.removeHandler(recorder)
+            if self._cacheable(parsed):
+                self._cache_store(filename, key, parsed, recorder.messages)
+        else:
+            parsed, messages = cached
+            for level, msg in (messages or []):
+                gc3libs.log.log(level, msg)
+        defaults, resources, auths = parsed
         for name, values in resources.iteritems():
             self.resources[name].update(values)
         for name, values in auths.iteritems():
@@ -291,6 +345,133 @@ class Configuration(gc3libs.utils.Struct):
             if not name.startswith('_'):
                 self[name] = value
 
+    # Parsed configuration files are cached in file
+    # `gc3libs.Default.CONFIG_CACHE_FILE`, so that command-line tools
+    # run in a loop need not parse and convert the same files over and
+    # over again.  The cache file holds a dictionary, mapping the
+    # absolute path of each configuration file to a triple `(key,
+    # parsed, messages)`, where `parsed` is the `(defaults, resources,
+    # auths)` triple returned by `_parse`, `messages` lists the
+    # `(level, message)` pairs of warnings logged by `_parse`, and
+    # `key` is computed by `_cache_key`; an entry is only used if its
+    # key matches the current one.
+
+    # max number of configuration files remembered in the cache file
+    _cache_max_entries = 32
+
+    def _cache_key(self, filename, contents):
+        """
+        Return a string identifying the result of parsing `contents`.
+
+        Besides the contents of the configuration file, the result of
+        `_parse` depends on the file location (relative paths are
+        resolved against it), on the current directory, and on the
+        class and GC3Pie version doing the parsing.
+        """
+        filename = os.path.abspath(filename)
+        try:
+            mtime = os.stat(filename).st_mtime
+        except OSError:
+            mtime = None
+        sha = hashlib.sha1()
+        for value in (gc3libs.__version__,
+                      self.__class__.__module__, self.__class__.__name__,
+                      filename, mtime, os.getcwd(), contents):
+            sha.update(repr(value))
+            sha.update('\0')
+        return sha.hexdigest()
+
+    def _cacheable(self, parsed):
+        """
+        Return ``True`` if the result of `_parse` can be cached.
+
+        The value of prologue and epilogue items is resolved against
+        different directories depending on whether a file by that
+        name exists (see `_perform_filename_conversion`), so files
+        defining any of them cannot be cached.
+        """
+        defaults, resources, auths = parsed
+        for values in resources.itervalues():
+            for key in values:
+                if self._path_key_regexp.match(key):
+                    return False
+        return True
+
+    @staticmethod
+    def _cache_read():
+        path = gc3libs.Default.CONFIG_CACHE_FILE
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as stream:
+                return pickle.load(stream)
+        except Exception as err:
+            if os.path.exists(path):
+                gc3libs.log.debug(
+                    "Ignoring unreadable configuration cache file '%s': %s",
+                    path, err)
+            return None
+
+    def _cache_lookup(self, filename, key):
+        """
+        Return the cached result of parsing `filename`, or ``None``.
+        """
+        cache = self._cache_read()
+        if not cache:
+            return None
+        try:
+            cached_key, parsed, messages = cache[os.path.abspath(filename)]
+        except (KeyError, TypeError, ValueError):
+            return None
+        if cached_key != key:
+            return None
+        if messages is None and gc3libs.log.isEnabledFor(logging.WARNING):
+            # warnings were not logged (hence not recorded) when the
+            # file was parsed, but they would be now
+            return None
+        gc3libs.log.debug(
+            "Configuration.merge_file(): Using cached contents of file '%s'.",
+            filename)
+        return parsed, messages
+
+    def _cache_store(self, filename, key, parsed, messages):
+        """
+        Record `parsed` as the result of parsing `filename`, and
+        `messages` as the warnings logged meanwhile.
+
+        Errors are logged and otherwise ignored: the cache is just an
+        optimization.  The cache file is replaced atomically, so
+        concurrent readers see either the old or the new version.
+        """
+        path = gc3libs.Default.CONFIG_CACHE_FILE
+        if not path:
+            return
+        cache = self._cache_read()
+        if not isinstance(cache, dict):
+            cache = {}
+        filename = os.path.abspath(filename)
+        cache.pop(filename, None)
+        while len(cache) >= self._cache_max_entries:
+            # drop some entry to make room; there is no point in
+            # tracking usage, as entries are refreshed anyway when
+            # their configuration file is parsed again
+            cache.popitem()
+        cache[filename] = (key, parsed, messages)
+        tmp = None
+        try:
+            dirname = os.path.dirname(os.path.abspath(path))
+            gc3libs.utils.mkdir(dirname)
+            fd, tmp = tempfile.mkstemp(prefix='.gc3pie.conf', dir=dirname)
+            with os.fdopen(fd, 'wb') as stream:
+                pickle.dump(cache, stream, pickle.HIGHEST_PROTOCOL)
+            os.rename(tmp, path)
+        except Exception as err:
+            gc3libs.log.debug(
+                "Could not write configuration cache file '%s': %s",
+                path, err)
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+
     def _parse(self, stream, filename=None):
         """
         Read configuration file and return a `(defaults, resources, auths)`
@@ -527,6 +708,7 @@ class Configuration(gc3libs.utils.Struct):
         'max_memory_per_core' : _legacy_parse_memory,
         'max_walltime'        : _legacy_parse_duration,
         'port'                : int,
+        'ssh_control_persist' : Duration,
         'vm_os_overhead'      : _legacy_parse_os_overhead,
         # LSF-specific
         'lsf_continuation_line_prefix_length': int,
@@ -642,35 +824,50 @@ class Configuration(gc3libs.utils.Struct):
         backend.
         """
         resources = {}
-        for name, resdict in self.resources.iteritems():
-            try:
-                backend = self._make_resource(resdict)
-                if backend is None:  # resource is disabled
-                    continue
-                assert name == backend.name
-            except Exception as err:
-                # Print the backtrace only if loglevel is DEBUG or
-                # more.
-                exc_info = gc3libs.log.level <= gc3libs.logging.DEBUG
-                gc3libs.log.warning(
-                    "Failed creating backend for resource '%s' of type '%s':"
-                    " %s: %s",
-                    resdict.get(
-                        'name',
-                        '(unknown name)'),
-                    resdict.get(
-                        'type',
-                        '(unknown type)'),
-                    err.__class__.__name__,
-                    str(err),
-                    exc_info=exc_info)
-                if ignore_errors:
-                    continue
-                else:
-                    raise
-            resources[name] = backend
+        for name in self.resources.keys():
+            backend = self.make_resource(name, ignore_errors)
+            if backend is not None:
+                resources[name] = backend
         return resources
 
+    def make_resource(self, name, ignore_errors=True):
+        """
+        Make the backend object corresponding to resource `name`.
+
+        Return ``None`` if the resource is disabled, or if the backend
+        could not be constructed and `ignore_errors` is ``True`` (the
+        default); otherwise, errors in constructing the backend are
+        propagated to the caller.  See `make_resources`:meth: for
+        details.
+        """
+        resdict = self.resources[name]
+        try:
+            backend = self._make_resource(resdict)
+            if backend is None:  # resource is disabled
+                return None
+            assert name == backend.name
+        except Exception as err:
+            # Print the backtrace only if loglevel is DEBUG or
+            # more.
+            exc_info = gc3libs.log.level <= gc3libs.logging.DEBUG
+            gc3libs.log.warning(
+                "Failed creating backend for resource '%s' of type '%s':"
+                " %s: %s",
+                resdict.get(
+                    'name',
+                    '(unknown name)'),
+                resdict.get(
+                    'type',
+                    '(unknown type)'),
+                err.__class__.__name__,
+                str(err),
+                exc_info=exc_info)
+            if ignore_errors:
+                return None
+            else:
+                raise
+        return backend
+
     def _make_resource(self, resdict):
         """
         Return a backend initialized from the key/value pairs in `resdict`.
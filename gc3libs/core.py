@@ -19,13 +19,14 @@ Top-level classes for task execution and control.
 # Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 2110-1301 USA
 #
 
-from collections import defaultdict
+from collections import defaultdict, MutableMapping
 from fnmatch import fnmatch
 import functools
 import itertools
 import os
 import posix
 import sys
+import threading
 import time
 import tempfile
 from warnings import warn
@@ -36,6 +37,7 @@ import gc3libs
 import gc3libs.debug
 from gc3libs import Application, Run, Task
 import gc3libs.exceptions
+import gc3libs.metrics
 from gc3libs.quantity import Duration
 import gc3libs.utils as utils
 
@@ -118,6 +120,152 @@ class MatchMaker(object):
         return targets
 
 
+class LazyResourceDict(MutableMapping):
+    """
+    Map resource names to backend objects, constructing each backend
+    only when it is first accessed.
+
+    Keys are the names of the resources defined in `cfg` (a
+    `gc3libs.config.Configuration`:class: instance) that are not
+    explicitly disabled.  Looking up a name constructs the
+    corresponding backend with `cfg.make_resource`; if that fails (and
+    `ignore_errors` is ``True``), the name is dropped from the mapping
+    and a `KeyError` is raised.  Hence the length of the mapping and
+    its keys reflect the configured resources, whereas `values()`
+    (and the other value-returning methods) construct all backends
+    and only return those that could be successfully created.
+
+    Backends are constructed while holding a lock, so that each one
+    is constructed only once even if looked up from several threads
+    at the same time.
+
+    Example::
+
+      >>> import gc3libs.config
+      >>> from gc3libs.quantity import GB, hours
+      >>> cfg = gc3libs.config.Configuration()
+      >>> cfg.resources['test'].update(
+      ...     name='test', type='shellcmd', transport='local', auth='none',
+      ...     max_cores_per_job=1, max_memory_per_core=1*GB,
+      ...     max_walltime=8*hours, max_cores=2,
+      ...     architecture=Run.Arch.X86_64)
+      >>> resources = LazyResourceDict(cfg)
+      >>> resources.keys()
+      ['test']
+      >>> resources.touched()
+      []
+      >>> resources['test'].name
+      'test'
+      >>> [lrms.name for lrms in resources.touched()]
+      ['test']
+
+    """
+
+    def __init__(self, cfg, ignore_errors=True):
+        self._cfg = cfg
+        self._ignore_errors = ignore_errors
+        self._names = [
+            name for name, resdict in cfg.resources.items()
+            if resdict.get('enabled', True)
+        ]
+        self._backends = {}
+        # resources that must be disabled as soon as they are constructed
+        self._disabled = set()
+        # serialize construction of backends
+        self._lock = threading.RLock()
+
+    def __getitem__(self, name):
+        try:
+            return self._backends[name]
+        except KeyError:
+            pass
+        with self._lock:
+            # another thread may have constructed (or failed to
+            # construct) the backend while we waited for the lock
+            if name in self._backends:
+                return self._backends[name]
+            if name not in self._names:
+                raise KeyError(name)
+            backend = self._cfg.make_resource(name, self._ignore_errors)
+            if backend is None:
+                self._names.remove(name)
+                raise KeyError(name)
+            if name in self._disabled:
+                backend.enabled = False
+            self._backends[name] = backend
+            return backend
+
+    def __setitem__(self, name, backend):
+        with self._lock:
+            if name not in self._names:
+                self._names.append(name)
+            self._backends[name] = backend
+
+    def __delitem__(self, name):
+        with self._lock:
+            self._names.remove(name)
+            self._backends.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(list(self._names))
+
+    def __len__(self):
+        return len(self._names)
+
+    def iteritems(self):
+        for name in list(self._names):
+            try:
+                yield (name, self[name])
+            except KeyError:
+                # backend could not be constructed
+                pass
+
+    def itervalues(self):
+        for _, backend in self.iteritems():
+            yield backend
+
+    def items(self):
+        return list(self.iteritems())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def disable(self, name):
+        """
+        Disable resource `name`, without constructing its backend.
+        """
+        with self._lock:
+            if name in self._backends:
+                self._backends[name].enabled = False
+            else:
+                self._disabled.add(name)
+
+    def count_enabled(self):
+        """
+        Return the number of resources that are, or could be, enabled.
+
+        Resources whose backend has not been constructed yet are
+        counted unless they have been disabled with `disable`:meth:.
+        """
+        count = 0
+        for name in self._names:
+            if name in self._backends:
+                count += int(self._backends[name].enabled)
+            elif name not in self._disabled:
+                count += 1
+        return count
+
+    def touched(self):
+        """
+        Return list of the backends that have been constructed so far.
+        """
+        return [self._backends[name]
+                for name in self._names if name in self._backends]
+
+
 class Core(object):
     """
     Core operations: submit, update state, retrieve (a snapshot of) output,
@@ -129,17 +277,29 @@ class Core(object):
     Operations are always performed by a `Core` object.  `Core` implements
     an overlay Grid on the resources specified in the configuration file.
 
-    Initialization of a `Core`:class: instance also initializes all
-    resources in the passed `Configuration`:class: instance.  By default,
-    GC3Pie's `Core` objects will ignore errors in initializing resources,
-    and only raise an exception if *no* resources can be initialized.
-    This can be changed by either passing an optional argument
-    ``resource_errors_are_fatal=True``, or by setting the environmental
-    variable ``GC3PIE_RESOURCE_INIT_ERRORS_ARE_FATAL`` to ``yes`` or ``1``.
+    The backend for each resource in the passed
+    `Configuration`:class: instance is only initialized when it is
+    first used (see `LazyResourceDict`:class:), so that operations on
+    a single job do not pay for connecting to all the configured
+    resources.  By default, GC3Pie's `Core` objects will ignore errors
+    in initializing resources, and only raise an exception if *no*
+    resources can be initialized.  This can be changed by either
+    passing an optional argument ``resource_errors_are_fatal=True``,
+    or by setting the environmental variable
+    ``GC3PIE_RESOURCE_INIT_ERRORS_ARE_FATAL`` to ``yes`` or ``1``; in
+    this case, all resources are initialized when the `Core` object
+    is created, and the first error is propagated to the caller.
+
+    If optional argument `result_cache` is a `gc3libs.cache.ResultCache`
+    instance, then applications whose result is found in the cache are
+    not submitted to any resource: cached output files are placed in the
+    application's output directory and the application goes to
+    ``TERMINATED`` state immediately.  Output of applications that
+    terminate successfully is added to the cache.
     """
 
     def __init__(self, cfg, matchmaker=MatchMaker(),
-                 resource_errors_are_fatal=None):
+                 resource_errors_are_fatal=None, result_cache=None):
         # propagate resource init errors?
         if resource_errors_are_fatal is None:
             # get result from the environment
@@ -150,8 +310,10 @@ class Core(object):
         self.auto_enable_auth = cfg.auto_enable_auth
 
         # init backends
-        self.resources = cfg.make_resources(
-            ignore_errors=(not resource_errors_are_fatal))
+        self.resources = LazyResourceDict(
+            cfg, ignore_errors=(not resource_errors_are_fatal))
+        if resource_errors_are_fatal:
+            self.resources.values()
         if len(self.resources) == 0:
             raise gc3libs.exceptions.NoResources(
                 "No resources given to initialize `gc3libs.core.Core` object!")
@@ -159,6 +321,19 @@ class Core(object):
         # init matchmaker
         self.matchmaker = matchmaker
 
+        self.result_cache = result_cache
+
+        # record latency of backend operations here
+        self.metrics = gc3libs.metrics.registry
+
+    def _timed(self, lrms, operation):
+        """
+        Return context manager recording the time taken by `operation`
+        on resource `lrms`.
+        """
+        return self.metrics.timer(
+            'backend_seconds', resource=lrms.name, operation=operation)
+
     def get_backend(self, name):
         try:
             return self.resources[name]
@@ -187,16 +362,16 @@ class Core(object):
           Calling this method modifies the configured list of
           resources in-place.
         """
+        if isinstance(match, basestring):
+            # no need to construct backends to match their names
+            for name in self.resources.keys():
+                if not fnmatch(name, match):
+                    self.resources.disable(name)
+            return self.resources.count_enabled()
         enabled = 0
         for lrms in self.resources.itervalues():
-            try:
-                if not match(lrms):
-                    lrms.enabled = False
-            # we expect `TypeError: 'str' object is not callable` in case
-            # argument `match` is a string
-            except TypeError:
-                if not fnmatch(lrms.name, match):
-                    lrms.enabled = False
+            if not match(lrms):
+                lrms.enabled = False
             if lrms.enabled:
                 enabled += 1
         return enabled
@@ -237,7 +412,8 @@ class Core(object):
 
         try:
             lrms = self.get_backend(app.execution.resource_name)
-            lrms.free(app)
+            with self._timed(lrms, 'free'):
+                lrms.free(app)
         except AttributeError:
             gc3libs.log.debug(
                 "Core.__free_application():"
@@ -314,6 +490,10 @@ class Core(object):
                         "Input file '%s' does not exist" % input_ref.path,
                         do_log=True)
 
+        if self.result_cache is not None:
+            if self.__fetch_from_cache(app):
+                return
+
         if targets is not None:
             assert len(targets) > 0
         else:  # targets is None
@@ -359,7 +539,8 @@ class Core(object):
             try:
                 job.timestamp[Run.State.NEW] = time.time()
                 job.info = ("Submitting to '%s'" % (resource.name,))
-                resource.submit_job(app)
+                with self._timed(resource, 'submit_job'):
+                    resource.submit_job(app)
             except gc3libs.exceptions.LRMSSkipSubmissionToNextIteration as ex:
                 gc3libs.log.info("Submission of job %s delayed", app)
                 # Just raise the exception
@@ -390,6 +571,54 @@ class Core(object):
         else:
             return
 
+    def __fetch_from_cache(self, app):
+        """
+        Look up `app` in the result cache; if found, copy the cached
+        output into `app.output_dir`, set `app` to ``TERMINATED``
+        state, and return ``True``.  Return ``False`` otherwise.
+        """
+        job = app.execution
+        key = self.result_cache.key_for(app)
+        returncode = self.result_cache.lookup(key)
+        if returncode is None:
+            # remember key so we can store results when done
+            job.result_cache_key = key
+            return False
+        gc3libs.log.info("Result of %s found in cache, skipping submission.",
+                         app)
+        # pylint: disable=protected-access
+        download_dir = app._get_download_dir(None)
+        if download_dir is not None:
+            utils.mkdir_with_backup(download_dir)
+            self.result_cache.retrieve(key, download_dir)
+            app.output_dir = os.path.abspath(download_dir)
+        job.result_cache_key = None
+        job.timestamp[Run.State.NEW] = time.time()
+        job.returncode = returncode
+        job.info = "Result retrieved from cache"
+        job.state = Run.State.TERMINATED
+        app.changed = True
+        return True
+
+    def __store_in_cache(self, app, download_dir):
+        """
+        Add the output of `app` (as found in `download_dir`) to the
+        result cache, if `app` was looked up at submission time and
+        exited successfully.
+        """
+        job = app.execution
+        key = getattr(job, 'result_cache_key', None)
+        if key is None or job.returncode != 0:
+            return
+        job.result_cache_key = None
+        try:
+            self.result_cache.store(key, job.returncode, download_dir)
+        # pylint: disable=broad-except
+        except Exception as err:
+            gc3libs.log.warning(
+                "Could not store output of %s in result cache: %s: %s",
+                app, err.__class__.__name__, err)
+
     def __submit_task(self, task, resubmit, targets, **extra_args):
         """Implementation of `submit` on generic `Task` objects."""
         extra_args.setdefault('auto_enable_auth', self.auto_enable_auth)
@@ -449,7 +678,8 @@ class Core(object):
                 ]:
                     lrms = self.get_backend(app.execution.resource_name)
                     try:
-                        state = lrms.update_job_state(app)
+                        with self._timed(lrms, 'update_job_state'):
+                            state = lrms.update_job_state(app)
                     # pylint: disable=broad-except
                     except Exception as ex:
                         gc3libs.log.debug(
@@ -553,7 +783,8 @@ class Core(object):
             task.update_state()
 
     def fetch_output(self, app, download_dir=None,
-                     overwrite=False, changed_only=True, **extra_args):
+                     overwrite=False, changed_only=True, transfer=None,
+                     **extra_args):
         """
         Retrieve output into local directory `app.output_dir`.
 
@@ -593,6 +824,14 @@ class Core(object):
         of the states `NEW` or `SUBMITTED`; an
         `OutputNotAvailableError` exception is thrown in these cases.
 
+        If optional argument `transfer` is not ``None``, it must be a
+        `gc3libs.utils.WorkerPool.Job` running `transfer_output`:meth:
+        on `app` with the same arguments: files are then not
+        downloaded again, and the outcome of `transfer` is processed
+        instead.  This allows running the file transfer in a
+        background thread, while `app` is only modified (and its
+        `terminated` handler run) in the thread calling this method.
+
         :raise: `gc3libs.exceptions.OutputNotAvailableError` if no
                 output can be fetched from the remote job (e.g., the
                 Application/Task object is in `NEW` or `SUBMITTED`
@@ -604,14 +843,66 @@ class Core(object):
             "which is not a `Task` instance."
         if isinstance(app, Application):
             self.__fetch_output_application(
-                app, download_dir, overwrite, changed_only, **extra_args)
+                app, download_dir, overwrite, changed_only, transfer,
+                **extra_args)
         else:
             # generic `Task` object
             self.__fetch_output_task(
                 app, download_dir, overwrite, changed_only, **extra_args)
 
+    def transfer_output(self, app, download_dir=None,
+                        overwrite=False, changed_only=True):
+        """
+        Download the output files of `app`, without altering it.
+
+        This performs the file transfer part of `fetch_output`:meth:
+        (which see for the meaning of arguments) and nothing else: no
+        attribute of `app` is changed and no state transition happens.
+        It is therefore safe to run this method in a background thread,
+        and then pass the resulting job to `fetch_output`:meth: with
+        the `transfer` argument.
+
+        Return the path to the download directory, or ``None`` if
+        `app` does not produce any output.
+        """
+        job = app.execution
+        if job.state in [Run.State.NEW, Run.State.SUBMITTED]:
+            raise gc3libs.exceptions.OutputNotAvailableError(
+                "Output not available: '%s' currently in state '%s'"
+                % (app, app.execution.state))
+        # pylint: disable=protected-access
+        download_dir = app._get_download_dir(download_dir)
+        if download_dir is not None:
+            self.__prepare_download_dir(download_dir, overwrite)
+            self.__get_results(app, download_dir, overwrite, changed_only)
+        return download_dir
+
+    @staticmethod
+    def __prepare_download_dir(download_dir, overwrite):
+        """Create (or clean) directory `download_dir`."""
+        try:
+            if overwrite:
+                if not os.path.exists(download_dir):
+                    os.makedirs(download_dir)
+            else:
+                utils.mkdir_with_backup(download_dir)
+        except Exception as ex:
+            gc3libs.log.error(
+                "Failed creating download directory '%s': %s: %s",
+                download_dir,
+                ex.__class__.__name__,
+                str(ex))
+            raise
+
+    def __get_results(self, app, download_dir, overwrite, changed_only):
+        """Download output files of `app` from its resource."""
+        lrms = self.get_backend(app.execution.resource_name)
+        with self._timed(lrms, 'get_results'):
+            lrms.get_results(app, download_dir, overwrite, changed_only)
+
     def __fetch_output_application(
-            self, app, download_dir, overwrite, changed_only, **extra_args):
+            self, app, download_dir, overwrite, changed_only, transfer,
+            **extra_args):
         """Implementation of `fetch_output` on `Application` objects."""
         job = app.execution
         if job.state in [Run.State.NEW, Run.State.SUBMITTED]:
@@ -628,25 +919,17 @@ class Core(object):
         download_dir = app._get_download_dir(download_dir)
 
         if download_dir is not None:
-            # Prepare/Clean download dir
-            try:
-                if overwrite:
-                    if not os.path.exists(download_dir):
-                        os.makedirs(download_dir)
-                else:
-                    utils.mkdir_with_backup(download_dir)
-            except Exception as ex:
-                gc3libs.log.error(
-                    "Failed creating download directory '%s': %s: %s",
-                    download_dir,
-                    ex.__class__.__name__,
-                    str(ex))
-                raise
+            if transfer is None:
+                self.__prepare_download_dir(download_dir, overwrite)
 
             # download job output
             try:
-                lrms = self.get_backend(job.resource_name)
-                lrms.get_results(app, download_dir, overwrite, changed_only)
+                if transfer is None:
+                    self.__get_results(
+                        app, download_dir, overwrite, changed_only)
+                else:
+                    # re-raises any error from the background transfer
+                    transfer.result()
                 # clear previous data staging errors
                 if job.signal == Run.Signals.DataStagingFailure:
                     job.signal = 0
@@ -685,6 +968,16 @@ class Core(object):
             if job.state == Run.State.TERMINATING:
                 gc3libs.log.debug("Final output of '%s' retrieved", app)
 
+        elif transfer is not None:
+            # nothing was downloaded, but re-raise any error anyway
+            transfer.result()
+
+        if (self.result_cache is not None
+                and job.state == Run.State.TERMINATING):
+            # cache output as downloaded, i.e., before the
+            # `terminated()` handler gets a chance to alter it
+            self.__store_in_cache(app, download_dir)
+
         return Task.fetch_output(app, download_dir)
 
     def __fetch_output_task(
@@ -696,8 +989,16 @@ class Core(object):
     def get_resources(self, **extra_args):
         """
         Return list of resources configured into this `Core` instance.
+
+        This initializes the backends of all resources; a
+        `NoResources` error is raised if none can be initialized.
         """
-        return [lrms for lrms in self.resources.itervalues()]
+        resources = self.resources.values()
+        if len(resources) == 0:
+            raise gc3libs.exceptions.NoResources(
+                "Could not initialize any computational resource"
+                " - please check log and configuration file.")
+        return resources
 
     def kill(self, app, **extra_args):
         """
@@ -722,7 +1023,8 @@ class Core(object):
         #     'auto_enable_auth', self.auto_enable_auth)
         try:
             lrms = self.get_backend(job.resource_name)
-            lrms.cancel_job(app)
+            with self._timed(lrms, 'cancel_job'):
+                lrms.cancel_job(app)
         except AttributeError:
             # A job in state NEW does not have a `resource_name`
             # attribute.
@@ -818,7 +1120,8 @@ class Core(object):
             lrms = self.get_backend(job.resource_name)
             local_file = tempfile.NamedTemporaryFile(
                 suffix='.tmp', prefix='gc3libs.')
-            lrms.peek(app, remote_filename, local_file, offset, size)
+            with self._timed(lrms, 'peek'):
+                lrms.peek(app, remote_filename, local_file, offset, size)
             local_file.flush()
             local_file.seek(0)
 
@@ -843,13 +1146,14 @@ class Core(object):
         """
         if resources is all:
             resources = self.resources.values()
-        for lrms in self.resources.itervalues():
+        for lrms in resources:
             try:
                 if not lrms.enabled:
                     continue
                 # auto_enable_auth = extra_args.get(
                 #     'auto_enable_auth', self.auto_enable_auth)
-                lrms.get_resource_status()
+                with self._timed(lrms, 'get_resource_status'):
+                    lrms.get_resource_status()
                 lrms.updated = True
             except gc3libs.exceptions.UnrecoverableError as err:
                 # disable resource -- there's no point in
@@ -886,7 +1190,8 @@ class Core(object):
         Used to invoke explicitly the destructor on objects
         e.g. LRMS
         """
-        for lrms in self.resources.itervalues():
+        # no need to construct backends just to close them
+        for lrms in self.resources.touched():
             lrms.close()
 
     # compatibility with the `Engine` interface
@@ -899,7 +1204,7 @@ class Core(object):
         """
         pass
 
-    def remove(self, task):
+    def remove(self, task, purge=False):
         """
         This method is here just to allow `Core` and `Engine` objects
         to be used interchangeably.  It's effectively a no-op, as it makes
@@ -1117,6 +1422,15 @@ def _contained(elt, lst):
     return False
 
 
+def _remove(elt, lst):
+    i = id(elt)
+    for n, item in enumerate(lst):
+        if i == id(item):
+            del lst[n]
+            return
+    raise ValueError("Task %s not in list" % elt)
+
+
 class Engine(object):  # pylint: disable=too-many-instance-attributes
     """
     Manage a collection of tasks, until a terminal state is reached.
@@ -1185,6 +1499,35 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
           ``False`` but this can (and should!) be changed in future
           releases.
 
+    `max_transfers`
+      If >0, retrieve output of ``TERMINATING`` applications in the
+      background, using at most this many threads: `progress`:meth:
+      then only starts the transfers and returns, and tasks move to
+      ``TERMINATED`` state in a later cycle, once their transfer is
+      complete.  Transfers failing with a
+      `RecoverableDataStagingError` are retried at the next cycle.
+      If 0 (default), output is retrieved synchronously.
+
+    `max_transfers_per_resource`
+      Maximum number of concurrent background transfers from any
+      single resource (default: 1).  Only relevant if
+      `max_transfers` is >0.
+
+    In addition, the following attributes provide insight into
+    where `progress`:meth: spends its time:
+
+    `metrics`
+      The `gc3libs.metrics.Registry`:class: instance where timings
+      of each phase of `progress`:meth: are recorded, together with
+      the `Core`:class: and I/O metrics; see `gc3libs.metrics`:mod:
+      for a list.
+
+    `last_cycle`
+      Dictionary mapping each phase of the last `progress`:meth:
+      cycle (``update``, ``kill``, ``stopped``, ``submit``,
+      ``fetch_output``, and ``total``) to the time it took, in
+      seconds.
+
     Any of the above can also be set by passing a keyword argument to
     the constructor (assume ``g`` is a `Core`:class: instance)::
 
@@ -1202,7 +1545,9 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
                  retrieve_running=False,
                  retrieve_overwrites=False,
                  retrieve_changed_only=True,
-                 forget_terminated=False):
+                 forget_terminated=False,
+                 max_transfers=0,
+                 max_transfers_per_resource=1):
         """
         Create a new `Engine` instance.  Arguments are as follows:
 
@@ -1230,6 +1575,9 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         :param bool retrieve_running:
         :param bool retrieve_overwrites:
         :param bool retrieve_changed_only:
+        :param bool forget_terminated:
+        :param int max_transfers:
+        :param int max_transfers_per_resource:
           Optional keyword arguments; see `Engine`:class: for a description.
 
         """
@@ -1243,6 +1591,15 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         self._core = controller
         self._store = store
         self._tasks_by_id = {}
+        # IDs of tasks to delete from the store at the end of the
+        # current `progress` cycle (``None`` outside of it)
+        self._to_purge = None
+        self._transfers = {}
+        self._transfers_pool = None
+
+        # performance metrics
+        self.metrics = gc3libs.metrics.registry
+        self.last_cycle = {}
 
         # public attributes
         self.can_submit = can_submit
@@ -1255,6 +1612,8 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         self.retrieve_overwrites = retrieve_overwrites
         self.retrieve_changed_only = retrieve_changed_only
         self.forget_terminated = forget_terminated
+        self.max_transfers = max_transfers
+        self.max_transfers_per_resource = max_transfers_per_resource
 
         # init counters/statistics
         self._counts = {}
@@ -1326,16 +1685,43 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         self.__update_task_counts(task, task.execution.state, +1)
 
 
-    def remove(self, task):
-        """Remove a `task` from the list of tasks managed by this Engine."""
+    def remove(self, task, purge=False):
+        """
+        Remove a `task` from the list of tasks managed by this Engine.
+
+        If `purge` is true, also delete the task from the store (if
+        the Engine has one).  During a `progress`:meth: cycle, this
+        only happens at the end of the cycle, after all changed tasks
+        (in particular, any collection that `task` was part of) have
+        been saved; so the store never holds a task referring to a
+        deleted one.
+        """
         queue = self.__get_task_queue(task)
-        queue.remove(task)
+        try:
+            _remove(task, queue)
+        except ValueError:
+            # `task` changed state outside of `progress` (e.g., it was
+            # updated by an enclosing task collection), so it is still
+            # queued according to the last state seen by the Engine
+            for queue in [self._new, self._in_flight, self._stopped,
+                          self._terminating, self._terminated]:
+                if _contained(task, queue):
+                    _remove(task, queue)
+                    break
+            else:
+                raise
+        self._transfers.pop(id(task), None)
         if self._store:
             try:
                 del self._tasks_by_id[task.persistent_id]
-            except AttributeError:
+            except (AttributeError, KeyError):
                 # already removed
                 pass
+            if purge and hasattr(task, 'persistent_id'):
+                if self._to_purge is not None:
+                    self._to_purge.append(task.persistent_id)
+                else:
+                    self._store.remove(task.persistent_id)
         task.detach()
         self.__update_task_counts(task, task.execution.state, -1)
 
@@ -1431,7 +1817,49 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
 
         The `max_in_flight` and `max_submitted` limits (if >0) are
         taken into account when attempting submission of tasks.
+
+        All tasks saved during the cycle are saved within a single
+        `batch` of the store (see `gc3libs.persistence.store.Store.batch`).
+        """
+        self._progress(gc3libs.metrics.Stopwatch(
+            self.metrics, 'engine_phase_seconds'))
+
+    def _progress(self, stopwatch):
+        """
+        Run a `progress`:meth: cycle, recording the time spent in each
+        phase with `stopwatch` (a `gc3libs.metrics.Stopwatch`:class:).
+
+        Subclasses doing work before the cycle proper should start
+        `stopwatch` beforehand, so that this work counts towards the
+        ``update`` phase and the cycle total.
         """
+        if self._store:
+            self._to_purge = []
+            try:
+                with self._store.batch():
+                    self.__progress(stopwatch)
+            finally:
+                self.__purge()
+        else:
+            self.__progress(stopwatch)
+
+    def __purge(self):
+        """
+        Delete from the store the tasks removed with ``purge=True``
+        during the current `progress`:meth: cycle.
+        """
+        to_purge, self._to_purge = self._to_purge, None
+        for task_id in to_purge:
+            try:
+                self._store.remove(task_id)
+            # pylint: disable=broad-except
+            except Exception as err:
+                gc3libs.log.warning(
+                    "Could not delete task '%s' from the store: %s: %s",
+                    task_id, err.__class__.__name__, err)
+
+    def __progress(self, stopwatch):
+        """Implementation of `progress`:meth:."""
         # prepare
         currently_submitted = 0
         currently_in_flight = 0
@@ -1447,8 +1875,7 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
 
         # if no resources are enabled, there's no point in running
         # this further
-        nr_enabled_resources = sum(int(rsc.enabled)
-                                   for rsc in self._core.resources.itervalues())
+        nr_enabled_resources = self._core.resources.count_enabled()
         if nr_enabled_resources == 0:
             raise gc3libs.exceptions.NoResources(
                 "No resources available for running jobs.")
@@ -1457,10 +1884,15 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         # new ones, otherwise we would be checking the status of
         # some tasks twice...
         transitioned = []
-        for index, task in enumerate(self._in_flight):
+        # iterate over a copy, as updating a task collection may
+        # remove some of its children from this Engine
+        for task in list(self._in_flight):
+            if not task._attached:
+                # removed earlier in this cycle
+                continue
             try:
                 old_state = task.execution.state
-                self._core.update_job_state(task)
+                self._update_task_state(task)
                 if self._store and task.changed:
                     self._store.save(task)
                 state = task.execution.state
@@ -1514,15 +1946,15 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
                                 raise
                 elif state == Run.State.STOPPED:
                     # task changed state, mark as to remove
-                    transitioned.append(index)
+                    transitioned.append(task)
                     self._stopped.append(task)
                 elif state == Run.State.TERMINATING:
                     # task changed state, mark as to remove
-                    transitioned.append(index)
+                    transitioned.append(task)
                     self._terminating.append(task)
                 elif state == Run.State.TERMINATED:
                     # task changed state, mark as to remove
-                    transitioned.append(index)
+                    transitioned.append(task)
                     self._terminated.append(task)
                 else:
                     # if we got to this point, state has an invalid value
@@ -1579,8 +2011,11 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
                     # propagate exception to caller
                     raise
         # remove tasks that transitioned to other states
-        for index in reversed(transitioned):
-            del self._in_flight[index]
+        if transitioned:
+            transitioned = set(id(task) for task in transitioned)
+            self._in_flight[:] = [task for task in self._in_flight
+                                  if id(task) not in transitioned]
+        stopwatch.lap('update')
 
         # execute kills and update count of submitted/in-flight tasks
         transitioned = []
@@ -1631,15 +2066,19 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         # remove tasks that transitioned to other states
         for index in reversed(transitioned):
             del self._to_kill[index]
+        stopwatch.lap('kill')
 
         # update state of STOPPED tasks; again need to make before new
         # submissions, because it can alter the count of in-flight
         # tasks.
         transitioned = []
-        for index, task in enumerate(self._stopped):
+        for task in list(self._stopped):
+            if not task._attached:
+                # removed earlier in this cycle
+                continue
             try:
                 old_state = task.execution.state
-                self._core.update_job_state(task)
+                self._update_task_state(task)
                 if self._store and task.changed:
                     self._store.save(task)
                 state = task.execution.state
@@ -1653,15 +2092,15 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
                             currently_submitted += 1
                     self._in_flight.append(task)
                     # task changed state, mark as to remove
-                    transitioned.append(index)
+                    transitioned.append(task)
                 elif state == Run.State.TERMINATING:
                     self._terminating.append(task)
                     # task changed state, mark as to remove
-                    transitioned.append(index)
+                    transitioned.append(task)
                 elif state == Run.State.TERMINATED:
                     self._terminated.append(task)
                     # task changed state, mark as to remove
-                    transitioned.append(index)
+                    transitioned.append(task)
             # pylint: disable=broad-except
             except Exception as err:
                 if gc3libs.error_ignored(
@@ -1688,14 +2127,17 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
                     # propagate exception to caller
                     raise
         # remove tasks that transitioned to other states
-        for index in reversed(transitioned):
-            del self._stopped[index]
+        if transitioned:
+            transitioned = set(id(task) for task in transitioned)
+            self._stopped[:] = [task for task in self._stopped
+                                if id(task) not in transitioned]
+        stopwatch.lap('stopped')
 
         # now try to submit NEW tasks
         # gc3libs.log.debug("Engine.progress: submitting new tasks [%s]"
         #                  % str.join(', ', [str(task) for task in self._new]))
         transitioned = []
-        if (self.can_submit and
+        if (self.can_submit and self._new and
                 currently_submitted < limit_submitted and
                 currently_in_flight < limit_in_flight):
             # update state of all enabled resources, to give a chance to
@@ -1722,13 +2164,19 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
                         # XXX: can remove the following assert when
                         # we're sure Issue 419 is fixed
                         assert task_index not in transitioned
-                        self._in_flight.append(task)
                         transitioned.append(task_index)
-                        if isinstance(task, Application):
-                            currently_submitted += 1
-                            currently_in_flight += 1
                         # if we get to this point, we know state is not NEW anymore
                         state = task.execution.state
+                        if state == Run.State.TERMINATED:
+                            # result found in the cache: nothing was
+                            # actually submitted, so don't count it
+                            # against the Engine limits
+                            self._terminated.append(task)
+                        else:
+                            self._in_flight.append(task)
+                            if isinstance(task, Application):
+                                currently_submitted += 1
+                                currently_in_flight += 1
                         self.__update_task_counts(task, Run.State.NEW, -1)
                         self.__update_task_counts(task, state, +1)
 
@@ -1783,6 +2231,7 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         # remove tasks that transitioned to SUBMITTED state
         for index in reversed(transitioned):
             del self._new[index]
+        stopwatch.lap('submit')
 
         # finally, retrieve output of finished tasks
         if self.can_retrieve:
@@ -1790,10 +2239,7 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
             for index, task in enumerate(self._terminating):
                 # try to get output
                 try:
-                    self._core.fetch_output(
-                        task,
-                        overwrite=self.retrieve_overwrites,
-                        changed_only=self.retrieve_changed_only)
+                    self._fetch_output(task)
                 except gc3libs.exceptions.UnrecoverableDataStagingError as ex:
                     gc3libs.log.error(
                         "Error in fetching output of task '%s',"
@@ -1835,6 +2281,10 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
                         raise
 
             for index, task in enumerate(self._terminating):
+                if id(task) in self._transfers:
+                    # output retrieval still in progress (or completed
+                    # after the loop above): check again at next cycle
+                    continue
                 if task.execution.state == Run.State.TERMINATED:
                     transitioned.append(index)
                     try:
@@ -1849,21 +2299,75 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
                             " (For cloud-based resources, it's possible that the VM"
                             " has been destroyed already.)",
                             task, err.__class__.__name__, err)
-                    if self.forget_terminated:
-                        try:
-                            self.remove(task)
-                        except Exception as err:
-                            gc3libs.log.debug(
-                                "Could not remove task '%s': %s: %s",
-                                task, err.__class__.__name__, err)
-                    else:
-                        self._terminated.append(task)
+                    self._terminated.append(task)
 
                 if self._store and task.changed:
                     self._store.save(task)
             # remove tasks for which final output has been retrieved
             for index in reversed(transitioned):
+                task = self._terminating[index]
                 del self._terminating[index]
+                if self.forget_terminated:
+                    try:
+                        self.remove(task)
+                    # pylint: disable=broad-except
+                    except Exception as err:
+                        gc3libs.log.debug(
+                            "Could not remove task '%s': %s: %s",
+                            task, err.__class__.__name__, err)
+        stopwatch.lap('fetch_output')
+
+        stopwatch.stop()
+        self.last_cycle = stopwatch.laps
+
+
+    def _fetch_output(self, task):
+        """
+        Retrieve output of TERMINATING `task`; called by `progress`:meth:.
+
+        If background transfers are enabled (see `max_transfers` in
+        `Engine`:class:), then start the transfer for `task` if none
+        is running; when the transfer is complete, update `task` (and
+        run its `terminated` handler) as `Core.fetch_output`:meth:
+        does, or re-raise any error from the transfer.
+        """
+        if self.max_transfers <= 0 or not isinstance(task, Application):
+            self._core.fetch_output(
+                task,
+                overwrite=self.retrieve_overwrites,
+                changed_only=self.retrieve_changed_only)
+            return
+        job = self._transfers.get(id(task))
+        if job is None:
+            if self._transfers_pool is None:
+                self._transfers_pool = utils.WorkerPool(
+                    self.max_transfers, self.max_transfers_per_resource)
+            # only download files in the background thread; `task`
+            # is modified below, in the main thread
+            self._transfers[id(task)] = self._transfers_pool.submit(
+                task.execution.resource_name,
+                self._core.transfer_output, task,
+                overwrite=self.retrieve_overwrites,
+                changed_only=self.retrieve_changed_only)
+        elif job.done():
+            del self._transfers[id(task)]
+            # a `RecoverableDataStagingError` leaves the task in
+            # TERMINATING state, so the transfer is restarted at the
+            # next cycle
+            self._core.fetch_output(
+                task,
+                overwrite=self.retrieve_overwrites,
+                changed_only=self.retrieve_changed_only,
+                transfer=job)
+
+
+    def _update_task_state(self, task):
+        """
+        Update the state of `task`; called by `progress`:meth: on
+        tasks in ``SUBMITTED``, ``RUNNING``, ``STOPPED`` or ``UNKNOWN``
+        state.
+        """
+        self._core.update_job_state(task)
 
 
     def redo(self, task, *args, **kwargs):
@@ -2003,6 +2507,9 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         Call explicilty finalize methods on relevant objects
         e.g. LRMS
         """
+        if self._transfers_pool is not None:
+            self._transfers_pool.shutdown()
+            self._transfers_pool = None
         self._core.close()
 
     # Wrapper methods around `Core` to access the backends directly
@@ -2023,6 +2530,92 @@ class Engine(object):  # pylint: disable=too-many-instance-attributes
         return self._core.get_backend(name)
 
 
+class ConcurrentEngine(Engine):
+    """
+    Like `Engine`:class:, but poll the state of running jobs
+    concurrently.
+
+    At the start of each `progress`:meth: cycle, state updates of all
+    `Application` tasks in ``SUBMITTED``, ``RUNNING``, ``STOPPED`` or
+    ``UNKNOWN`` state are handed over to a pool of (at most)
+    `max_workers` background threads, so that slow remote queries on
+    different resources overlap instead of adding up.  The rest of
+    the `progress`:meth: cycle (submission, output retrieval,
+    saving tasks to the store) is then run as in `Engine`:class:.
+
+    To avoid overloading a resource (and because most backends share
+    a single connection to the remote host among all operations), no
+    more than `max_per_resource` operations are run concurrently on
+    any given resource; the default value of 1 is safe with all of
+    GC3Pie's backends.
+
+    .. note::
+
+      State-transition methods of tasks (e.g., `Task.terminated`:meth:)
+      are called from within the background threads.
+
+    Additional keyword arguments are passed unchanged to the
+    `Engine`:class: constructor.
+    """
+
+    # pylint: disable=dangerous-default-value
+    def __init__(self, controller, tasks=[], store=None,
+                 max_workers=8, max_per_resource=1, **extra_args):
+        self.max_workers = max_workers
+        self.max_per_resource = max_per_resource
+        self._pool = None
+        self._updates = {}
+        Engine.__init__(self, controller, tasks, store, **extra_args)
+
+    def progress(self):
+        """
+        Update state of all registered tasks concurrently, then
+        proceed as in `Engine.progress`:meth:.
+        """
+        # time the concurrent updates as part of the ``update`` phase
+        stopwatch = gc3libs.metrics.Stopwatch(
+            self.metrics, 'engine_phase_seconds')
+        if self._pool is None:
+            self._pool = utils.WorkerPool(self.max_workers,
+                                          self.max_per_resource)
+        for task in itertools.chain(self._in_flight, self._stopped):
+            if isinstance(task, Application):
+                self._updates[id(task)] = self._pool.submit(
+                    task.execution.resource_name,
+                    self._core.update_job_state, task)
+        # wait for all updates to complete, so that task collections
+        # (which are updated in this thread) see the new states
+        for job in self._updates.itervalues():
+            job.wait()
+        try:
+            self._progress(stopwatch)
+        finally:
+            self._updates.clear()
+
+    def _update_task_state(self, task):
+        """
+        Return result of state update performed in the background, or
+        update state of `task` directly if it was not.
+        """
+        try:
+            job = self._updates.pop(id(task))
+        except KeyError:
+            self._core.update_job_state(task)
+        else:
+            # re-raises any exception caught in the background thread
+            job.result()
+
+    def close(self):
+        """
+        Stop background threads, then close backends as in
+        `Engine.close`:meth:.
+        """
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        Engine.close(self)
+
+
 class BgEngine(object):
     """
     Run a GC3Pie `Engine`:class: instance in the background.
@@ -2385,13 +2978,14 @@ class BgEngine(object):
             self._engine.progress()
 
 
-    def remove(self, task):
+    def remove(self, task, purge=False):
         """Proxy to `Engine.remove`:meth: (which see)."""
         if self.running:
             with self._queue_locked:
-                self._queue.append((self._engine.remove, (task,), {}))
+                self._queue.append(
+                    (self._engine.remove, (task,), {'purge': purge}))
         else:
-            self._engine.remove(task)
+            self._engine.remove(task, purge)
 
 
     def select_resource(self, match):
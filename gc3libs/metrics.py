@@ -0,0 +1,341 @@
+#! /usr/bin/env python
+#
+"""
+Collect performance metrics of GC3Pie's own operation.
+
+Counters and latency histograms are kept in a `Registry`:class:;
+GC3Libs records into the process-wide instance `registry`:data: the
+following metrics:
+
+``engine_phase_seconds{phase=...}``
+  Wall-clock time spent in each phase of `Engine.progress`:meth:
+  (``update``, ``kill``, ``stopped``, ``submit``, ``fetch_output``);
+  phase ``total`` measures the whole cycle.
+
+``backend_seconds{resource=...,operation=...}``
+  Latency of each operation that `Core`:class: performs on a
+  resource (``submit_job``, ``update_job_state``, ``get_results``,
+  ``cancel_job``, ``free``, ``peek``, ``get_resource_status``).
+
+``transport_commands_total{transport=...,host=...}``
+  Number of commands run through a `Transport`:class:.
+
+``transport_bytes_total{transport=...,host=...,direction=...}``
+  Number of bytes copied with `Transport.get`:meth: (direction
+  ``get``) or `Transport.put`:meth: (direction ``put``).
+
+  These two counters are only updated while transport operations
+  are traced (see `gc3libs.backends.transport.TransportTracer`:class:).
+
+``store_save_seconds{store=...}``, ``store_pickled_bytes_total{store=...}``
+  Latency of saving an object into a persistent store, and size of
+  the pickled data.
+
+A registry can be dumped in Prometheus' text exposition format, or as
+JSON; the latter is a dictionary mapping each metric name to a list
+of samples, each one carrying the sample labels.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+from contextlib import contextmanager
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+class Histogram(object):
+    """
+    Distribution of observed values, counted into cumulative buckets.
+
+    Bucket upper bounds are given by `bounds`; an implicit last
+    bucket with bound ``+Inf`` counts all observations.
+
+    Example::
+
+      >>> h = Histogram(bounds=[1, 10])
+      >>> for value in [0.5, 2, 20]:
+      ...     h.observe(value)
+      >>> h.count, h.total
+      (3, 22.5)
+      >>> h.cumulative()
+      [(1, 1), (10, 2), (inf, 3)]
+    """
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'min', 'max')
+
+    #: Default bucket bounds, suitable for latencies in seconds
+    DEFAULT_BOUNDS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5,
+                      1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+    def __init__(self, bounds=DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        for n, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[n] += 1
+                break
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def cumulative(self):
+        """
+        Return list of pairs *(bound, count of values <= bound)*.
+        """
+        result = []
+        acc = 0
+        for bound, count in zip(self.bounds, self.counts):
+            acc += count
+            result.append((bound, acc))
+        result.append((float('inf'), self.count))
+        return result
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': [[('+Inf' if bound == float('inf') else bound), count]
+                        for bound, count in self.cumulative()],
+        }
+
+
+class Registry(object):
+    """
+    Thread-safe collection of named counters and histograms.
+
+    Each metric is identified by a name and a set of labels, passed
+    as keyword arguments::
+
+      >>> reg = Registry()
+      >>> reg.incr('requests_total', host='example.org')
+      >>> reg.incr('requests_total', 2, host='example.org')
+      >>> reg.get('requests_total', host='example.org')
+      3
+
+    Recording can be turned off (e.g., to measure the overhead of
+    instrumentation) by setting attribute `enabled` to ``False``.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def incr(self, name, value=1, **labels):
+        """
+        Add `value` to the counter identified by `name` and `labels`.
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Record `value` into the histogram identified by `name` and `labels`.
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Record the wall-clock time taken to run the body of a
+        ``with`` statement into histogram `name`.
+
+        Time is recorded also if the body raises an exception.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def get(self, name, **labels):
+        """
+        Return the value of a counter, or the `Histogram`:class: for
+        the given `name` and `labels`; return ``None`` if no such
+        metric has been recorded.
+        """
+        key = self._key(name, labels)
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            return self._histograms.get(key)
+
+    def reset(self):
+        """
+        Forget all recorded values.
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def as_dict(self):
+        """
+        Return all metrics as a (JSON-serializable) dictionary.
+        """
+        result = {}
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                result.setdefault(name, []).append(
+                    {'labels': dict(labels), 'value': value})
+            for (name, labels), hist in sorted(self._histograms.items()):
+                sample = hist.as_dict()
+                sample['labels'] = dict(labels)
+                result.setdefault(name, []).append(sample)
+        return result
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), sort_keys=True)
+
+    @staticmethod
+    def _format_labels(labels, **extra):
+        labels = list(labels) + sorted(extra.items())
+        if not labels:
+            return ''
+        return '{' + str.join(',', [
+            ('%s="%s"' % (key, str(value).replace('\\', r'\\')
+                          .replace('"', r'\"').replace('\n', r'\n')))
+            for key, value in labels]) + '}'
+
+    def to_prometheus(self):
+        """
+        Return all metrics in Prometheus' text exposition format.
+        """
+        lines = []
+        with self._lock:
+            last = None
+            for (name, labels), value in sorted(self._counters.items()):
+                if name != last:
+                    lines.append('# TYPE %s counter' % name)
+                    last = name
+                lines.append('%s%s %r' % (
+                    name, self._format_labels(labels), value))
+            last = None
+            for (name, labels), hist in sorted(self._histograms.items()):
+                if name != last:
+                    lines.append('# TYPE %s histogram' % name)
+                    last = name
+                for bound, count in hist.cumulative():
+                    lines.append('%s_bucket%s %d' % (
+                        name,
+                        self._format_labels(
+                            labels,
+                            le=('+Inf' if bound == float('inf')
+                                else repr(bound))),
+                        count))
+                lines.append('%s_sum%s %r' % (
+                    name, self._format_labels(labels), hist.total))
+                lines.append('%s_count%s %d' % (
+                    name, self._format_labels(labels), hist.count))
+        return str.join('\n', lines) + '\n'
+
+    def dump(self, path):
+        """
+        Write all metrics into file `path`.
+
+        Metrics are written in JSON format if `path` ends with
+        ``.json``, and in Prometheus' text format otherwise.  The
+        file is replaced atomically, so that readers never see a
+        partially-written file.
+        """
+        if path.endswith('.json'):
+            data = self.to_json()
+        else:
+            data = self.to_prometheus()
+        dirname = os.path.dirname(os.path.abspath(path))
+        fd, tmp = tempfile.mkstemp(prefix='.metrics', dir=dirname)
+        try:
+            with os.fdopen(fd, 'w') as stream:
+                stream.write(data)
+            os.rename(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
+
+
+class Stopwatch(object):
+    """
+    Measure consecutive phases of an activity.
+
+    Each call to `lap`:meth: records the time elapsed since the
+    previous one (or since the stopwatch was created) into histogram
+    `name` of `registry`, labeled with the given phase; `stop`:meth:
+    records the total time::
+
+      >>> reg = Registry()
+      >>> sw = Stopwatch(reg, 'cycle_seconds')
+      >>> sw.lap('first')
+      >>> sw.lap('second')
+      >>> sw.stop()
+      >>> sorted(sw.laps.keys())
+      ['first', 'second', 'total']
+      >>> reg.get('cycle_seconds', phase='total').count
+      1
+    """
+
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+        self.laps = {}
+        self._start = self._last = time.time()
+
+    def lap(self, phase):
+        now = time.time()
+        elapsed = now - self._last
+        self._last = now
+        self.laps[phase] = elapsed
+        self.registry.observe(self.name, elapsed, phase=phase)
+
+    def stop(self, phase='total'):
+        elapsed = time.time() - self._start
+        self.laps[phase] = elapsed
+        self.registry.observe(self.name, elapsed, phase=phase)
+
+
+#: Process-wide registry where GC3Libs records its metrics.
+registry = Registry()
@@ -271,8 +271,9 @@ def populate(create_fn, in_domain=None, max_n_resample=100):
             fillin_pop[
                 total_filled:new_total_filled] = new_pop[ix_new_recruits]
             total_filled = new_total_filled
+            ctr += 1
         if total_filled < n_invalid_orig:
-            self.logger.warning(
+            gc3libs.log.warning(
                 "%d population members are invalid even after re-sampling %d times."
                 "  You might want to increase `max_n_resample`.",
                 (n_invalid_orig - total_filled),
@@ -306,3 +307,180 @@ def draw_population(
                                        np.random.random_sample((size, dim)) *
                                        (upper_bds -
                                         lower_bds)), in_domain=in_domain)
+
+
+class EvaluationCache(object):
+
+    '''
+    Store target function values computed so far during an optimization.
+
+    Drivers look up each new population member in the cache before
+    evaluating it, so that a point is never evaluated twice.  Points
+    are compared after quantization: if `resolution` is given (a
+    number, or a sequence with one number per dimension), two points
+    are considered the same when they round to the same multiple of
+    `resolution` in every coordinate.  By default, points must be
+    exactly equal.
+
+    The cache is a plain Python object, so it is saved (and
+    restored) together with the driver that uses it.
+
+    :param resolution: Quantization step for parameter vectors.
+    '''
+
+    def __init__(self, resolution=None):
+        self.resolution = resolution
+        self._xs = []
+        self._ys = []
+        self._index = {}
+
+    def key(self, x):
+        '''
+        Return the (hashable) key for point `x`.
+        '''
+        x = np.asarray(x, dtype=float)
+        if self.resolution is None:
+            return tuple(x.tolist())
+        return tuple(np.round(x / self.resolution).astype(int).tolist())
+
+    def __len__(self):
+        return len(self._ys)
+
+    def __contains__(self, x):
+        return self.key(x) in self._index
+
+    def get(self, x, default=None):
+        '''
+        Return the value cached for point `x`, or `default` if there is none.
+        '''
+        ix = self._index.get(self.key(x))
+        if ix is None:
+            return default
+        return self._ys[ix]
+
+    def add(self, x, y):
+        '''
+        Record `y` as the value of the target function at point `x`.
+
+        Non-finite values (e.g., from failed evaluations) are not
+        recorded.
+        '''
+        if not np.isfinite(y):
+            return
+        key = self.key(x)
+        if key in self._index:
+            self._ys[self._index[key]] = y
+        else:
+            self._index[key] = len(self._ys)
+            self._xs.append(np.array(x, dtype=float))
+            self._ys.append(y)
+
+    @property
+    def points(self):
+        '''Array of the points recorded so far, one per row.'''
+        return np.array(self._xs)
+
+    @property
+    def values(self):
+        '''Array of the values recorded so far.'''
+        return np.array(self._ys)
+
+    def screen(self, surrogate, trials, incumbents):
+        '''
+        Return array of booleans telling which `trials` are worth evaluating.
+
+        A trial vector is deemed worth evaluating when the value
+        predicted for it by `surrogate` (see
+        :class:`NearestNeighbourSurrogate` and :class:`RBFSurrogate`)
+        is lower than the corresponding value in `incumbents`, i.e.,
+        when it is likely to replace the population member it
+        competes against.  All trials are worth evaluating as long as
+        the cache holds fewer than `surrogate.min_points` points
+        (default: twice the dimension of the search space, plus one).
+        '''
+        trials = np.atleast_2d(np.asarray(trials, dtype=float))
+        min_points = surrogate.min_points or (2 * trials.shape[1] + 1)
+        if len(self) < min_points:
+            return np.ones(len(trials), dtype=bool)
+        predicted = surrogate.predict(self.points, self.values, trials)
+        return predicted < np.asarray(incumbents)
+
+
+class NearestNeighbourSurrogate(object):
+
+    '''
+    Predict the target function value at a point as the mean value
+    of the `k` nearest points evaluated so far.
+
+    :param int k: Number of neighbours to average over.
+    :param int min_points: Minimum number of evaluated points before
+                           predictions are used, see
+                           :meth:`EvaluationCache.screen`.
+    '''
+
+    def __init__(self, k=1, min_points=None):
+        self.k = k
+        self.min_points = min_points
+
+    def predict(self, xs, ys, trials):
+        '''
+        Return array of predicted values at `trials`, given that the
+        target function has values `ys` at points `xs`.
+        '''
+        dists = np.sqrt(
+            ((trials[:, np.newaxis, :] - xs[np.newaxis, :, :]) ** 2).sum(axis=2))
+        k = min(self.k, len(ys))
+        nearest = np.argsort(dists, axis=1)[:, :k]
+        return ys[nearest].mean(axis=1)
+
+
+class RBFSurrogate(object):
+
+    '''
+    Predict the target function value by multiquadric radial basis
+    function interpolation over the points evaluated so far.
+
+    Since building the interpolant takes time cubic in the number of
+    points, only the `max_points` most recently evaluated ones are
+    used.
+
+    :param float epsilon: Shape parameter of the basis functions;
+                          by default, the mean distance between points.
+    :param float smooth: Values greater than 0 trade exact
+                         interpolation for smoothness.
+    :param int max_points: Maximum number of points to interpolate.
+    :param int min_points: Minimum number of evaluated points before
+                           predictions are used, see
+                           :meth:`EvaluationCache.screen`.
+    '''
+
+    def __init__(self, epsilon=None, smooth=0.0, max_points=500,
+                 min_points=None):
+        self.epsilon = epsilon
+        self.smooth = smooth
+        self.max_points = max_points
+        self.min_points = min_points
+
+    @staticmethod
+    def _distances(xs1, xs2):
+        return np.sqrt(
+            ((xs1[:, np.newaxis, :] - xs2[np.newaxis, :, :]) ** 2).sum(axis=2))
+
+    def predict(self, xs, ys, trials):
+        '''
+        Return array of predicted values at `trials`, given that the
+        target function has values `ys` at points `xs`.
+        '''
+        xs = xs[-self.max_points:]
+        ys = ys[-self.max_points:]
+        dists = self._distances(xs, xs)
+        epsilon = self.epsilon
+        if not epsilon:
+            n = len(xs)
+            epsilon = (dists.sum() / (n * (n - 1)) if n > 1 else 1.0) or 1.0
+        phi = np.sqrt(1 + (dists / epsilon) ** 2)
+        phi -= self.smooth * np.eye(len(xs))
+        weights = np.linalg.lstsq(phi, ys, rcond=None)[0]
+        return np.dot(
+            np.sqrt(1 + (self._distances(trials, xs) / epsilon) ** 2),
+            weights)
@@ -46,10 +46,12 @@ __docformat__ = 'reStructuredText'
 
 import logging
 import os
+import cPickle as pickle
 import sys
 
 import numpy as np
 
+import gc3libs
 from gc3libs.optimizer import EvolutionaryAlgorithm
 from gc3libs.optimizer import draw_population, populate
 from gc3libs.utils import Enum
@@ -106,6 +108,14 @@ class DifferentialEvolutionAlgorithm(EvolutionaryAlgorithm):
                                            Choosing de_step_size = 0.3 is a good start here.
     6. ``'DE_rand_either_or_algorithm'``: Alternates between differential mutation and three-point- recombination.
 
+    The optimizer state is saved along with the task driving the
+    optimization (see `gc3libs.optimizer.drivers`:mod:), so functions
+    given as `in_domain` or in `after_update_opt_state` should be
+    picklable, i.e., defined at the top level of a module.  Any other
+    function (e.g., a ``lambda`` or a closure) is left out of the saved
+    state, with a warning, and is missing when the state is loaded
+    back: the default `in_domain` check is then used.
+
     '''
 
     def __init__(self, initial_pop,
@@ -133,6 +143,8 @@ class DifferentialEvolutionAlgorithm(EvolutionaryAlgorithm):
         self.prob_crossover = prob_crossover
         self.exp_cross = exp_cross
         self.de_strategy = de_strategy
+        # number of evaluations fed back with `update_member`
+        self.n_evals = 0
 
         if not in_domain:
             self.in_domain = self._default_in_domain
@@ -143,7 +155,7 @@ class DifferentialEvolutionAlgorithm(EvolutionaryAlgorithm):
         np.random.seed(seed)
 
     def _default_in_domain(self, x):
-        return np.array([True] * self.pop_size)
+        return np.array([True] * len(x))
 
     def select(self, new_pop, new_vals):
         '''
@@ -154,6 +166,60 @@ class DifferentialEvolutionAlgorithm(EvolutionaryAlgorithm):
         self.pop[ix_superior, :] = new_pop[ix_superior, :].copy()
         self.vals[ix_superior] = new_vals[ix_superior].copy()
 
+    # Steady-state evolution: instead of evaluating a whole new
+    # population before selection, a trial vector for a single member
+    # is generated with `new_trial` and, as soon as its value is
+    # known, it competes against that member in `update_member`.
+
+    def new_trial(self, ix):
+        '''
+        Return a new trial vector for population member `ix`.
+
+        The trial vector is generated according to `de_strategy` from
+        the current population, and fulfills `in_domain`.
+        '''
+        return populate(
+            create_fn=(
+                lambda: DifferentialEvolutionAlgorithm.trial_fn(
+                    self.pop,
+                    ix,
+                    self.prob_crossover,
+                    self.de_step_size,
+                    self.dim,
+                    self.best_x,
+                    self.de_strategy,
+                    self.exp_cross)[np.newaxis, :]),
+            in_domain=self.in_domain)[0]
+
+    def update_member(self, ix, x, y):
+        '''
+        Replace population member `ix` with vector `x`, if its value
+        `y` is lower than the member's.
+
+        Every `pop_size` calls, the iteration count is advanced and
+        the `after_update_opt_state` functions are called, so that
+        `itermax` and the reporting functions keep their meaning of
+        "number of evaluations divided by the population size".
+
+        Members that have not been evaluated yet are always
+        replaced, so the initial population should be evaluated by
+        calling this method with `x = self.pop[ix]`.
+        '''
+        if self.__dict__.get('vals') is None:
+            self.vals = np.inf * np.ones(self.pop_size)
+            self.best_y = np.inf
+        if y < self.vals[ix]:
+            self.pop[ix, :] = x
+            self.vals[ix] = y
+        if y < self.best_y:
+            self.best_x = np.array(x, copy=True)
+            self.best_y = y
+        self.n_evals += 1
+        if self.n_evals % self.pop_size == 0:
+            for fn in self.after_update_opt_state:
+                fn(self)
+            self.cur_iter += 1
+
     def evolve(self):
         '''
         Generates a new population fullfilling `in_domain`.
@@ -221,11 +287,9 @@ class DifferentialEvolutionAlgorithm(EvolutionaryAlgorithm):
         pm4 = population[a4, :]  # shuffled population matrix 4
         pm5 = population[a5, :]  # shuffled population matrix 5
 
-        # "best member" matrix
-        bm = np.zeros((pop_size, dim))   # initialize FVr_bestmember  matrix
-        # population filled with the best member
-        for k in range(pop_size):
-            bm[k, :] = best_iter                       # of the last iteration
+        # "best member" matrix: population filled with the best member
+        # of the last iteration (read-only view, no copying)
+        bm = np.broadcast_to(best_iter, (pop_size, dim))
 
         # mask for intermediate population
         # all random numbers < prob_crossover are 1, 0 otherwise
@@ -234,19 +298,15 @@ class DifferentialEvolutionAlgorithm(EvolutionaryAlgorithm):
         if exp_cross:
             # rotating index array, i.e. [0, 1, 2, ..., dim]
             rotd = np.arange(dim)
-            # rotating index array for exponential crossover
-            rtd = np.zeros(dim, dtype=np.int)
             # Prepare intermediate population for indexing.
             mui = np.sort(mui.transpose(), axis=0)
             # Columns are pop members. Put all False indices in the first rows.
-            for k in range(pop_size):
-                n = int(np.floor(np.random.rand() * dim))
-                if n > 0:
-                    # Build actual rotation vector.
-                    rtd = (rotd + n) % dim
-                    # e.g. dim = 6, n = 2 -> [3,2,1,0,1,2]
-                    # Rotate indices for kth population member by n.
-                    mui[:, k] = mui[rtd, k]
+            n = np.floor(np.random.rand(pop_size) * dim).astype(np.int)
+            # Build actual rotation vectors, one column per member,
+            # e.g. dim = 6, n = 2 -> [2,3,4,5,0,1]
+            rtd = (rotd[:, np.newaxis] + n) % dim
+            # Rotate indices for kth population member by n[k].
+            mui = mui[rtd, np.arange(pop_size)]
             mui = mui.transpose()
 
         # inverse mask to mui (mpo + mui == <vector of 1's>)
@@ -275,9 +335,7 @@ class DifferentialEvolutionAlgorithm(EvolutionaryAlgorithm):
                     (pop_size,
                      1)) +
                 de_step_size)
-            for k in range(dim):
-                pm5[:, k] = f1
-            ui = pm3 + (pm1 - pm2) * pm5    # differential variation
+            ui = pm3 + (pm1 - pm2) * f1     # differential variation
             ui = population * mpo + ui * mui     # crossover
         elif (de_strategy == 'DE_rand_with_per_generation_dither'):
             #origin = pm3
@@ -300,16 +358,119 @@ class DifferentialEvolutionAlgorithm(EvolutionaryAlgorithm):
 
         return ui
 
+    @staticmethod
+    def trial_fn(
+            population,
+            ix,
+            prob_crossover,
+            de_step_size,
+            dim,
+            best_iter,
+            de_strategy,
+            exp_cross):
+        """
+        Return a trial vector for member `ix` of `population`, evolved
+        according to `de_strategy`.
+
+        This computes a single row of what :meth:`evolve_fn` returns,
+        so its cost does not depend on the population size.  The other
+        parameters have the same meaning as in :meth:`evolve_fn`.
+        """
+
+        assert de_strategy in strategies
+
+        pop_size = len(population)
+
+        # three distinct members, drawn at random
+        a1, a2, a3 = np.random.permutation(pop_size)[:3]
+        x = population[ix]
+        pm1 = population[a1]
+        pm2 = population[a2]
+        pm3 = population[a3]
+
+        # mask for intermediate member
+        mui = np.random.random_sample(dim) < prob_crossover
+
+        if exp_cross:
+            # put all False indices first, then rotate by n positions
+            n = int(np.floor(np.random.rand() * dim))
+            mui = np.sort(mui)[(np.arange(dim) + n) % dim]
+
+        # inverse mask to mui
+        mpo = mui < 0.5
+
+        if (de_strategy == 'DE_rand'):
+            ui = pm3 + de_step_size * (pm1 - pm2)   # differential variation
+            ui = x * mpo + ui * mui                  # crossover
+        elif (de_strategy == 'DE_local_to_best'):
+            ui = x + de_step_size * \
+                (best_iter - x) + de_step_size * (pm1 - pm2)
+            ui = x * mpo + ui * mui
+        elif (de_strategy == 'DE_best_with_jitter'):
+            ui = best_iter + (pm1 - pm2) * ((1 - 0.9999) * \
+                np.random.random_sample(dim) + de_step_size)
+            ui = x * mpo + ui * mui
+        elif (de_strategy == 'DE_rand_with_per_vector_dither'):
+            f1 = (1 - de_step_size) * np.random.random_sample() + de_step_size
+            ui = pm3 + (pm1 - pm2) * f1     # differential variation
+            ui = x * mpo + ui * mui         # crossover
+        elif (de_strategy == 'DE_rand_with_per_generation_dither'):
+            # with a single member, per-generation dither is the same
+            # as per-vector dither
+            f1 = (1 - de_step_size) * np.random.random_sample() + de_step_size
+            ui = pm3 + (pm1 - pm2) * f1     # differential variation
+            ui = x * mpo + ui * mui         # crossover
+        elif (de_strategy == 'DE_rand_either_or_algorithm'):
+            if (np.random.random_sample() < 0.5):
+                ui = pm3 + de_step_size * (pm1 - pm2)  # differential variation
+            # use F-K-Rule: K = 0.5(F+1)
+            else:
+                ui = pm3 + 0.5 * (de_step_size + 1.0) * (pm1 + pm2 - 2 * pm3)
+                ui = x * mpo + ui * mui     # crossover
+
+        return ui
+
     # Adjustments for pickling
     def __getstate__(self):
         state = self.__dict__.copy()
         if 'logger' in state.keys():
             del state['logger']
-#        return state
-        return None
+        # bound methods cannot be pickled
+        if state.get('in_domain') == self._default_in_domain:
+            del state['in_domain']
+        elif not _picklable(state.get('in_domain')):
+            gc3libs.log.warning(
+                "Function %r passed as `in_domain` cannot be pickled:"
+                " the default domain check will be used when the"
+                " optimizer state is loaded back.", state['in_domain'])
+            del state['in_domain']
+        fns = state.get('after_update_opt_state', [])
+        picklable_fns = [fn for fn in fns if _picklable(fn)]
+        if len(picklable_fns) < len(fns):
+            gc3libs.log.warning(
+                "Not saving functions %s in `after_update_opt_state`:"
+                " they cannot be pickled.",
+                str.join(', ', [repr(fn) for fn in fns
+                                if fn not in picklable_fns]))
+            state['after_update_opt_state'] = picklable_fns
+        return state
 
     def __setstate__(self, state):
         self.__dict__ = state
+        self.__dict__.setdefault('logger', gc3libs.log)
+        self.__dict__.setdefault('in_domain', self._default_in_domain)
+
+
+def _picklable(obj):
+    """
+    Return ``True`` if `obj` can be pickled.
+    """
+    try:
+        pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        return True
+    # pylint: disable=broad-except
+    except Exception:
+        return False
 
 
 # Variable changes from matlab implementation
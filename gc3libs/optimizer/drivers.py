@@ -7,6 +7,9 @@ Global optimizations can be performed sequentially on a local machine using
 :class:`~gc3libs.optimizer.drivers.SequentialDriver`. To make use of
 parallelization, :class:`~gc3libs.optimizer.drivers.ParallelDriver` allows
 submission of jobs to gc3pie ressources.
+:class:`~gc3libs.optimizer.drivers.AsyncParallelDriver` does the same
+without waiting for a whole population to be evaluated before
+evolving it.
 
 Drivers use an algorithm instance that conforms to
 :class:`optimizer.EvolutionaryAlgorithm <gc3libs.optimizer.EvolutionaryAlgorithm>` to generate new
@@ -40,7 +43,19 @@ import numpy as np
 from prettytable import PrettyTable
 
 import gc3libs
-from gc3libs.workflow import SequentialTaskCollection, ParallelTaskCollection
+from gc3libs.optimizer import EvaluationCache
+from gc3libs.workflow import (SequentialTaskCollection, ParallelTaskCollection,
+                              StreamingTaskCollection)
+
+
+def _get_value(app):
+    """
+    Default `extract_value_fn` for the drivers: return `app.value`.
+
+    (A module-level function, unlike a lambda, can be pickled
+    together with the driver.)
+    """
+    return app.value
 
 
 class SequentialDriver(object):
@@ -55,6 +70,8 @@ class SequentialDriver(object):
                           <gc3libs.optimizer.EvolutionaryAlgorithm>`.
 
     :param target_fn: Function to evaluate a population and return the corresponding values.
+                      If `vectorized` is `False`, it is instead called on each population
+                      member in turn, and must return the corresponding value.
     :param path_to_stage_dir: Directory in which to perform the optimization.
     :param cur_pop_file: Filename under which the population is stored in the
                          current iteration dir. The population is discarded
@@ -65,6 +82,14 @@ class SequentialDriver(object):
                      values at each step of the algorithm. If `None` (default), this verbose
                      report is not generated, as it might be time-consuming for large population
                      sizes.
+
+    :param pool: Object with a `map` method, like a `multiprocessing.Pool`
+                 or a `concurrent.futures` executor; if given, population members
+                 are evaluated in parallel by mapping `target_fn` over the population
+                 with it.  (Therefore, `target_fn` must be picklable, i.e., defined
+                 at the top level of a module.)
+    :param bool vectorized: Whether `target_fn` evaluates a whole population
+                            at once.  Default is `True` unless `pool` is given.
     """
 
     def __init__(
@@ -74,7 +99,9 @@ class SequentialDriver(object):
             path_to_stage_dir=os.getcwd(),
             cur_pop_file=None,
             logger=None,
-            fmt=None):
+            fmt=None,
+            pool=None,
+            vectorized=None):
         self.path_to_stage_dir = path_to_stage_dir
         self.opt_algorithm = opt_algorithm
         self.target_fn = target_fn
@@ -84,6 +111,21 @@ class SequentialDriver(object):
         else:
             self.logger = logging.getLogger('gc3.gc3libs')
         self.fmt = fmt
+        self.pool = pool
+        if vectorized is None:
+            vectorized = (pool is None)
+        self.vectorized = vectorized
+
+    def evaluate(self, pop):
+        '''
+        Return array of target function values for population `pop`.
+        '''
+        if self.vectorized:
+            return np.asarray(self.target_fn(pop))
+        if self.pool is not None:
+            # `concurrent.futures` executors return an iterator
+            return np.array(list(self.pool.map(self.target_fn, pop)))
+        return np.array([self.target_fn(x) for x in pop])
 
     def de_opt(self):
         '''
@@ -106,7 +148,7 @@ class SequentialDriver(object):
                     new_pop,
                     delimiter=' ')
             # EVALUATE TARGET #
-            new_vals = self.target_fn(new_pop)
+            new_vals = self.evaluate(new_pop)
             if self.fmt:
                 self.logger.info(
                     "*** Population (X's) and values (Y) at iteration %d: ***",
@@ -167,6 +209,25 @@ class ParallelDriver(SequentialTaskCollection):
                              population is discarded if no file is
                              specified.
 
+    :param cache:            A :class:`~gc3libs.optimizer.EvaluationCache`
+                             instance; if given, population members
+                             whose value is found in the cache are not
+                             evaluated again, and the values of
+                             evaluated members are added to it.
+
+    :param surrogate:        An object predicting target function values
+                             from the cached ones, like
+                             :class:`~gc3libs.optimizer.NearestNeighbourSurrogate`
+                             or :class:`~gc3libs.optimizer.RBFSurrogate`;
+                             if given, only trial vectors that are
+                             predicted to beat the population member
+                             they compete against are evaluated; the
+                             others are given an infinite value.
+                             Implies using a cache.
+
+    When a cache or surrogate is used, only the members actually
+    evaluated are saved in `cur_pop_file`.
+
 
     Optimization drivers use GC3Pie in the following way: A
     :class:`~gc3libs.workflow.SequentialTaskCollection` represents the main
@@ -190,10 +251,15 @@ class ParallelDriver(SequentialTaskCollection):
 
     """
 
+    # defaults for instances saved before these attributes were introduced
+    cache = None
+    surrogate = None
+    _pending = None
+
     def __init__(self, jobname='', path_to_stage_dir='',
                  opt_algorithm=None, task_constructor=None,
-                 extract_value_fn=(lambda app: app.value),
-                 cur_pop_file = '',
+                 extract_value_fn=_get_value,
+                 cur_pop_file = '', cache=None, surrogate=None,
                  **extra_args):
 
         gc3libs.log.debug('entering ParallelDriver.__init__')
@@ -206,48 +272,91 @@ class ParallelDriver(SequentialTaskCollection):
         self.task_constructor = task_constructor
         self.cur_pop_file = cur_pop_file
         self.extra_args = extra_args
+        if surrogate is not None and cache is None:
+            cache = EvaluationCache()
+        self.cache = cache
+        self.surrogate = surrogate
 
         self.new_pop = self.opt_algorithm.pop
-        initial_task = ComputeTargetVals(
-            self.opt_algorithm.pop, self.jobname, self.opt_algorithm.cur_iter,
-            path_to_stage_dir, self.cur_pop_file, task_constructor)
+        initial_task = self._new_evaluation()
+        if initial_task is None:
+            # all values are cached, but a `SequentialTaskCollection`
+            # cannot start without tasks: evaluate one member anyway
+            self._pending = np.arange(1)
+            initial_task = self._new_evaluation_of_pending()
 
         SequentialTaskCollection.__init__(self, [initial_task], **extra_args)
 
+    def _new_evaluation(self):
+        """
+        Return a `ComputeTargetVals` instance to evaluate the members
+        of `self.new_pop` whose value is not known yet, or `None` if
+        there are none.
+        """
+        pop = self.new_pop
+        vals = np.nan * np.ones(len(pop))
+        if self.cache is not None:
+            for ix, x in enumerate(pop):
+                vals[ix] = self.cache.get(x, np.nan)
+            if self.surrogate is not None and self.opt_algorithm.cur_iter > 0:
+                todo = np.where(np.isnan(vals))[0]
+                if len(todo):
+                    promising = self.cache.screen(
+                        self.surrogate, pop[todo], self.opt_algorithm.vals[todo])
+                    vals[todo[~promising]] = np.inf
+        self._new_vals = vals
+        self._pending = np.where(np.isnan(vals))[0]
+        if len(self._pending) == 0:
+            return None
+        return self._new_evaluation_of_pending()
+
+    def _new_evaluation_of_pending(self):
+        return ComputeTargetVals(
+            self.new_pop[self._pending],
+            self.jobname,
+            self.opt_algorithm.cur_iter,
+            self.path_to_stage_dir,
+            self.cur_pop_file,
+            self.task_constructor)
+
     def next(self, done):
         gc3libs.log.debug('entering ParallelDriver.next(%d)', done)
 
         # feed back results from the evaluation just completed
         new_pop = self.new_pop
-        new_vals = [self.extract_value_fn(task)
-                    for task in self.tasks[done].tasks]
+        if self._pending is None:
+            self._pending = np.arange(len(new_pop))
+            self._new_vals = np.nan * np.ones(len(new_pop))
+        new_vals = self._new_vals
+        for ix, task in zip(self._pending, self.tasks[done].tasks):
+            new_vals[ix] = self.extract_value_fn(task)
+            if self.cache is not None:
+                self.cache.add(new_pop[ix], new_vals[ix])
         self.opt_algorithm.update_opt_state(new_pop, new_vals)
 
         self.changed = True
 
-        if self.opt_algorithm.cur_iter > self.opt_algorithm.itermax:
-            # maximum number of iterations exceeded
-            # XXX: what return code is appropriate here?
-            self.execution.exitcode = os.EX_TEMPFAIL
-            return gc3libs.Run.State.TERMINATED
-
-        # still within allowed number of iterations, check convergence
-        if self.opt_algorithm.has_converged():
-            # report success of sequential task
-            self.execution.returncode = 0
-            return gc3libs.Run.State.TERMINATED
-        else:
+        while True:
+            if self.opt_algorithm.cur_iter > self.opt_algorithm.itermax:
+                # maximum number of iterations exceeded
+                # XXX: what return code is appropriate here?
+                self.execution.exitcode = os.EX_TEMPFAIL
+                return gc3libs.Run.State.TERMINATED
+
+            # still within allowed number of iterations, check convergence
+            if self.opt_algorithm.has_converged():
+                # report success of sequential task
+                self.execution.returncode = 0
+                return gc3libs.Run.State.TERMINATED
+
             # prepare next evaluation
             self.new_pop = self.opt_algorithm.evolve()
-            self.add(
-                ComputeTargetVals(
-                    self.new_pop,
-                    self.jobname,
-                    self.opt_algorithm.cur_iter,
-                    self.path_to_stage_dir,
-                    self.cur_pop_file,
-                    self.task_constructor))
-            return gc3libs.Run.State.RUNNING
+            task = self._new_evaluation()
+            if task is not None:
+                self.add(task)
+                return gc3libs.Run.State.RUNNING
+            # no new member needs evaluating, go on with next iteration
+            self.opt_algorithm.update_opt_state(self.new_pop, self._new_vals)
 
     def __str__(self):
         return self.jobname
@@ -269,6 +378,163 @@ class ParallelDriver(SequentialTaskCollection):
     # self._setup_logging()
 
 
+class AsyncParallelDriver(StreamingTaskCollection):
+
+    """Drives a steady-state optimization using `opt_algorithm` on the grid.
+
+    Unlike :class:`ParallelDriver`, this driver does not wait for all
+    members of a population to be evaluated: as soon as the
+    evaluation of a trial vector is done, the trial vector competes
+    against the population member it was generated for, and a new
+    trial vector for that member is generated and submitted.  Thus
+    one slow evaluation does not hold up the whole optimization.
+
+    The `opt_algorithm` must support steady-state evolution through
+    methods `new_trial` and `update_member`, as
+    :class:`~gc3libs.optimizer.dif_evolution.DifferentialEvolutionAlgorithm`
+    does.  The initial population is evaluated first, member by member.
+
+    Parameters `jobname`, `path_to_stage_dir`, `opt_algorithm`,
+    `task_constructor` and `extract_value_fn` have the same meaning
+    as in :class:`ParallelDriver`; trial vectors are evaluated in
+    directory ``Iteration-N`` (within `path_to_stage_dir`), where `N`
+    is the iteration count of `opt_algorithm` at the time the trial
+    vector is generated.
+
+    :param int max_live: Maximum number of evaluations in flight; by
+                         default, one per population member.
+
+    Parameters `cache` and `surrogate` have the same meaning as in
+    :class:`ParallelDriver`.  Trial vectors whose value is cached,
+    or that are predicted not to beat their population member, are
+    not submitted but still count as evaluations towards advancing
+    the iteration count.  Each time free evaluation slots are
+    refilled, the surrogate may reject at most as many trial vectors
+    as there are free slots; further trial vectors are submitted
+    without screening.
+
+    The optimizer state and the in-flight evaluations are saved
+    together with the driver, so an optimization can be resumed
+    after the controlling script has been stopped.  Evaluations whose
+    value cannot be extracted are discarded, and a new trial vector
+    is generated for the same population member.
+    """
+
+    def __init__(self, jobname='', path_to_stage_dir='',
+                 opt_algorithm=None, task_constructor=None,
+                 extract_value_fn=_get_value,
+                 max_live=0, cache=None, surrogate=None, **extra_args):
+
+        gc3libs.log.debug('entering AsyncParallelDriver.__init__')
+
+        self.jobname = jobname
+        self.path_to_stage_dir = path_to_stage_dir
+        self.opt_algorithm = opt_algorithm
+        self.extract_value_fn = extract_value_fn
+        self.task_constructor = task_constructor
+        # population members with no evaluation in flight
+        self._idle = range(opt_algorithm.pop_size)
+        # population members whose initial value is known
+        self._seeded = np.zeros(opt_algorithm.pop_size, dtype=bool)
+        self._converged = False
+        if surrogate is not None and cache is None:
+            cache = EvaluationCache()
+        self.cache = cache
+        self.surrogate = surrogate
+
+        StreamingTaskCollection.__init__(
+            self, max_live=(max_live or opt_algorithm.pop_size),
+            **extra_args)
+
+    def _next_params(self, count):
+        result = []
+        # limit the number of trial vectors the surrogate may reject
+        # in one go; once reached, trial vectors are submitted
+        # without screening, so that a pessimistic surrogate cannot
+        # keep the driver from ever submitting evaluations
+        screenings = count
+        while self._idle and len(result) < count and not self._exhausted:
+            ix = self._idle.pop(0)
+            if self._seeded[ix]:
+                x = self.opt_algorithm.new_trial(ix)
+            else:
+                x = self.opt_algorithm.pop[ix].copy()
+            if self.cache is not None:
+                value = self.cache.get(x)
+                if (value is None and self._seeded[ix]
+                        and self.surrogate is not None
+                        and screenings > 0
+                        and not self.cache.screen(
+                            self.surrogate, [x],
+                            [self.opt_algorithm.vals[ix]])[0]):
+                    value = np.inf
+                    screenings -= 1
+                if value is not None:
+                    # no need to submit an evaluation
+                    self._idle.append(ix)
+                    self._update(ix, x, value)
+                    continue
+            result.append((ix, x))
+        self._cursor += len(result)
+        return result
+
+    def new_task(self, param, **extra_args):
+        ix, x = param
+        iteration_folder = os.path.join(
+            self.path_to_stage_dir,
+            'Iteration-' + str(self.opt_algorithm.cur_iter))
+        if not os.path.isdir(iteration_folder):
+            os.makedirs(iteration_folder)
+        task = self.task_constructor(x, iteration_folder)
+        # remember which population member this is a trial for
+        task._opt_ix = ix
+        task._opt_x = x
+        return task
+
+    def task_done(self, task):
+        ix = task._opt_ix
+        self._idle.append(ix)
+        try:
+            value = self.extract_value_fn(task)
+        except Exception as err:
+            gc3libs.log.warning(
+                "%s: could not get value of evaluation %s: %s;"
+                " will try another trial vector for population member %d.",
+                self.jobname, task, err, ix)
+            return
+        if self.cache is not None:
+            self.cache.add(task._opt_x, value)
+        self._update(ix, task._opt_x, value)
+
+    def _update(self, ix, x, value):
+        self._seeded[ix] = True
+        algo = self.opt_algorithm
+        algo.update_member(ix, x, value)
+        if algo.cur_iter > algo.itermax:
+            # maximum number of iterations exceeded; stop generating
+            # trial vectors and let the running evaluations finish
+            self._exhausted = True
+        elif self._seeded.all() and algo.has_converged():
+            self._converged = True
+            self._exhausted = True
+
+    def update_state(self, **extra_args):
+        old_state = self.execution.state
+        state = StreamingTaskCollection.update_state(self, **extra_args)
+        if (state == gc3libs.Run.State.TERMINATED
+                and old_state != gc3libs.Run.State.TERMINATED):
+            # failed evaluations are replaced by new ones, so the
+            # outcome only depends on convergence: exit with
+            # `EX_TEMPFAIL` if `itermax` was exceeded, like
+            # `ParallelDriver` does
+            self.execution.returncode = (
+                0, (0 if self._converged else os.EX_TEMPFAIL))
+        return state
+
+    def __str__(self):
+        return self.jobname
+
+
 class ComputeTargetVals(ParallelTaskCollection):
 
     """
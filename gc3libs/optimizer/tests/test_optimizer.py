@@ -36,11 +36,16 @@ from gc3libs import Application, configure_logger
 from gc3libs.cmdline import SessionBasedScript
 
 # optimizer specific imports
-from gc3libs.optimizer import draw_population
+from gc3libs.optimizer import (EvaluationCache, NearestNeighbourSurrogate,
+                               RBFSurrogate, draw_population)
 from gc3libs.utils import update_parameter_in_file
-from gc3libs.optimizer.drivers import ParallelDriver, SequentialDriver
+from gc3libs.optimizer.drivers import (AsyncParallelDriver, ParallelDriver,
+                                       SequentialDriver)
 from gc3libs.optimizer.dif_evolution import DifferentialEvolutionAlgorithm
 from gc3libs.optimizer.extra import print_stats, log_stats, plot_population
+from gc3libs.persistence import make_store
+
+from gc3libs.testing.helpers import SuccessfulApp, temporary_engine
 
 
 class TestSequentialDriver(object):
@@ -135,6 +140,268 @@ class TestSequentialDriver(object):
         return [x[0] + x[1] <= filter_pop_sum for x in pop]
 
 
+def _evaluate_rosenbrock(x_vals, iteration_directory):
+    # no need to actually run anything: just compute the value
+    app = SuccessfulApp('rosenbrock')
+    app.value = TestSequentialDriver.rosenbrock_fn([x_vals])[0]
+    return app
+
+
+def _get_value(app):
+    return app.value
+
+
+def test_AsyncParallelDriver():
+    """Test :class:`gc3libs.optimizer.drivers.AsyncParallelDriver`"""
+    dim = 2
+    pop_size = 10
+    initial_pop = draw_population(
+        lower_bds=-2 * np.ones(dim), upper_bds=+2 * np.ones(dim),
+        dim=dim, size=pop_size, seed=100)
+    algo = DifferentialEvolutionAlgorithm(
+        initial_pop=initial_pop,
+        itermax=20,
+        y_conv_crit=1e-8,
+        dx_conv_crit=1e-8,
+        seed=100)
+    stage_dir = tempfile.mkdtemp(prefix='AsyncParallelDriver_')
+    try:
+        driver = AsyncParallelDriver(
+            jobname='async', path_to_stage_dir=stage_dir,
+            opt_algorithm=algo, task_constructor=_evaluate_rosenbrock,
+            max_live=4)
+        # the driver (with the default `extract_value_fn`) can be saved
+        store = make_store(os.path.join(stage_dir, 'store'))
+        with temporary_engine() as engine:
+            engine.add(driver)
+            while algo.n_evals < pop_size + 5:
+                engine.progress()
+                # never more than `max_live` evaluations in flight
+                assert len(driver.tasks) <= 4
+            best_y = algo.best_y
+            assert best_y == algo.vals.min()
+            driver_id = store.save(driver)
+
+        # optimization can be resumed from the saved state
+        driver = store.load(driver_id)
+        algo = driver.opt_algorithm
+        assert algo.best_y == best_y
+        with temporary_engine() as engine:
+            engine.add(driver)
+            while driver.execution.state != gc3libs.Run.State.TERMINATED:
+                engine.progress()
+        # did not converge, so stopped after `itermax` iterations
+        assert algo.cur_iter == algo.itermax + 1
+        assert algo.best_y <= best_y
+        assert driver.execution.exitcode == os.EX_TEMPFAIL
+    finally:
+        shutil.rmtree(stage_dir)
+
+
+def test_new_trial():
+    dim = 3
+    pop_size = 6
+    initial_pop = draw_population(
+        lower_bds=-2 * np.ones(dim), upper_bds=+2 * np.ones(dim),
+        dim=dim, size=pop_size, seed=100)
+    for strategy in ['DE_rand', 'DE_local_to_best', 'DE_best_with_jitter',
+                     'DE_rand_with_per_vector_dither',
+                     'DE_rand_with_per_generation_dither',
+                     'DE_rand_either_or_algorithm']:
+        for exp_cross in False, True:
+            algo = DifferentialEvolutionAlgorithm(
+                initial_pop=initial_pop.copy(), de_strategy=strategy,
+                prob_crossover=0.5, exp_cross=exp_cross, seed=100,
+                # only accept vectors in the positive half-space
+                in_domain=(lambda pop: pop[:, 0] > 0))
+            algo.best_x = initial_pop[0]
+            trial = algo.new_trial(2)
+            assert trial.shape == (dim,)
+            assert trial[0] > 0
+
+
+def test_pickle_drops_unpicklable_functions():
+    import cPickle as pickle
+    initial_pop = draw_population(
+        lower_bds=-2 * np.ones(2), upper_bds=+2 * np.ones(2),
+        dim=2, size=10, seed=100)
+    algo = DifferentialEvolutionAlgorithm(
+        initial_pop=initial_pop,
+        in_domain=(lambda pop: np.array([True] * len(pop))),
+        after_update_opt_state=[print_stats, lambda algo: None],
+        seed=100)
+    algo = pickle.loads(pickle.dumps(algo, pickle.HIGHEST_PROTOCOL))
+    assert algo.in_domain == algo._default_in_domain
+    assert algo.after_update_opt_state == [print_stats]
+
+
+def _count_evaluations(x_vals, iteration_directory):
+    _count_evaluations.count += 1
+    return _evaluate_rosenbrock(x_vals, iteration_directory)
+_count_evaluations.count = 0
+
+
+def test_EvaluationCache():
+    cache = EvaluationCache(resolution=0.1)
+    cache.add([1.0, 2.0], 3.0)
+    # failed evaluations are not recorded
+    cache.add([5.0, 5.0], np.nan)
+    assert len(cache) == 1
+    assert cache.get([1.01, 1.98]) == 3.0
+    assert [1.2, 2.0] not in cache
+    assert cache.get([1.2, 2.0], 'missing') == 'missing'
+
+
+def test_surrogates():
+    xs = np.array([[0., 0.], [1., 0.], [0., 1.], [1., 1.]])
+    ys = np.array([0., 1., 1., 2.])
+    # RBF interpolation is exact at the data points
+    rbf = RBFSurrogate()
+    assert np.allclose(rbf.predict(xs, ys, xs), ys)
+    nn = NearestNeighbourSurrogate()
+    assert (nn.predict(xs, ys, np.array([[0.9, 0.1]])) == [1.]).all()
+
+    cache = EvaluationCache()
+    for x, y in zip(xs, ys):
+        cache.add(x, y)
+    # not enough points for screening in 2 dimensions
+    assert cache.screen(nn, [[0.1, 0.1]], [0.5]).all()
+    cache.add([2., 2.], 8.)
+    assert (cache.screen(nn, [[0.1, 0.1], [1.9, 1.9]], [0.5, 0.5])
+            == [True, False]).all()
+
+
+def test_ParallelDriver_with_cache():
+    """Test that :class:`ParallelDriver` does not evaluate points twice"""
+    dim = 2
+    initial_pop = draw_population(
+        lower_bds=-2 * np.ones(dim), upper_bds=+2 * np.ones(dim),
+        dim=dim, size=10, seed=100)
+    algo = DifferentialEvolutionAlgorithm(
+        initial_pop=initial_pop, itermax=10,
+        y_conv_crit=1e-8, dx_conv_crit=1e-8, seed=100)
+    cache = EvaluationCache()
+    for x in initial_pop:
+        cache.add(x, TestSequentialDriver.rosenbrock_fn([x])[0])
+    stage_dir = tempfile.mkdtemp(prefix='ParallelDriver_')
+    try:
+        _count_evaluations.count = 0
+        driver = ParallelDriver(
+            jobname='cached', path_to_stage_dir=stage_dir,
+            opt_algorithm=algo, task_constructor=_count_evaluations,
+            extract_value_fn=_get_value,
+            cache=cache, surrogate=NearestNeighbourSurrogate())
+        # only one member of the initial population is evaluated
+        assert _count_evaluations.count == 1
+        with temporary_engine() as engine:
+            engine.add(driver)
+            while driver.execution.state != gc3libs.Run.State.TERMINATED:
+                engine.progress()
+        assert algo.cur_iter == algo.itermax + 1
+        # pre-screening saves a good share of the evaluations
+        assert _count_evaluations.count < 10 * algo.itermax
+        assert len(cache) == 10 + _count_evaluations.count - 1
+        assert algo.best_y == algo.vals.min()
+    finally:
+        shutil.rmtree(stage_dir)
+
+
+def test_AsyncParallelDriver_with_surrogate():
+    dim = 2
+    initial_pop = draw_population(
+        lower_bds=-2 * np.ones(dim), upper_bds=+2 * np.ones(dim),
+        dim=dim, size=10, seed=100)
+    algo = DifferentialEvolutionAlgorithm(
+        initial_pop=initial_pop, itermax=10,
+        y_conv_crit=1e-8, dx_conv_crit=1e-8, seed=100)
+    stage_dir = tempfile.mkdtemp(prefix='AsyncParallelDriver_')
+    try:
+        _count_evaluations.count = 0
+        driver = AsyncParallelDriver(
+            jobname='async', path_to_stage_dir=stage_dir,
+            opt_algorithm=algo, task_constructor=_count_evaluations,
+            extract_value_fn=_get_value, max_live=4,
+            surrogate=RBFSurrogate())
+        with temporary_engine() as engine:
+            engine.add(driver)
+            while driver.execution.state != gc3libs.Run.State.TERMINATED:
+                engine.progress()
+        assert algo.cur_iter == algo.itermax + 1
+        assert algo.n_evals >= 10 * algo.itermax
+        assert _count_evaluations.count < algo.n_evals
+        assert len(driver.cache) == _count_evaluations.count
+    finally:
+        shutil.rmtree(stage_dir)
+
+
+class _RejectAllSurrogate(object):
+    min_points = 1
+
+    def predict(self, points, values, trials):
+        return np.inf * np.ones(len(trials))
+
+
+def test_AsyncParallelDriver_caps_rejections():
+    dim = 2
+    initial_pop = draw_population(
+        lower_bds=-2 * np.ones(dim), upper_bds=+2 * np.ones(dim),
+        dim=dim, size=10, seed=100)
+    algo = DifferentialEvolutionAlgorithm(
+        initial_pop=initial_pop, itermax=1000, seed=100)
+    stage_dir = tempfile.mkdtemp(prefix='AsyncParallelDriver_')
+    try:
+        driver = AsyncParallelDriver(
+            jobname='async', path_to_stage_dir=stage_dir,
+            opt_algorithm=algo, task_constructor=_evaluate_rosenbrock,
+            max_live=4, surrogate=_RejectAllSurrogate())
+        # seed the population
+        params = driver._next_params(10)
+        for ix, x in params:
+            driver._idle.append(ix)
+            driver.cache.add(x, _rosenbrock(x))
+            driver._update(ix, x, _rosenbrock(x))
+        assert algo.n_evals == 10
+        # trial vectors are still submitted, after at most 4 rejections
+        params = driver._next_params(4)
+        assert len(params) == 4
+        assert algo.n_evals == 14
+    finally:
+        shutil.rmtree(stage_dir)
+
+
+def _rosenbrock(x):
+    return 100 * (x[1] - x[0] ** 2) ** 2 + (1 - x[0]) ** 2
+
+
+def _run_sequential_driver(**extra_args):
+    dim = 2
+    initial_pop = draw_population(
+        lower_bds=-2 * np.ones(dim), upper_bds=+2 * np.ones(dim),
+        dim=dim, size=20, seed=100)
+    algo = DifferentialEvolutionAlgorithm(
+        initial_pop=initial_pop, itermax=30,
+        y_conv_crit=1e-8, dx_conv_crit=1e-8, seed=100)
+    SequentialDriver(algo, **extra_args).de_opt()
+    return algo
+
+
+def test_SequentialDriver_with_pool():
+    """Test mapping the target function over a process pool."""
+    import multiprocessing
+    pool = multiprocessing.Pool(2)
+    try:
+        algo1 = _run_sequential_driver(target_fn=_rosenbrock, pool=pool)
+    finally:
+        pool.terminate()
+    algo2 = _run_sequential_driver(
+        target_fn=TestSequentialDriver.rosenbrock_fn)
+    algo3 = _run_sequential_driver(target_fn=_rosenbrock, vectorized=False)
+    # same seed, same results irrespective of the evaluation method
+    assert algo1.best_y == algo2.best_y == algo3.best_y
+    assert (algo1.best_x == algo2.best_x).all()
+    assert (algo1.best_x == algo3.best_x).all()
+
+
 class TestParallelDriver(cli.test.FunctionalTest):
     CONF = """
 [resource/localhost_test]
@@ -21,19 +21,28 @@
 __docformat__ = 'reStructuredText'
 
 # stdlib imports
+from contextlib import contextmanager
+import errno
+import hashlib
 import os
+import re
+import sqlite3
 import sys
+import threading
+import time
 
 # GC3Pie imports
 import gc3libs
 import gc3libs.exceptions
+import gc3libs.metrics
+import gc3libs.utils
 from gc3libs.utils import same_docstring_as
 from gc3libs.url import Url
 
 from gc3libs.persistence.idfactory import IdFactory
 from gc3libs.persistence.serialization import (DEFAULT_PROTOCOL, make_pickler,
                                                make_unpickler)
-from gc3libs.persistence.store import Store
+from gc3libs.persistence.store import Store, _stats_keys, _submission_time
 
 
 # persist objects in a filesystem directory
@@ -46,6 +55,20 @@ class FilesystemStore(Store):
 
     All objects are saved as files in the given directory (default:
     `gc3libs.Default.JOBS_DIR`).  The file name is the object ID.
+    Unless optional argument `sharded` is ``False``, files in a *new*
+    store directory are spread over 256 subdirectories, named after
+    the first two hex digits of the SHA1 hash of the object ID, so
+    that no single directory grows too large; a ``.layout`` file in
+    the store directory records this.  Directories populated by older
+    versions of GC3Pie (or with ``sharded=False``) keep all files in
+    the store directory itself.
+
+    Files are written to a temporary file first, which then replaces
+    the previous version with an atomic `os.rename`, so a saved object
+    is never left half-written.  If optional argument `fsync` is
+    ``True``, data is also flushed to disk before the rename, so the
+    new version survives a machine crash (at a considerable cost in
+    speed).
 
     If an object contains references to other `Persistable` objects,
     these are saved in the file they would have been saved if the
@@ -62,14 +85,41 @@ class FilesystemStore(Store):
     The `protocol` argument specifies the serialization protocol to use,
     if different from `gc3libs.persistence.serialization.DEFAULT_PROTOCOL`.
 
+    A "sidecar" SQLite database (file ``.index.db`` in the store
+    directory) records the state and return code of each saved
+    `Task` (together with the attributes used by `query`:meth:), so
+    that `query`:meth:, `stats`:meth: and `last_transition_time`:meth:
+    can be answered without loading any object; in a sharded store, it
+    also records the IDs of all saved objects, so that `list`:meth:
+    need not scan the store directory.  The index is only created
+    in a new (empty) store directory; for directories populated by
+    older versions of GC3Pie, or if updating the index ever fails, the
+    index is not used and those methods fall back to loading each
+    object (or scanning the directory).  Updates to the index are
+    written once per `batch`:meth: (e.g., once per `Engine` cycle),
+    through a single connection per `FilesystemStore` instance.
+
+    SQLite locking is not reliable on network filesystems (NFS,
+    Lustre, etc.), so the index is not used (and any existing one is
+    removed) if the store directory is on one of those.  Optional
+    argument `index` overrides this: if ``True``, always use the
+    index; if ``False``, never use it.
+
     Any extra keyword arguments are ignored for compatibility with
     `SqlStore`.
     """
 
+    INDEX_FILENAME = '.index.db'
+
+    LAYOUT_FILENAME = '.layout'
+
     def __init__(self,
                  directory=gc3libs.Default.JOBS_DIR,
                  idfactory=IdFactory(),
                  protocol=DEFAULT_PROTOCOL,
+                 sharded=True,
+                 fsync=False,
+                 index=None,
                  **extra_args):
         if isinstance(directory, Url):
             super(FilesystemStore, self).__init__(directory)
@@ -82,12 +132,399 @@ class FilesystemStore(Store):
         self.idfactory = idfactory
         self._protocol = protocol
 
+        self._fsync = fsync
+        # avoid checking for the store directory on every save
+        self._directory_exists = False
+
+        # layout of a new store directory; the actual layout is
+        # determined upon first use, see `_is_sharded`
+        self._want_sharded = sharded
+        self._sharded = None
+        self._layout_recorded = False
+
+        # whether the sidecar index can be used; see `_check_index`
+        self._index_path = os.path.join(self._directory, self.INDEX_FILENAME)
+        self._want_index = index
+        self._index_usable = None
+        # connection to the index, shared by all threads; see `_open_index`
+        self._index = None
+        self._index_pid = None
+        self._index_lock = threading.RLock()
+        # index updates deferred until the end of the current batch
+        self._batch_depth = 0
+        self._pending = {}
+
+    def _is_sharded(self):
+        """
+        Return ``True`` if object files are kept in subdirectories.
+        """
+        if self._sharded is None:
+            if os.path.exists(
+                    os.path.join(self._directory, self.LAYOUT_FILENAME)):
+                self._sharded = True
+            elif self._has_unsharded_files():
+                # populated by older versions of GC3Pie
+                self._sharded = False
+            else:
+                self._sharded = self._want_sharded
+        return self._sharded
+
+    def _has_unsharded_files(self):
+        """
+        Return ``True`` if there are object files directly in the
+        store directory.
+        """
+        try:
+            entries = os.listdir(self._directory)
+        except OSError:
+            return False
+        # shard directory names are 2 characters long, and object IDs
+        # are longer than that
+        return any((len(entry) != 2 and not entry.startswith('.'))
+                   for entry in entries)
+
+    def _path(self, id_):
+        """
+        Return path to the file where object `id_` is saved.
+        """
+        id_ = str(id_)
+        if self._is_sharded():
+            return os.path.join(self._directory,
+                                hashlib.sha1(id_).hexdigest()[:2], id_)
+        else:
+            return os.path.join(self._directory, id_)
+
+    def _scan(self, sharded):
+        """
+        Return list of IDs of objects saved in the store directory,
+        assuming files are laid out according to `sharded`.
+        """
+        def ids_in(path):
+            try:
+                entries = os.listdir(path)
+            except OSError as err:
+                if err.errno == errno.ENOENT:
+                    return []
+                raise
+            return [entry for entry in entries
+                    if not (entry.endswith('.OLD') or entry.startswith('.'))]
+        if not sharded:
+            return ids_in(self._directory)
+        result = []
+        for shard in ids_in(self._directory):
+            if len(shard) == 2:
+                result.extend(ids_in(os.path.join(self._directory, shard)))
+        return result
+
     @same_docstring_as(Store.list)
     def list(self):
-        if not os.path.exists(self._directory):
-            return []
-        return [id_ for id_ in os.listdir(self._directory)
-                if not id_.endswith('.OLD')]
+        if self._is_sharded():
+            with self._index_lock:
+                conn = self._flush_index()
+                if conn is not None:
+                    return [str(row[0]) for row in
+                            conn.execute('SELECT id FROM objects')]
+        return self._scan(self._is_sharded())
+
+    def _open_index(self):
+        """
+        Return the connection to the sidecar index, or ``None`` if the
+        index cannot be used.
+
+        The connection is opened upon first use, and then kept open
+        and shared by all threads; callers must hold `_index_lock`
+        while using it.
+        """
+        if not self._check_index():
+            return None
+        if self._index is not None and self._index_pid == os.getpid():
+            return self._index
+        # first use, or a connection inherited across `fork()`,
+        # which cannot be used safely
+        try:
+            gc3libs.utils.mkdir(self._directory)
+            conn = sqlite3.connect(self._index_path, check_same_thread=False)
+            # the index is not essential, so trade durability for
+            # speed; WAL mode still guarantees consistency after a
+            # crash (older SQLite versions ignore this)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS tasks ('
+                    ' id TEXT PRIMARY KEY,'
+                    ' state TEXT,'
+                    ' returncode INTEGER,'
+                    ' changed REAL,'
+                    ' jobname TEXT,'
+                    ' exitcode INTEGER,'
+                    ' submitted REAL)')
+                conn.execute(
+                    'CREATE INDEX IF NOT EXISTS tasks_state'
+                    ' ON tasks (state)')
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS objects ('
+                    ' id TEXT PRIMARY KEY)')
+        except sqlite3.Error as err:
+            self._discard_index(err)
+            return None
+        self._index = conn
+        self._index_pid = os.getpid()
+        return conn
+
+    def _check_index(self):
+        """
+        Return ``True`` if the sidecar index can be used.
+        """
+        if self._index_usable is None:
+            want = self._want_index
+            if want is None:
+                fstype = _network_filesystem_type(self._directory)
+                want = (fstype is None)
+                if not want:
+                    gc3libs.log.debug(
+                        "Store directory '%s' is on a network filesystem"
+                        " (%s): not using index '%s'.",
+                        self._directory, fstype, self._index_path)
+            if not want:
+                self._index_usable = False
+                # an index that is not kept up-to-date would mislead
+                # other users of this store
+                try:
+                    os.remove(self._index_path)
+                except OSError:
+                    pass
+            else:
+                # an index created now in a populated directory would
+                # be out of sync with its contents
+                self._index_usable = (os.path.exists(self._index_path)
+                                      or not self._scan(self._is_sharded()))
+        return self._index_usable
+
+    def _discard_index(self, err):
+        """
+        Stop using the sidecar index after error `err`.
+        """
+        gc3libs.log.warning(
+            "Error using index '%s' of store '%s': %s: %s;"
+            " removing index.",
+            self._index_path, self._directory, err.__class__.__name__, err)
+        self._index_usable = False
+        self._pending.clear()
+        if self._index is not None:
+            try:
+                self._index.close()
+            except sqlite3.Error:
+                pass
+            self._index = None
+        try:
+            os.remove(self._index_path)
+        except OSError:
+            pass
+
+    @contextmanager
+    def batch(self):
+        """
+        Defer updates to the sidecar index until the outermost
+        `batch` context exits, and then write them all in a single
+        transaction.
+        """
+        with self._index_lock:
+            self._batch_depth += 1
+        try:
+            yield
+        finally:
+            with self._index_lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self._flush_index()
+
+    def _flush_index(self):
+        """
+        Write deferred updates to the sidecar index.
+
+        Return the index connection, or ``None`` if the index cannot
+        be used.  Must be called with `_index_lock` held.
+        """
+        conn = self._open_index()
+        if conn is None or not self._pending:
+            return conn
+        pending, self._pending = self._pending, {}
+        now = time.time()
+        try:
+            with conn:
+                for id_, values in pending.iteritems():
+                    if values is None:
+                        # removed
+                        conn.execute(
+                            'DELETE FROM tasks WHERE id = ?', (id_,))
+                        continue
+                    # only bump the `changed` time if something changed
+                    cursor = conn.execute(
+                        'UPDATE tasks SET state = ?, returncode = ?,'
+                        ' jobname = ?, exitcode = ?, submitted = ?,'
+                        ' changed = ?'
+                        ' WHERE id = ? AND NOT (state IS ?'
+                        ' AND returncode IS ? AND jobname IS ?'
+                        ' AND exitcode IS ? AND submitted IS ?)',
+                        values + (now, id_) + values)
+                    if cursor.rowcount == 0:
+                        # no such row, or no change
+                        conn.execute(
+                            'INSERT OR IGNORE INTO tasks'
+                            ' (state, returncode, jobname, exitcode,'
+                            '  submitted, changed, id)'
+                            ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            values + (now, id_))
+        except sqlite3.Error as err:
+            # do not keep an index that is out of sync with the store
+            self._discard_index(err)
+            return None
+        return conn
+
+    def _update_index(self, id_, obj):
+        """
+        Record state of `obj` (or its removal, if `obj` is ``None``)
+        in the sidecar index.
+
+        Removals are written immediately; other updates are deferred
+        until the end of the current `batch`:meth:, if any.
+        """
+        id_ = str(id_)
+        if obj is None:
+            values = None
+        elif _submission_time(obj) is None:
+            # not a task
+            return
+        else:
+            job = obj.execution
+            values = (job.state, job.returncode,
+                      getattr(obj, 'jobname', None), job.exitcode,
+                      _submission_time(obj))
+        with self._index_lock:
+            if not self._check_index():
+                return
+            self._pending[id_] = values
+            if obj is None:
+                conn = self._flush_index()
+                if conn is None:
+                    return
+                try:
+                    with conn:
+                        conn.execute(
+                            'DELETE FROM objects WHERE id = ?', (id_,))
+                except sqlite3.Error as err:
+                    self._discard_index(err)
+            elif self._batch_depth == 0:
+                self._flush_index()
+
+    def _add_to_index(self, id_):
+        """
+        Record in the sidecar index that object `id_` is in the store.
+
+        This is done *before* the object file is written: should the
+        process crash in between, `list` will report an object that
+        cannot be loaded, rather than silently missing one.
+
+        The index is queried on every save, as other processes using
+        the same store may have removed the object meanwhile.  Return
+        ``True`` if the object was not recorded in the index yet.
+        """
+        id_ = str(id_)
+        with self._index_lock:
+            conn = self._open_index()
+            if conn is None:
+                return False
+            try:
+                with conn:
+                    cursor = conn.execute(
+                        'INSERT OR IGNORE INTO objects VALUES (?)', (id_,))
+                return (cursor.rowcount == 1)
+            except sqlite3.Error as err:
+                self._discard_index(err)
+                return False
+
+    def _remove_from_index(self, id_):
+        """
+        Undo `_add_to_index`:meth: for object `id_`.
+        """
+        id_ = str(id_)
+        with self._index_lock:
+            conn = self._open_index()
+            if conn is None:
+                return
+            try:
+                with conn:
+                    conn.execute('DELETE FROM objects WHERE id = ?', (id_,))
+            except sqlite3.Error as err:
+                self._discard_index(err)
+
+    @same_docstring_as(Store.query)
+    def query(self, states=None, jobname=None, exitcodes=None,
+              successful=None, submitted_after=None, submitted_before=None):
+        conds = []
+        args = []
+        if states is not None:
+            states = list(states)
+            conds.append('state IN (%s)' % ', '.join('?' * len(states)))
+            args.extend(states)
+        if exitcodes is not None:
+            exitcodes = list(exitcodes)
+            conds.append('exitcode IN (%s)' % ', '.join('?' * len(exitcodes)))
+            args.extend(exitcodes)
+        if successful is True:
+            conds.append('returncode = 0')
+        elif successful is False:
+            conds.append('returncode != 0')
+        if submitted_after is not None:
+            conds.append('submitted >= ?')
+            args.append(submitted_after)
+        if submitted_before is not None:
+            conds.append('submitted <= ?')
+            args.append(submitted_before)
+        q = 'SELECT id, jobname FROM tasks'
+        if conds:
+            q += ' WHERE ' + str.join(' AND ', conds)
+        with self._index_lock:
+            conn = self._flush_index()
+            if conn is not None:
+                rows = conn.execute(q, args).fetchall()
+        if conn is None:
+            return super(FilesystemStore, self).query(
+                states, jobname, exitcodes, successful,
+                submitted_after, submitted_before)
+        if jobname is None:
+            return [str(row[0]) for row in rows]
+        # SQLite has no built-in regexp matching, so do it here
+        regexp = re.compile(jobname, re.I)
+        return [str(id_) for id_, name in rows
+                if name is not None and regexp.search(name)]
+
+    @same_docstring_as(Store.stats)
+    def stats(self):
+        with self._index_lock:
+            conn = self._flush_index()
+            if conn is not None:
+                rows = conn.execute(
+                    'SELECT state, returncode, count(*) FROM tasks'
+                    ' GROUP BY state, returncode = 0').fetchall()
+        if conn is None:
+            return super(FilesystemStore, self).stats()
+        counts = dict((state, 0) for state in gc3libs.Run.State)
+        counts.update(ok=0, failed=0, total=0)
+        for state, returncode, count in rows:
+            for key in _stats_keys(state, returncode):
+                counts[key] += count
+        return counts
+
+    @same_docstring_as(Store.last_transition_time)
+    def last_transition_time(self):
+        with self._index_lock:
+            conn = self._flush_index()
+            if conn is not None:
+                return conn.execute(
+                    'SELECT max(changed) FROM tasks').fetchone()[0]
+        return super(FilesystemStore, self).last_transition_time()
 
     def _load_from_file(self, path):
         """Auxiliary method for `load`."""
@@ -98,7 +535,7 @@ class FilesystemStore(Store):
 
     @same_docstring_as(Store.load)
     def load(self, id_):
-        filename = os.path.join(self._directory, id_)
+        filename = self._path(id_)
         # gc3libs.log.debug("Loading object from file '%s' ...", filename)
 
         if not os.path.exists(filename):
@@ -146,8 +583,9 @@ class FilesystemStore(Store):
 
     @same_docstring_as(Store.remove)
     def remove(self, id_):
-        filename = os.path.join(self._directory, id_)
+        filename = self._path(id_)
         os.remove(filename)
+        self._update_index(id_, None)
 
     @same_docstring_as(Store.replace)
     def replace(self, id_, obj):
@@ -166,51 +604,139 @@ class FilesystemStore(Store):
         destination file exists, create it.  Ensure that the
         destination file is kept intact in case dumping `obj` fails.
         """
-        filename = os.path.join(self._directory, id_)
-        # gc3libs.log.debug("Storing job '%s' into file '%s'", obj, filename)
-
-        if not os.path.exists(self._directory):
-            try:
-                os.makedirs(self._directory)
-            except Exception as ex:
-                # raise same exception but add context message
-                gc3libs.log.error("Could not create jobs directory '%s': %s"
-                                  % (self._directory, str(ex)))
-                raise
+        # must be checked before the directory is populated
+        self._check_index()
 
-        backup = None
-        if os.path.exists(filename):
-            backup = filename + '.OLD'
-            os.rename(filename, backup)
+        if not self._directory_exists:
+            if not os.path.exists(self._directory):
+                try:
+                    os.makedirs(self._directory)
+                except Exception as ex:
+                    # raise same exception but add context message
+                    gc3libs.log.error(
+                        "Could not create jobs directory '%s': %s"
+                        % (self._directory, str(ex)))
+                    raise
+            self._directory_exists = True
+
+        if self._is_sharded():
+            if not self._layout_recorded:
+                layout_file = os.path.join(
+                    self._directory, self.LAYOUT_FILENAME)
+                if not os.path.exists(layout_file):
+                    gc3libs.utils.write_contents(layout_file, 'sharded\n')
+                self._layout_recorded = True
+            added = self._add_to_index(id_)
+        else:
+            added = False
 
-        # TODO: this should become `with tgt = ...:` as soon as we
-        # stop supporting Python 2.4
-        tgt = None
+        filename = self._path(id_)
+        # gc3libs.log.debug("Storing job '%s' into file '%s'", obj, filename)
+        dirname = os.path.dirname(filename)
+
+        # the temporary file name must be unique to this process and
+        # thread, and hidden from `list`
+        tmp = os.path.join(dirname, '.%s.%d.%d.tmp' % (
+            os.path.basename(filename), os.getpid(),
+            threading.current_thread().ident))
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
         try:
-            tgt = open(filename, 'w+b')
-            pickler = make_pickler(self, tgt, obj)
-            pickler.dump(obj)
+            try:
+                fd = os.open(tmp, flags, 0o666)
+            except OSError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                # first object in this shard
+                gc3libs.utils.mkdir(dirname)
+                fd = os.open(tmp, flags, 0o666)
+            with os.fdopen(fd, 'wb') as tgt:
+                with gc3libs.metrics.registry.timer(
+                        'store_save_seconds', store=self.__class__.__name__):
+                    pickler = make_pickler(self, tgt, obj)
+                    pickler.dump(obj)
+                gc3libs.metrics.registry.incr(
+                    'store_pickled_bytes_total', tgt.tell(),
+                    store=self.__class__.__name__)
+                if self._fsync:
+                    tgt.flush()
+                    os.fsync(tgt.fileno())
+            os.rename(tmp, filename)
+            if self._fsync:
+                _fsync_dir(dirname)
             if hasattr(obj, 'changed'):
                 obj.changed = False
-            tgt.close()
-            try:
-                os.remove(backup)
-            except:
-                pass  # ignore errors
         except Exception as ex:
             gc3libs.log.error("Error saving job '%s' to file '%s': %s: %s",
                               obj, filename, ex.__class__.__name__, ex)
-            if tgt is not None:
-                try:
-                    tgt.close()
-                except:
-                    pass  # ignore errors
-            if backup is not None:
-                try:
-                    os.rename(backup, filename)
-                except:
-                    pass  # ignore errors
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass  # ignore errors
+            if added and not os.path.exists(filename):
+                # first save failed, do not list a non-existing object
+                self._remove_from_index(id_)
             raise
+        self._update_index(id_, obj)
+
+
+# filesystem types on which SQLite locking cannot be relied upon
+_NETWORK_FILESYSTEMS = frozenset([
+    'afs',
+    'beegfs',
+    'ceph',
+    'cifs',
+    'fuse.glusterfs',
+    'fuse.sshfs',
+    'glusterfs',
+    'gpfs',
+    'lustre',
+    'ncpfs',
+    'nfs',
+    'nfs4',
+    'smb3',
+    'smbfs',
+])
+
+
+def _network_filesystem_type(path, mounts='/proc/mounts'):
+    """
+    Return the type of the filesystem `path` is on, if it is a
+    network filesystem, or ``None`` otherwise.
+
+    Mount points are read from file `mounts` (Linux-specific); if
+    that cannot be read, return ``None``.
+    """
+    try:
+        with open(mounts, 'r') as entries:
+            table = [line.split()[1:3] for line in entries]
+    except (IOError, OSError):
+        return None
+    path = os.path.realpath(path)
+    # the mount point that is the longest prefix of `path` wins
+    best, fstype = '', None
+    for entry in table:
+        if len(entry) < 2:
+            continue
+        # spaces in mount points are escaped as ``\040``
+        mountpoint = entry[0].replace('\\040', ' ')
+        if ((path == mountpoint
+             or path.startswith(mountpoint.rstrip('/') + '/'))
+                and len(mountpoint) >= len(best)):
+            best, fstype = mountpoint, entry[1]
+    if fstype in _NETWORK_FILESYSTEMS:
+        return fstype
+    return None
+
+
+def _fsync_dir(path):
+    """
+    Flush changes to directory `path` to disk.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
 
 def make_filesystemstore(url, *args, **extra_args):
@@ -20,7 +20,10 @@
 #
 __docformat__ = 'reStructuredText'
 
+from collections import deque
 import operator
+import threading
+import time
 
 import gc3libs
 from gc3libs.utils import progressive_number
@@ -108,9 +111,20 @@ class IdFactory(object):
     Automatically generate a "unique identifier" (of class `Id`).
     Object identifiers are temporally unique: no identifier will
     (ever) be re-used, even in different invocations of the program.
+
+    Sequence numbers are obtained from `next_id_fn` in blocks, which
+    are then handed out one by one by `new`:meth:; the block size
+    adapts to the allocation rate: it doubles (up to `max_block`)
+    each time a block is used up within `lease_interval` seconds of
+    the previous lease, and is halved otherwise.  Sequence numbers
+    that are leased but not used are simply lost.
     """
 
-    def __init__(self, prefix=None, next_id_fn=None, id_class=Id):
+    #: Leases closer than this (in seconds) make the block size grow.
+    lease_interval = 1.0
+
+    def __init__(self, prefix=None, next_id_fn=None, id_class=Id,
+                 max_block=None):
         """
         Construct an `IdFactory` instance whose `new` method returns
         objects of class `id_class` (default: `Id`:class:) with the
@@ -120,13 +134,27 @@ class IdFactory(object):
         Function `next_id_fn` must conform to the calling syntax and
         behavior of the `gc3libs.utils.progressive_number`:func:
         (which is the one used by default).
+
+        Argument `max_block` is the maximum number of IDs leased at
+        once from `next_id_fn`; it defaults to 1024 if `next_id_fn`
+        is not given, and to 1 (i.e., `next_id_fn` is called without
+        arguments to get each sequence number) otherwise.
         """
         self._prefix = prefix
         if next_id_fn is None:
             self._next_id_fn = progressive_number
+            if max_block is None:
+                max_block = 1024
         else:
             self._next_id_fn = next_id_fn
+            if max_block is None:
+                max_block = 1
         self._idclass = id_class
+        self.max_block = max_block
+        self._block = 1
+        self._last_lease = None
+        self._seqno_pool = deque()
+        self._lock = threading.Lock()
 
     def reserve(self, n):
         """
@@ -136,8 +164,21 @@ class IdFactory(object):
         loop.
         """
         assert n > 0, "Argument `n` must be a positive integer"
-        IdFactory._seqno_pool.extend(self._next_id_fn(n))
-    _seqno_pool = []
+        with self._lock:
+            self._seqno_pool.extend(self._next_id_fn(n))
+
+    def _lease(self):
+        now = time.time()
+        if (self._last_lease is not None
+                and now - self._last_lease < self.lease_interval):
+            self._block = min(2 * self._block, self.max_block)
+        else:
+            self._block = max(1, self._block // 2)
+        self._last_lease = now
+        if self._block > 1:
+            self._seqno_pool.extend(self._next_id_fn(self._block))
+        else:
+            self._seqno_pool.append(self._next_id_fn())
 
     def new(self, obj):
         """
@@ -147,10 +188,10 @@ class IdFactory(object):
             prefix = obj.__class__.__name__
         else:
             prefix = self._prefix
-        if len(IdFactory._seqno_pool) > 0:
-            seqno = IdFactory._seqno_pool.pop()
-        else:
-            seqno = self._next_id_fn()
+        with self._lock:
+            if not self._seqno_pool:
+                self._lease()
+            seqno = self._seqno_pool.popleft()
         return self._idclass(prefix, seqno)
 
 
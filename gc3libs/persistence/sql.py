@@ -27,6 +27,8 @@ __docformat__ = 'reStructuredText'
 from contextlib import closing
 from cStringIO import StringIO
 import os
+import re
+import time
 from warnings import warn
 
 import sqlalchemy as sqla
@@ -35,12 +37,14 @@ import sqlalchemy.sql as sql
 # GC3Pie interface
 from gc3libs import Run
 import gc3libs.exceptions
+import gc3libs.metrics
 import gc3libs.utils
 from gc3libs.utils import same_docstring_as
 
+from gc3libs.persistence.accessors import GetValue
 from gc3libs.persistence.idfactory import IdFactory
 from gc3libs.persistence.serialization import make_pickler, make_unpickler
-from gc3libs.persistence.store import Store
+from gc3libs.persistence.store import Store, _stats_keys, _submission_time
 
 
 def sql_next_id_factory(db):
@@ -79,6 +83,19 @@ class IntId(int):
         return (None, int(self))
 
 
+# columns added to newly-created tables to support `SqlStore.query`
+_QUERY_FIELDS = {
+    sqla.Column('jobname', sqla.String(length=255), index=True):
+        GetValue(default=None).jobname,
+    sqla.Column('exitcode', sqla.Integer(), index=True):
+        GetValue(default=None).execution.exitcode,
+    sqla.Column('returncode', sqla.Integer()):
+        GetValue(default=None).execution.returncode,
+    sqla.Column('submitted', sqla.Float(), index=True):
+        _submission_time,
+}
+
+
 class SqlStore(Store):
 
     """
@@ -119,6 +136,33 @@ class SqlStore(Store):
     - `state`: if the object is a `Task`:class: instance, this will be
       its current execution state.
 
+    When creating the table, the following columns are added as well;
+    they are used by `query`:meth: to select tasks without loading
+    them from the database:
+
+    - `jobname`: the task's `jobname` attribute;
+    - `exitcode`, `returncode`: the task's exit code and return code;
+    - `submitted`: the time the task was submitted (0 if it never
+      was), or ``NULL`` if the object is not a `Task`:class:.
+
+    If the table already exists but lacks any of these columns,
+    `query`:meth: falls back to loading and checking each object.
+
+    Along with the main table, a table named `table_name` +
+    ``_summary`` is created, holding the counters returned by
+    `stats`:meth:; they are updated in the same transaction that
+    saves or removes an object.  Stores whose tables were created by
+    older versions of GC3Pie have no such table, so `stats`:meth:
+    falls back to loading and checking each object.
+
+    Unless an `idfactory` is passed to the constructor, IDs of newly
+    saved objects are taken from a sequence kept in table
+    `table_name` + ``_seq``, which is leased in blocks by
+    `next_ids`:meth:; this sequence starts after the largest ID
+    already in the main table.  If the sequence table does not exist
+    and cannot be created (see argument `create`), IDs are taken from
+    `gc3libs.utils.progressive_number`:func: instead.
+
     The `extra_fields` constructor argument is used to extend the
     database. It must contain a mapping `*column*: *function*`
     where:
@@ -152,7 +196,8 @@ class SqlStore(Store):
 
         # init static public args
         if not idfactory:
-            self.idfactory = IdFactory(id_class=IntId)
+            self.idfactory = IdFactory(
+                id_class=IntId, next_id_fn=self.next_ids, max_block=1024)
         else:
             self.idfactory = idfactory
         self.table_name = table_name
@@ -164,7 +209,10 @@ class SqlStore(Store):
         # create slots for lazy-init'ed attrs
         self._real_engine = None
         self._real_extra_fields = None
+        self._real_query_fields = None
+        self._real_summary = None
         self._real_tables = None
+        self._real_sequence = None
 
     def _delayed_init(self):
         """
@@ -188,23 +236,120 @@ class SqlStore(Store):
             sqla.Column('data',
                         sqla.LargeBinary()),
             sqla.Column('state',
-                        sqla.String(length=128)))
+                        sqla.String(length=128), index=True))
+
+        # check if the db exists and already has a 'store' table
+        current_meta = sqla.MetaData(bind=self._real_engine)
+        current_meta.reflect()
+        current_table = current_meta.tables.get(self.table_name, None)
 
         # create internal rep of table
+        extra_names = set(col.name for col in self._init_extra_fields)
+        self._real_query_fields = {}
+        for col, func in _QUERY_FIELDS.iteritems():
+            if col.name in extra_names:
+                # user-defined columns take precedence
+                continue
+            if current_table is not None and col.name not in current_table.c:
+                # table created by an older version of GC3Pie
+                continue
+            table.append_column(col.copy())
+            self._real_query_fields[col.name] = func
         self._real_extra_fields = {}
         for col, func in self._init_extra_fields.iteritems():
             assert isinstance(col, sqla.Column)
             table.append_column(col.copy())
             self._real_extra_fields[col.name] = func
 
-        # check if the db exists and already has a 'store' table
-        current_meta = sqla.MetaData(bind=self._real_engine)
-        current_meta.reflect()
-        if self._init_create and self.table_name not in current_meta.tables:
+        # counters can only be maintained incrementally if they have
+        # been there since the main table was created
+        summary_name = self.table_name + '_summary'
+        if (len(self._real_query_fields) == len(_QUERY_FIELDS)
+                and (current_table is None
+                     or summary_name in current_meta.tables)):
+            summary = sqla.Table(
+                summary_name,
+                meta,
+                sqla.Column('name',
+                            sqla.String(length=128),
+                            primary_key=True, nullable=False),
+                sqla.Column('count',
+                            sqla.Integer(), nullable=False),
+                sqla.Column('updated',
+                            sqla.Float()))
+        else:
+            summary = None
+
+        if self._init_create and current_table is None:
             meta.create_all()
+            if summary is not None:
+                with closing(self._real_engine.connect()) as conn:
+                    conn.execute(summary.insert(), [
+                        {'name': name, 'count': 0, 'updated': None}
+                        for name in (list(Run.State)
+                                     + ['ok', 'failed', 'total'])
+                    ])
+        elif current_table is None:
+            summary = None
 
         self._real_tables = meta.tables[self.table_name]
+        self._real_summary = summary
+        self._real_sequence = self._init_sequence(current_meta)
+
+
+    def _init_sequence(self, current_meta):
+        seq_name = self.table_name + '_seq'
+        if seq_name not in current_meta.tables and not self._init_create:
+            return None
+        seq = sqla.Table(
+            seq_name,
+            sqla.MetaData(bind=self._real_engine),
+            sqla.Column('name',
+                        sqla.String(length=128),
+                        primary_key=True, nullable=False),
+            sqla.Column('last_id',
+                        sqla.Integer(), nullable=False))
+        if seq_name not in current_meta.tables:
+            try:
+                seq.create(checkfirst=True)
+            except sqla.exc.DBAPIError:
+                # created concurrently by another process
+                pass
+        table = self._real_tables
+        with closing(self._real_engine.connect()) as conn:
+            if conn.execute(sql.select([seq.c.last_id])).first() is None:
+                last_id = conn.execute(
+                    sql.select([sql.func.max(table.c.id)])).scalar()
+                try:
+                    conn.execute(seq.insert().values(
+                        name=self.table_name, last_id=(last_id or 0)))
+                except sqla.exc.IntegrityError:
+                    # initialized concurrently by another process
+                    pass
+        return seq
+
+    def next_ids(self, qty=None):
+        """
+        Return the next ID from this store's sequence, or a list of
+        `qty` consecutive IDs if `qty` is given.
 
+        The calling syntax and behavior is the same as
+        `gc3libs.utils.progressive_number`:func:, which is called if
+        this store has no sequence table.  Only one database
+        transaction is needed for leasing any number of IDs.
+        """
+        if self._real_tables is None:
+            self._delayed_init()
+        seq = self._real_sequence
+        if seq is None:
+            return gc3libs.utils.progressive_number(qty)
+        count = (qty or 1)
+        with self._engine.begin() as conn:
+            conn.execute(seq.update().values(last_id=(seq.c.last_id + count)))
+            last_id = conn.execute(sql.select([seq.c.last_id])).scalar()
+        if qty is None:
+            return last_id
+        return range(last_id - count + 1, last_id + 1)
 
     @property
     def _engine(self):
@@ -234,6 +379,18 @@ class SqlStore(Store):
             self._delayed_init()
         return self._real_extra_fields
 
+    @property
+    def _summary(self):
+        if self._real_tables is None:
+            self._delayed_init()
+        return self._real_summary
+
+    @property
+    def _query_fields(self):
+        if self._real_query_fields is None:
+            self._delayed_init()
+        return self._real_query_fields
+
 
     @same_docstring_as(Store.list)
     def list(self):
@@ -244,6 +401,84 @@ class SqlStore(Store):
         conn.close()
         return ids
 
+    @same_docstring_as(Store.query)
+    def query(self, states=None, jobname=None, exitcodes=None,
+              successful=None, submitted_after=None, submitted_before=None):
+        if len(self._query_fields) < len(_QUERY_FIELDS):
+            return super(SqlStore, self).query(
+                states, jobname, exitcodes, successful,
+                submitted_after, submitted_before)
+        cols = self._tables.c
+        # non-task objects have no submission time
+        conds = [cols.submitted != None]
+        if states is not None:
+            conds.append(cols.state.in_(list(states)))
+        if exitcodes is not None:
+            conds.append(cols.exitcode.in_(list(exitcodes)))
+        if successful is True:
+            conds.append(cols.returncode == 0)
+        elif successful is False:
+            conds.append(sql.and_(cols.returncode != None,
+                                  cols.returncode != 0))
+        if submitted_after is not None:
+            conds.append(cols.submitted >= submitted_after)
+        if submitted_before is not None:
+            conds.append(cols.submitted <= submitted_before)
+        q = sql.select([cols.id, cols.jobname]).where(sql.and_(*conds))
+        with closing(self._engine.connect()) as conn:
+            rows = conn.execute(q).fetchall()
+        if jobname is None:
+            return [row[0] for row in rows]
+        # SQL has no portable regexp matching, so do it here; it's
+        # still way cheaper than loading the objects
+        regexp = re.compile(jobname, re.I)
+        return [id_ for id_, name in rows
+                if name is not None and regexp.search(name)]
+
+    @same_docstring_as(Store.stats)
+    def stats(self):
+        summary = self._summary
+        if summary is None:
+            return super(SqlStore, self).stats()
+        q = sql.select([summary.c.name, summary.c.count])
+        with closing(self._engine.connect()) as conn:
+            return dict(conn.execute(q).fetchall())
+
+    @same_docstring_as(Store.last_transition_time)
+    def last_transition_time(self):
+        summary = self._summary
+        if summary is None:
+            return super(SqlStore, self).last_transition_time()
+        q = sql.select([sql.func.max(summary.c.updated)])
+        with closing(self._engine.connect()) as conn:
+            return conn.execute(q).scalar()
+
+    def _update_summary(self, conn, old, new):
+        """
+        Update counters in the summary table, given the
+        `(state, returncode, submitted)` values of an object before
+        and after a change; `None` stands for a missing object.
+        """
+        delta = dict()
+        for values, incr in [(old, -1), (new, +1)]:
+            if values is None:
+                continue
+            state, returncode, submitted = values
+            if submitted is None:
+                # not a task
+                continue
+            for key in _stats_keys(state, returncode):
+                delta[key] = delta.get(key, 0) + incr
+        now = time.time()
+        summary = self._summary
+        for key, incr in delta.iteritems():
+            if incr == 0:
+                continue
+            conn.execute(
+                summary.update()
+                .where(summary.c.name == key)
+                .values(count=(summary.c.count + incr), updated=now))
+
     @same_docstring_as(Store.replace)
     def replace(self, id_, obj):
         self._save_or_replace(id_, obj)
@@ -259,43 +494,67 @@ class SqlStore(Store):
         # build row to insert/update
         fields = {'id': id_}
 
-        with closing(StringIO()) as dstdata:
-            make_pickler(self, dstdata, obj).dump(obj)
-            fields['data'] = dstdata.getvalue()
-
-        try:
-            fields['state'] = obj.execution.state
-        except AttributeError:
-            # If we cannot determine the state of a task, consider it UNKNOWN.
-            fields['state'] = Run.State.UNKNOWN
+        with gc3libs.metrics.registry.timer(
+                'store_save_seconds', store=self.__class__.__name__):
+            with closing(StringIO()) as dstdata:
+                make_pickler(self, dstdata, obj).dump(obj)
+                fields['data'] = dstdata.getvalue()
+            gc3libs.metrics.registry.incr(
+                'store_pickled_bytes_total', len(fields['data']),
+                store=self.__class__.__name__)
 
-        # insert into db
-        for column in self.extra_fields:
             try:
-                fields[column] = self.extra_fields[column](obj)
-                gc3libs.log.debug(
-                    "Writing value '%s' in column '%s' for object '%s'",
-                    fields[column], column, obj)
-            except Exception as ex:
-                gc3libs.log.warning(
-                    "Error saving DB column '%s' of object '%s': %s: %s",
-                    column, obj, ex.__class__.__name__, str(ex))
-
-        with closing(self._engine.connect()) as conn:
-            q = sql.select([self._tables.c.id]).where(self._tables.c.id == id_)
-            r = conn.execute(q)
-            if not r.fetchone():
-                # It's an insert
-                q = self._tables.insert().values(**fields)
-                conn.execute(q)
+                fields['state'] = obj.execution.state
+            except AttributeError:
+                # If we cannot determine the state of a task, consider it UNKNOWN.
+                fields['state'] = Run.State.UNKNOWN
+
+            # columns used by `query`
+            for column, func in self._query_fields.iteritems():
+                try:
+                    fields[column] = func(obj)
+                # pylint: disable=broad-except
+                except Exception:
+                    fields[column] = None
+
+            # insert into db
+            for column in self.extra_fields:
+                try:
+                    fields[column] = self.extra_fields[column](obj)
+                    gc3libs.log.debug(
+                        "Writing value '%s' in column '%s' for object '%s'",
+                        fields[column], column, obj)
+                except Exception as ex:
+                    gc3libs.log.warning(
+                        "Error saving DB column '%s' of object '%s': %s: %s",
+                        column, obj, ex.__class__.__name__, str(ex))
+
+            cols = self._tables.c
+            if self._summary is None:
+                selected = [cols.id]
             else:
-                # it's an update
-                q = self._tables.update().where(
-                    self._tables.c.id == id_).values(**fields)
-                conn.execute(q)
-            obj.persistent_id = id_
-            if hasattr(obj, 'changed'):
-                obj.changed = False
+                selected = [cols.state, cols.returncode, cols.submitted]
+            with closing(self._engine.connect()) as conn:
+                with conn.begin():
+                    q = sql.select(selected).where(cols.id == id_)
+                    old = conn.execute(q).fetchone()
+                    if not old:
+                        # It's an insert
+                        q = self._tables.insert().values(**fields)
+                        conn.execute(q)
+                    else:
+                        # it's an update
+                        q = self._tables.update().where(
+                            cols.id == id_).values(**fields)
+                        conn.execute(q)
+                    if self._summary is not None:
+                        self._update_summary(
+                            conn, old,
+                            (fields['state'], fields['returncode'],
+                             fields['submitted']))
+                obj.persistent_id = id_
+                if hasattr(obj, 'changed'):
+                    obj.changed = False
 
         # return id
         return obj.persistent_id
@@ -314,8 +573,16 @@ class SqlStore(Store):
 
     @same_docstring_as(Store.remove)
     def remove(self, id_):
+        cols = self._tables.c
         with closing(self._engine.connect()) as conn:
-            conn.execute(self._tables.delete().where(self._tables.c.id == id_))
+            with conn.begin():
+                if self._summary is not None:
+                    q = (sql.select([cols.state, cols.returncode,
+                                     cols.submitted])
+                         .where(cols.id == id_))
+                    old = conn.execute(q).fetchone()
+                    self._update_summary(conn, old, None)
+                conn.execute(self._tables.delete().where(cols.id == id_))
 
 
 # register all URLs that SQLAlchemy can handle
@@ -21,6 +21,10 @@
 __docformat__ = 'reStructuredText'
 
 
+# stdlib imports
+from contextlib import contextmanager
+import re
+
 # GC3Pie imports
 import gc3libs
 from gc3libs.url import Url
@@ -59,6 +63,91 @@ class Store(object):
         raise NotImplementedError(
             "Method `list` not implemented in this class.")
 
+    def query(self, states=None, jobname=None, exitcodes=None,
+              successful=None, submitted_after=None, submitted_before=None):
+        """
+        Return list of IDs of saved `Task` objects matching all the
+        given criteria:
+
+        * `states`: sequence of `Run.State` values; select tasks whose
+          execution state is one of them;
+        * `jobname`: regular expression; select tasks whose `jobname`
+          matches it (case-insensitive, not anchored);
+        * `exitcodes`: sequence of integers; select tasks whose exit
+          code is one of them;
+        * `successful`: if ``True``, select tasks with a zero return
+          code; if ``False``, select tasks with a non-zero one;
+        * `submitted_after`, `submitted_before`: UNIX timestamps;
+          select tasks submitted within this time range (tasks that
+          have never been submitted count as submitted at time 0).
+
+        Criteria with value ``None`` (default) are not checked.
+        Stored objects that are not tasks never match.
+
+        The default implementation loads every object listed by
+        `list`:meth: and checks it; derived classes should override
+        this with something more efficient, if they can.
+        """
+        if jobname is not None:
+            jobname = re.compile(jobname, re.I)
+        ids = []
+        for id_ in self.list():
+            try:
+                obj = self.load(id_)
+            except Exception as err:
+                gc3libs.log.debug(
+                    "Ignoring object '%s' in query: cannot load it: %s: %s",
+                    id_, err.__class__.__name__, err)
+                continue
+            if _matches(obj, states, jobname, exitcodes, successful,
+                        submitted_after, submitted_before):
+                ids.append(id_)
+        return ids
+
+    def stats(self):
+        """
+        Return a dictionary mapping each `Run.State` to the number of
+        saved `Task` objects in that state.
+
+        Additional key ``total`` counts all saved tasks; keys ``ok``
+        and ``failed`` count the ``TERMINATED`` tasks with a zero and
+        a non-zero (or unknown) return code, respectively.
+
+        The default implementation loads every object listed by
+        `list`:meth:; derived classes should override this with
+        something more efficient, if they can.
+        """
+        return self._scan_stats()[0]
+
+    def last_transition_time(self):
+        """
+        Return the time of the latest state change recorded among the
+        saved `Task` objects, or ``None`` if there are no tasks.
+
+        The default implementation loads every object listed by
+        `list`:meth:; derived classes should override this with
+        something more efficient, if they can.
+        """
+        return self._scan_stats()[1]
+
+    def _scan_stats(self):
+        """
+        Auxiliary method for `stats`:meth: and `last_transition_time`:meth:.
+        """
+        return count_tasks(self._load_all())
+
+    def _load_all(self):
+        """
+        Iterate over all objects in the store that can be loaded.
+        """
+        for id_ in self.list():
+            try:
+                yield self.load(id_)
+            except Exception as err:
+                gc3libs.log.debug(
+                    "Ignoring object '%s' in stats: cannot load it: %s: %s",
+                    id_, err.__class__.__name__, err)
+
     def remove(self, id_):
         """
         Delete a given object from persistent storage, given its ID.
@@ -84,6 +173,21 @@ class Store(object):
             "Abstract method 'Store.load' called"
             " -- should have been implemented in a derived class!")
 
+    @contextmanager
+    def batch(self):
+        """
+        Context manager grouping a sequence of updates to the store.
+
+        Derived classes may defer part of the work of `save`:meth:,
+        `replace`:meth: and `remove`:meth: calls made within the
+        context until it is exited, e.g., to update auxiliary
+        indexes in a single transaction.  Contexts may be nested;
+        deferred work is done when the outermost one exits.
+
+        The default implementation does nothing.
+        """
+        yield
+
     def _update_to_latest_schema(self):
         """
         Modify an object in-place to reflect changes in the schema.
@@ -119,6 +223,92 @@ class Store(object):
             " -- should have been implemented in a derived class!")
 
 
+def _submission_time(task):
+    """
+    Return the time `task` was submitted, or ``None`` if `task` is not a
+    `Task`:class: instance.
+
+    Tasks that have never been submitted count as submitted at time 0.
+    """
+    try:
+        timestamp = task.execution.timestamp
+    except AttributeError:
+        return None
+    submitted = timestamp.get(gc3libs.Run.State.SUBMITTED, None)
+    if submitted is None:
+        # Jobs run by the ShellCmd backend transition directly to
+        # RUNNING; use that timestamp if available.
+        submitted = timestamp.get(gc3libs.Run.State.RUNNING, 0.0)
+    return submitted
+
+
+def _stats_keys(state, returncode):
+    """
+    Return the keys of `Store.stats`:meth: that a task in the given
+    state and with the given return code contributes to.
+    """
+    if state == gc3libs.Run.State.TERMINATED:
+        return ('total', state, ('ok' if returncode == 0 else 'failed'))
+    else:
+        return ('total', state)
+
+
+def count_tasks(objs):
+    """
+    Return a pair `(counts, last)` where `counts` is a dictionary
+    like the one returned by `Store.stats`:meth:, and `last` is the
+    time of the latest state change, computed over the `Task` objects
+    in sequence `objs`.  Any other object is ignored.
+    """
+    counts = dict((state, 0) for state in gc3libs.Run.State)
+    counts.update(ok=0, failed=0, total=0)
+    last = None
+    for obj in objs:
+        try:
+            job = obj.execution
+        except AttributeError:
+            # not a task
+            continue
+        for key in _stats_keys(job.state, job.returncode):
+            counts[key] += 1
+        if job.timestamp:
+            last = max(last, max(job.timestamp.values()))
+    return counts, last
+
+
+def _matches(obj, states, jobname, exitcodes, successful,
+             submitted_after, submitted_before):
+    """
+    Auxiliary function for `Store.query`:meth:; return ``True`` if
+    `obj` satisfies all the given criteria.
+
+    Argument `jobname` must be either ``None`` or a compiled regexp.
+    """
+    submitted = _submission_time(obj)
+    if submitted is None:
+        # not a task
+        return False
+    job = obj.execution
+    if states is not None and job.state not in states:
+        return False
+    if jobname is not None:
+        name = getattr(obj, 'jobname', None)
+        if name is None or not jobname.search(name):
+            return False
+    if exitcodes is not None and job.exitcode not in exitcodes:
+        return False
+    if successful is not None:
+        if job.returncode is None:
+            return False
+        if successful != (job.returncode == 0):
+            return False
+    if submitted_after is not None and submitted < submitted_after:
+        return False
+    if submitted_before is not None and submitted > submitted_before:
+        return False
+    return True
+
+
 class Persistable(object):
 
     """
@@ -41,7 +41,6 @@ def test_new_item():
     # it...
     idfactory.reserve(5)
 
-@pytest.mark.skip("Code currently bugged, cfr. issue #608")
 def test_custom_next_id():
     class next_id(object):
 
@@ -65,6 +64,33 @@ def test_custom_next_id():
         assert ids[i] == "DummyObject.%d" % i
 
 
+def test_block_leasing():
+    leases = []
+
+    def next_id(qty=None):
+        leases.append(qty)
+        start = sum(n or 1 for n in leases[:-1])
+        if qty is None:
+            return start + 1
+        return range(start + 1, start + qty + 1)
+
+    idfactory = IdFactory(next_id_fn=next_id, max_block=8)
+    dummy = DummyObject()
+    ids = [idfactory.new(dummy) for _ in range(100)]
+    assert ids == sorted(ids)
+    assert ids == ["DummyObject.%d" % n for n in range(1, 101)]
+    # block size grows up to `max_block` when IDs are allocated quickly
+    assert leases[:5] == [None, 2, 4, 8, 8]
+    assert len(leases) < 20
+
+    # pre-allocated IDs are per-instance, and handed out in order
+    leased = sum(n or 1 for n in leases)
+    other = IdFactory(next_id_fn=next_id, max_block=8)
+    other.reserve(3)
+    assert [other.new(dummy) for _ in range(3)] == [
+        "DummyObject.%d" % n for n in range(leased + 1, leased + 4)]
+
+
 # main: run tests
 
 if "__main__" == __name__:
@@ -43,6 +43,7 @@ from gc3libs.persistence import make_store, Persistable
 from gc3libs.persistence.accessors import GET
 from gc3libs.persistence.serialization import DEFAULT_PROTOCOL
 from gc3libs.persistence.idfactory import IdFactory
+from gc3libs.persistence import filesystem
 from gc3libs.persistence.filesystem import FilesystemStore
 from gc3libs.persistence.sql import SqlStore
 from gc3libs.url import Url
@@ -245,6 +246,80 @@ class GenericStoreChecks(object):
         obj2 = self.store.load(id_)
         assert obj2.x == "Updated"
 
+    def _save_tasks_for_query(self):
+        ids = {}
+        for name, state, returncode, submitted in [
+                ('ok1', Run.State.TERMINATED, 0, 100.0),
+                ('ok2', Run.State.TERMINATED, 0, 200.0),
+                ('failed', Run.State.TERMINATED, (0, 1), 300.0),
+                ('running', Run.State.RUNNING, None, 400.0),
+                ('new', Run.State.NEW, None, None),
+        ]:
+            task = Task(jobname=name)
+            task.execution.state = state
+            if returncode is not None:
+                task.execution.returncode = returncode
+            if submitted is not None:
+                task.execution.timestamp[Run.State.SUBMITTED] = submitted
+            ids[name] = self.store.save(task)
+        # non-task objects are never selected
+        self.store.save(SimplePersistableObject('not a task'))
+        return ids
+
+    def test_query_method(self):
+        """Test the `query` method of a generic `Store` class"""
+        ids = self._save_tasks_for_query()
+
+        def query(**criteria):
+            return sorted(self.store.query(**criteria))
+
+        def select(*names):
+            return sorted(ids[name] for name in names)
+
+        assert query() == select('ok1', 'ok2', 'failed', 'running', 'new')
+        assert query(states=[Run.State.TERMINATED]) == select(
+            'ok1', 'ok2', 'failed')
+        assert query(states=[Run.State.NEW, Run.State.RUNNING]) == select(
+            'running', 'new')
+        assert query(jobname='^OK') == select('ok1', 'ok2')
+        assert query(exitcodes=[1]) == select('failed')
+        assert query(successful=True) == select('ok1', 'ok2')
+        assert query(successful=False) == select('failed')
+        assert query(submitted_after=150.0) == select(
+            'ok2', 'failed', 'running')
+        assert query(submitted_before=150.0) == select('ok1', 'new')
+        assert query(states=[Run.State.TERMINATED],
+                     submitted_after=150.0,
+                     successful=True) == select('ok2')
+
+    def test_stats_method(self):
+        """Test the `stats` method of a generic `Store` class"""
+        ids = self._save_tasks_for_query()
+        stats = self.store.stats()
+        assert stats['total'] == 5
+        assert stats[Run.State.TERMINATED] == 3
+        assert stats[Run.State.RUNNING] == 1
+        assert stats[Run.State.NEW] == 1
+        assert stats[Run.State.SUBMITTED] == 0
+        assert stats['ok'] == 2
+        assert stats['failed'] == 1
+        assert self.store.last_transition_time() is not None
+
+        # counters follow state changes and removals
+        task = self.store.load(ids['running'])
+        task.execution.state = Run.State.TERMINATED
+        task.execution.returncode = 0
+        self.store.replace(ids['running'], task)
+        self.store.remove(ids['failed'])
+        self.store.remove(ids['new'])
+        stats = self.store.stats()
+        assert stats['total'] == 3
+        assert stats[Run.State.TERMINATED] == 3
+        assert stats[Run.State.RUNNING] == 0
+        assert stats[Run.State.NEW] == 0
+        assert stats['ok'] == 3
+        assert stats['failed'] == 0
+
     @pytest.mark.skip(reason="FIXME: Test code needs to be checked!")
     def test_persist_classes_with_slots(self):
 
@@ -331,6 +406,173 @@ class TestFilesystemStore(GenericStoreChecks):
         
         shutil.rmtree(self.tmpdir)
 
+    def test_stats_without_index(self):
+        """
+        Test that `stats` works on directories populated without the
+        sidecar index.
+        """
+        self._save_tasks_for_query()
+        os.remove(os.path.join(self.tmpdir, FilesystemStore.INDEX_FILENAME))
+        self.store = FilesystemStore(self.tmpdir)
+        assert self.store.stats()['ok'] == 2
+        # index is not re-created behind our back
+        self.store.save(Task())
+        assert not os.path.exists(
+            os.path.join(self.tmpdir, FilesystemStore.INDEX_FILENAME))
+        assert self.store.stats()['total'] == 6
+
+    def test_batch_defers_index_updates(self):
+        """Test that index updates are written when a batch ends."""
+        ids = self._save_tasks_for_query()
+        conn = self.store._index
+        other = FilesystemStore(self.tmpdir)
+        with self.store.batch():
+            with self.store.batch():
+                for id_ in ids.values():
+                    task = self.store.load(id_)
+                    task.execution.state = Run.State.STOPPED
+                    self.store.replace(id_, task)
+            # not written yet...
+            assert other.stats()[Run.State.STOPPED] == 0
+            # ...but visible to the store itself
+            assert self.store.stats()[Run.State.STOPPED] == 5
+            task = self.store.load(ids['new'])
+            task.execution.state = Run.State.NEW
+            self.store.replace(ids['new'], task)
+        assert other.stats()[Run.State.STOPPED] == 4
+        # a single connection is used throughout
+        assert self.store._index is conn
+
+    def test_no_index_on_network_filesystem(self):
+        """Test that the index is not used on network filesystems."""
+        mounts = os.path.join(self.tmpdir, 'mounts')
+        with open(mounts, 'w') as stream:
+            stream.write(
+                'rootfs / rootfs rw 0 0\n'
+                'server:/export /home nfs4 rw 0 0\n'
+                'server:/export /home/my\\040dir ext4 rw 0 0\n')
+        fstype = filesystem._network_filesystem_type
+        assert fstype('/home/x', mounts) == 'nfs4'
+        assert fstype('/home', mounts) == 'nfs4'
+        assert fstype('/home/my dir/x', mounts) is None
+        assert fstype('/homework', mounts) is None
+        assert fstype('/tmp', mounts) is None
+        assert fstype('/tmp', '/no/such/file') is None
+
+    def test_index_disabled(self):
+        """Test that `index=False` removes and ignores the index."""
+        self._save_tasks_for_query()
+        index_path = os.path.join(self.tmpdir, FilesystemStore.INDEX_FILENAME)
+        assert os.path.exists(index_path)
+        self.store = FilesystemStore(self.tmpdir, index=False)
+        assert self.store.stats()['total'] == 5
+        assert not os.path.exists(index_path)
+        self.store.save(Task())
+        assert len(self.store.list()) == 7
+        assert not os.path.exists(index_path)
+
+    def test_query_uses_index(self):
+        """Test that `query` selects tasks without loading them."""
+        ids = self._save_tasks_for_query()
+
+        def fail(id_):
+            raise AssertionError("Object '%s' loaded" % id_)
+        self.store.load = fail
+        assert sorted(self.store.query(jobname='^ok',
+                                       submitted_after=150.0)) == [ids['ok2']]
+        assert self.store.query(exitcodes=[]) == []
+
+    def test_query_without_index(self):
+        """
+        Test that `query` works on directories populated without the
+        sidecar index.
+        """
+        ids = self._save_tasks_for_query()
+        os.remove(os.path.join(self.tmpdir, FilesystemStore.INDEX_FILENAME))
+        self.store = FilesystemStore(self.tmpdir)
+        assert sorted(self.store.query(successful=True)) == sorted(
+            [ids['ok1'], ids['ok2']])
+
+    def test_sharded_layout(self):
+        """Test that object files are spread over subdirectories."""
+        ids = [self.store.save(SimplePersistableObject(str(i)))
+               for i in range(20)]
+        assert os.path.exists(
+            os.path.join(self.tmpdir, FilesystemStore.LAYOUT_FILENAME))
+        for id_ in ids:
+            path = self.store._path(id_)
+            assert os.path.dirname(os.path.dirname(path)) == self.tmpdir
+            assert os.path.exists(path)
+        # only the index and shard directories at top level
+        assert all(len(name) == 2 or name.startswith('.')
+                   for name in os.listdir(self.tmpdir))
+        # a new instance detects the layout, even if asked otherwise
+        store = FilesystemStore(self.tmpdir, sharded=False)
+        assert sorted(store.list()) == sorted(ids)
+        assert store.load(ids[0]).value == '0'
+
+    def test_list_without_index(self):
+        """Test that `list` scans directories if there is no index."""
+        ids = [self.store.save(SimplePersistableObject(str(i)))
+               for i in range(5)]
+        os.remove(os.path.join(self.tmpdir, FilesystemStore.INDEX_FILENAME))
+        store = FilesystemStore(self.tmpdir)
+        assert sorted(store.list()) == sorted(ids)
+        store.remove(ids[0])
+        assert sorted(store.list()) == sorted(ids[1:])
+
+    def test_unsharded_layout(self):
+        """Test stores with all files in one directory."""
+        store = FilesystemStore(self.tmpdir, sharded=False)
+        id_ = store.save(SimplePersistableObject('GC3'))
+        assert os.path.exists(os.path.join(self.tmpdir, str(id_)))
+        # a new instance detects the layout, even if asked otherwise
+        store = FilesystemStore(self.tmpdir, sharded=True)
+        assert store.list() == [id_]
+        store.save(store.load(id_))
+        assert os.path.exists(os.path.join(self.tmpdir, str(id_)))
+
+    def test_failed_save_keeps_old_version(self):
+        """Test that a failed save leaves the file untouched."""
+        class Unpicklable(object):
+            def __getstate__(self):
+                raise RuntimeError("Cannot pickle this!")
+        obj = SimplePersistableObject('GC3')
+        id_ = self.store.save(obj)
+        obj.value = Unpicklable()
+        with pytest.raises(RuntimeError):
+            self.store.save(obj)
+        assert self.store.load(id_).value == 'GC3'
+        shard = os.path.dirname(self.store._path(id_))
+        assert os.listdir(shard) == [str(id_)]
+
+    def test_failed_first_save_not_listed(self):
+        """Test that a failed first save leaves no entry in the index."""
+        class Unpicklable(object):
+            def __getstate__(self):
+                raise RuntimeError("Cannot pickle this!")
+        obj = SimplePersistableObject(Unpicklable())
+        with pytest.raises(RuntimeError):
+            self.store.save(obj)
+        assert self.store.list() == []
+        assert FilesystemStore(self.tmpdir).list() == []
+
+    def test_save_after_removal_by_other_store(self):
+        """Test that re-saving an object removed elsewhere lists it again."""
+        obj = SimplePersistableObject('GC3')
+        id_ = self.store.save(obj)
+        other = FilesystemStore(self.tmpdir)
+        other.remove(id_)
+        assert self.store.list() == []
+        self.store.save(obj)
+        assert self.store.list() == [id_]
+        assert other.list() == [id_]
+
+    def test_fsync(self):
+        store = FilesystemStore(self.tmpdir, fsync=True)
+        id_ = store.save(SimplePersistableObject('GC3'))
+        assert store.load(id_).value == 'GC3'
+
     # XXX: there's nothing which is `FilesystemStore`-specific here!
     def test_filesystemstorage_pickler_class(self):
         """
@@ -368,9 +610,9 @@ class TestFilesystemStore(GenericStoreChecks):
         container_id, obj_id = super(
             TestFilesystemStore, self).test_disaggregate_persistable_objects()
         # check that files exist
-        container_file = os.path.join(self.store._directory, str(container_id))
+        container_file = self.store._path(container_id)
         assert os.path.exists(container_file)
-        obj_file = os.path.join(self.store._directory, str(obj_id))
+        obj_file = self.store._path(obj_id)
         assert os.path.exists(obj_file)
 
 
@@ -407,6 +649,20 @@ class SqlStoreChecks(GenericStoreChecks):
 
         assert row[0] == app.execution.state
 
+    def test_ids_from_sequence(self):
+        ids = [self.store.save(SimplePersistableObject(str(n)))
+               for n in range(10)]
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+        # a second store on the same table continues the sequence
+        other = self._make_store()
+        more_ids = [other.save(SimplePersistableObject(str(n)))
+                    for n in range(10)]
+        assert min(more_ids) > max(ids)
+        # both stores keep allocating distinct IDs
+        ids.append(self.store.save(SimplePersistableObject('last')))
+        assert len(set(ids + more_ids)) == 21
+
     # the `jobname` attribute is optional in the `Application` ctor
     def test_persist_Application_with_no_job_name(self):
         app = gc3libs.Application(
@@ -489,6 +745,23 @@ class SqlStoreChecks(GenericStoreChecks):
         assert len(rows) == 1
         assert rows[0][0] == obj.foo.value
 
+    def test_query_on_table_without_query_columns(self):
+        """
+        Test that `SqlStore.query` works on tables created without the
+        columns it needs.
+        """
+        table_name = 'old_store'
+        self.conn.execute(
+            'create table `%s` (id integer primary key,'
+            ' data blob, state varchar(128))' % table_name)
+        self.store = make_store(self.db_url, table_name=table_name)
+        ids = self._save_tasks_for_query()
+        assert sorted(self.store.query(states=[Run.State.NEW])) == [ids['new']]
+        # no summary table, so `stats` loads every object
+        assert self.store._summary is None
+        assert self.store.stats()['ok'] == 2
+        self.conn.execute('drop table `%s`' % table_name)
+
     @pytest.mark.skip(reason="FIXME: Check if test is still valid")
     def test_sql_error_if_no_extra_fields(self):
         """
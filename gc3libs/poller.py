@@ -26,8 +26,13 @@ __docformat__ = 'reStructuredText'
 from .url import Url
 import os
 import logging
+import select
+import threading
+import time
 log = logging.getLogger('gc3.gc3libs')
 
+from gc3libs.compat._collections import OrderedDict
+
 # Conditional imports. Some pollers depend on the presence of specific
 # Python modules.
 try:
@@ -37,6 +42,14 @@ except:
         "Module inotifyx not found. INotifyPoller class will not be available")
     inotifyx = None
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
 try:
     import swiftclient
 except ImportError:
@@ -115,6 +128,14 @@ class Poller(object):
             "Abstract method `Poller.get_events()` called "
             " - this should have been defined in a derived class.")
 
+    def close(self):
+        """
+        Release any resource held by this poller.
+
+        No more events can be read afterwards.
+        """
+        pass
+
 
 def register_poller(scheme, cls):
     # We might want to add some check here...
@@ -131,6 +152,20 @@ class INotifyPoller(Poller):
     :params recurse: When set to `True`, automatically track also
     events in any already existing or newly created subfolder.
 
+    :params coalesce: When set to a number of seconds, events on the
+    same path are merged into a single one, whose mask is the
+    bitwise-or of all the merged events' masks; such an event is only
+    returned after no new event has been seen on that path for the
+    given number of seconds (use 0 to just merge events that occurred
+    since the last call to `get_events`).  By default (`None`), each
+    event is returned as the kernel delivered it.
+
+    :params background: When `True` (default), a thread reads events
+    as soon as the kernel delivers them, so that the kernel queue does
+    not overflow when `get_events` is called infrequently.
+
+    All directories are watched through a single inotify descriptor.
+
     This poller is used by default when the system supports INotify
     and the Url has a `file` schema
 
@@ -144,68 +179,152 @@ class INotifyPoller(Poller):
     also cfr. inotify(7) manpage http://linux.die.net/man/7/inotify
     """
 
-    def __init__(self, url, mask, recurse=False, **kw):
+    def __init__(self, url, mask, recurse=False, coalesce=None,
+                 background=True, **kw):
         Poller.__init__(self, url, mask, **kw)
 
         self._recurse = recurse
-        self._ifds = {}
+        self._coalesce = coalesce
+        # we need to see directory creation to watch new directories
+        self._watch_mask = mask
+        if recurse:
+            self._watch_mask |= events['IN_CREATE']
+        # map watch descriptors to paths, and vice versa
+        self._wds = {}
+        self._paths = {}
+        # events read from the kernel, but not yet returned by `get_events`
+        self._pending = OrderedDict() if coalesce is not None else []
+        self._lock = threading.Lock()
         # Ensure inbox directory exists
         if not os.path.exists(self.url.path):
             log.warning("Inbox directory `%s` does not exist,"
                         " creating it.", self.url.path)
             os.makedirs(self.url.path)
 
-        ifd = inotifyx.init()
-        inotifyx.add_watch(ifd, self.url.path, self.mask)
-        log.debug("Adding watch for path %s" % self.url.path)
-        self._ifds[self.url.path] = ifd
-
+        self._ifd = inotifyx.init()
+        self._add_watch(self.url.path)
         if self._recurse:
-            for dirpath, dirnames, filename in os.walk(self.url.path):
+            for dirpath, dirnames, _ in os.walk(self.url.path):
                 for dirname in dirnames:
-                    abspath = os.path.join(self.url.path,
-                                           dirpath,
-                                           dirname)
-                    log.debug("Adding watch for path %s" % abspath)
-                    self._add_watch(abspath)
+                    self._add_watch(os.path.join(dirpath, dirname))
+
+        self._reader = None
+        if background:
+            self._reader = threading.Thread(target=self._read_forever,
+                                            name=('INotifyPoller(%s)'
+                                                  % self.url.path))
+            self._reader.daemon = True
+            self._reader.start()
 
     def _add_watch(self, path):
-        if path not in self._ifds:
+        if path not in self._paths:
             log.debug("Adding watch for path %s" % path)
-            ifd = inotifyx.init()
-            inotifyx.add_watch(ifd, path, self.mask)
-            self._ifds[path] = ifd
+            wd = inotifyx.add_watch(self._ifd, path, self._watch_mask)
+            self._wds[wd] = path
+            self._paths[path] = wd
+
+    def _read_forever(self):
+        while self._ifd is not None:
+            try:
+                ready, _, _ = select.select([self._ifd], [], [], 1.0)
+                if ready:
+                    with self._lock:
+                        self._read_events()
+            except (select.error, IOError, OSError, ValueError) as err:
+                if self._ifd is not None:
+                    log.error("Error reading inotify events for %s: %s",
+                              self.url.path, err)
+                return
+
+    def _read_events(self):
+        """
+        Read available events from the kernel into `self._pending`.
+
+        Must be called with `self._lock` held.
+        """
+        if self._ifd is None:
+            return
+        for event in inotifyx.get_events(self._ifd, 0):
+            path = self._wds.get(event.wd)
+            if path is None:
+                # watch has already been removed
+                continue
+            if event.mask & events['IN_IGNORED']:
+                # watched directory is gone
+                del self._wds[event.wd]
+                self._paths.pop(path, None)
+            # if `name` is empty, it's the watched directory itself
+            abspath = os.path.join(path, event.name) if event.name else path
+            if event.mask & self.mask:
+                self._add_event(abspath, event.mask)
+            if self._recurse and \
+               event.mask & events['IN_ISDIR'] and \
+               event.mask & events['IN_CREATE']:
+                # New directory has been created. We need to add a
+                # watch for this directory too and for all its
+                # subdirectories. Also, we need to trigger new
+                # events for any other file created in it, since
+                # we might have missed them
+                self._add_watch(abspath)
+                for (rootdir, dirnames, filenames) in os.walk(abspath):
+                    for dirname in dirnames:
+                        self._add_watch(os.path.join(rootdir, dirname))
+                    for filename in filenames:
+                        # Trigger a fake event
+                        self._add_event(
+                            os.path.join(rootdir, filename),
+                            events['IN_CLOSE_WRITE'] | events['IN_ALL_EVENTS'])
+
+    def _add_event(self, path, mask):
+        if self._coalesce is None:
+            self._pending.append((path, mask))
+        else:
+            # move `path` to the end, as it's now the most recent one
+            prev_mask, _ = self._pending.pop(path, (0, None))
+            self._pending[path] = (prev_mask | mask, time.time())
 
     def get_events(self):
-        newevents = []
-        for path, ifd in self._ifds.items():
-            ievents = inotifyx.get_events(ifd, 0)
-            for event in ievents:
-                # if `name` is empty, it's the same directory
-                abspath = os.path.join(path, event.name)
-                url = Url(abspath) if event.name else self.url
-                newevents.append((url, event.mask))
-                if self._recurse and \
-                   event.mask & inotifyx.IN_ISDIR and \
-                   event.mask & inotifyx.IN_CREATE:
-                    # New directory has been created. We need to add a
-                    # watch for this directory too and for all its
-                    # subdirectories. Also, we need to trigger new
-                    # events for any other file created in it
-
-                    for (rootdir, dirnames, filenames) in os.walk(abspath):
-                        for dirname in dirnames:
-                            self._add_watch(os.path.join(rootdir, dirname))
-                        for filename in filenames:
-                            # Trigger a fake event
-                            newevents.append((Url(os.path.join(rootdir, filename)),
-                                              events['IN_CLOSE_WRITE']|events['IN_ALL_EVENTS']))
-        return newevents
+        with self._lock:
+            self._read_events()
+            if self._coalesce is None:
+                newevents, self._pending = self._pending, []
+            else:
+                # entries are sorted by time of last event
+                threshold = time.time() - self._coalesce
+                newevents = []
+                for path, (mask, last) in self._pending.items():
+                    if last > threshold:
+                        break
+                    del self._pending[path]
+                    newevents.append((path, mask))
+        return [(Url(path), mask) for path, mask in newevents]
+
+    def close(self):
+        ifd, self._ifd = self._ifd, None
+        if ifd is not None:
+            with self._lock:
+                os.close(ifd)
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
 
 if inotifyx:
     register_poller('file', INotifyPoller)
 
 
+def _read_dir(path):
+    """
+    Return a dictionary mapping the name of each entry in directory
+    `path` to `True` if it is a directory, and `False` otherwise.
+    """
+    if scandir is not None:
+        # no need to `stat()` each entry
+        return dict((entry.name, entry.is_dir()) for entry in scandir(path))
+    else:
+        return dict((name, os.path.isdir(os.path.join(path, name)))
+                    for name in os.listdir(path))
+
+
 class FilePoller(Poller):
     """Poller implementation that uses regular `os` module to track for
     new events on a filesystem.
@@ -213,46 +332,105 @@ class FilePoller(Poller):
     This implementation is used to track Url with `file` schema
     whenever :py:mod:`inotifyx` module is not available.
 
+    Only creation and deletion of files are reported.  A directory is
+    only listed again if its modification time has changed since the
+    last check, so the cost of `get_events` does not depend on the
+    number of files in the directory, unless they have changed.
+
+    :params recurse: When set to `True`, automatically track also
+    events in any already existing or newly created subfolder.
     """
-    def __init__(self, url, mask, **kw):
+
+    # directories modified less than this many seconds before they
+    # were last listed are listed again, since their modification
+    # time might not change on further modifications (depending on the
+    # filesystem's timestamp resolution)
+    MTIME_RESOLUTION = 1.0
+
+    def __init__(self, url, mask, recurse=False, **kw):
         Poller.__init__(self, url, mask, **kw)
         self._path = self.url.path
+        self._recurse = recurse
         if not os.path.exists(self.url.path):
             log.warning("Inbox directory `%s` does not exist,"
                         " creating it.", self.url.path)
             os.makedirs(self.url.path)
-        self._known_files = {}
-        for path in os.listdir(self._path):
-            abspath = os.path.join(self._path, path)
-            stat = os.stat(abspath)
-            self._known_files[path] = stat
+        # map directory path to `(mtime, listed, entries)`, where
+        # `entries` maps each name in the directory to `True` if it's
+        # a directory and `False` otherwise
+        self._dirs = {}
+        self._scan(self._path, [])
+
+    def _scan(self, path, newevents):
+        """
+        Update entries of directory `path` (and of its subdirectories,
+        if recursing), appending creation/deletion events to
+        `newevents`.
+
+        Return ``False`` if the directory no longer exists.
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return False
+        known = self._dirs.get(path)
+        now = time.time()
+        if known is not None:
+            old_mtime, listed, entries = known
+            if mtime == old_mtime and listed - old_mtime > self.MTIME_RESOLUTION:
+                # no entry was added or removed
+                if self._recurse:
+                    self._scan_subdirs(path, entries, newevents)
+                return True
+        else:
+            entries = None
+        try:
+            current = _read_dir(path)
+        except OSError:
+            return False
+        if entries is not None:
+            for name, is_dir in current.iteritems():
+                if name not in entries:
+                    event = events['IN_CLOSE_WRITE'] | events['IN_CREATE']
+                    if is_dir:
+                        event |= events['IN_ISDIR']
+                    newevents.append((os.path.join(path, name), event))
+            for name, is_dir in entries.iteritems():
+                if name not in current:
+                    newevents.append((os.path.join(path, name),
+                                      events['IN_DELETE']))
+                    if is_dir:
+                        self._forget(os.path.join(path, name))
+        self._dirs[path] = (mtime, now, current)
+        if self._recurse:
+            self._scan_subdirs(path, current, newevents)
+        return True
+
+    def _scan_subdirs(self, path, entries, newevents):
+        for name, is_dir in entries.iteritems():
+            if is_dir:
+                subdir = os.path.join(path, name)
+                new = subdir not in self._dirs
+                if self._scan(subdir, newevents) and new:
+                    # report files that were created before we could
+                    # see the new directory
+                    for subname, sub_is_dir in \
+                            self._dirs[subdir][2].iteritems():
+                        if not sub_is_dir:
+                            newevents.append((
+                                os.path.join(subdir, subname),
+                                events['IN_CLOSE_WRITE'] | events['IN_CREATE']))
+
+    def _forget(self, path):
+        prefix = path + os.sep
+        for dirpath in list(self._dirs):
+            if dirpath == path or dirpath.startswith(prefix):
+                del self._dirs[dirpath]
 
     def get_events(self):
-        dircontents = [os.path.join(self._path, path) for path in os.listdir(self._path)]
-        # Check if new files have been created or old ones updated
         newevents = []
-        for path in dircontents:
-            stat = os.stat(path)
-
-            # We can only check if:
-            #
-            if path not in self._known_files:
-                # We can only get
-                event = events['IN_CLOSE_WRITE']|events['IN_CREATE']
-                if os.path.isdir(path):
-                    event|=events['IN_ISDIR']
-                self._known_files[path] = stat
-                newevents.append((Url(path), event))
-            elif stat.st_mtime > self._known_files[path].st_mtime:
-                # File was updated?
-                raise
-
-        # check if some file was deleted
-        for path in list(self._known_files):
-            if path not in dircontents:
-                newevents.append((Url(path), events['IN_DELETE']))
-                self._known_files.pop(path)
-        return newevents
+        self._scan(self._path, newevents)
+        return [(Url(path), mask) for path, mask in newevents]
 
 if not inotifyx:
     register_poller('file', FilePoller)
@@ -110,6 +110,32 @@ def _split_amount_and_unit(val, default_unit=None, allow=None):
     return (amount, unit)
 
 
+# quantities are immutable, so the same object can be returned
+# whenever a string is parsed again; the cache is emptied when it
+# reaches `_PARSE_CACHE_SIZE` entries
+_parse_cache = {}
+_PARSE_CACHE_SIZE = 1024
+
+
+def _unpickle_quantity(cls, amount, unit_name, name):
+    """
+    Rebuild a quantity saved by `_Quantity.__reduce__`.
+
+    Argument `amount` is the amount in base units; `unit_name` is
+    the name of the unit used for display.
+    """
+    if name is not None and name in cls._UNITS:
+        # units are singletons
+        return cls._UNITS[name]
+    new = object.__new__(cls)
+    new._amount = amount
+    new._unit = cls._UNITS[unit_name]
+    new._name = name
+    if name is not None:
+        cls.register(new)
+    return new
+
+
 # since the code for `_Quantity` comparison methods is basically the
 # same for all methods, we use a decorator-based approach to reduce
 # boilerplate code...  Oh, how do I long for LISP macros! :-)
@@ -268,6 +294,16 @@ class _Quantity(object):
     def __new__(cls, val, unit=None, name=None):
         # dispatch to actual constructor depending on the type of `val`
         if isinstance(val, types.StringTypes):
+            if name is None:
+                key = (cls, val)
+                try:
+                    return _parse_cache[key]
+                except KeyError:
+                    new = cls._new_from_string(val)
+                    if len(_parse_cache) >= _PARSE_CACHE_SIZE:
+                        _parse_cache.clear()
+                    _parse_cache[key] = new
+                    return new
             new = cls._new_from_string(val)
         elif isinstance(val, _Quantity):
             new = cls._new_from_amount_and_unit(val.amount(), val.unit)
@@ -304,11 +340,13 @@ class _Quantity(object):
         unit = cls._UNITS[unitname]
         return cls._new_from_amount_and_unit(amount, unit)
 
-    def __getnewargs__(self):
-        # use the string serialization, as the `(amount, unit, name)`
-        # constructor could lead to infinite recursion ("unit" could
-        # be the very class itself that we are going to serialize)
-        return (("%d %s" % (self.amount(), self.unit.name)), self.name)
+    def __reduce__(self):
+        # save the amount in base units and the unit name, so that
+        # loading does not need to parse strings; passing the unit
+        # itself could lead to infinite recursion (the base unit is
+        # its own unit)
+        return (_unpickle_quantity,
+                (self.__class__, self._amount, self.unit.name, self.name))
 
     # string representation
     def to_str(self, fmt, unit=None, conv=(lambda value: value)):
@@ -33,6 +33,7 @@ import gc3libs
 import gc3libs.exceptions
 import gc3libs.persistence
 import gc3libs.persistence.store
+import gc3libs.url
 import gc3libs.utils
 from gc3libs.workflow import TaskCollection
 
@@ -132,7 +133,8 @@ class Session(list):
 
     DEFAULT_JOBS_DIR = 'jobs'
 
-    def __init__(self, path, create=True, store_or_url=None, **extra_args):
+    def __init__(self, path, create=True, store_or_url=None,
+                 load_tasks=True, **extra_args):
         """
         First argument `path` is the path to the session directory.
 
@@ -159,6 +161,14 @@ class Session(list):
 
         By default `gc3libs.persistence.filesystem.FileSystemStore`:class:
         (which see) is used for providing a new session with a store.
+
+        If `load_tasks` is ``False``, tasks of an existing session are
+        not loaded from the store; the session then appears empty, but
+        its `store` can still be used to access (e.g., `query`) the
+        tasks.  Such a session should only be used for read-only
+        access, as saving its index would forget all of its tasks.
+        Methods `query`:meth: and `stats`:meth: load the tasks anyway
+        if the store is shared with other sessions.
         """
         self.path = os.path.abspath(path)
         self.name = os.path.basename(self.path)
@@ -167,6 +177,18 @@ class Session(list):
         self.created = -1
         self.finished = -1
         self.cmdline = extra_args.get('cmdline', None)
+        self._load_tasks = load_tasks
+        # IDs listed in the index file, if tasks were not loaded
+        self._unloaded_ids = []
+        # tasks that have been marked as changed since the last
+        # `save_all`, and tasks that cannot tell us so; both are keyed
+        # by `id()` as tasks compare by value
+        self._dirty = dict()
+        self._unwatched = dict()
+        # IDs to append to the index file at the next `flush`; if
+        # `_index_stale` is set, the whole index file is rewritten
+        self._index_added = []
+        self._index_stale = True
 
         # load or make session
         if os.path.isdir(self.path):
@@ -254,9 +276,24 @@ class Session(list):
                 "Unable to recover starting time from existing session:"
                 " file %s is missing." % (start_file))
 
+        if not self._load_tasks:
+            self._unloaded_ids = ids
+            return
+        self._load_tasks_by_id(ids)
+
+    def _load_tasks_by_id(self, ids):
+        """
+        Load the tasks with the given IDs from the store.
+        """
+        self._index_stale = False
         for task_id in ids:
+            if task_id in self.tasks:
+                # duplicate line in index file
+                self._index_stale = True
+                continue
             try:
                 self.tasks[task_id] = self.store.load(task_id)
+                self._watch(self.tasks[task_id])
             except Exception as err:
                 if gc3libs.error_ignored(
                         # context:
@@ -273,6 +310,8 @@ class Session(list):
                 ):
                     gc3libs.log.warning(
                         "Ignoring error from loading '%s': %s", task_id, err)
+                    # drop it from the index file at next `flush`
+                    self._index_stale = True
                 else:
                     # propagate exception back to caller
                     raise
@@ -329,7 +368,14 @@ class Session(list):
 
         """
         newid = self.store.save(task)
-        self.tasks[newid] = task
+        old = self.tasks.get(newid)
+        if old is not task:
+            if old is None:
+                self._index_added.append(newid)
+            else:
+                self._unwatch(old)
+            self.tasks[newid] = task
+            self._watch(task)
         if flush:
             self.flush()
         return newid
@@ -342,7 +388,8 @@ class Session(list):
         if task_id not in self.tasks:
             raise gc3libs.exceptions.InvalidArgument(
                 "Task '%s' not found in session" % task_id)
-        self.tasks.pop(task_id)
+        self._unwatch(self.tasks.pop(task_id))
+        self._index_stale = True
         if flush:
             self.flush()
 
@@ -395,6 +442,76 @@ class Session(list):
         """
         return self.tasks.keys()
 
+    def owns_store(self):
+        """
+        Return ``True`` if the store holds only objects of this session.
+
+        This is the case if the store is a directory or an SQLite
+        database file within the session directory, as it is by
+        default; any other store may be shared with other sessions.
+        """
+        url = gc3libs.url.Url(str(self.store_url))
+        if url.scheme not in ('file', 'sqlite'):
+            return False
+        path = os.path.normpath('/' + url.path.lstrip('/'))
+        return path.startswith(self.path + os.sep)
+
+    def _all_task_ids(self):
+        """
+        Return set of IDs of all tasks in this session, including tasks
+        that are part of a collection, as strings.
+
+        Tasks are loaded from the store if needed.
+        """
+        if not self._load_tasks:
+            self._load_tasks = True
+            ids, self._unloaded_ids = self._unloaded_ids, []
+            self._load_tasks_by_id(ids)
+        return set(str(task.persistent_id) for task in self.iter_workflow())
+
+    def query(self, **criteria):
+        """
+        Return list of IDs of tasks in this session matching all the
+        given criteria.
+
+        Criteria are the keyword arguments of `Store.query`:meth:,
+        which does the actual selection; if the store is shared with
+        other sessions (see `owns_store`:meth:), tasks of this session
+        must be loaded to tell which IDs belong to it.
+        """
+        ids = self.store.query(**criteria)
+        if self.owns_store():
+            return ids
+        own_ids = self._all_task_ids()
+        return [id_ for id_ in ids if str(id_) in own_ids]
+
+    def stats(self):
+        """
+        Return a dictionary mapping each `Run.State` to the number of
+        tasks in this session in that state, plus keys ``total``,
+        ``ok`` and ``failed`` (see `Store.stats`:meth:).
+
+        If the store is shared with other sessions (see
+        `owns_store`:meth:), tasks of this session are loaded and
+        counted one by one.
+        """
+        if self.owns_store():
+            return self.store.stats()
+        self._all_task_ids()
+        return gc3libs.persistence.store.count_tasks(self.iter_workflow())[0]
+
+    def last_transition_time(self):
+        """
+        Return the time of the latest state change of a task in this
+        session, or ``None`` if there are no tasks.
+
+        See `stats`:meth: for how shared stores are handled.
+        """
+        if self.owns_store():
+            return self.store.last_transition_time()
+        self._all_task_ids()
+        return gc3libs.persistence.store.count_tasks(self.iter_workflow())[1]
+
     def list_names(self):
         """
         Return set of names of tasks belonging to this session.
@@ -413,9 +530,13 @@ class Session(list):
         # create directory if it does not exists
         if not os.path.exists(self.path):
             os.mkdir(self.path)
+            self._index_stale = True
         # Update store.url and job_ids.db files
-        self._save_store_url_file()
-        self._save_index_file()
+        if self._index_stale:
+            self._save_store_url_file()
+            self._save_index_file()
+        elif self._index_added:
+            self._append_to_index_file(self._index_added)
 
     def load(self, obj_id):
         """
@@ -461,12 +582,54 @@ class Session(list):
     def save_all(self, flush=True):
         """
         Save all modified tasks to persistent storage.
+
+        Only tasks that have been marked as changed since the last
+        call are looked at, so the cost of this method depends on the
+        number of modified tasks and not on the size of the session.
+
+        Return the number of tasks that were saved.
         """
-        for task in self.tasks.itervalues():
-            if task.changed:
-                self.save(task)
+        dirty, self._dirty = self._dirty, dict()
+        dirty.update(self._unwatched)
+        saved = 0
+        with self.store.batch():
+            for task in dirty.itervalues():
+                if task.changed:
+                    self.save(task)
+                    saved += 1
         if flush:
             self.flush()
+        return saved
+
+    # dirty-task tracking: `Task` objects call `_on_child_changed`
+    # on their watchers whenever they are marked as changed (see
+    # `gc3libs.Task.changed`); any other kind of object in the session
+    # is checked at every `save_all`.
+
+    def _watch(self, task):
+        if isinstance(task, gc3libs.Task):
+            task._add_watcher(self)
+            if task.changed:
+                self._dirty[id(task)] = task
+        else:
+            self._unwatched[id(task)] = task
+
+    def _unwatch(self, task):
+        if isinstance(task, gc3libs.Task):
+            task._remove_watcher(self)
+        self._dirty.pop(id(task), None)
+        self._unwatched.pop(id(task), None)
+
+    def _on_child_changed(self, task):
+        """
+        Called when a task in this session is marked as changed.
+        """
+        self._dirty[id(task)] = task
+
+    def _on_child_transition(self, old_state, old_returncode,
+                             new_state, new_returncode):
+        # the `changed` setter tells us all we need to know
+        pass
 
     def _save_index_file(self):
         """
@@ -482,6 +645,19 @@ class Session(list):
         except:
             idx_fd.close()
             raise
+        self._index_added = []
+        self._index_stale = False
+
+    def _append_to_index_file(self, task_ids):
+        """
+        Append the given job IDs to the default session index.
+        """
+        idx_filename = os.path.join(self.path, self.INDEX_FILENAME)
+        with open(idx_filename, 'a') as idx_fd:
+            for task_id in task_ids:
+                idx_fd.write(str(task_id))
+                idx_fd.write('\n')
+        self._index_added = []
 
     def _save_store_url_file(self):
         """
@@ -0,0 +1,650 @@
+#! /usr/bin/env python
+#
+"""
+Emulate the SLURM ``sbatch``, ``squeue``, ``sacct`` and ``scancel``
+commands on the local host.
+
+This script lets the real `gc3libs.backends.slurm.SlurmLrms`:class:
+code run against a simulated cluster, through the ``local`` transport:
+set the SLURM command names in a resource configuration to
+invocations of this script, e.g.::
+
+    [resource/fakeslurm]
+    type = slurm
+    transport = local
+    frontend = localhost
+    auth = none
+    sbatch = python /path/to/fakeslurm.py --state-dir /tmp/fake --slots 100 sbatch
+    squeue = python /path/to/fakeslurm.py --state-dir /tmp/fake --slots 100 squeue
+    sacct = python /path/to/fakeslurm.py --state-dir /tmp/fake --slots 100 sacct
+    scancel = python /path/to/fakeslurm.py --state-dir /tmp/fake --slots 100 scancel
+    # ...
+
+or use function `commands`:func: to generate these lines.  Jobs are
+never actually run: the simulated cluster has a fixed number of slots,
+and each job waits in the queue for a random time, then runs for a
+random time (capped at the requested wall-clock time limit) once
+enough slots are free.  State of the simulated cluster is kept in an
+SQLite database in the state directory, and is advanced to the
+current time whenever one of the commands is invoked; all commands
+must therefore be invoked with the same options.
+
+Options preceding the command name are:
+
+``--state-dir DIR``
+  Directory where the cluster state is kept; default is taken from
+  environment variable ``GC3PIE_FAKESLURM_DIR``, or
+  ``~/.gc3/fakeslurm`` if unset.
+
+``--slots NUM``
+  Number of CPU cores in the cluster (default: 8).
+
+``--queue-wait SPEC``, ``--runtime SPEC``
+  Distribution of the time (in seconds) a job waits before being
+  eligible to start, and of the job run time (default: 0 and 1).
+
+``--latency SPEC``
+  Distribution of the time (in seconds) each command invocation
+  takes (default: 0).
+
+``--failure-rate P``
+  Probability that a job ends with a non-zero exit code (default: 0).
+
+``--command-failure-rate P``
+  Probability that a command fails because the (simulated) SLURM
+  controller cannot be contacted (default: 0).
+
+``--min-job-age SECS``
+  How long terminated jobs are still listed by ``squeue``, like
+  SLURM's ``MinJobAge`` configuration parameter (default: 300).
+
+A distribution `SPEC` is either a number (constant value),
+``exp:MEAN`` for an exponential distribution with the given mean, or
+``uniform:LOW:HIGH``.
+
+This module only depends on the Python standard library, so that
+the commands start quickly.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import getopt
+import getpass
+import heapq
+import os
+import random
+import sqlite3
+import sys
+import time
+
+
+DEFAULTS = {
+    'slots': 8,
+    'queue_wait': '0',
+    'runtime': '1',
+    'latency': '0',
+    'failure_rate': 0.0,
+    'command_failure_rate': 0.0,
+    'min_job_age': 300,
+}
+
+
+def commands(state_dir, python=sys.executable, **options):
+    """
+    Return a dictionary mapping SLURM command names to command lines
+    invoking this emulator.
+
+    The returned dictionary can be used to update a resource
+    configuration.  Keyword arguments are the options described in
+    the module documentation (with underscores in place of dashes)::
+
+      >>> cmds = commands('/tmp/fake', python='python', slots=4)
+      >>> cmds['squeue'].endswith('--state-dir /tmp/fake --slots 4 squeue')
+      True
+    """
+    script = os.path.abspath(__file__)
+    if script.endswith(('.pyc', '.pyo')):
+        script = script[:-1]
+    args = ['--state-dir', state_dir]
+    for name, value in sorted(options.items()):
+        if name not in DEFAULTS:
+            raise TypeError("Unknown option '%s'" % name)
+        args += ['--' + name.replace('_', '-'), str(value)]
+    prefix = str.join(' ', [python, script] + args)
+    return dict((cmd, prefix + ' ' + cmd)
+                for cmd in ['sbatch', 'squeue', 'sacct', 'scancel'])
+
+
+class _Error(Exception):
+    """A SLURM command error; message goes to STDERR."""
+    def __init__(self, msg, exitcode=1):
+        Exception.__init__(self, msg)
+        self.exitcode = exitcode
+
+
+def _sample(spec):
+    """
+    Return a random value from the distribution given by `spec`.
+
+    Examples::
+
+      >>> _sample('42')
+      42.0
+      >>> 1 <= _sample('uniform:1:2') <= 2
+      True
+    """
+    if spec.startswith('exp:'):
+        mean = float(spec[4:])
+        return (random.expovariate(1.0 / mean) if mean > 0 else 0.0)
+    elif spec.startswith('uniform:'):
+        low, high = spec[8:].split(':')
+        return random.uniform(float(low), float(high))
+    else:
+        return float(spec)
+
+
+def _parse_time_limit(spec):
+    """
+    Parse a SLURM ``--time`` argument and return number of seconds.
+
+    Examples::
+
+      >>> _parse_time_limit('90')
+      5400
+      >>> _parse_time_limit('1-02:00')
+      93600
+      >>> _parse_time_limit('01:02:03')
+      3723
+    """
+    days = 0
+    if '-' in spec:
+        days, spec = spec.split('-')
+        days = int(days)
+        # with a day count, fields are hours[:minutes[:seconds]]
+        parts = [int(p) for p in spec.split(':')] + [0, 0]
+        hours, mins, secs = parts[:3]
+    else:
+        parts = [int(p) for p in spec.split(':')]
+        if len(parts) == 1:
+            hours, mins, secs = 0, parts[0], 0
+        elif len(parts) == 2:
+            hours, mins, secs = 0, parts[0], parts[1]
+        else:
+            hours, mins, secs = parts[:3]
+    return ((days * 24 + hours) * 60 + mins) * 60 + secs
+
+
+def _format_duration(secs):
+    """
+    Format a number of seconds as a SLURM duration ``[D-]HH:MM:SS``.
+
+    Examples::
+
+      >>> _format_duration(3723)
+      '01:02:03'
+      >>> _format_duration(93600)
+      '1-02:00:00'
+    """
+    secs = int(round(max(0, secs)))
+    days, secs = divmod(secs, 86400)
+    hours, secs = divmod(secs, 3600)
+    mins, secs = divmod(secs, 60)
+    if days:
+        return '%d-%02d:%02d:%02d' % (days, hours, mins, secs)
+    return '%02d:%02d:%02d' % (hours, mins, secs)
+
+
+def _format_timestamp(timestamp):
+    if timestamp is None:
+        return 'Unknown'
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(timestamp))
+
+
+class FakeCluster(object):
+    """
+    Simulated SLURM cluster, with state kept in an SQLite database.
+    """
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      name TEXT,
+      cwd TEXT,
+      script TEXT,
+      cores INTEGER,
+      time_limit REAL,
+      submit REAL,
+      eligible REAL,
+      runtime REAL,
+      exitcode INTEGER,
+      start REAL,
+      end REAL,
+      cancelled INTEGER DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (start, eligible);
+    CREATE INDEX IF NOT EXISTS jobs_running ON jobs (end);
+    CREATE TABLE IF NOT EXISTS clock (now REAL);
+    """
+
+    def __init__(self, state_dir, **options):
+        self.options = dict(DEFAULTS)
+        self.options.update(options)
+        if not os.path.isdir(state_dir):
+            try:
+                os.makedirs(state_dir)
+            except OSError:
+                # concurrently created by another command
+                if not os.path.isdir(state_dir):
+                    raise
+        self.db = sqlite3.connect(
+            os.path.join(state_dir, 'cluster.db'),
+            timeout=600, isolation_level=None)
+        self.db.executescript(self._SCHEMA)
+        self.user = getpass.getuser()
+        self.uid = os.getuid()
+        self.now = time.time()
+
+    def __enter__(self):
+        # serialize concurrent commands
+        self.db.execute('BEGIN IMMEDIATE')
+        self._advance()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.db.execute('COMMIT')
+        else:
+            self.db.execute('ROLLBACK')
+        self.db.close()
+
+    def _advance(self):
+        """
+        Start pending jobs that could have been started by now.
+
+        Jobs are started in the order they become eligible, as soon
+        as enough slots are free; no job is started before a job that
+        became eligible earlier.
+        """
+        row = self.db.execute('SELECT now FROM clock').fetchone()
+        if row is None:
+            clock = 0
+            self.db.execute('INSERT INTO clock VALUES (0)')
+        else:
+            clock = row[0]
+        slots = int(self.options['slots'])
+        # end times of jobs occupying slots at the current
+        # simulation time, one heap entry per core
+        busy = []
+        for end, cores in self.db.execute(
+                'SELECT end, cores FROM jobs'
+                ' WHERE start IS NOT NULL AND end > ?', (clock,)):
+            busy.extend([end] * cores)
+        heapq.heapify(busy)
+        earliest = clock
+        started = []
+        for jobid, eligible, runtime, cores in self.db.execute(
+                'SELECT id, eligible, runtime, cores FROM jobs'
+                ' WHERE start IS NULL AND eligible <= ?'
+                ' ORDER BY eligible, id', (self.now,)):
+            start = max(eligible, earliest)
+            while busy and busy[0] <= start:
+                heapq.heappop(busy)
+            while len(busy) > slots - min(cores, slots):
+                start = max(start, heapq.heappop(busy))
+            if start > self.now:
+                break
+            earliest = start
+            for _ in range(cores):
+                heapq.heappush(busy, start + runtime)
+            started.append((start, start + runtime, jobid))
+        self.db.executemany(
+            'UPDATE jobs SET start = ?, end = ? WHERE id = ?', started)
+        self.db.execute('UPDATE clock SET now = ?', (self.now,))
+
+    def _state(self, start, end, time_limit, runtime, exitcode, cancelled):
+        if start is None or start > self.now:
+            return 'PENDING'
+        if end > self.now:
+            return 'RUNNING'
+        if cancelled:
+            return 'CANCELLED'
+        if time_limit is not None and runtime >= time_limit:
+            return 'TIMEOUT'
+        if exitcode == 0:
+            return 'COMPLETED'
+        return 'FAILED'
+
+    def sbatch(self, args):
+        try:
+            opts, args = getopt.gnu_getopt(
+                args, 'n:c:t:J:o:e:i:N:',
+                ['ntasks=', 'cpus-per-task=', 'time=', 'job-name=',
+                 'output=', 'error=', 'input=', 'mem=', 'mem-per-cpu=',
+                 'nodes=', 'no-requeue'])
+        except getopt.GetoptError as err:
+            raise _Error('sbatch: error: %s' % err)
+        ntasks = 1
+        cpus = 1
+        time_limit = None
+        name = 'sbatch'
+        for opt, value in opts:
+            if opt in ('-n', '--ntasks'):
+                ntasks = int(value)
+            elif opt in ('-c', '--cpus-per-task'):
+                cpus = int(value)
+            elif opt in ('-t', '--time'):
+                time_limit = _parse_time_limit(value)
+            elif opt in ('-J', '--job-name'):
+                name = value
+        if not args:
+            raise _Error('sbatch: error: Batch script is empty!')
+        script = args[0]
+        try:
+            with open(script) as stream:
+                first_line = stream.readline()
+        except IOError as err:
+            raise _Error('sbatch: error: Unable to open file %s' % script)
+        if not first_line.startswith('#!'):
+            raise _Error(
+                'sbatch: error: This does not look like a batch script.'
+                '  The first\nsbatch: error: line must start with #!'
+                ' followed by the path to an interpreter.\n'
+                'sbatch: error: For instance: #!/bin/sh')
+        cores = ntasks * cpus
+        if cores > int(self.options['slots']):
+            raise _Error(
+                'sbatch: error: Batch job submission failed:'
+                ' Requested node configuration is not available')
+        runtime = _sample(self.options['runtime'])
+        if time_limit is not None:
+            runtime = min(runtime, time_limit)
+        exitcode = (1 if random.random() < float(self.options['failure_rate'])
+                    else 0)
+        cursor = self.db.execute(
+            'INSERT INTO jobs (name, cwd, script, cores, time_limit,'
+            ' submit, eligible, runtime, exitcode)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (name, os.getcwd(), os.path.abspath(script), cores, time_limit,
+             self.now, self.now + _sample(self.options['queue_wait']),
+             runtime, exitcode))
+        return 'Submitted batch job %d\n' % cursor.lastrowid
+
+    def _select(self, jobids):
+        query = ('SELECT id, name, cores, time_limit, submit, eligible,'
+                 ' runtime, exitcode, start, end, cancelled FROM jobs')
+        if jobids:
+            return self.db.execute(
+                query + ' WHERE id IN (%s) ORDER BY id'
+                % str.join(',', ['?'] * len(jobids)), jobids).fetchall()
+        else:
+            return self.db.execute(query + ' ORDER BY id').fetchall()
+
+    @staticmethod
+    def _parse_jobids(value):
+        try:
+            return [int(jobid) for jobid in value.split(',') if jobid]
+        except ValueError:
+            raise _Error('Invalid job id specified')
+
+    def squeue(self, args):
+        try:
+            opts, args = getopt.gnu_getopt(
+                args, 'ho:j:u:', ['noheader', 'format=', 'jobs=', 'user='])
+        except getopt.GetoptError as err:
+            raise _Error('squeue: error: %s' % err)
+        header = True
+        fmt = '%.18i %.9P %.8j %.8u %.2t %.10M %.6D %R'
+        jobids = []
+        for opt, value in opts:
+            if opt in ('-h', '--noheader'):
+                header = False
+            elif opt in ('-o', '--format'):
+                fmt = value
+            elif opt in ('-j', '--jobs'):
+                jobids = self._parse_jobids(value)
+        rows = []
+        for (jobid, name, cores, time_limit, submit, eligible, runtime,
+             exitcode, start, end, cancelled) in self._select(jobids):
+            if end is not None and end <= self.now - int(
+                    self.options['min_job_age']):
+                # purged from the controller's memory
+                continue
+            state = self._state(
+                start, end, time_limit, runtime, exitcode, cancelled)
+            if state == 'PENDING':
+                reason = ('Resources' if eligible <= self.now
+                          else 'BeginTime')
+                nodes = '(%s)' % reason
+            elif state == 'RUNNING':
+                reason = 'None'
+                nodes = 'localhost'
+            else:
+                reason = 'None'
+                nodes = ''
+            rows.append({
+                'i': str(jobid), 'j': name, 'u': self.user,
+                'U': str(self.uid), 'T': state, 't': state[:2],
+                'r': reason, 'R': nodes, 'C': str(cores),
+                'P': 'fake', 'D': '1',
+                'M': _format_duration(
+                    (min(end, self.now) - start) if start is not None
+                    else 0),
+            })
+        if jobids and not rows:
+            raise _Error(
+                'slurm_load_jobs error: Invalid job id specified')
+        lines = []
+        if header:
+            lines.append(self._format(fmt, dict(
+                i='JOBID', j='NAME', u='USER', U='UID', T='STATE', t='ST',
+                r='REASON', R='NODELIST(REASON)', C='CPUS', P='PARTITION',
+                D='NODES', M='TIME')))
+        for row in rows:
+            lines.append(self._format(fmt, row))
+        return str.join('', [line + '\n' for line in lines])
+
+    @staticmethod
+    def _format(fmt, fields):
+        """
+        Expand ``%`` field specifiers in a ``squeue`` format string.
+
+        Example::
+
+          >>> FakeCluster._format('%i^%T^%.8j', {'i': '1', 'T': 'RUNNING', 'j': 'test'})
+          '1^RUNNING^    test'
+        """
+        result = []
+        n = 0
+        while n < len(fmt):
+            char = fmt[n]
+            if char != '%':
+                result.append(char)
+                n += 1
+                continue
+            n += 1
+            # optional field width, e.g. `%.18i` or `%-10j`
+            width = ''
+            while n < len(fmt) and fmt[n] in '.-0123456789':
+                width += fmt[n]
+                n += 1
+            value = fields.get(fmt[n], '') if n < len(fmt) else ''
+            n += 1
+            size = width.lstrip('.')
+            if size:
+                if size.startswith('-'):
+                    value = value.ljust(int(size[1:]))
+                else:
+                    value = value.rjust(int(size))
+            result.append(value)
+        return str.join('', result)
+
+    def sacct(self, args):
+        try:
+            opts, args = getopt.gnu_getopt(
+                args, 'npPo:j:S:',
+                ['noheader', 'parsable', 'parsable2', 'format=', 'jobs=',
+                 'starttime='])
+        except getopt.GetoptError as err:
+            raise _Error('sacct: error: %s' % err)
+        header = True
+        trailing = ''
+        fields = ['jobid', 'jobname', 'partition', 'account', 'alloccpus',
+                  'state', 'exitcode']
+        jobids = []
+        for opt, value in opts:
+            if opt in ('-n', '--noheader'):
+                header = False
+            elif opt in ('-p', '--parsable'):
+                trailing = '|'
+            elif opt in ('-o', '--format'):
+                fields = [field.strip().lower() for field in value.split(',')]
+            elif opt in ('-j', '--jobs'):
+                jobids = self._parse_jobids(value)
+        lines = []
+        if header:
+            lines.append(str.join('|', [f.capitalize() for f in fields]))
+        for (jobid, name, cores, time_limit, submit, eligible, runtime,
+             exitcode, start, end, cancelled) in self._select(jobids):
+            state = self._state(
+                start, end, time_limit, runtime, exitcode, cancelled)
+            if state in ('PENDING', 'RUNNING'):
+                elapsed = (self.now - start) if state == 'RUNNING' else 0
+                end = None
+            else:
+                elapsed = end - start
+            if state == 'CANCELLED':
+                exit = '0:15'
+            else:
+                exit = '%d:0' % exitcode
+            record = {
+                'jobid': str(jobid),
+                'jobname': name,
+                'partition': 'fake',
+                'account': self.user,
+                'user': self.user,
+                'alloccpus': str(cores),
+                'ncpus': str(cores),
+                'state': (('CANCELLED by %d' % self.uid)
+                          if state == 'CANCELLED' else state),
+                'exitcode': exit,
+                'elapsed': _format_duration(elapsed),
+                'totalcpu': _format_duration(elapsed * cores) + '.000',
+                'cputimeraw': str(int(elapsed * cores)),
+                'submit': _format_timestamp(submit),
+                'eligible': _format_timestamp(eligible),
+                'start': _format_timestamp(start),
+                'end': _format_timestamp(end),
+                'reserved': _format_duration(
+                    (start if start is not None else self.now) - eligible),
+                'maxrss': '',
+                'maxvmsize': '',
+            }
+            lines.append(
+                str.join('|', [record.get(f, '') for f in fields]) + trailing)
+            if state != 'PENDING':
+                # the batch step carries the resource usage records
+                record.update(jobid=('%d.batch' % jobid), jobname='batch',
+                              state=state, maxrss='1024K', maxvmsize='8192K')
+                lines.append(
+                    str.join('|', [record.get(f, '') for f in fields])
+                    + trailing)
+        return str.join('', [line + '\n' for line in lines])
+
+    def scancel(self, args):
+        jobids = []
+        for arg in args:
+            if not arg.startswith('-'):
+                jobids += self._parse_jobids(arg)
+        found = dict((row[0], row) for row in self._select(jobids))
+        errors = []
+        for jobid in jobids:
+            if jobid not in found:
+                errors.append(
+                    'scancel: error: Kill job error on job id %d:'
+                    ' Invalid job id specified' % jobid)
+                continue
+            (_, _, _, time_limit, _, _, runtime, exitcode,
+             start, end, cancelled) = found[jobid]
+            state = self._state(
+                start, end, time_limit, runtime, exitcode, cancelled)
+            if state not in ('PENDING', 'RUNNING'):
+                errors.append(
+                    'scancel: error: Kill job error on job id %d:'
+                    ' Job/step already completing or completed' % jobid)
+                continue
+            if start is None:
+                start = self.now
+            self.db.execute(
+                'UPDATE jobs SET start = ?, end = ?, runtime = ?,'
+                ' cancelled = 1 WHERE id = ?',
+                (start, self.now, self.now - start, jobid))
+        if errors:
+            raise _Error(str.join('\n', errors))
+        return ''
+
+
+def main(argv=None):
+    """
+    Run a SLURM command emulation; return exit code.
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    options = {}
+    state_dir = os.environ.get(
+        'GC3PIE_FAKESLURM_DIR',
+        os.path.expanduser('~/.gc3/fakeslurm'))
+    try:
+        opts, args = getopt.getopt(
+            argv, '',
+            ['state-dir='] + [(name.replace('_', '-') + '=')
+                              for name in DEFAULTS])
+    except getopt.GetoptError as err:
+        sys.stderr.write('fakeslurm: %s\n' % err)
+        return 2
+    for opt, value in opts:
+        if opt == '--state-dir':
+            state_dir = value
+        else:
+            options[opt[2:].replace('-', '_')] = value
+    if not args or args[0] not in ('sbatch', 'squeue', 'sacct', 'scancel'):
+        sys.stderr.write(
+            'Usage: fakeslurm [OPTIONS] {sbatch|squeue|sacct|scancel} ...\n')
+        return 2
+    command = args[0]
+
+    cluster = FakeCluster(state_dir, **options)
+    time.sleep(_sample(cluster.options['latency']))
+    if random.random() < float(cluster.options['command_failure_rate']):
+        sys.stderr.write(
+            '%s: error: Unable to contact slurm controller'
+            ' (connect failure)\n' % command)
+        return 1
+    try:
+        with cluster:
+            output = getattr(cluster, command)(args[1:])
+    except _Error as err:
+        sys.stderr.write(str(err) + '\n')
+        return err.exitcode
+    sys.stdout.write(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -23,6 +23,7 @@ Utility functions for use in unit test code.
 
 # stdlib imports
 from contextlib import contextmanager
+import os
 import sys
 from tempfile import NamedTemporaryFile, mkdtemp
 import shutil
@@ -32,6 +33,7 @@ from gc3libs import Application, Run
 from gc3libs.config import Configuration
 from gc3libs.core import Core, Engine
 from gc3libs.quantity import GB, hours
+from gc3libs.testing import fakeslurm
 from gc3libs.workflow import ParallelTaskCollection, SequentialTaskCollection
 
 
@@ -74,6 +76,42 @@ def temporary_core(
     del cfg.TYPE_CONSTRUCTOR_MAP['noop']
 
 
+@contextmanager
+def temporary_slurm_core(
+        max_cores_per_job=1,
+        max_memory_per_core=1*GB,
+        max_walltime=8*hours,
+        max_cores=2,
+        architecture=Run.Arch.X86_64,
+        **options
+):
+    """
+    Yield a `Core` connected to a simulated SLURM cluster.
+
+    The cluster has `max_cores` slots; any additional keyword argument
+    is passed as an option to the SLURM commands emulator, see
+    `gc3libs.testing.fakeslurm`:mod: for a list.
+    """
+    with temporary_directory() as tmpdir:
+        cfg = Configuration()
+        name = 'test'
+        cfg.resources[name].update(
+            name=name,
+            type='slurm',
+            auth='none',
+            transport='local',
+            frontend='localhost',
+            max_cores_per_job=max_cores_per_job,
+            max_memory_per_core=max_memory_per_core,
+            max_walltime=max_walltime,
+            max_cores=max_cores,
+            architecture=architecture,
+            **fakeslurm.commands(os.path.join(tmpdir, 'cluster'),
+                                 slots=max_cores, **options)
+        )
+        yield Core(cfg)
+
+
 @contextmanager
 def temporary_directory(*args, **kwargs):
     tmpdir = mkdtemp(*args, **kwargs)
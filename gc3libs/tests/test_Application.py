@@ -23,7 +23,7 @@ __docformat__ = 'reStructuredText'
 
 import pytest
 
-from gc3libs import Application
+from gc3libs import Application, Run
 import gc3libs.exceptions
 
 
@@ -113,6 +113,56 @@ def test_io_spec_to_dict_unicode():
             True)
 
 
+def test_pickle_roundtrip():
+    import pickle
+    app = Application(['/bin/true'], inputs=['/tmp/a'], outputs=['o1'],
+                      output_dir='/tmp', jobname='test', stdout='out',
+                      extra='extra')
+    app.execution.state = Run.State.SUBMITTED
+    app.execution.lrms_jobid = '1'
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        app2 = pickle.loads(pickle.dumps(app, protocol))
+        assert sorted(app2.keys()) == sorted(app.keys())
+        assert app2.extra == 'extra'
+        assert app2.stdout == 'out'
+        assert app2.inputs == app.inputs
+        assert app2.inputs._force_abs
+        assert app2.execution.state is Run.State.SUBMITTED
+        assert app2.execution.lrms_jobid == '1'
+        assert Run.State.SUBMITTED in app2.execution.timestamp
+
+
+def test_load_state_without_slots():
+    """Test loading `Application` objects saved by older GC3Pie versions."""
+    # pylint: disable=import-error
+    from gc3libs.compat._collections import OrderedDict
+    from gc3libs.url import UrlKeyDict, UrlValueDict
+    from gc3libs.utils import History
+    # these are `__dict__` of objects with no `__slots__`
+    inputs = UrlKeyDict.__new__(UrlKeyDict)
+    inputs.__setstate__({'_force_abs': True})
+    history = History.__new__(History)
+    history.__setstate__({'_messages': []})
+    run = Run.__new__(Run)
+    run.__setstate__({
+        '_ref': None, '_state': 'NEW', '_exitcode': None, '_signal': None,
+        '_execution_targets': [], 'history': history,
+        'timestamp': OrderedDict([('NEW', 0.0)]), 'lrms_jobid': '1'})
+    app = Application.__new__(Application)
+    app.__setstate__({
+        'arguments': ['/bin/true'], 'inputs': inputs,
+        'outputs': UrlValueDict(), 'output_dir': '/tmp', 'jobname': 'test',
+        'execution': run, 'changed': True, 'persistent_id': 42,
+        '_attached': None, '_controller': None})
+    assert app.jobname == 'test'
+    assert app['persistent_id'] == 42
+    assert app.changed
+    assert app.execution.state == Run.State.NEW
+    assert app.execution.timestamp == {Run.State.NEW: 0.0}
+    assert 'lrms_jobid' in app.execution
+    assert 'stdout' not in app
+
+
 # main: run tests
 
 if "__main__" == __name__:
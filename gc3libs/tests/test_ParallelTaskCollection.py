@@ -60,6 +60,64 @@ def test_ParallelTaskCollection_redo():
             assert task.execution.state == Run.State.NEW
 
 
+def test_ParallelTaskCollection_stats_follow_transitions():
+    par = ParallelTaskCollection([SuccessfulApp(), UnsuccessfulApp()])
+    stats = par.stats()
+    assert stats[Run.State.NEW] == 2
+    assert stats['total'] == 2
+
+    # state changes of managed tasks are reflected without re-scanning
+    par.tasks[0].execution.state = Run.State.RUNNING
+    par.tasks[1].execution.state = Run.State.TERMINATED
+    stats = par.stats()
+    assert stats[Run.State.NEW] == 0
+    assert stats[Run.State.RUNNING] == 1
+    assert stats[Run.State.TERMINATED] == 1
+    assert stats['failed'] == 1
+    assert stats['ok'] == 0
+
+    # return code changes of TERMINATED tasks are tracked as well
+    par.tasks[1].execution.returncode = 0
+    stats = par.stats()
+    assert stats['failed'] == 0
+    assert stats['ok'] == 1
+
+    # adding and removing tasks keeps counts up-to-date
+    extra = SuccessfulApp()
+    par.add(extra)
+    assert par.stats()[Run.State.NEW] == 1
+    par.remove(extra)
+    assert par.stats()[Run.State.NEW] == 0
+    assert par.stats()['total'] == 2
+    # a removed task does not affect counts any more
+    extra.execution.state = Run.State.RUNNING
+    assert par.stats()[Run.State.RUNNING] == 1
+
+
+def test_ParallelTaskCollection_stats_direct_list_manipulation():
+    par = ParallelTaskCollection([SuccessfulApp()])
+    assert par.stats()[Run.State.NEW] == 1
+    par.tasks.append(SuccessfulApp())
+    assert par.stats()[Run.State.NEW] == 2
+    par.tasks = [SuccessfulApp()]
+    assert par.stats()[Run.State.NEW] == 1
+
+
+def test_ParallelTaskCollection_changed_only_on_state_change():
+    with temporary_core(max_cores=10) as core:
+        par = SimpleParallelTaskCollection(5)
+        par.attach(core)
+        while par.execution.state != Run.State.TERMINATED:
+            par.progress()
+        par.changed = False
+        for task in par.tasks:
+            task.changed = False
+        # no state change, so no need to save the collection again
+        par.update_state()
+        assert par.execution.state == Run.State.TERMINATED
+        assert not par.changed
+
+
 # main: run tests
 
 if "__main__" == __name__:
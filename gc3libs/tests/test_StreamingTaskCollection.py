@@ -0,0 +1,220 @@
+#! /usr/bin/env python
+#
+"""
+Test class `StreamingTaskCollection`:class:.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+## imports
+
+import os
+
+from gc3libs import Run
+from gc3libs.core import Engine
+from gc3libs.persistence import make_store
+from gc3libs.workflow import ParallelTaskCollection, StreamingTaskCollection
+
+from gc3libs.testing.helpers import SuccessfulApp, UnsuccessfulApp, temporary_core, temporary_directory, temporary_engine
+
+
+## auxiliary classes
+
+class _Sweep(StreamingTaskCollection):
+
+    def __init__(self, num_tasks, **extra_args):
+        self.num_tasks = num_tasks
+        self.done = []
+        StreamingTaskCollection.__init__(self, **extra_args)
+
+    def iter_params(self):
+        return iter(xrange(self.num_tasks))
+
+    def new_task(self, param, **extra_args):
+        if param % 5 == 4:
+            return UnsuccessfulApp('task{0}'.format(param))
+        else:
+            return SuccessfulApp('task{0}'.format(param))
+
+    def task_done(self, task):
+        self.done.append(task.jobname)
+
+
+## tests
+
+def test_StreamingTaskCollection_progress():
+    with temporary_engine() as engine:
+        sweep = _Sweep(20, max_live=3)
+        engine.add(sweep)
+        assert sweep.execution.state == Run.State.NEW
+
+        while sweep.execution.state != Run.State.TERMINATED:
+            engine.progress()
+            # never more than `max_live` tasks around
+            assert len(sweep.tasks) <= 3
+
+        assert sweep.tasks == []
+        assert sorted(sweep.done) == sorted(
+            'task{0}'.format(n) for n in range(20))
+        stats = sweep.stats()
+        assert stats['total'] == 20
+        assert stats[Run.State.TERMINATED] == 20
+        assert stats['ok'] == 16
+        assert stats['failed'] == 4
+        assert sweep.execution.exitcode == 1
+        # folded tasks are no longer managed by the engine
+        assert engine.counts()['total'] == 1
+
+
+def test_StreamingTaskCollection_purges_store():
+    with temporary_directory() as tmpdir:
+        store = make_store(os.path.join(tmpdir, 'store'))
+        with temporary_core() as core:
+            engine = Engine(core, store=store)
+            sweep = _Sweep(10, max_live=3)
+            engine.add(sweep)
+            while sweep.execution.state != Run.State.TERMINATED:
+                engine.progress()
+                # only the collection and its live tasks are stored
+                assert len(store.list()) <= 1 + len(sweep.tasks)
+            assert store.list() == [sweep.persistent_id]
+            # folded tasks have left all the Engine queues
+            assert list(engine.iter_tasks()) == [sweep]
+
+
+def test_StreamingTaskCollection_purges_after_save():
+    with temporary_directory() as tmpdir:
+        store = make_store(os.path.join(tmpdir, 'store'))
+        remove = store.remove
+        purged = []
+
+        def checked_remove(id_):
+            # the stored collection must not refer to the task any more
+            saved = store.load(sweep.persistent_id)
+            assert id_ not in [task.persistent_id for task in saved.tasks]
+            purged.append(id_)
+            remove(id_)
+        store.remove = checked_remove
+
+        with temporary_core() as core:
+            engine = Engine(core, store=store)
+            sweep = _Sweep(10, max_live=3)
+            engine.add(sweep)
+            while sweep.execution.state != Run.State.TERMINATED:
+                engine.progress()
+            assert len(purged) == 10
+
+
+def test_StreamingTaskCollection_refill_changed():
+    sweep = _Sweep(3, max_live=3)
+    sweep._refill()
+    assert len(sweep.tasks) == 3
+    assert sweep.changed
+    # the stream is exhausted, but we only find out now
+    sweep.tasks = sweep.tasks[:2]
+    for task in sweep.tasks:
+        task.changed = False
+    sweep.changed = False
+    sweep._refill()
+    assert len(sweep.tasks) == 2
+    assert not sweep.changed
+
+
+def test_StreamingTaskCollection_submit_extra_args(monkeypatch):
+    class _ArgsSweep(_Sweep):
+        def new_task(self, param, **extra_args):
+            self.done.append(extra_args)
+            return _Sweep.new_task(self, param, **extra_args)
+
+    monkeypatch.setattr(ParallelTaskCollection, 'submit',
+                        lambda self, *args, **kwargs: None)
+    sweep = _ArgsSweep(2, max_live=3)
+    sweep.submit(foo='bar')
+    assert sweep.done == [{'foo': 'bar'}, {'foo': 'bar'}]
+
+
+def test_StreamingTaskCollection_default_max_live():
+    with temporary_engine() as engine:
+        engine.max_in_flight = 2
+        sweep = _Sweep(10)
+        engine.add(sweep)
+        engine.progress()
+        assert sweep._max_live() == 2
+        assert len(sweep.tasks) == 2
+
+
+def test_StreamingTaskCollection_empty():
+    with temporary_engine() as engine:
+        sweep = _Sweep(0)
+        engine.add(sweep)
+        engine.progress()
+        engine.progress()
+        assert sweep.execution.state == Run.State.TERMINATED
+        assert sweep.execution.exitcode == 0
+        assert sweep.stats()['total'] == 0
+
+
+def test_StreamingTaskCollection_resume():
+    with temporary_directory() as tmpdir:
+        store = make_store(os.path.join(tmpdir, 'store'))
+        with temporary_engine() as engine:
+            sweep = _Sweep(10, max_live=2)
+            engine.add(sweep)
+            while sweep.stats()[Run.State.TERMINATED] < 4:
+                engine.progress()
+            cursor = sweep._cursor
+            done = list(sweep.done)
+            sweep_id = store.save(sweep)
+
+        # the live parameter iterator is not saved
+        sweep = store.load(sweep_id)
+        assert '_params' not in sweep
+        assert sweep._cursor == cursor
+
+        with temporary_engine() as engine:
+            engine.add(sweep)
+            while sweep.execution.state != Run.State.TERMINATED:
+                engine.progress()
+            # no parameter is generated twice
+            assert sorted(done + sweep.done[len(done):]) == sorted(
+                'task{0}'.format(n) for n in range(10))
+            assert sweep.stats()['total'] == 10
+
+
+def test_StreamingTaskCollection_redo():
+    with temporary_core(max_cores=10) as core:
+        sweep = _Sweep(4, max_live=2)
+        sweep.attach(core)
+        while sweep.execution.state != Run.State.TERMINATED:
+            sweep.progress()
+        assert sweep.stats()['total'] == 4
+
+        sweep.redo()
+        assert sweep.execution.state == Run.State.NEW
+        assert sweep.stats()['total'] == 0
+        while sweep.execution.state != Run.State.TERMINATED:
+            sweep.progress()
+        assert sweep.stats()['total'] == 4
+
+
+# main: run tests
+
+if "__main__" == __name__:
+    import pytest
+    pytest.main(["-v", __file__])
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+#
+"""
+Test the `gc3libs.benchmarks` module.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import json
+
+import pytest
+
+# GC3Pie imports
+from gc3libs.benchmarks import (BASELINE_FILE, SHAPES, TRANSITION_GRAPHS,
+                                benchmark_id, run_benchmark)
+
+
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+def test_shapes(shape):
+    num_tasks = 25
+    tasks = SHAPES[shape](num_tasks)
+    apps = 0
+    for task in tasks:
+        if hasattr(task, '_deps'):
+            # `DependentTaskCollection` only fills `.tasks` on submission
+            apps += len(task._deps)
+        else:
+            apps += len(getattr(task, 'tasks', [task]))
+    assert apps == num_tasks
+
+
+@pytest.mark.parametrize('shape', sorted(SHAPES))
+@pytest.mark.parametrize('graph', sorted(TRANSITION_GRAPHS))
+def test_run_benchmark(shape, graph):
+    result = run_benchmark(shape, 12, transition_graph=graph)
+    assert result['cycles'] > 0
+    assert result['cycle_seconds_max'] >= result['cycle_seconds_p50']
+    assert result['saves'] == 0
+    assert 'update' in result['phase_seconds']
+
+
+def test_run_benchmark_with_store():
+    result = run_benchmark('flat', 5, store='sqlite')
+    assert result['saves'] > 5
+    assert result['saves_per_second'] > 0
+
+
+def test_run_benchmark_on_fake_slurm():
+    result = run_benchmark('flat', 3, backend='fakeslurm')
+    assert result['cycles'] > 0
+
+
+def test_baseline_file():
+    with open(BASELINE_FILE) as stream:
+        baseline = json.load(stream)
+    assert benchmark_id('flat', 1000) in baseline
+
+
+# main: run tests
+
+if "__main__" == __name__:
+    import pytest
+    pytest.main(["-v", __file__])
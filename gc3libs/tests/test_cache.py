@@ -0,0 +1,171 @@
+#! /usr/bin/env python
+#
+"""
+Test the `gc3libs.cache` module.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import os
+
+# GC3Pie imports
+from gc3libs import Application, Run
+from gc3libs.cache import ResultCache
+from gc3libs.core import Engine
+from gc3libs.utils import read_contents, write_contents
+
+from gc3libs.testing.helpers import temporary_core, temporary_directory
+
+
+def _make_app(tmpdir, input_contents='input data', **extra_args):
+    input_path = os.path.join(tmpdir, 'input.txt')
+    write_contents(input_path, input_contents)
+    return Application(
+        ['/bin/cat', 'input.txt'],
+        inputs=[input_path],
+        outputs=[],
+        output_dir=os.path.join(tmpdir, 'output'),
+        stdout='stdout.txt',
+        **extra_args)
+
+
+class _EchoApp(Application):
+    """Application exiting successfully on the No-Op backend."""
+    def __init__(self, tmpdir, text):
+        Application.__init__(
+            self,
+            ['/bin/echo', text],
+            inputs=[],
+            outputs=[],
+            output_dir=os.path.join(tmpdir, text),
+            requested_cores=1)
+
+    def terminating(self):
+        # the No-Op backend does not set a return code
+        self.execution.returncode = 0
+
+
+def test_key_depends_on_input_contents():
+    with temporary_directory() as tmpdir:
+        key1 = ResultCache.key_for(_make_app(tmpdir))
+        key2 = ResultCache.key_for(_make_app(tmpdir))
+        assert key1 == key2
+        key3 = ResultCache.key_for(_make_app(tmpdir, 'other data'))
+        assert key1 != key3
+        key4 = ResultCache.key_for(
+            _make_app(tmpdir, environment={'FOO': 'bar'}))
+        assert key1 != key4
+
+
+def test_store_and_retrieve():
+    with temporary_directory() as tmpdir:
+        cache = ResultCache(os.path.join(tmpdir, 'cache'))
+        outdir = os.path.join(tmpdir, 'out')
+        os.makedirs(os.path.join(outdir, 'sub'))
+        write_contents(os.path.join(outdir, 'sub', 'result.txt'), '42')
+
+        assert cache.lookup('deadbeef') is None
+        cache.store('deadbeef', 0, outdir)
+        assert cache.lookup('deadbeef') == 0
+
+        dest = os.path.join(tmpdir, 'dest')
+        cache.retrieve('deadbeef', dest)
+        assert read_contents(os.path.join(dest, 'sub', 'result.txt')) == '42'
+
+
+def test_evict_by_size():
+    with temporary_directory() as tmpdir:
+        cache = ResultCache(os.path.join(tmpdir, 'cache'), max_size=15)
+        for n, key in enumerate(['aa', 'bb', 'cc']):
+            outdir = os.path.join(tmpdir, key)
+            os.makedirs(outdir)
+            write_contents(os.path.join(outdir, 'data'), 'x' * 10)
+            cache.store(key, 0, outdir)
+        # only the most recent entry fits
+        assert cache.lookup('aa') is None
+        assert cache.lookup('bb') is None
+        assert cache.lookup('cc') == 0
+
+
+def test_evict_by_age():
+    with temporary_directory() as tmpdir:
+        cache = ResultCache(os.path.join(tmpdir, 'cache'), max_age=0)
+        outdir = os.path.join(tmpdir, 'out')
+        os.makedirs(outdir)
+        cache.store('aa', 0, outdir)
+        assert cache.lookup('aa') is None
+
+
+def test_core_uses_cache():
+    with temporary_directory() as tmpdir:
+        with temporary_core() as core:
+            core.result_cache = ResultCache(os.path.join(tmpdir, 'cache'))
+
+            app1 = _EchoApp(tmpdir, 'hello')
+            while app1.execution.state != Run.State.TERMINATED:
+                core.submit(app1)
+                core.update_job_state(app1)
+                if app1.execution.state == Run.State.TERMINATING:
+                    core.fetch_output(app1)
+            assert app1.execution.returncode == 0
+
+            # identical application is not run again
+            app2 = _EchoApp(tmpdir, 'hello')
+            core.submit(app2)
+            assert app2.execution.state == Run.State.TERMINATED
+            assert app2.execution.returncode == 0
+            assert 'resource_name' not in app2.execution
+
+            # a different one is
+            app3 = _EchoApp(tmpdir, 'world')
+            core.submit(app3)
+            assert app3.execution.state == Run.State.SUBMITTED
+
+
+def test_engine_cache_hits_do_not_count_as_submitted():
+    with temporary_directory() as tmpdir:
+        with temporary_core() as core:
+            core.result_cache = ResultCache(os.path.join(tmpdir, 'cache'))
+            app = _EchoApp(tmpdir, 'hello')
+            while app.execution.state != Run.State.TERMINATED:
+                core.submit(app)
+                core.update_job_state(app)
+                if app.execution.state == Run.State.TERMINATING:
+                    core.fetch_output(app)
+
+            engine = Engine(core, max_submitted=1, max_in_flight=1)
+            apps = [_EchoApp(tmpdir, 'hello') for _ in range(5)]
+            for app in apps:
+                engine.add(app)
+            # all cached tasks are done in one cycle
+            engine.progress()
+            assert [app.execution.state for app in apps] == (
+                [Run.State.TERMINATED] * 5)
+            counts = engine.counts()
+            assert counts[Run.State.TERMINATED] == 5
+            assert counts[Run.State.SUBMITTED] == 0
+            assert list(engine.iter_tasks()) == apps
+
+
+# main: run tests
+
+if "__main__" == __name__:
+    import pytest
+    pytest.main(["-v", __file__])
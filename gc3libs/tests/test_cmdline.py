@@ -241,6 +241,79 @@ resourcedir = %s
         # the output directory
         assert os.path.isdir(os.path.join(wdir, 'EchoApp'))
 
+
+
+def test_task_snapshot_paging():
+    from gc3libs import Run
+    from gc3libs.workflow import ParallelTaskCollection
+    from gc3libs.testing.helpers import SuccessfulApp
+
+    apps = [SuccessfulApp('app%d' % n) for n in range(4)]
+    for n, app in enumerate(apps):
+        app.persistent_id = 'app.%d' % n
+    apps[2].execution.state = Run.State.RUNNING
+    coll = ParallelTaskCollection(apps[:3])
+    coll.persistent_id = 'coll.1'
+
+    snapshot = gc3libs.cmdline._TaskSnapshot([coll, apps[3]], {'total': 5})
+    # depth-first order of the task tree
+    assert [row[1] for row in snapshot.rows] == [
+        'coll.1', 'app.0', 'app.1', 'app.2', 'app.3']
+    assert [row[0] for row in snapshot.rows] == [0, 1, 1, 1, 0]
+    assert snapshot.rows[1][2] == 'coll.1'
+    assert snapshot.stats == {'total': 5}
+
+    assert [row[1] for row in snapshot.page(1, 2)] == ['app.0', 'app.1']
+    assert [row[1] for row in snapshot.page(3)] == ['app.2', 'app.3']
+    assert [row[1] for row in snapshot.page(toplevel=True)] == [
+        'coll.1', 'app.3']
+    assert [row[1] for row in snapshot.page(states=[Run.State.RUNNING])] \
+        == ['app.2']
+    row = gc3libs.cmdline._TaskSnapshot.as_dict(snapshot.rows[2])
+    assert row['jobname'] == 'app1'
+    assert row['parent'] == 'coll.1'
+
+
+def test_comm_daemon_snapshot_and_stats(tmpdir):
+    import threading
+    from gc3libs.testing.helpers import SuccessfulApp, temporary_engine
+
+    class _Parent(object):
+        log = gc3libs.log
+
+    parent = _Parent()
+    with temporary_engine() as engine:
+        parent._controller = engine
+        comm = gc3libs.cmdline._CommDaemon(
+            'test', '127.0.0.1', str(tmpdir), parent)
+        server = threading.Thread(target=comm.start)
+        server.daemon = True
+        server.start()
+        try:
+            app1 = SuccessfulApp('app1')
+            app1.persistent_id = 'app.1'
+            app2 = SuccessfulApp('app2')
+            app2.persistent_id = 'app.2'
+            # a first snapshot is always taken
+            assert comm.snapshot_due()
+            comm.update_snapshot([app1], {})
+            # no new snapshot is taken until a client reads the current one ...
+            assert not comm.snapshot_due(changed=True)
+            assert comm.list_jobs() == 'app.1'
+            assert comm.snapshot_due()
+            comm.update_snapshot([app1, app2], {})
+            assert comm.list_jobs() == 'app.1 app.2'
+            # ... and tasks have changed since it was taken
+            assert not comm.snapshot_due()
+            # `stat` reports the counts copied at the end of a cycle
+            parent._controller.add(app1)
+            comm.update_stats(parent._controller.counts())
+            parent._controller.add(app2)
+            assert 'total:1' in comm.stat_jobs().split('\n')
+        finally:
+            comm.stop()
+
+
 # main: run tests
 
 if "__main__" == __name__:
@@ -34,7 +34,7 @@ from gc3libs import Run, Application
 import gc3libs.config
 import gc3libs.core
 import gc3libs.template
-from gc3libs.quantity import GB, hours
+from gc3libs.quantity import GB, GiB, hours
 from gc3libs.backends.shellcmd import ShellcmdLrms
 from gc3libs.quantity import Memory, Duration
 
@@ -419,6 +419,131 @@ architecture = x86_64
         assert cfg.resources['localhost']['foo'] == '2'
 
 
+_CACHED_CONF = """
+[resource/test]
+type = shellcmd
+auth = none
+transport = local
+max_cores_per_job = 2
+max_memory_per_core = 2GiB
+max_walltime = 8 hours
+max_cores = 2
+architecture = x86_64
+"""
+
+
+@pytest.fixture
+def config_cache(monkeypatch):
+    tmpdir = tempfile.mkdtemp()
+    cache_file = os.path.join(tmpdir, 'gc3pie.conf.cache')
+    monkeypatch.setattr(gc3libs.Default, 'CONFIG_CACHE_FILE', cache_file)
+    yield cache_file
+    shutil.rmtree(tmpdir)
+
+
+def test_config_cache_hit(config_cache, monkeypatch):
+    """Test that parsed configuration files are reused"""
+    tmpfile = _setup_config_file(_CACHED_CONF)
+    try:
+        cfg1 = gc3libs.config.Configuration(tmpfile)
+        assert os.path.exists(config_cache)
+
+        def no_parse(*args, **kwargs):
+            assert False, "configuration file parsed again"
+        monkeypatch.setattr(
+            gc3libs.config.Configuration, '_parse', no_parse)
+        cfg2 = gc3libs.config.Configuration(tmpfile)
+        assert cfg2.resources == cfg1.resources
+        assert cfg2.resources['test']['max_walltime'] == 8 * hours
+        assert cfg2.resources['test']['max_memory_per_core'] == 2 * GiB
+    finally:
+        os.remove(tmpfile)
+
+
+def test_config_cache_invalidated(config_cache):
+    """Test that modified configuration files are parsed again"""
+    tmpfile = _setup_config_file(_CACHED_CONF)
+    try:
+        cfg1 = gc3libs.config.Configuration(tmpfile)
+        assert cfg1.resources['test']['max_cores'] == 2
+        with open(tmpfile, 'w') as stream:
+            stream.write(_CACHED_CONF.replace(
+                'max_cores = 2', 'max_cores = 4'))
+        cfg2 = gc3libs.config.Configuration(tmpfile)
+        assert cfg2.resources['test']['max_cores'] == 4
+    finally:
+        os.remove(tmpfile)
+
+
+def test_config_cache_replays_warnings(config_cache, monkeypatch):
+    """Test that warnings are logged again on a cache hit"""
+    import logging
+
+    class Recorder(logging.Handler):
+        def __init__(self):
+            logging.Handler.__init__(self, logging.WARNING)
+            self.messages = []
+
+        def emit(self, record):
+            self.messages.append(record.getMessage())
+
+    # other tests may have raised the logging threshold
+    monkeypatch.setattr(gc3libs.log, 'level', logging.WARNING)
+    tmpfile = _setup_config_file(_CACHED_CONF.replace(
+        'max_cores = 2', 'ncores = 2'))
+    recorder = Recorder()
+    gc3libs.log.addHandler(recorder)
+    try:
+        cfg1 = gc3libs.config.Configuration(tmpfile)
+        warnings = list(recorder.messages)
+        assert any('ncores' in msg for msg in warnings)
+        del recorder.messages[:]
+
+        def no_parse(*args, **kwargs):
+            assert False, "configuration file parsed again"
+        monkeypatch.setattr(
+            gc3libs.config.Configuration, '_parse', no_parse)
+        cfg2 = gc3libs.config.Configuration(tmpfile)
+        assert cfg2.resources['test']['max_cores'] == 2
+        assert recorder.messages == warnings
+    finally:
+        gc3libs.log.removeHandler(recorder)
+        os.remove(tmpfile)
+
+
+def test_config_cache_skips_prologue(config_cache, monkeypatch):
+    """Test that files defining prologue scripts are not cached"""
+    tmpfile = _setup_config_file(
+        _CACHED_CONF + "prologue = prologue.sh\n")
+    try:
+        cfg1 = gc3libs.config.Configuration(tmpfile)
+        assert not os.path.exists(config_cache)
+        # the resolved path depends on whether `prologue.sh` exists
+        # in the current directory
+        monkeypatch.chdir(tempfile.mkdtemp())
+        with open('prologue.sh', 'w') as stream:
+            stream.write('#!/bin/sh\n')
+        cfg2 = gc3libs.config.Configuration(tmpfile)
+        assert cfg2.resources['test']['prologue'] == 'prologue.sh'
+        assert (cfg1.resources['test']['prologue']
+                == os.path.join(os.path.dirname(tmpfile), 'prologue.sh'))
+        shutil.rmtree(os.getcwd())
+    finally:
+        os.remove(tmpfile)
+
+
+def test_config_cache_corrupt(config_cache):
+    """Test that an unreadable cache file is ignored"""
+    with open(config_cache, 'w') as stream:
+        stream.write('not a pickle')
+    tmpfile = _setup_config_file(_CACHED_CONF)
+    try:
+        cfg = gc3libs.config.Configuration(tmpfile)
+        assert cfg.resources['test']['max_cores'] == 2
+    finally:
+        os.remove(tmpfile)
+
+
 def test_no_valid_config1():
     """`Configuration.load` raises an exception if called with no arguments"""
     cfg = gc3libs.config.Configuration()
@@ -20,13 +20,15 @@
 
 # stdlib imports
 import sys
+import threading
+import time
 
 import pytest
 
 # GC3Pie imports
 from gc3libs import Run, Application, create_core
 import gc3libs.config
-from gc3libs.core import Core, MatchMaker
+from gc3libs.core import Core, LazyResourceDict, MatchMaker
 from gc3libs.quantity import GB, hours
 
 from gc3libs.testing.helpers import temporary_config_file
@@ -121,6 +123,100 @@ def _test_core_disable_resource_on_auth_failure(auth_cls):
         architecture=Run.Arch.X86_64,
     )
     core = Core(cfg)
+    # backends are only initialized upon first use
+    core.get_resources()
+
+
+def _make_lazy_core_config(num_resources):
+    cfg = gc3libs.config.Configuration()
+    for n in range(num_resources):
+        name = 'test{nr}'.format(nr=n)
+        cfg.resources[name].update(
+            name=name,
+            type='shellcmd',
+            auth='none',
+            transport='local',
+            max_cores_per_job=1,
+            max_memory_per_core=1*GB,
+            max_walltime=8*hours,
+            max_cores=2,
+            architecture=Run.Arch.X86_64,
+        )
+    # this one cannot be constructed
+    cfg.resources['broken'].update(cfg.resources['test0'],
+                                   name='broken', type='no-such-type')
+    return cfg
+
+
+def test_core_lazy_resources():
+    """Test that backends are only constructed when used."""
+    core = Core(_make_lazy_core_config(3))
+    assert sorted(core.resources.keys()) == ['broken', 'test0', 'test1', 'test2']
+    assert core.resources.touched() == []
+    lrms = core.get_backend('test1')
+    assert lrms.name == 'test1'
+    assert core.resources.touched() == [lrms]
+    core.close()
+    assert core.resources.touched() == [lrms]
+
+
+def test_core_lazy_resources_select_by_name():
+    """Test that selecting resources by name does not construct them."""
+    core = Core(_make_lazy_core_config(3))
+    assert core.select_resource('test[01]') == 2
+    assert core.resources.touched() == []
+    assert not core.get_backend('test2').enabled
+    assert core.get_backend('test0').enabled
+
+
+def test_core_lazy_resources_drop_broken():
+    """Test that resources which cannot be constructed are dropped."""
+    core = Core(_make_lazy_core_config(2))
+    with pytest.raises(gc3libs.exceptions.InvalidResourceName):
+        core.get_backend('broken')
+    assert 'broken' not in core.resources
+    assert sorted(lrms.name for lrms in core.get_resources()) == [
+        'test0', 'test1']
+
+
+def test_core_lazy_resources_concurrent_lookup():
+    """Test that concurrent lookups construct each backend only once."""
+    cfg = _make_lazy_core_config(1)
+    make_resource = cfg.make_resource
+    calls = []
+
+    def slow_make_resource(name, *args, **kwargs):
+        calls.append(name)
+        time.sleep(0.05)
+        return make_resource(name, *args, **kwargs)
+    cfg.make_resource = slow_make_resource
+
+    resources = LazyResourceDict(cfg)
+    results = []
+    errors = []
+
+    def lookup(name):
+        try:
+            results.append(resources[name])
+        except KeyError:
+            errors.append(name)
+    threads = [threading.Thread(target=lookup, args=(name,))
+               for name in ['test0', 'broken'] * 4]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(calls) == ['broken', 'test0']
+    assert len(results) == 4
+    assert all(lrms is results[0] for lrms in results)
+    assert errors == ['broken'] * 4
+    assert sorted(resources.keys()) == ['test0']
+
+
+def test_core_resource_errors_are_fatal():
+    """Test that `resource_errors_are_fatal` checks all resources upfront."""
+    with pytest.raises(gc3libs.exceptions.ConfigurationError):
+        Core(_make_lazy_core_config(1), resource_errors_are_fatal=True)
 
 
 def test_create_core_default():
@@ -23,6 +23,8 @@ from cStringIO import StringIO
 import os
 import shutil
 import tempfile
+import threading
+import time
 import re
 
 import pytest
@@ -30,7 +32,8 @@ import pytest
 # GC3Pie imports
 from gc3libs import Run, Application, create_engine
 import gc3libs.config
-from gc3libs.core import Core, Engine, MatchMaker
+import gc3libs.exceptions
+from gc3libs.core import ConcurrentEngine, Core, Engine, MatchMaker
 from gc3libs.persistence.filesystem import FilesystemStore
 from gc3libs.quantity import GB, hours
 
@@ -357,6 +360,114 @@ def test_engine_submit_to_multiple_resources(num_resources=3, num_jobs=50):
     del cfg.TYPE_CONSTRUCTOR_MAP['noop']
 
 
+def test_engine_background_transfers(num_jobs=10, max_iter=500):
+    with temporary_core(max_cores=10) as core:
+        engine = Engine(core, max_transfers=2)
+        try:
+            for n in range(num_jobs):
+                engine.add(SuccessfulApp('app{nr}'.format(nr=n+1)))
+            current_iter = 0
+            while (engine.counts()[Run.State.TERMINATED] < num_jobs
+                   and current_iter < max_iter):
+                engine.progress()
+                # give transfer threads a chance to run
+                time.sleep(0.01)
+                current_iter += 1
+            assert engine.counts()[Run.State.TERMINATED] == num_jobs
+            assert engine.counts()['ok'] == num_jobs
+            assert not engine._transfers
+        finally:
+            engine.close()
+
+
+def test_engine_background_transfers_retry(max_iter=500):
+    with temporary_core(max_cores=10) as core:
+        engine = Engine(core, max_transfers=1)
+        attempts = []
+        transfer_output = core.transfer_output
+
+        def flaky_transfer_output(task, *args, **kwargs):
+            attempts.append(task)
+            if len(attempts) == 1:
+                raise gc3libs.exceptions.RecoverableDataStagingError(
+                    "Transient failure")
+            return transfer_output(task, *args, **kwargs)
+        core.transfer_output = flaky_transfer_output
+
+        try:
+            app = SuccessfulApp()
+            engine.add(app)
+            current_iter = 0
+            while (engine.counts()[Run.State.TERMINATED] < 1
+                   and current_iter < max_iter):
+                engine.progress()
+                # give transfer threads a chance to run
+                time.sleep(0.01)
+                current_iter += 1
+            assert app.execution.state == Run.State.TERMINATED
+            assert len(attempts) == 2
+            assert engine.counts()[Run.State.TERMINATED] == 1
+        finally:
+            engine.close()
+
+
+def test_engine_background_transfers_handler_thread(max_iter=500):
+    """Test that `terminated()` runs in the thread calling `progress()`."""
+
+    class _App(SuccessfulApp):
+        def terminated(self):
+            self.handler_thread = threading.current_thread()
+
+    with temporary_core(max_cores=10) as core:
+        engine = Engine(core, max_transfers=1)
+        try:
+            app = _App()
+            engine.add(app)
+            current_iter = 0
+            while (app.execution.state != Run.State.TERMINATED
+                   and current_iter < max_iter):
+                engine.progress()
+                # background transfer does not change the task state
+                if engine._transfers:
+                    assert app.execution.state == Run.State.TERMINATING
+                time.sleep(0.01)
+                current_iter += 1
+            assert app.execution.state == Run.State.TERMINATED
+            assert app.handler_thread is threading.current_thread()
+        finally:
+            engine.close()
+
+
+def test_concurrent_engine_progress(num_jobs=20, max_iter=100):
+    with temporary_core(max_cores=10) as core:
+        engine = ConcurrentEngine(core, max_workers=4)
+        try:
+            for n in range(num_jobs):
+                engine.add(SuccessfulApp('app{nr}'.format(nr=n+1)))
+            current_iter = 0
+            while (engine.counts()[Run.State.TERMINATED] < num_jobs
+                   and current_iter < max_iter):
+                engine.progress()
+                current_iter += 1
+            assert engine.counts()[Run.State.TERMINATED] == num_jobs
+            assert engine.counts()['ok'] == num_jobs
+        finally:
+            engine.close()
+
+
+def test_concurrent_engine_progress_collection():
+    with temporary_core(max_cores=10) as core:
+        engine = ConcurrentEngine(core)
+        try:
+            par = SimpleParallelTaskCollection(5)
+            engine.add(par)
+            while par.execution.state != Run.State.TERMINATED:
+                engine.progress()
+            assert par.stats()['ok'] == 5
+        finally:
+            engine.close()
+
+
 def test_create_engine_default():
     """Test `create_engine` with factory defaults."""
     with temporary_config_file() as cfgfile:
@@ -448,6 +559,50 @@ def test_engine_cannot_find_task_by_id_if_no_store():
                 engine.find_task_by_id(task_id)
 
 
+def test_engine_records_metrics():
+    with temporary_directory() as tmpdir:
+        store = FilesystemStore(tmpdir)
+        with temporary_engine() as engine:
+            engine._store = store
+            engine.metrics.reset()
+            engine.add(SuccessfulApp())
+            while engine.counts()[Run.State.TERMINATED] < 1:
+                engine.progress()
+
+            assert sorted(engine.last_cycle.keys()) == [
+                'fetch_output', 'kill', 'stopped', 'submit', 'total', 'update']
+            cycles = engine.metrics.get('engine_phase_seconds', phase='total')
+            assert cycles.count > 1
+            submits = engine.metrics.get(
+                'backend_seconds', resource='test', operation='submit_job')
+            assert submits.count == 1
+            assert engine.metrics.get(
+                'store_pickled_bytes_total', store='FilesystemStore') > 0
+
+
+def test_concurrent_engine_times_updates():
+    with temporary_core(max_cores=10) as core:
+        update_job_state = core.update_job_state
+
+        def slow_update_job_state(*args, **kwargs):
+            time.sleep(0.1)
+            return update_job_state(*args, **kwargs)
+        core.update_job_state = slow_update_job_state
+
+        engine = ConcurrentEngine(core)
+        try:
+            app = SuccessfulApp()
+            engine.add(app)
+            engine.progress()
+            assert app.execution.state == Run.State.SUBMITTED
+            engine.progress()
+            # concurrent state updates are part of the `update` phase
+            assert engine.last_cycle['update'] >= 0.1
+            assert engine.last_cycle['total'] >= engine.last_cycle['update']
+        finally:
+            engine.close()
+
+
 if __name__ == "__main__":
     import pytest
     pytest.main(["-v", __file__])
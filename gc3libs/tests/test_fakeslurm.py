@@ -0,0 +1,99 @@
+#! /usr/bin/env python
+#
+"""
+Test the SLURM backend against the `gc3libs.testing.fakeslurm` emulator.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import os
+import time
+
+# GC3Pie imports
+from gc3libs import Application, Run
+from gc3libs.core import Engine
+from gc3libs.quantity import minutes
+from gc3libs.testing.fakeslurm import FakeCluster, main
+
+from gc3libs.testing.helpers import temporary_directory, temporary_slurm_core
+
+
+def _make_app(tmpdir, n):
+    return Application(
+        ['/bin/true'],
+        inputs=[],
+        outputs=[],
+        output_dir=os.path.join(tmpdir, 'out%d' % n),
+        jobname='app%d' % n,
+        requested_walltime=(10 * minutes))
+
+
+def _run(tmpdir, num_apps, **options):
+    apps = [_make_app(tmpdir, n) for n in range(num_apps)]
+    with temporary_slurm_core(**options) as core:
+        engine = Engine(core, apps)
+        for _ in range(100):
+            engine.progress()
+            if all(app.execution.state == Run.State.TERMINATED
+                   for app in apps):
+                break
+            time.sleep(0.1)
+    return apps
+
+
+def test_jobs_complete():
+    with temporary_directory() as tmpdir:
+        apps = _run(tmpdir, 3, max_cores=2, runtime='0.2')
+        for app in apps:
+            assert app.execution.state == Run.State.TERMINATED
+            assert app.execution.returncode == 0
+            assert app.execution.cores == 1
+
+
+def test_job_failures():
+    with temporary_directory() as tmpdir:
+        apps = _run(tmpdir, 2, runtime='0', failure_rate=1)
+        for app in apps:
+            assert app.execution.state == Run.State.TERMINATED
+            assert app.execution.exitcode == 1
+
+
+def test_slots_are_respected():
+    with temporary_directory() as tmpdir:
+        script = os.path.join(tmpdir, 'job.sh')
+        with open(script, 'w') as stream:
+            stream.write('#!/bin/sh\n')
+        options = dict(slots=2, runtime='60')
+        for _ in range(3):
+            with FakeCluster(tmpdir, **options) as cluster:
+                cluster.sbatch([script])
+        with FakeCluster(tmpdir, **options) as cluster:
+            states = cluster.squeue(['--noheader', '-o', '%i^%T']).split()
+        assert states == ['1^RUNNING', '2^RUNNING', '3^PENDING']
+        # command failures are reported like SLURM does
+        assert main(['--state-dir', tmpdir, '--command-failure-rate', '1',
+                     'squeue']) == 1
+
+
+# main: run tests
+
+if "__main__" == __name__:
+    import pytest
+    pytest.main(["-v", __file__])
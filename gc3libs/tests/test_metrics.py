@@ -0,0 +1,94 @@
+#! /usr/bin/env python
+#
+"""
+Test the `gc3libs.metrics` module.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import json
+import os
+
+import pytest
+
+# GC3Pie imports
+from gc3libs.metrics import Registry
+from gc3libs.utils import read_contents
+
+from gc3libs.testing.helpers import temporary_directory
+
+
+def test_timer_records_on_error():
+    reg = Registry()
+    with pytest.raises(ValueError):
+        with reg.timer('op_seconds', op='fail'):
+            raise ValueError()
+    assert reg.get('op_seconds', op='fail').count == 1
+    assert reg.get('op_seconds', op='other') is None
+
+
+def test_disabled_registry():
+    reg = Registry()
+    reg.enabled = False
+    reg.incr('requests_total')
+    reg.observe('op_seconds', 1.0)
+    assert reg.as_dict() == {}
+
+
+def test_prometheus_format():
+    reg = Registry()
+    reg.incr('bytes_total', 10, host='a"b')
+    reg.observe('op_seconds', 0.002, op='x')
+    reg.observe('op_seconds', 20, op='x')
+    lines = reg.to_prometheus().splitlines()
+    assert '# TYPE bytes_total counter' in lines
+    assert r'bytes_total{host="a\"b"} 10' in lines
+    assert '# TYPE op_seconds histogram' in lines
+    assert 'op_seconds_bucket{op="x",le="0.001"} 0' in lines
+    assert 'op_seconds_bucket{op="x",le="0.005"} 1' in lines
+    assert 'op_seconds_bucket{op="x",le="+Inf"} 2' in lines
+    assert 'op_seconds_count{op="x"} 2' in lines
+
+
+def test_dump():
+    reg = Registry()
+    reg.incr('requests_total', host='example.org')
+    reg.observe('op_seconds', 0.5)
+    with temporary_directory() as tmpdir:
+        path = os.path.join(tmpdir, 'metrics.json')
+        reg.dump(path)
+        data = json.loads(read_contents(path))
+        assert data['requests_total'] == [
+            {'labels': {'host': 'example.org'}, 'value': 1}]
+        assert data['op_seconds'][0]['count'] == 1
+        assert data['op_seconds'][0]['buckets'][-1] == ['+Inf', 1]
+
+        path = os.path.join(tmpdir, 'metrics.prom')
+        reg.dump(path)
+        assert 'requests_total{host="example.org"} 1\n' in read_contents(path)
+        # no temporary files left around
+        assert sorted(os.listdir(tmpdir)) == ['metrics.json', 'metrics.prom']
+
+
+# main: run tests
+
+if "__main__" == __name__:
+    import pytest
+    pytest.main(["-v", __file__])
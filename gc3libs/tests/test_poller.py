@@ -82,6 +82,70 @@ class TestPollers(object):
         assert url.path == fpath
         assert mask == plr.events['IN_DELETE']
 
+    def test_filepoller_recurse(self):
+        poller = plr.FilePoller(self.tmpdir, 0, recurse=True)
+        subdir = os.path.join(self.tmpdir, 'sub')
+        os.mkdir(subdir)
+        fpath = os.path.join(subdir, 'foo')
+        open(fpath, 'w').close()
+        events = dict((url.path, mask) for url, mask in poller.get_events())
+        assert events == {
+            subdir: (plr.events['IN_CLOSE_WRITE'] | plr.events['IN_CREATE']
+                     | plr.events['IN_ISDIR']),
+            fpath: plr.events['IN_CLOSE_WRITE'] | plr.events['IN_CREATE'],
+        }
+        assert poller.get_events() == []
+
+    def test_filepoller_skips_unchanged_dirs(self, monkeypatch):
+        poller = plr.FilePoller(self.tmpdir, 0)
+        # pretend the directory was listed long after its last change
+        mtime, _, entries = poller._dirs[self.tmpdir]
+        poller._dirs[self.tmpdir] = (mtime, mtime + 60, entries)
+        listed = []
+        monkeypatch.setattr(plr, '_read_dir',
+                            lambda path: listed.append(path) or {})
+        assert poller.get_events() == []
+        assert listed == []
+
+    def test_inotifypoller_coalesce(self):
+        poller = plr.INotifyPoller(self.tmpdir, plr.events['IN_ALL_EVENTS'],
+                                   coalesce=0)
+        fpath = os.path.join(self.tmpdir, 'foo')
+        for _ in range(3):
+            with open(fpath, 'w') as fd:
+                fd.write('x')
+        events = poller.get_events()
+        assert len(events) == 1
+        url, mask = events[0]
+        assert url.path == fpath
+        assert mask & plr.events['IN_CREATE']
+        assert mask & plr.events['IN_CLOSE_WRITE']
+        poller.close()
+
+    def test_inotifypoller_debounce(self):
+        poller = plr.INotifyPoller(self.tmpdir, plr.events['IN_CLOSE_WRITE'],
+                                   coalesce=60)
+        open(os.path.join(self.tmpdir, 'foo'), 'w').close()
+        # event is held back until 60 seconds have passed
+        assert poller.get_events() == []
+        poller._coalesce = 0
+        assert len(poller.get_events()) == 1
+        poller.close()
+
+    def test_inotifypoller_recurse(self):
+        poller = plr.INotifyPoller(self.tmpdir, plr.events['IN_CLOSE_WRITE'],
+                                   recurse=True, background=False)
+        subdir = os.path.join(self.tmpdir, 'sub')
+        os.mkdir(subdir)
+        # new directory is watched as soon as its creation is seen
+        assert poller.get_events() == []
+        fpath = os.path.join(subdir, 'foo')
+        open(fpath, 'w').close()
+        events = poller.get_events()
+        assert [(url.path, mask) for url, mask in events] == [
+            (fpath, plr.events['IN_CLOSE_WRITE'])]
+        poller.close()
+
 
 ## main: run tests
 
@@ -32,6 +32,7 @@ import sqlalchemy
 import sqlalchemy.sql as sql
 
 # GC3Pie imports
+import gc3libs
 import gc3libs.exceptions
 from gc3libs.persistence import Persistable, make_store
 import gc3libs.persistence.sql
@@ -81,6 +82,38 @@ def test_destroy():
         raise
 
 
+def test_query_shared_store(tmpdir):
+    pytest.importorskip("sqlite3")
+    from gc3libs.testing.helpers import SuccessfulApp
+    store_url = "sqlite:///{0}/store.db".format(tmpdir)
+    sess1 = Session(str(tmpdir.join('sess1')), store_or_url=store_url)
+    sess2 = Session(str(tmpdir.join('sess2')), store_or_url=store_url)
+    assert not sess1.owns_store()
+    id1 = sess1.add(SuccessfulApp('app1'), flush=True)
+    sess2.add(SuccessfulApp('app2'), flush=True)
+    # tasks of `sess2` are in the store, but not in `sess1`
+    assert len(sess1.store.query(states=[gc3libs.Run.State.NEW])) == 2
+    sess1 = Session(sess1.path, create=False, load_tasks=False)
+    assert ([str(id_) for id_ in sess1.query(states=[gc3libs.Run.State.NEW])]
+            == [str(id1)])
+    # the same holds for task counts
+    assert sess1.store.stats()['total'] == 2
+    assert sess1.stats()['total'] == 1
+    assert sess1.stats()[gc3libs.Run.State.NEW] == 1
+
+
+def test_query_own_store(tmpdir):
+    from gc3libs.testing.helpers import SuccessfulApp
+    sess = Session(str(tmpdir.join('sess')))
+    assert sess.owns_store()
+    sess.add(SuccessfulApp('app'), flush=True)
+    sess = Session(sess.path, create=False, load_tasks=False)
+    assert len(sess.query(states=[gc3libs.Run.State.NEW])) == 1
+    assert sess.stats()['total'] == 1
+    # tasks were not loaded, the store answered the query
+    assert len(sess) == 0
+
+
 class TestSession(object):
 
     @pytest.fixture(autouse=True)
@@ -119,6 +152,13 @@ class TestSession(object):
         assert len(ids) == 1
         assert ids == [str(i) for i in self.sess.tasks]
 
+    def test_load_session_without_tasks(self):
+        """Check that tasks are not loaded if `load_tasks` is `False`."""
+        tid = self.sess.add(_PStruct(a=1, b='foo'), flush=True)
+        sess2 = Session(self.sess.path, load_tasks=False)
+        assert len(sess2) == 0
+        assert sess2.store.load(tid).a == 1
+
     def test_empty_lines_in_index_file(self):
         """Check that the index file is read correctly even when there
         are empty lines.
@@ -263,6 +303,61 @@ class TestSession(object):
                       'collection-1', 'task-1-0', 'task-1-1', 'task-1-2'] ==
                      [job.jobname for job in self.sess.iter_workflow()])
 
+    def _count_saves(self):
+        saved = []
+        orig_save = self.sess.store.save
+
+        def save(obj):
+            saved.append(obj)
+            return orig_save(obj)
+        self.sess.store.save = save
+        return saved
+
+    def test_save_all_only_saves_changed_tasks(self):
+        tasks = [Task(jobname='task-%d' % i) for i in range(3)]
+        for task in tasks:
+            self.sess.add(task)
+        saved = self._count_saves()
+        self.sess.save_all()
+        assert saved == []
+        tasks[1].execution.state = gc3libs.Run.State.SUBMITTED
+        self.sess.save_all()
+        assert saved == [tasks[1]]
+        assert not tasks[1].changed
+
+    def test_save_all_saves_collection_of_changed_task(self):
+        child = Task(jobname='child')
+        coll = TaskCollection(jobname='collection', tasks=[child])
+        self.sess.add(coll)
+        saved = self._count_saves()
+        child.changed = True
+        self.sess.save_all()
+        assert coll in saved
+
+        # also works for collections loaded from disk
+        if hasattr(self, 'extra_args'):
+            sess2 = Session(self.sess.path, **self.extra_args)
+        else:
+            sess2 = Session(self.sess.path)
+        saved = []
+        sess2.store.save = lambda obj: saved.append(obj)
+        sess2.save_all()
+        assert saved == []
+        coll2 = sess2.tasks.values()[0]
+        coll2.tasks[0].changed = True
+        sess2.save_all()
+        assert saved == [coll2]
+
+    def test_index_file_follows_add_and_remove(self):
+        tid1 = self.sess.add(_PStruct(a=1, b='foo'))
+        tid2 = self.sess.add(_PStruct(a=2, b='bar'))
+        idx_filename = os.path.join(self.sess.path, Session.INDEX_FILENAME)
+        with open(idx_filename) as idx_file:
+            assert idx_file.read().split() == [str(tid1), str(tid2)]
+        self.sess.remove(tid1)
+        with open(idx_filename) as idx_file:
+            assert idx_file.read().split() == [str(tid2)]
+
 
 class StubForSqlSession(TestSession):
 
@@ -0,0 +1,104 @@
+#! /usr/bin/env python
+#
+"""
+Check that GC3Utils commands start up quickly.
+"""
+# Copyright (C) 2016, University of Zurich. All rights reserved.
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Lesser General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+#
+__docformat__ = 'reStructuredText'
+
+
+# stdlib imports
+import os
+import subprocess
+import sys
+import time
+
+# GC3Pie imports
+from gc3libs.session import Session
+from gc3libs.testing.helpers import SuccessfulApp, temporary_directory
+
+
+# maximum wall-clock time (in seconds) allowed for ``gstat --help``
+STARTUP_BUDGET = float(os.environ.get('GC3PIE_STARTUP_BUDGET', '1.5'))
+
+# modules that take long to load and are only needed by some commands
+HEAVY_MODULES = [
+    'boto',
+    'daemon',
+    'novaclient',
+    'paramiko',
+    'prettytable',
+    'sqlalchemy',
+    'yaml',
+]
+
+
+def _run_command(*argv):
+    """
+    Run a GC3Utils command in a new Python interpreter.
+
+    Return a triple (exitcode, output, wall-clock duration).
+    """
+    code = ("import sys; sys.argv = %r;"
+            " from gc3utils.frontend import main; sys.exit(main())"
+            % (list(argv),))
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, '-c', code],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = proc.communicate()[0]
+    return proc.returncode, output, (time.time() - start)
+
+
+def test_no_heavy_imports():
+    code = ("import sys; import gc3utils.commands;"
+            " print(sorted(set(name.split('.')[0] for name, mod"
+            " in sys.modules.items() if mod is not None)))")
+    output = subprocess.check_output([sys.executable, '-c', code])
+    loaded = eval(output.strip().splitlines()[-1])
+    assert [name for name in HEAVY_MODULES if name in loaded] == []
+
+
+def test_help_startup_time():
+    # take the best of a few runs, to smooth out system load
+    durations = []
+    for _ in range(3):
+        rc, output, duration = _run_command('gstat', '--help')
+        assert rc == 0, output
+        durations.append(duration)
+    assert min(durations) < STARTUP_BUDGET
+
+
+def test_gstat_needs_no_resources():
+    with temporary_directory() as tmpdir:
+        session = Session(os.path.join(tmpdir, 'session'))
+        session.add(SuccessfulApp('test_app'))
+        session.save_all()
+        # no resources are defined in an empty configuration file
+        config = os.path.join(tmpdir, 'gc3pie.conf')
+        open(config, 'w').close()
+        rc, output, _ = _run_command(
+            'gstat', '-s', session.path, '--config-files', config)
+        assert rc == 0, output
+        assert 'test_app' in output
+
+
+# main: run tests
+
+if "__main__" == __name__:
+    import pytest
+    pytest.main(["-v", __file__])
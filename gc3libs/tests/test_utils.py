@@ -118,6 +118,65 @@ class TestYieldAtNext(object):
             g.next()
 
 
+def test_WorkerPool_max_per_key():
+    import threading
+    import time
+    lock = threading.Lock()
+    running = {'a': 0, 'b': 0}
+    peak = {'a': 0, 'b': 0}
+
+    def work(key):
+        with lock:
+            running[key] += 1
+            peak[key] = max(peak[key], running[key])
+        time.sleep(0.01)
+        with lock:
+            running[key] -= 1
+        return key
+
+    pool = gc3libs.utils.WorkerPool(max_workers=4, max_per_key=2)
+    try:
+        jobs = [pool.submit(key, work, key) for key in 'ab' * 5]
+        assert [job.result() for job in jobs] == list('ab' * 5)
+    finally:
+        pool.shutdown()
+    assert peak['a'] <= 2
+    assert peak['b'] <= 2
+
+
+def test_WorkerPool_reraise():
+    pool = gc3libs.utils.WorkerPool(max_workers=1)
+    try:
+        job = pool.submit(None, int, 'not a number')
+        with pytest.raises(ValueError):
+            job.result()
+    finally:
+        pool.shutdown()
+
+
+def test_WorkerPool_result_after_wait():
+    import threading
+
+    class _Py26Event(threading._Event):
+        # Python 2.6's `Event.wait()` does not report whether the
+        # event was set
+        def wait(self, timeout=None):
+            super(_Py26Event, self).wait(timeout)
+
+    pool = gc3libs.utils.WorkerPool(max_workers=1)
+    try:
+        job = pool.submit(None, sum, [1, 2, 3])
+        job._done.wait()
+        event = _Py26Event()
+        event.set()
+        job._done = event
+        assert job.wait(1)
+        assert job.result(1) == 6
+    finally:
+        pool.shutdown()
+
+
+
 # main: run tests
 
 if "__main__" == __name__:
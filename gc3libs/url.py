@@ -26,6 +26,18 @@ import os
 import urlparse
 
 
+# `Url` objects are immutable, so the same object can be returned
+# whenever a string is parsed again (with the same defaults); the
+# cache is emptied when it reaches `_PARSE_CACHE_SIZE` entries
+_parse_cache = {}
+_PARSE_CACHE_SIZE = 1024
+
+
+def _unpickle_url(cls, fields):
+    """Rebuild a `Url` object saved by `Url.__reduce__`."""
+    return tuple.__new__(cls, fields)
+
+
 # XXX: rewrite using `collections.namedtuple` when we no longer
 # support 2.4 and 2.5
 class Url(tuple):
@@ -147,15 +159,30 @@ class Url(tuple):
                     urlstring.username, urlstring.password
                 ))
             else:
+                key = (cls, type(urlstring), urlstring, force_abs,
+                       scheme, netloc, path, hostname, port, query,
+                       username, password)
+                try:
+                    return _parse_cache[key]
+                except KeyError:
+                    pass
+                # relative paths are made absolute w.r.t. the current
+                # directory, so results depend on it
+                if force_abs:
+                    try:
+                        return _parse_cache[key + (os.getcwd(),)]
+                    except KeyError:
+                        pass
                 # parse `urlstring` and use kwd arguments as default values
                 try:
                     urldata = urlparse.urlsplit(
                         urlstring, scheme=scheme, allow_fragments=False)
                     if urldata.scheme == 'file' and not os.path.isabs(
                             urldata.path) and force_abs:
+                        key += (os.getcwd(),)
                         urldata = urlparse.urlsplit(
                             'file://' + os.path.abspath(urldata.path))
-                    return tuple.__new__(cls, (
+                    url = tuple.__new__(cls, (
                         urldata.scheme or scheme,
                         urldata.netloc or netloc,
                         urldata.path or path,
@@ -169,6 +196,10 @@ class Url(tuple):
                     raise ValueError(
                         "Cannot parse string '%s' as a URL: %s: %s" %
                         (urlstring, ex.__class__.__name__, str(ex)))
+                if len(_parse_cache) >= _PARSE_CACHE_SIZE:
+                    _parse_cache.clear()
+                _parse_cache[key] = url
+                return url
         else:
             # no `urlstring`, use kwd arguments
             return tuple.__new__(cls, (
@@ -184,11 +215,14 @@ class Url(tuple):
             raise AttributeError("'%s' object has no attribute '%s'"
                                  % (self.__class__.__name__, name))
 
-    def __getnewargs__(self):
-        """Support pickling/unpickling `Url` class objects."""
-        return (None, False,  # urlstring, force_abs
-                self.scheme, self.netloc, self.path, self.hostname, self.port,
-                self.query, self.username, self.password)
+    def __reduce__(self):
+        """
+        Support pickling/unpickling `Url` class objects.
+
+        The tuple of fields is saved as-is, so that loading a `Url`
+        needs no parsing and no keyword-argument processing.
+        """
+        return (_unpickle_url, (self.__class__, tuple(self)))
 
     def __repr__(self):
         """
@@ -400,6 +434,8 @@ class UrlKeyDict(dict):
 
     """
 
+    __slots__ = ('_force_abs',)
+
     def __init__(self, iter_or_dict=None, force_abs=False):
         self._force_abs = force_abs
         if iter_or_dict is not None:
@@ -435,6 +471,13 @@ class UrlKeyDict(dict):
         except:
             dict.__setitem__(self, key, value)
 
+    # use the same pickled format as when this class had a `__dict__`
+    def __getstate__(self):
+        return {'_force_abs': self._force_abs}
+
+    def __setstate__(self, state):
+        self._force_abs = state.get('_force_abs', False)
+
 
 class UrlValueDict(dict):
 
@@ -493,6 +536,8 @@ class UrlValueDict(dict):
 
     """
 
+    __slots__ = ('_force_abs',)
+
     def __init__(self, iter_or_dict=None, force_abs=False, **extra_args):
         self._force_abs = force_abs
         if iter_or_dict is not None:
@@ -515,6 +560,13 @@ class UrlValueDict(dict):
         except:
             dict.__setitem__(self, key, value)
 
+    # use the same pickled format as when this class had a `__dict__`
+    def __getstate__(self):
+        return {'_force_abs': self._force_abs}
+
+    def __setstate__(self, state):
+        self._force_abs = state.get('_force_abs', False)
+
 
 # main: run tests
 
@@ -29,6 +29,8 @@ __docformat__ = 'reStructuredText'
 
 from collections import defaultdict, deque
 import contextlib
+import errno
+import fcntl
 import functools
 import os
 import os.path
@@ -37,6 +39,7 @@ import re
 import shutil
 import sys
 import tempfile
+import threading
 import time
 import cStringIO as StringIO
 import UserDict
@@ -804,9 +807,19 @@ class History(object):
 
     """
 
+    # there is one `History` object per task, so keep it small
+    __slots__ = ('_messages',)
+
     def __init__(self):
         self._messages = []
 
+    # use the same pickled format as when `History` had a `__dict__`
+    def __getstate__(self):
+        return {'_messages': self._messages}
+
+    def __setstate__(self, state):
+        self._messages = state['_messages']
+
     def append(self, message, *tags):
         """
         Append a message to this `History`.
@@ -1238,7 +1251,11 @@ def progressive_number(qty=None, id_filename=None):
     *Note:* as file-level locking is used to serialize access to the
     counter file, this function may block (default timeout: 30
     seconds) while trying to acquire the lock, or raise a
-    `LockTimeout` exception if this fails.
+    `LockTimeout` exception if this fails.  The lock is a POSIX
+    record lock on the counter file itself (see `fcntl.lockf`), which
+    is held only for the time needed to read and rewrite the counter;
+    callers needing many numbers should request them all in one go
+    by passing argument `qty`.
 
     :raise: LockTimeout, IOError, OSError
 
@@ -1256,21 +1273,29 @@ def progressive_number(qty=None, id_filename=None):
     id_dirname = dirname(id_filename)
     if not os.path.exists(id_dirname):
         os.makedirs(id_dirname)
-    # XXX: can raise 'LockTimeout'
-    lck = lock(id_filename, timeout=30, create=True)
-    id_file = open(id_filename, 'r+')
-    id = int(id_file.read(8) or "0", 16)
-    id_file.seek(0)
-    if qty is None:
-        id_file.write(
-            "%08x -- DO NOT REMOVE OR ALTER THIS FILE: it is used internally"
-            " by the gc3libs\n" % (id + 1))
-    else:
-        id_file.write(
-            "%08x -- DO NOT REMOVE OR ALTER THIS FILE: it is used internally"
-            " by the gc3libs\n" % (id + qty))
-    id_file.close()
-    unlock(lck)
+    fd = os.open(id_filename, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except IOError as err:
+                if err.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+                if time.time() > deadline:
+                    raise lockfile.LockTimeout(
+                        "Timeout waiting to acquire lock for %s"
+                        % id_filename)
+                time.sleep(0.01 * random.random())
+        id = int(os.read(fd, 8) or "0", 16)
+        os.lseek(fd, 0, os.SEEK_SET)
+        os.write(fd,
+                 "%08x -- DO NOT REMOVE OR ALTER THIS FILE: it is used"
+                 " internally by the gc3libs\n" % (id + (qty or 1)))
+    finally:
+        # closing the file releases the lock
+        os.close(fd)
     if qty is None:
         return id + 1
     else:
@@ -1631,6 +1656,20 @@ class Struct(object, UserDict.DictMixin):
       >>> b.z
       3
 
+    Subclasses may list frequently-used attributes in `__slots__`, to
+    save memory when many instances are alive at the same time; slot
+    attributes that have been set are still visible as keys, and are
+    saved together with the other keys when pickling::
+
+      >>> class Point(Struct):
+      ...     __slots__ = ('x', 'y')
+      >>> p = Point(x=1, label='origin')
+      >>> sorted(p.keys())
+      ['label', 'x']
+      >>> p['y'] = 2
+      >>> p.y
+      2
+
     """
 
     def __init__(self, initializer=None, **extra_args):
@@ -1653,13 +1692,85 @@ class Struct(object, UserDict.DictMixin):
     # the `DictMixin` class defines all std `dict` methods, provided
     # that `__getitem__`, `__setitem__` and `keys` are defined.
     def __setitem__(self, name, val):
-        self.__dict__[name] = val
+        slot = _slots_of(self.__class__).get(name)
+        if slot is None:
+            self.__dict__[name] = val
+        else:
+            slot.__set__(self, val)
 
     def __getitem__(self, name):
-        return self.__dict__[name]
+        slot = _slots_of(self.__class__).get(name)
+        if slot is None:
+            return self.__dict__[name]
+        try:
+            return slot.__get__(self)
+        except AttributeError:
+            raise KeyError(name)
 
     def keys(self):
-        return self.__dict__.keys()
+        keys = self.__dict__.keys()
+        for name, slot in _slots_of(self.__class__).iteritems():
+            if name not in self.__dict__:
+                try:
+                    slot.__get__(self)
+                    keys.append(name)
+                except AttributeError:
+                    pass
+        return keys
+
+    # pickle slot attributes and the instance dictionary as a single
+    # `dict`, so that saved objects do not depend on which attributes
+    # are slots
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name, slot in _slots_of(self.__class__).iteritems():
+            try:
+                state[name] = slot.__get__(self)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        slots = _slots_of(self.__class__)
+        if slots:
+            for name, value in state.iteritems():
+                slot = slots.get(name)
+                if slot is None:
+                    self.__dict__[name] = value
+                else:
+                    slot.__set__(self, value)
+        else:
+            self.__dict__.update(state)
+
+
+_struct_slots = {}
+
+
+def _slots_of(cls):
+    """
+    Return a mapping of the names of `__slots__` attributes defined by
+    class `cls` and its ancestors to the corresponding descriptors.
+
+    Slots that are hidden by a class attribute with the same name in a
+    derived class are left out, as instances keep those attributes
+    in their `__dict__`.
+    """
+    try:
+        return _struct_slots[cls]
+    except KeyError:
+        slots = {}
+        for base in reversed(cls.__mro__):
+            names = base.__dict__.get('__slots__', ())
+            if isinstance(names, basestring):
+                names = [names]
+            for name in names:
+                if name in ('__dict__', '__weakref__'):
+                    continue
+                slot = base.__dict__[name]
+                if getattr(cls, name, None) is slot:
+                    slots[name] = slot
+        _struct_slots[cls] = slots
+        return slots
 
 
 def string_to_boolean(word):
@@ -1992,6 +2103,168 @@ def update_parameter_in_file(path, var_in, new_val, regex_in):
             ' in sepcified file')
 
 
+class WorkerPool(object):
+
+    """
+    Run callables on a fixed-size set of background threads.
+
+    Each job is submitted together with a *key* (e.g., the name of the
+    resource it operates on); if `max_per_key` is positive, then no
+    more than that many jobs with the same key are run concurrently,
+    and the remaining ones wait in a queue.  Jobs with different keys
+    are picked in round-robin fashion, so that a long queue for one
+    key does not delay jobs for the other ones.
+
+    Threads are started lazily, upon the first submissions::
+
+      >>> pool = WorkerPool(max_workers=2, max_per_key=1)
+      >>> job = pool.submit('a', sum, [1, 2, 3])
+      >>> job.result()
+      6
+      >>> pool.shutdown()
+
+    Method `submit`:meth: returns a `WorkerPool.Job` object, which
+    can be used to wait for the job to complete and collect its return
+    value (or re-raise the exception it raised).
+    """
+
+    class Job(object):
+
+        """
+        A call to be run by `WorkerPool`:class:.
+        """
+
+        __slots__ = ['key', '_fn', '_args', '_kwargs',
+                     '_done', '_result', '_exc_info']
+
+        def __init__(self, key, fn, args, kwargs):
+            self.key = key
+            self._fn = fn
+            self._args = args
+            self._kwargs = kwargs
+            self._done = threading.Event()
+            self._result = None
+            self._exc_info = None
+
+        def run(self):
+            try:
+                self._result = self._fn(*self._args, **self._kwargs)
+            # pylint: disable=broad-except
+            except Exception:
+                self._exc_info = sys.exc_info()
+            self._done.set()
+
+        def done(self):
+            """Return ``True`` if the job has completed."""
+            return self._done.is_set()
+
+        def wait(self, timeout=None):
+            """
+            Block until the job has completed, or `timeout` seconds
+            have passed.  Return ``True`` if the job has completed.
+            """
+            # on Python 2.6, `Event.wait()` always returns ``None``
+            self._done.wait(timeout)
+            return self._done.is_set()
+
+        def result(self, timeout=None):
+            """
+            Wait until the job has completed, then return its result.
+
+            If the job raised an exception, re-raise it here.
+            """
+            if not self.wait(timeout):
+                raise gc3libs.exceptions.InternalError(
+                    "Job %r did not complete within %s seconds"
+                    % (self._fn, timeout))
+            if self._exc_info is not None:
+                raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+            return self._result
+
+    def __init__(self, max_workers=4, max_per_key=0):
+        assert max_workers > 0, \
+            "Argument `max_workers` to `WorkerPool` must be positive"
+        self.max_workers = max_workers
+        self.max_per_key = max_per_key
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()
+        self._running = defaultdict(int)
+        self._threads = []
+        self._closed = False
+
+    def __len__(self):
+        """Return number of jobs queued or running."""
+        with self._cond:
+            return (sum(len(jobs) for jobs in self._pending.itervalues())
+                    + sum(self._running.itervalues()))
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Schedule `fn(*args, **kwargs)` for execution, and return the
+        corresponding `WorkerPool.Job` instance.
+        """
+        job = WorkerPool.Job(key, fn, args, kwargs)
+        with self._cond:
+            if self._closed:
+                raise gc3libs.exceptions.InvalidOperation(
+                    "Cannot submit jobs to a `WorkerPool` after shutdown.")
+            if key not in self._pending:
+                self._pending[key] = deque()
+            self._pending[key].append(job)
+            if len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._work)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+            self._cond.notify()
+        return job
+
+    def shutdown(self, wait=True):
+        """
+        Stop all threads once they are done with the current job.
+
+        Jobs that are still queued are never run.  If `wait` is
+        ``True`` (default), block until all threads have exited.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next_job(self):
+        # must be called with `self._cond` held
+        for key, jobs in self._pending.iteritems():
+            if 0 < self.max_per_key <= self._running[key]:
+                continue
+            job = jobs.popleft()
+            del self._pending[key]
+            if jobs:
+                # move `key` at the end of the round-robin order
+                self._pending[key] = jobs
+            return job
+        return None
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    job = self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait()
+                self._running[job.key] += 1
+            try:
+                job.run()
+            finally:
+                with self._cond:
+                    self._running[job.key] -= 1
+                    self._cond.notify_all()
+
+
 def write_contents(path, data):
     """
     Overwrite the contents of the file at `path` with the given data.
@@ -30,6 +30,7 @@ __docformat__ = 'reStructuredText'
 
 import itertools
 import os
+import threading
 
 from collections import defaultdict
 from gc3libs.compat.toposort import toposort
@@ -39,6 +40,10 @@ import gc3libs.exceptions
 import gc3libs.utils
 
 
+# serialize updates to `TaskCollection` state counts
+_state_counts_lock = threading.Lock()
+
+
 class TaskCollection(Task):
 
     """
@@ -63,6 +68,8 @@ class TaskCollection(Task):
         else:
             self.tasks = tasks
         Task.__init__(self, **extra_args)
+        for task in self.tasks:
+            task._add_watcher(self)
 
     def iter_workflow(self):
         """
@@ -107,6 +114,8 @@ class TaskCollection(Task):
 
         def fset(self, value):
             self._changed = value
+            if value:
+                self._notify_changed()
         return locals()
 
     # manipulate the "controller" interface used to control the associated task
@@ -136,9 +145,114 @@ class TaskCollection(Task):
         """
         Remove a task from the collection.
         """
+        counted = self._state_counts_valid()
         self.tasks.remove(task)
+        if counted:
+            self._uncount(task)
+        else:
+            task._remove_watcher(self)
         task.detach()
 
+    # per-state counts of the managed tasks; they are computed once
+    # (lazily) and then kept up-to-date by the `Run.state` setter,
+    # which calls `_on_child_transition` on each state change of a
+    # managed task.  Counts are not saved to persistent storage.
+
+    def __getstate__(self):
+        state = Task.__getstate__(self)
+        for attr in ['_state_counts', '_state_counts_tasks',
+                     '_state_counts_len']:
+            state.pop(attr, None)
+        return state
+
+    def __setstate__(self, state):
+        Task.__setstate__(self, state)
+        for task in self.tasks:
+            task._add_watcher(self)
+
+    @staticmethod
+    def _count_state(counts, state, returncode, increment):
+        """
+        Add `increment` to the counters in `counts` relevant to a task
+        in state `state` with the given `returncode`.
+        """
+        counts[state] += increment
+        if state == Run.State.TERMINATED:
+            if returncode == 0:
+                counts['ok'] += increment
+            else:
+                counts['failed'] += increment
+
+    def _state_counts_valid(self):
+        """
+        Return ``True`` if the per-state counts match the `tasks` list.
+        """
+        attrs = self.__dict__
+        return (attrs.get('_state_counts') is not None
+                and attrs.get('_state_counts_tasks') is self.tasks
+                and attrs.get('_state_counts_len') == len(self.tasks))
+
+    def _counts_by_state(self):
+        """
+        Return a mapping of task states (plus ``ok`` and ``failed``)
+        to the number of managed tasks in that state.
+
+        Counts are recomputed from scratch only if the `tasks` list
+        has been altered without going through `add`:meth: or
+        `remove`:meth:; otherwise this is a constant-time operation.
+        """
+        if not self._state_counts_valid():
+            counts = defaultdict(int)
+            for task in self.tasks:
+                task._add_watcher(self)
+                self._count_state(counts, task.execution.state,
+                                  task.execution.returncode, +1)
+            self._state_counts = counts
+            self._state_counts_tasks = self.tasks
+            self._state_counts_len = len(self.tasks)
+        return self._state_counts
+
+    def _count(self, task):
+        """
+        Update counts after `task` has been appended to `self.tasks`.
+        """
+        task._add_watcher(self)
+        self._count_state(self._state_counts, task.execution.state,
+                          task.execution.returncode, +1)
+        self._state_counts_len += 1
+
+    def _uncount(self, task):
+        """
+        Update counts after `task` has been removed from `self.tasks`.
+        """
+        task._remove_watcher(self)
+        self._count_state(self._state_counts, task.execution.state,
+                          task.execution.returncode, -1)
+        self._state_counts_len -= 1
+
+    def _on_child_changed(self, task):
+        """
+        Called when a managed task is marked as changed.
+
+        The collection needs to be saved too, so pass the notification
+        on to our own watchers.
+        """
+        self._notify_changed()
+
+    def _on_child_transition(self, old_state, old_returncode,
+                             new_state, new_returncode):
+        """
+        Called by `Run.state` when a managed task changes state
+        (or return code, if it is ``TERMINATED``).
+        """
+        counts = self.__dict__.get('_state_counts')
+        if counts is not None:
+            # tasks may be updated from several threads at once,
+            # see `gc3libs.core.ConcurrentEngine`
+            with _state_counts_lock:
+                self._count_state(counts, old_state, old_returncode, -1)
+                self._count_state(counts, new_state, new_returncode, +1)
+
     # task execution manipulation -- these methods should be overriden
     # in derived classes, to implement the desired policy.
 
@@ -263,9 +377,13 @@ class TaskCollection(Task):
         :param tuple only: Restrict counting to tasks of these classes.
 
         """
+        if not only:
+            result = defaultdict(lambda: 0, self._counts_by_state())
+            result['total'] = len(self.tasks)
+            return result
         result = defaultdict(lambda: 0)
         for task in self.tasks:
-            if only and not isinstance(task, only):
+            if not isinstance(task, only):
                 continue
             state = task.execution.state
             result[state] += 1
@@ -274,11 +392,8 @@ class TaskCollection(Task):
                     result['ok'] += 1
                 else:
                     result['failed'] += 1
-        if only:
-            result['total'] = len([task for task in self.tasks
-                                   if isinstance(task, only)])
-        else:
-            result['total'] = len(self.tasks)
+        result['total'] = len([task for task in self.tasks
+                               if isinstance(task, only)])
         return result
 
     def terminated(self):
@@ -323,7 +438,12 @@ class SequentialTaskCollection(TaskCollection):
 
     def add(self, task):
         task.detach()
+        counted = self._state_counts_valid()
         self.tasks.append(task)
+        if counted:
+            self._count(task)
+        else:
+            task._add_watcher(self)
 
     def attach(self, controller):
         """
@@ -766,7 +886,7 @@ class ParallelTaskCollection(TaskCollection):
         TERMINATED jobs, then the global state is RUNNING (presuming
         we're in the middle of a computation).
         """
-        stats = self.stats()
+        stats = self._counts_by_state()
         if (stats[Run.State.NEW] > 0
                 and stats[Run.State.TERMINATED] > 0
                 and stats[Run.State.NEW] + stats[Run.State.TERMINATED] ==
@@ -794,7 +914,12 @@ class ParallelTaskCollection(TaskCollection):
         Add a task to the collection.
         """
         task.detach()
+        counted = self._state_counts_valid()
         self.tasks.append(task)
+        if counted:
+            self._count(task)
+        else:
+            task._add_watcher(self)
         if self._attached:
             task.attach(self._controller)
 
@@ -859,14 +984,14 @@ class ParallelTaskCollection(TaskCollection):
             # gc3libs.log.debug("Updating state of %s in collection %s ..."
             #                  % (task, self))
             task.update_state(**extra_args)
+        old_state = self.execution.state
         self.execution.state = self._state()
-        if self.execution.state == Run.State.TERMINATED:
+        if (self.execution.state == Run.State.TERMINATED
+                and old_state != Run.State.TERMINATED):
             self.execution.returncode = (0, 0)
             # set exitcode based on returncode of sub-tasks
-            for task in self.tasks:
-                if task.execution.returncode != 0:
-                    self.execution.exitcode = 1
-            # FIXME: incorrectly sets `changed` each time it's called!
+            if self._counts_by_state()['failed'] > 0:
+                self.execution.exitcode = 1
             self.changed = True
 
 
@@ -920,10 +1045,10 @@ class ChunkedParameterSweep(ParallelTaskCollection):
         #                       self._controller.max_in_flight))
         #     self.chunk_size =  self._controller.
         # XXX: shall we als could jobs in Run.State.STOPPED ?
-        num_running = len([task for task in self.tasks if
-                           task.execution.state in [Run.State.NEW,
-                                                    Run.State.SUBMITTED,
-                                                    Run.State.RUNNING]])
+        counts = self._counts_by_state()
+        num_running = (counts[Run.State.NEW]
+                       + counts[Run.State.SUBMITTED]
+                       + counts[Run.State.RUNNING])
         # Run.State.UNKNOWN ]])
         # add more jobs if we're close to the end
         # XXX: why using 2*self.chunk_size as treshold ?
@@ -942,6 +1067,275 @@ class ChunkedParameterSweep(ParallelTaskCollection):
         return self.execution.state
 
 
+class StreamingTaskCollection(ParallelTaskCollection):
+
+    """
+    Like `ParallelTaskCollection`, but tasks are created on demand
+    from a (possibly very long) stream of parameters, and dropped from
+    the collection as soon as they reach `TERMINATED` state.
+
+    Subclasses must define two methods:
+
+    * `iter_params`:meth: returns an iterator over the parameters of
+      the sweep; it must yield the same sequence each time it is called,
+      as it is used to resume the stream after the collection has been
+      loaded back from persistent storage;
+
+    * `new_task`:meth: returns the `Task` corresponding to a given
+      parameter.
+
+    New tasks are only created while the number of live (i.e., not
+    yet terminated) tasks is below `max_live`; if `max_live` is 0 (the
+    default), then the `max_in_flight` limit of the controlling
+    `Engine` is used, or `default_max_live` if that is not set either.
+
+    When a task reaches `TERMINATED` state, method `task_done`:meth:
+    is called on it (override it to harvest results) and then the
+    task is removed from the collection; only its contribution to the
+    ``TERMINATED``, ``ok`` and ``failed`` counters is retained.  The
+    records of finished tasks are also deleted from the store of the
+    controlling `Engine`, if any, once the collection has been saved
+    without them (see `Engine.remove`).
+
+    Therefore, only the position in the parameter stream and the live
+    tasks are kept in memory and saved to persistent storage,
+    regardless of the total length of the sweep.  For example, a sweep
+    over all the expansions of a template can be written as::
+
+      class MySweep(StreamingTaskCollection):
+          def iter_params(self):
+              return gc3libs.template.expansions(self.template)
+          def new_task(self, param, **extra_args):
+              return MyApplication(param, **extra_args)
+
+    and a sweep over the rows of a CSV file as::
+
+      class MyCsvSweep(StreamingTaskCollection):
+          def iter_params(self):
+              return csv.reader(open(self.csv_path, 'r'))
+          ...
+    """
+
+    default_max_live = 100
+
+    def __init__(self, max_live=0, **extra_args):
+        self.max_live = max_live
+        # number of parameters consumed from the stream so far
+        self._cursor = 0
+        self._exhausted = False
+        # counters of tasks that have been dropped from the collection
+        self._done = defaultdict(int)
+        ParallelTaskCollection.__init__(self, None, **extra_args)
+
+    def __getstate__(self):
+        state = ParallelTaskCollection.__getstate__(self)
+        # iterators cannot be pickled; `_next_params` re-creates it
+        state.pop('_params', None)
+        return state
+
+    def iter_params(self):
+        """
+        Return an iterator over the parameter values of the sweep.
+
+        This method *must* be overridden in subclasses.
+        """
+        raise NotImplementedError(
+            "Abstract method `StreamingTaskCollection.iter_params()` called -"
+            " this should have been defined in a derived class.")
+
+    def new_task(self, param, **extra_args):
+        """
+        Return the `Task` corresponding to the parameter value `param`.
+
+        This method *must* be overridden in subclasses to generate tasks.
+        """
+        raise NotImplementedError(
+            "Abstract method `StreamingTaskCollection.new_task()` called -"
+            " this should have been defined in a derived class.")
+
+    def task_done(self, task):
+        """
+        Called when `task` has reached `TERMINATED` state, right before
+        it is removed from the collection.
+
+        Default implementation does nothing; override in derived
+        classes to process the task results.
+        """
+        pass
+
+    def _max_live(self):
+        """
+        Return the maximum number of live tasks in this collection.
+        """
+        if self.max_live > 0:
+            return self.max_live
+        limit = getattr(self._controller, 'max_in_flight', 0)
+        if limit > 0:
+            return limit
+        return self.default_max_live
+
+    def _next_params(self, count):
+        """
+        Return a list of (at most) `count` parameter values, taken
+        from the stream at the current position.
+        """
+        params = self.__dict__.get('_params')
+        if params is None:
+            # (re)start the stream, skipping items already consumed
+            params = itertools.islice(self.iter_params(), self._cursor, None)
+            self._params = params
+        result = list(itertools.islice(params, count))
+        self._cursor += len(result)
+        if len(result) < count:
+            self._exhausted = True
+        return result
+
+    def _fold_terminated(self):
+        """
+        Remove `TERMINATED` tasks from the collection, adding them
+        to the summary counters.
+        """
+        counts = self._counts_by_state()
+        if counts[Run.State.TERMINATED] == 0:
+            return
+        live = []
+        for task in self.tasks:
+            if task.execution.state == Run.State.TERMINATED:
+                self.task_done(task)
+                self._count_state(self._done, Run.State.TERMINATED,
+                                  task.execution.returncode, +1)
+                self._drop(task)
+            else:
+                live.append(task)
+        self.tasks = live
+        self.changed = True
+
+    def _drop(self, task):
+        """
+        Stop watching `task`, remove it from the controlling `Engine`
+        and delete it from the `Engine`'s store.
+        """
+        task._remove_watcher(self)
+        if task._attached:
+            try:
+                task._controller.remove(task, purge=True)
+            # pylint: disable=broad-except
+            except Exception as err:
+                gc3libs.log.warning(
+                    "Could not remove task '%s' from %s: %s: %s",
+                    task, task._controller, err.__class__.__name__, err)
+        task.detach()
+
+    def _refill(self, **extra_args):
+        """
+        Create new tasks until there are `max_live` live tasks or
+        the parameter stream is exhausted.
+        """
+        if self._exhausted:
+            return
+        room = self._max_live() - len(self.tasks)
+        if room <= 0:
+            return
+        for param in self._next_params(room):
+            self.add(self.new_task(param, **extra_args))
+            self.changed = True
+
+    def _state(self):
+        """
+        Return the state of the collection.
+
+        The state is computed from that of the live tasks, as in
+        `ParallelTaskCollection._state`:meth:, except that the
+        collection is `RUNNING` (instead of `TERMINATING` or
+        `TERMINATED`) until the parameter stream has been exhausted.
+        """
+        if not self.tasks:
+            if self._exhausted:
+                return Run.State.TERMINATED
+            elif self._cursor == 0:
+                return Run.State.NEW
+            else:
+                return Run.State.RUNNING
+        state = ParallelTaskCollection._state(self)
+        if state == Run.State.NEW and self._done[Run.State.TERMINATED] > 0:
+            return Run.State.RUNNING
+        if (state in [Run.State.TERMINATING, Run.State.TERMINATED]
+                and not self._exhausted):
+            return Run.State.RUNNING
+        return state
+
+    def kill(self, **extra_args):
+        """
+        Terminate all live tasks and stop generating new ones.
+        """
+        self._exhausted = True
+        ParallelTaskCollection.kill(self, **extra_args)
+
+    def redo(self, *args, **kwargs):
+        """
+        Restart the parameter stream from the beginning.
+
+        Live tasks are dropped from the collection, and counters
+        of finished tasks are reset.
+        """
+        for task in self.tasks:
+            self._drop(task)
+        self.tasks = []
+        self._params = None
+        self._cursor = 0
+        self._exhausted = False
+        self._done = defaultdict(int)
+        Task.redo(self, *args, **kwargs)
+
+    def stats(self, only=None):
+        """
+        Like `TaskCollection.stats`:meth:, but also count the
+        tasks that have terminated and been removed from the collection.
+        """
+        result = ParallelTaskCollection.stats(self, only)
+        if not only:
+            for key, count in self._done.iteritems():
+                result[key] += count
+            result['total'] += self._done[Run.State.TERMINATED]
+        return result
+
+    def submit(self, resubmit=False, targets=None, **extra_args):
+        """
+        Create the initial batch of tasks and start them.
+        """
+        self._refill(**extra_args)
+        ParallelTaskCollection.submit(self, resubmit, targets, **extra_args)
+
+    def terminated(self):
+        """
+        Set the exitcode to 1 if any task failed, and 0 otherwise.
+        """
+        if self._done['failed'] > 0:
+            self.execution._exitcode = 1
+        else:
+            self.execution._exitcode = 0
+
+    # this is called at every cycle
+    def update_state(self, **extra_args):
+        """
+        Update state of all live tasks, drop the terminated ones, and
+        create new tasks from the parameter stream to replace them.
+        """
+        for task in self.tasks:
+            task.update_state(**extra_args)
+        self._fold_terminated()
+        self._refill(**extra_args)
+        old_state = self.execution.state
+        self.execution.state = self._state()
+        if (self.execution.state == Run.State.TERMINATED
+                and old_state != Run.State.TERMINATED):
+            self.execution.returncode = (0, 0)
+            if self._done['failed'] > 0:
+                self.execution.exitcode = 1
+            self.changed = True
+        return self.execution.state
+
+
 class RetryableTask(Task):
 
     """
@@ -973,6 +1367,7 @@ class RetryableTask(Task):
         self.task = task
         self.would_output = self.task.would_output
         Task.__init__(self, **extra_args)
+        task._add_watcher(self)
 
     @gc3libs.utils.defproperty
     def changed():
@@ -986,8 +1381,23 @@ class RetryableTask(Task):
 
         def fset(self, value):
             self._changed = value
+            if value:
+                self._notify_changed()
         return locals()
 
+    def __setstate__(self, state):
+        Task.__setstate__(self, state)
+        self.task._add_watcher(self)
+
+    def _on_child_changed(self, task):
+        # the wrapped task is saved as part of this one
+        self._notify_changed()
+
+    def _on_child_transition(self, old_state, old_returncode,
+                             new_state, new_returncode):
+        # state of this task is updated by `update_state`
+        pass
+
     def __getattr__(self, name):
         """Proxy public attributes of the wrapped task."""
         if name.startswith('_'):
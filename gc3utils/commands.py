@@ -30,20 +30,21 @@ __copyright__ = "Copyright (c) 2009-2014 Grid Computing Competence Center,"
 
 # stdlib imports
 import csv
+import json
 import sys
 import os
 import posix
-from prettytable import PrettyTable
 import time
 import types
 import re
 import multiprocessing as mp
 
-# 3rd party modules
-from parsedatetime.parsedatetime import Calendar
+# 3rd party modules (`prettytable`, `parsedatetime`) are imported
+# by the commands that use them, to keep startup fast
 
 # local modules
 from gc3libs import __version__, Run
+from gc3libs.backends.transport import summarize_trace
 from gc3libs.quantity import Duration, Memory
 from gc3libs.session import Session
 import gc3libs.cmdline
@@ -225,6 +226,7 @@ GC3Libs internals.
                        help="Print job history only")
 
     def main(self):
+        from prettytable import PrettyTable
         try:
             self.session = Session(self.params.session, create=False)
         except gc3libs.exceptions.InvalidArgument:
@@ -500,23 +502,49 @@ Print job state.
                        " appears in this comma-separated list.")
 
     def main(self):
+        from prettytable import PrettyTable
         # by default, DO NOT update job statuses
         try:
-            self.session = Session(self.params.session, create=False)
+            # jobs are loaded below, and only if needed
+            self.session = Session(self.params.session, create=False,
+                                   load_tasks=False)
         except gc3libs.exceptions.InvalidArgument:
             # session not found?
             raise RuntimeError('Session %s not found' % self.params.session)
 
-        if len(self.params.args) == 0:
-            # if no arguments, operate on all known jobs
-            # self.params.args = self.session.list_ids()
-            self.params.args = [job.persistent_id
-                                for job in self.session.iter_workflow()]
+        # limit to specified job states?
+        if self.params.states is not None:
+            states = self.params.states.split(',')
+        else:
+            states = None
 
-        if len(self.params.args) == 0:
-            print("No jobs submitted.")
+        if (self.params.summary
+                and len(self.params.args) == 0
+                and not self.params.update
+                and self.params.lifetimes is None):
+            # the store keeps counters, no need to load any job
+            # (unless the store is shared with other sessions)
+            stats = dict((key, num)
+                         for key, num in self.session.stats().items()
+                         if num > 0)
+            tot = stats.pop('total', 0)
+            if tot == 0:
+                print("No jobs submitted.")
+                return 0
+            print(self._make_summary_table(stats, tot, states))
             return 0
 
+        if len(self.params.args) == 0:
+            # if no arguments, operate on all jobs in the session
+            self.session = Session(self.params.session, create=False)
+            jobs = list(self.session.iter_workflow())
+            if len(jobs) == 0:
+                print("No jobs submitted.")
+                return 0
+            self.params.args = [job.persistent_id for job in jobs]
+        else:
+            jobs = self._get_jobs(self.params.args)
+
         if posix.isatty(sys.stdout.fileno()):
             # try to determine how many lines of output can we fit in a screen
             try:
@@ -527,12 +555,6 @@ Print job state.
             # output is dumped to a file, so no restrictions
             capacity = gc3libs.utils.PlusInfinity
 
-        # limit to specified job states?
-        if self.params.states is not None:
-            states = self.params.states.split(',')
-        else:
-            states = None
-
         # any additional values to print?
         if self.params.keys is not None:
             keys = self.params.keys.split(',')
@@ -554,7 +576,7 @@ Print job state.
         stats = utils.defaultdict(lambda: 0)
         tot = 0
         rows = []
-        for app in self._get_jobs(self.params.args):
+        for app in jobs:
             tot += 1  # one more job successfully loaded
             jobid = app.persistent_id
             if self.params.update:
@@ -623,19 +645,7 @@ Print job state.
         )
         if summary_only:
             # only print table with statistics
-            table = PrettyTable(['state', 'num/tot', 'num/tot %'])
-            table.header = False
-            table.align['state'] = 'r'
-            table.align['num/tot'] = 'c'
-            table.align['num/tot %'] = 'r'
-
-            for state, num in sorted(stats.items()):
-                if (states is None) or (str(state) in states):
-                    table.add_row([
-                        state,
-                        "%d/%d" % (num, tot),
-                        "%.2f%%" % (100.0 * num / tot)
-                    ])
+            table = self._make_summary_table(stats, tot, states)
         else:
             # print table of job status
             table = PrettyTable(["JobID", "Job name", "State", "Info"] + keys)
@@ -663,6 +673,28 @@ Print job state.
         # exit code is practically limited to 7 bits ...
         return min(failed, 126)
 
+    @staticmethod
+    def _make_summary_table(stats, tot, states=None):
+        """
+        Return a table with the count of jobs per each state in `stats`
+        (only those listed in `states`, if not ``None``).
+        """
+        from prettytable import PrettyTable
+        table = PrettyTable(['state', 'num/tot', 'num/tot %'])
+        table.header = False
+        table.align['state'] = 'r'
+        table.align['num/tot'] = 'c'
+        table.align['num/tot %'] = 'r'
+
+        for state, num in sorted(stats.items()):
+            if (states is None) or (str(state) in states):
+                table.add_row([
+                    state,
+                    "%d/%d" % (num, tot),
+                    "%.2f%%" % (100.0 * num / tot)
+                ])
+        return table
+
 
 class cmd_gget(_BaseCmd):
     """
@@ -1014,6 +1046,7 @@ List status of computational resources.
                        " resources to check.")
 
     def main(self):
+        from prettytable import PrettyTable
         if len(self.params.args) > 0:
             self._select_resources(* self.params.args)
             self.log.info(
@@ -1060,6 +1093,99 @@ List status of computational resources.
             print('')
 
 
+class cmd_gtrace(_BaseCmd):
+    """
+Summarize traces of operations performed on computational resources.
+
+Trace files are written by any GC3Pie program when environment
+variable GC3PIE_TRANSPORT_TRACE is set to the name of a file: every
+remote command, file transfer, or file system query is then appended
+to that file, one JSON record per line.  For each host, this command
+prints the count and duration of each kind of operation, and lists
+the slowest ones.
+    """
+
+    def setup_options(self):
+        self.add_param("-n", "--slowest", type=int, metavar="NUM",
+                       dest="slowest", default=10,
+                       help="List the NUM slowest operations on each host"
+                       " (default: %(default)s).")
+        self.add_param("-H", "--host", action="append", metavar="NAME",
+                       dest="hosts", default=None,
+                       help="Only report operations on host NAME."
+                       " Can be repeated.")
+
+    def setup(self):
+        """
+        Override `GC3UtilsScript`:class: `setup` method since we
+        don't need any `session` argument.
+        """
+        gc3libs.cmdline._Script.setup(self)
+
+    def setup_args(self):
+        """
+        Override `GC3UtilsScript`:class: `setup_args` method since we
+        don't operate on jobs but on trace files.
+        """
+        self.add_param('args',
+                       nargs='+',
+                       metavar='TRACEFILE',
+                       help="Trace file(s) to summarize.")
+
+    def main(self):
+        from prettytable import PrettyTable
+        records = []
+        for path in self.params.args:
+            with open(path) as stream:
+                for lineno, line in enumerate(stream):
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        self.log.warning(
+                            "Ignoring malformed line %d of file '%s'",
+                            lineno + 1, path)
+                        continue
+                    if self.params.hosts and entry['host'] not in self.params.hosts:
+                        continue
+                    records.append(entry)
+
+        summary = summarize_trace(records)
+        for host in sorted(summary):
+            ops = summary[host]
+            grand_total = sum(stats['total'] for stats in ops.values())
+            table = PrettyTable(['Operation', 'Count', 'Total time (s)',
+                                 '% of time', 'Mean (s)', 'Max (s)',
+                                 'Bytes', 'Errors'])
+            table.align = 'r'
+            table.align['Operation'] = 'l'
+            for op, stats in sorted(ops.items(),
+                                    key=(lambda item: -item[1]['total'])):
+                table.add_row([
+                    op, stats['count'], '%.3f' % stats['total'],
+                    '%.1f' % (100.0 * stats['total'] / grand_total
+                              if grand_total else 0.0),
+                    '%.3f' % (stats['total'] / stats['count']),
+                    '%.3f' % stats['max'], stats['bytes'], stats['errors']])
+            print("Operations on host '%s':" % host)
+            print(table)
+
+            if self.params.slowest > 0:
+                slowest = sorted((entry for entry in records
+                                  if entry['host'] == host),
+                                 key=(lambda entry: -entry['duration']))
+                table = PrettyTable(['Duration (s)', 'Operation',
+                                     'Argument', 'Caller'])
+                table.align = 'l'
+                table.align['Duration (s)'] = 'r'
+                for entry in slowest[:self.params.slowest]:
+                    table.add_row(['%.3f' % entry['duration'], entry['op'],
+                                   entry['arg'], entry['caller']])
+                print("Slowest operations on host '%s':" % host)
+                print(table)
+            print('')
+        return 0
+
+
 class cmd_gsession(_BaseCmd):
     """
 `gsession` get info on a session.
@@ -1108,6 +1234,11 @@ To get detailed info on a specific command, run:
                                default=False,
                                help="Show all jobs contained in a task"
                                " collection, not only top-level jobs.")
+        subparser.add_argument('-b', '--brief', '--summary',
+                               action="store_true", dest="summary",
+                               default=False,
+                               help="Only print a summary table with count"
+                               " of jobs per each state.")
 
         self._add_subcmd(
             'log',
@@ -1204,15 +1335,35 @@ To get detailed info on a specific command, run:
 
         With option `--recursive`, indent job ids to show the tree-like
         organization of jobs in the task collections.
+
+        With option `--summary`, only print the count of jobs per each
+        state, as maintained by the session store: no job is loaded.
         """
+        from prettytable import PrettyTable
         try:
-            self.session = Session(self.params.session, create=False)
+            self.session = Session(self.params.session, create=False,
+                                   load_tasks=(not self.params.summary))
         except gc3libs.exceptions.InvalidArgument:
             raise RuntimeError(
                 "Session '{0}' not found. Please specify a valid"
                 " session directory as argument"
                 .format(self.params.session))
 
+        if self.params.summary:
+            stats = dict((key, num)
+                         for key, num in self.session.stats().items()
+                         if num > 0)
+            tot = stats.pop('total', 0)
+            if tot == 0:
+                print("No jobs in session.")
+                return
+            print(cmd_gstat._make_summary_table(stats, tot))
+            last = self.session.last_transition_time()
+            if last is not None:
+                print("Last state change: %s"
+                      % time.strftime("%b %d %H:%M:%S", time.localtime(last)))
+            return
+
         def print_app_table(app, indent, recursive):
             rows = []
             try:
@@ -1289,6 +1440,12 @@ in order to be selected.
         pass
 
     def setup_options(self):
+        self.add_param(
+            '--exit-code', '--exitcode', metavar='LIST',
+            dest='exitcodes', default=None,
+            help=("Select jobs whose exit code is one of the specified ones"
+                  " (comma-separated list of integers)."),
+        )
         self.add_param(
             '--error-message', '--errmsg', metavar='REGEXP',
             help=("Select jobs such that a line in their error output (STDERR)"
@@ -1348,6 +1505,11 @@ in order to be selected.
             )
 
     def parse_args(self):
+        from parsedatetime.parsedatetime import Calendar
+        # criteria that can be checked by the store, without loading
+        # the tasks; see `gc3libs.persistence.store.Store.query`
+        self.query = {}
+        # criteria that need to examine the task objects
         self.criteria = []
 
         # --successful, --unsuccessful
@@ -1357,31 +1519,37 @@ in order to be selected.
                 " `--successful` or `--unsuccessful`.")
 
         if self.params.successful:
-            self.criteria.append(
-                (self.params.successful, self.filter_successful, ()))
+            self.query['successful'] = True
 
         if self.params.unsuccessful:
-            self.criteria.append(
-                (self.params.unsuccessful, self.filter_unsuccessful, ()))
+            self.query['successful'] = False
+
+        # --exit-code
+        if self.params.exitcodes is not None:
+            try:
+                self.query['exitcodes'] = set(
+                    int(code) for code in self.params.exitcodes.split(','))
+            except ValueError:
+                raise gc3libs.exceptions.InvalidUsage(
+                    "Invalid value `%s` for --exit-code argument:"
+                    " must be a comma-separated list of integers."
+                    % (self.params.exitcodes,))
 
         # --jobname, --job-name
         if self.params.jobname:
             try:
                 self.jobname_re = re.compile(self.params.jobname, re.I)
-                self.criteria.append(
-                    (True, self.filter_by_jobname, (self.jobname_re,)))
+                self.query['jobname'] = self.params.jobname
             except re.error, err:
                 raise gc3libs.exceptions.InvalidUsage(
                     "Regexp `%s` for option `--job-name` is invalid: %s"
                     % (self.params.jobname, err))
 
         # --jobid, --job-id
+        self.jobid_re = None
         if self.params.jobid:
             try:
                 self.jobid_re = re.compile(self.params.jobid, re.I)
-                self.criteria.append(
-                    (True, self.filter_by_jobid, (self.jobid_re,)))
-
             except re.error, err:
                 raise gc3libs.exceptions.InvalidUsage(
                     "Regexp `%s` for option `--job-id` is invalid: %s"
@@ -1396,11 +1564,11 @@ in order to be selected.
                 raise gc3libs.exceptions.InvalidUsage(
                     "Invalid state(s): %s" % str.join(", ", invalid))
 
-            self.criteria.append(
-                (True, self.filter_by_state, (self.allowed_states,)))
+            self.query['states'] = self.allowed_states
 
         # --submitted-after, --submitted-before
         self.submission_start = None
+        self.submission_end = None
 
         # NOTE: short-cut `if self.params.submitted:` will *not* work here, as
         # the empty string is a valid value -- only `None` indicates that the
@@ -1419,10 +1587,7 @@ in order to be selected.
                     "Invalid value `%s` for --submitted-after argument: %s"
                     % (self.params.submitted_after, str(ex)))
 
-        else:  # no `--submitted-after` option
-            # a starting date is always needed; if user did not specify one,
-            # then choose the beginning of time
-            self.submission_start = 0.0
+            self.query['submitted_after'] = self.submission_start
 
         # NOTE: short-cut `if self.params.submitted_before:` will *not* work
         # here, as the empty string is a valid value -- only `None` indicates
@@ -1440,14 +1605,7 @@ in order to be selected.
                     "Invalid value `%s` for --submitted-before argument: %s"
                     % (self.params.submitted_before, err))
 
-        else:  # no `--submitted-before` option
-            # an ending date is always needed; if user did not specify one,
-            # then choose the end of (UNIX) time
-            self.submission_end = float(sys.maxint)
-
-        self.criteria.append(
-            (True, self.filter_by_submission_date,
-             (self.submission_start, self.submission_end)))
+            self.query['submitted_before'] = self.submission_end
 
         # --input-file
         if self.params.input_file:
@@ -1472,27 +1630,34 @@ in order to be selected.
 
     def main(self):
         try:
-            self.session = Session(self.params.session, create=False)
+            # tasks are selected through the store, no need to load them all
+            self.session = Session(self.params.session, create=False,
+                                   load_tasks=False)
             self.store = self.session.store
         except gc3libs.exceptions.InvalidArgument:
             # session not found?
             raise RuntimeError("Session `%s` not found" % self.params.session)
 
-        # Load tasks from the store
-        current_jobs = list(self.session.iter_workflow())
+        # let the store do the cheap checks
+        job_ids = self.session.query(**self.query)
+        if self.jobid_re is not None:
+            job_ids = [jobid for jobid in job_ids
+                       if self.jobid_re.search(str(jobid))]
 
         # pipeline of checks to perform; more expensive checks should come last
         # so they look at less jobs (do I long for LISP? Oh yes I do...)
-        for cond, fn, args in self.criteria:
-            if cond:
-                current_jobs = fn(current_jobs, *args)
-                if not current_jobs:
-                    break
+        if job_ids and any(cond for cond, _, _ in self.criteria):
+            current_jobs = list(self._get_jobs(job_ids))
+            for cond, fn, args in self.criteria:
+                if cond:
+                    current_jobs = fn(current_jobs, *args)
+                    if not current_jobs:
+                        break
+            job_ids = [job.persistent_id for job in current_jobs]
 
         # Print remaining job IDs, if any
-        if current_jobs:
-            print(str.join('\n',
-                           (str(job.persistent_id) for job in current_jobs)))
+        if job_ids:
+            print(str.join('\n', (str(jobid) for jobid in job_ids)))
         else:
             gc3libs.log.info("No jobs match the specified conditions.")
 
@@ -1784,6 +1949,7 @@ To get detailed info on a specific command, run:
 
     @staticmethod
     def _print_vms(vms, res, header=True):
+        from prettytable import PrettyTable
         table = PrettyTable()
         table.border = True
         if header:
@@ -156,6 +156,7 @@ setuptools.setup(
             'gstat = gc3utils.frontend:main',
             'gsub = gc3utils.frontend:main',
             'gtail = gc3utils.frontend:main',
+            'gtrace = gc3utils.frontend:main',
             'gsession = gc3utils.frontend:main',
             'gselect = gc3utils.frontend:main',
             'gcloud = gc3utils.frontend:main',
@@ -245,6 +246,8 @@ setuptools.setup(
             'etc/run_gtsub_control.sh',
             'etc/smd_projections_wrapper.sh',
             'etc/square.sh',
+            # reference results of the scalability benchmarks
+            'benchmarks/baseline.json',
         ],
     },
     data_files=[